@@ -2,25 +2,26 @@
 Rotas para gerenciamento de empresas e usuários
 """
 from flask import Blueprint, jsonify, request, render_template
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime
 import logging
 
+from etl_service.engines import obter_engine
+
 logger = logging.getLogger(__name__)
 
 # Blueprint será registrado no app_admin.py
 empresa_bp = Blueprint('empresa', __name__)
 
 
-def init_empresa_routes(app, db_url):
+def init_empresa_routes(app):
     """
     Inicializa as rotas de empresa com a engine do banco
     
     Args:
         app: Instância Flask
-        db_url: URL de conexão do banco de dados
     """
-    engine = create_engine(db_url)
+    engine = obter_engine('fiscal_auditor')
     
     @app.route('/empresas')
     def pagina_empresas():
@@ -27,11 +27,17 @@ from fiscal_auditor import crud, schemas, db_models
 from fiscal_auditor.auth import criar_token_acesso, obter_usuario_atual, verificar_acesso_empresa
 from fiscal_auditor.exportador import ExportadorRelatorios
 from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from datalake_integration import (
+    ApuradorDatalake,
     buscar_documentos_periodo,
+    filtro_vigente,
     verificar_documentos_disponiveis,
     obter_estatisticas_datalake
 )
+from perfil_requisicoes import instalar_perfil, perfil_habilitado
+from etl_service.consultas_lentas import consultas_lentas_habilitado, monitorar_engines
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -52,12 +58,22 @@ class ProcessarDatalakeRequest(BaseModel):
     data_inicio: str
     data_fim: str
     tipo_data: str
+    apenas_totais: bool = True
+
+class ApuracaoIncrementalRequest(BaseModel):
+    empresa_id: int
+    data_inicio: str
+    data_fim: str
+    tipo_data: str = "emissao"
 
 # Lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Inicializa o banco de dados na inicialização."""
     init_db()
+    # Log de consultas lentas do datalake (opt-in: CONSULTAS_LENTAS=true)
+    if consultas_lentas_habilitado():
+        monitorar_engines()
     yield
 
 app = FastAPI(
@@ -66,6 +82,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Perfil de requisições (opt-in: PERFIL_REQUISICOES=true); antes das rotas
+monitor_perfil = instalar_perfil(app) if perfil_habilitado() else None
+
 # Configurar templates e arquivos estáticos
 templates = Jinja2Templates(directory="templates")
 
@@ -78,6 +97,7 @@ dados_sessao = {
     "documentos": [],
     "validacoes": [],
     "mapa": None,
+    "resumo": None,
     "relatorios": {}
 }
 
@@ -231,80 +251,61 @@ async def processar_datalake(
         dados_sessao["documentos"] = []
         dados_sessao["validacoes"] = []
         dados_sessao["mapa"] = None
+        dados_sessao["resumo"] = None
         dados_sessao["relatorios"] = {}
         dados_sessao["empresa_id"] = dados.empresa_id
         dados_sessao["filtro_data_tipo"] = dados.tipo_data
         dados_sessao["filtro_data_inicio"] = dados.data_inicio
         dados_sessao["filtro_data_fim"] = dados.data_fim
         dados_sessao["fonte_dados"] = "datalake"
+        dados_sessao["apurador_pendente"] = None
         
-        # Buscar documentos do datalake
-        documentos = buscar_documentos_periodo(
+        # Apuração executada no banco do datalake (somente as somas, sem carregar itens)
+        apurador = ApuradorDatalake(
             cnpj=empresa.cnpj,
             data_inicio=data_inicio_dt,
             data_fim=data_fim_dt,
-            tipo_data=dados.tipo_data,
-            incluir_itens=True
+            tipo_data=dados.tipo_data
         )
         
-        if not documentos:
+        resumo = apurador.obter_resumo()
+        if not resumo['total_documentos']:
             return JSONResponse({
                 "success": False,
                 "message": "Nenhum documento encontrado no datalake para o período selecionado"
             }, status_code=400)
         
-        # Inicializar componentes
-        validador = ValidadorTributario()
-        apurador = ApuradorTributario()
-        gerador = GeradorRelatorios()
-        
-        validacoes = []
-        
-        # Processar documentos
-        for doc in documentos:
-            # Validar
-            validacao = validador.validar_documento(doc)
-            validacoes.append(validacao)
-            
-            # Adicionar para apuração
-            apurador.adicionar_documento(doc)
-        
         # Calcular período
-        datas = [doc.data_emissao for doc in documentos if doc.data_emissao]
-        if datas:
-            data_mais_antiga = min(datas)
+        if resumo['data_mais_antiga']:
+            data_mais_antiga = resumo['data_mais_antiga']
             periodo = f"{data_mais_antiga.month:02d}/{data_mais_antiga.year}"
         else:
-            data_inicio_obj = datetime.strptime(data_inicio, "%Y-%m-%d")
+            data_inicio_obj = datetime.strptime(dados.data_inicio, "%Y-%m-%d")
             periodo = f"{data_inicio_obj.month:02d}/{data_inicio_obj.year}"
         
         # Realizar apuração
         mapa = apurador.apurar(periodo)
         
-        # Gerar relatórios
-        relatorios = {
-            "entradas": gerador.gerar_demonstrativo_entradas(documentos),
-            "saidas": gerador.gerar_demonstrativo_saidas(documentos),
-            "mapa": gerador.gerar_mapa_apuracao(mapa),
-            "validacao": gerador.gerar_relatorio_validacao(validacoes),
-            "completo": gerador.gerar_relatorio_completo(documentos, mapa, validacoes)
-        }
-        
         # Armazenar na sessão
-        dados_sessao["documentos"] = documentos
-        dados_sessao["validacoes"] = validacoes
         dados_sessao["mapa"] = mapa
-        dados_sessao["relatorios"] = relatorios
+        dados_sessao["resumo"] = resumo
+        dados_sessao["relatorios"] = {"mapa": GeradorRelatorios().gerar_mapa_apuracao(mapa)}
+        dados_sessao["apurador_pendente"] = apurador
         dados_sessao["empresa"] = {
             "id": empresa.id,
             "cnpj": empresa.cnpj,
             "razao_social": empresa.razao_social
         }
         
+        # Documentos, validações e demonstrativos só são carregados pelas rotas de
+        # detalhe (documentos, relatórios, exportação), salvo apenas_totais=false
+        if not dados.apenas_totais:
+            _materializar_detalhes()
+        
         return JSONResponse({
             "success": True,
-            "message": f"{len(documentos)} documento(s) processado(s) do datalake",
-            "total_documentos": len(documentos),
+            "message": f"{resumo['total_documentos']} documento(s) processado(s) do datalake",
+            "total_documentos": resumo['total_documentos'],
             "periodo": periodo,
             "fonte": "datalake"
         })
@@ -318,9 +319,43 @@ async def processar_datalake(
         }, status_code=500)
 
 
+def _materializar_detalhes():
+    """
+    Carrega os documentos de uma apuração feita no datalake e gera validações e relatórios.
+    
+    Não faz nada se a sessão não tiver uma apuração pendente de detalhamento.
+    """
+    apurador = dados_sessao.get("apurador_pendente")
+    if apurador is None:
+        return
+    
+    documentos = apurador.documentos
+    
+    validador = ValidadorTributario()
+    gerador = GeradorRelatorios()
+    
+    validacoes = [validador.validar_documento(doc) for doc in documentos]
+    mapa = dados_sessao["mapa"]
+    
+    # Gerar relatórios (uma única passada pelos documentos)
+    relatorios = gerador.gerar_relatorios_combinados(documentos, mapa, validacoes)
+    
+    dados_sessao["documentos"] = documentos
+    dados_sessao["validacoes"] = validacoes
+    dados_sessao["relatorios"] = relatorios
+    dados_sessao["apurador_pendente"] = None
+
+
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
-    """Exibe o dashboard com os resultados."""
+async def dashboard(request: Request, detalhes: bool = False):
+    """
+    Exibe o dashboard com os resultados.
+    
+    O resumo e o mapa de apuração vêm dos totais apurados no banco; a lista de
+    documentos e as validações só são carregadas com detalhes=true.
+    """
+    if detalhes:
+        _materializar_detalhes()
     if not dados_sessao["mapa"]:
         return templates.TemplateResponse("index.html", {
             "request": request,
@@ -330,15 +365,32 @@ async def dashboard(request: Request):
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "mapa": dados_sessao["mapa"],
+        "resumo": _resumo_dashboard(),
         "relatorios": dados_sessao["relatorios"],
         "documentos": dados_sessao["documentos"],
-        "validacoes": dados_sessao["validacoes"]
+        "validacoes": dados_sessao["validacoes"],
+        "detalhes_pendentes": dados_sessao.get("apurador_pendente") is not None
     })
 
 
+def _resumo_dashboard() -> dict:
+    """Quantidades e valores de entradas e saídas, dos relatórios ou dos totais do datalake."""
+    relatorios = dados_sessao["relatorios"]
+    if "entradas" in relatorios and "saidas" in relatorios:
+        return {
+            "total_documentos": len(dados_sessao["documentos"]),
+            "entradas": relatorios["entradas"]["quantidade_documentos"],
+            "saidas": relatorios["saidas"]["quantidade_documentos"],
+            "valor_entradas": relatorios["entradas"]["valor_total"],
+            "valor_saidas": relatorios["saidas"]["valor_total"],
+        }
+    return dados_sessao["resumo"]
+
+
 @app.get("/produtos", response_class=HTMLResponse)
 async def visao_produtos(request: Request):
     """Exibe a visão por produtos."""
+    _materializar_detalhes()
     if not dados_sessao["documentos"]:
         return templates.TemplateResponse("index.html", {
             "request": request,
@@ -372,6 +424,7 @@ async def visao_produtos(request: Request):
 @app.get("/analise-tributaria", response_class=HTMLResponse)
 async def analise_tributaria(request: Request):
     """Exibe análise tributária detalhada por produto."""
+    _materializar_detalhes()
     if not dados_sessao["documentos"]:
         return templates.TemplateResponse("index.html", {
             "request": request,
@@ -390,6 +443,8 @@ async def analise_tributaria(request: Request):
 @app.get("/api/relatorios/{tipo}")
 async def obter_relatorio(tipo: str):
     """Retorna um relatório específico em JSON."""
+    if tipo not in dados_sessao["relatorios"]:
+        _materializar_detalhes()
     if tipo not in dados_sessao["relatorios"]:
         return JSONResponse({
             "success": False,
@@ -402,9 +457,59 @@ async def obter_relatorio(tipo: str):
     )
 
 
+class _ValidacoesSobDemanda:
+    """Validações recalculadas a cada iteração sobre os documentos (sem guardar a lista)."""
+
+    def __init__(self, documentos):
+        self.documentos = documentos
+
+    def __iter__(self):
+        validador = ValidadorTributario()
+        for doc in self.documentos:
+            yield validador.validar_documento(doc)
+
+
+@app.get("/api/relatorios/{tipo}/stream")
+async def obter_relatorio_stream(tipo: str):
+    """
+    Retorna um relatório (entradas, saidas ou completo) em JSON gerado em partes.
+    
+    Em análises do datalake ainda não detalhadas, os documentos são lidos em
+    lotes durante a resposta, sem carregar o período inteiro na memória.
+    """
+    if tipo not in ("entradas", "saidas", "completo"):
+        return JSONResponse({
+            "success": False,
+            "message": "Relatório não encontrado"
+        }, status_code=404)
+    
+    mapa = dados_sessao["mapa"]
+    if mapa is None:
+        raise HTTPException(status_code=400, detail="Nenhum documento processado")
+    
+    apurador = dados_sessao.get("apurador_pendente")
+    if apurador is not None:
+        documentos = apurador.iterar_documentos()
+        validacoes = _ValidacoesSobDemanda(documentos)
+    else:
+        documentos = dados_sessao["documentos"]
+        validacoes = dados_sessao["validacoes"]
+    
+    gerador = GeradorRelatorios()
+    if tipo == "entradas":
+        partes = gerador.gerar_demonstrativo_entradas_stream(documentos)
+    elif tipo == "saidas":
+        partes = gerador.gerar_demonstrativo_saidas_stream(documentos)
+    else:
+        partes = gerador.gerar_relatorio_completo_stream(documentos, mapa, validacoes)
+    
+    return StreamingResponse(partes, media_type="application/json")
+
+
 @app.get("/api/documentos")
 async def listar_documentos():
     """Lista todos os documentos processados."""
+    _materializar_detalhes()
     docs = []
     for doc in dados_sessao["documentos"]:
         docs.append({
@@ -454,11 +559,11 @@ async def obter_estatisticas_fase1(
     db: Session = Depends(get_db)
 ):
     """Retorna estatísticas dos campos implementados na Fase 1."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, NFeItem
     from sqlalchemy import func, and_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         # Validar empresa_id
@@ -670,11 +775,11 @@ async def bi_conformidade(
     db: Session = Depends(get_db)
 ):
     """Visão 1: Conformidade Fiscal - Validações e erros."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func, and_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -688,11 +793,11 @@ async def bi_conformidade(
             NFe.emitente_cnpj == cnpj_filtro
         ).scalar() or 0
         
-        # Documentos cancelados (simulação - baseado em campos)
+        # Documentos cancelados (protocolo ou evento de cancelamento, ver etl_service/eventos.py)
         cancelados = etl_db.query(func.count(NFe.id)).filter(
             and_(
                 NFe.emitente_cnpj == cnpj_filtro,
-                NFe.tipo_operacao == 'cancelamento'  # Ajustar conforme modelo
+                NFe.situacao == 'Cancelada'
             )
         ).scalar() or 0
         
@@ -719,12 +824,12 @@ async def bi_exposicao(
     db: Session = Depends(get_db)
 ):
     """Visão 2: Exposição Tributária - Impacto financeiro dos impostos."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, NFeItem
     from sqlalchemy import func, and_
     from decimal import Decimal
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -732,6 +837,8 @@ async def bi_exposicao(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Somar todos os impostos
         impostos = etl_db.query(
@@ -742,7 +849,8 @@ async def bi_exposicao(
         ).join(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).first()
         
         icms_total = float(impostos.icms or 0)
@@ -756,7 +864,8 @@ async def bi_exposicao(
         valor_total = etl_db.query(
             func.sum(NFe.valor_total_nota)
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).scalar() or 0
         
         carga_efetiva = (total_impostos / float(valor_total) * 100) if valor_total > 0 else 0
@@ -769,6 +878,7 @@ async def bi_exposicao(
         ).filter(
             and_(
                 NFe.emitente_cnpj == cnpj_filtro,
+                vigente,
                 NFe.tipo_operacao == '0'
             )
         ).scalar() or 0
@@ -800,11 +910,11 @@ async def bi_parceiros(
     db: Session = Depends(get_db)
 ):
     """Visão 3: Operações por Parceiro - Volume e características."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func, and_, or_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -812,6 +922,8 @@ async def bi_parceiros(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Top parceiros (clientes e fornecedores)
         parceiros = etl_db.query(
@@ -822,7 +934,8 @@ async def bi_parceiros(
             or_(
                 NFe.emitente_cnpj == cnpj_filtro,
                 NFe.destinatario_cnpj == cnpj_filtro
-            )
+            ),
+            vigente
         ).group_by(
             func.coalesce(NFe.destinatario_razao_social, NFe.emitente_razao_social)
         ).order_by(
@@ -850,7 +963,8 @@ async def bi_parceiros(
             or_(
                 NFe.emitente_cnpj == cnpj_filtro,
                 NFe.destinatario_cnpj == cnpj_filtro
-            )
+            ),
+            vigente
         ).scalar() or 0
         
         # Concentração top 5
@@ -880,12 +994,12 @@ async def bi_temporalidade(
     db: Session = Depends(get_db)
 ):
     """Visão 4: Temporalidade e Sazonalidade - Padrões temporais."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func, extract
     from datetime import datetime, timedelta
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -893,10 +1007,13 @@ async def bi_temporalidade(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Total de documentos
         total_docs = etl_db.query(func.count(NFe.id)).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).scalar() or 1
         
         # Média diária (estimativa simples)
@@ -907,7 +1024,8 @@ async def bi_temporalidade(
             func.date(NFe.data_emissao).label('data'),
             func.count(NFe.id).label('quantidade')
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).group_by(
             func.date(NFe.data_emissao)
         ).order_by(
@@ -936,11 +1054,11 @@ async def bi_eficiencia(
     db: Session = Depends(get_db)
 ):
     """Visão 5: Eficiência Operacional - Métricas de performance."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, NFeItem
     from sqlalchemy import func, and_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -992,11 +1110,11 @@ async def bi_risco(
     db: Session = Depends(get_db)
 ):
     """Visão 6: Risco Fiscal e Auditoria - Indicadores de risco."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func, and_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1051,12 +1169,12 @@ async def bi_produto(
     db: Session = Depends(get_db)
 ):
     """Visão 7: Análise por Produto - NCM, CFOP e Tributação detalhada."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, NFeItem
     from sqlalchemy import func, case, distinct
     from collections import defaultdict
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1064,6 +1182,8 @@ async def bi_produto(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # ========== ANÁLISE POR NCM ==========
         analise_ncm = etl_db.query(
@@ -1092,6 +1212,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFeItem.ncm.isnot(None)
         ).group_by(
             NFeItem.ncm
@@ -1148,6 +1269,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFeItem.cfop.isnot(None)
         ).group_by(
             NFeItem.cfop
@@ -1224,6 +1346,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFeItem.ncm.isnot(None),
             NFeItem.cfop.isnot(None)
         ).group_by(
@@ -1282,7 +1405,8 @@ async def bi_produto(
         ).join(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).group_by(
             NFeItem.descricao,
             NFeItem.ncm,
@@ -1316,7 +1440,8 @@ async def bi_produto(
         ).join(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).scalar() or 0
         
         total_ncm_distintos = etl_db.query(
@@ -1325,6 +1450,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFeItem.ncm.isnot(None)
         ).scalar() or 0
         
@@ -1334,6 +1460,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFeItem.cfop.isnot(None)
         ).scalar() or 0
         
@@ -1375,6 +1502,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '0',  # Entrada
             NFeItem.situacao_tributaria_icms.isnot(None)
         ).group_by(
@@ -1408,6 +1536,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '1',  # Saída
             NFeItem.situacao_tributaria_icms.isnot(None)
         ).group_by(
@@ -1478,6 +1607,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '0',  # Entrada
             NFeItem.situacao_tributaria_pis.isnot(None)
         ).group_by(
@@ -1511,6 +1641,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '1',  # Saída
             NFeItem.situacao_tributaria_pis.isnot(None)
         ).group_by(
@@ -1547,6 +1678,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '0',  # Entrada
             NFeItem.situacao_tributaria_cofins.isnot(None)
         ).group_by(
@@ -1580,6 +1712,7 @@ async def bi_produto(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
             NFe.emitente_cnpj == cnpj_filtro,
+            vigente,
             NFe.tipo_operacao == '1',  # Saída
             NFeItem.situacao_tributaria_cofins.isnot(None)
         ).group_by(
@@ -1644,12 +1777,12 @@ async def bi_integracao(
     db: Session = Depends(get_db)
 ):
     """Visão 8: Performance de Integrações - Qualidade dos dados."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, ArquivoProcessado
     from sqlalchemy import func
     from datetime import datetime, timedelta
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1697,11 +1830,11 @@ async def bi_benchmarking(
     db: Session = Depends(get_db)
 ):
     """Visão 9: Benchmarking Interno - Comparações entre períodos."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func, extract
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1709,6 +1842,8 @@ async def bi_benchmarking(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Performance por mês
         performance_mensal = etl_db.query(
@@ -1716,7 +1851,8 @@ async def bi_benchmarking(
             func.count(NFe.id).label('quantidade'),
             func.sum(NFe.valor_total_nota).label('valor_total')
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).group_by(
             extract('month', NFe.data_emissao)
         ).order_by(
@@ -1752,11 +1888,11 @@ async def bi_preditiva(
     db: Session = Depends(get_db)
 ):
     """Visão 10: Visão Preditiva e de Otimização - Projeções e insights."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe
     from sqlalchemy import func
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1764,12 +1900,15 @@ async def bi_preditiva(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Valor total atual
         valor_atual = etl_db.query(
             func.sum(NFe.valor_total_nota)
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).scalar() or 0
         
         # Projeção próximo mês (estimativa simples)
@@ -1804,11 +1943,11 @@ async def bi_reforma(
     db: Session = Depends(get_db)
 ):
     """Visão 11: Reforma Tributária - IBS e CBS."""
-    from etl_service.database import SessionLocal
+    from etl_service.roteamento import sessao_leitura
     from etl_service.models import NFe, NFeItem
     from sqlalchemy import func, and_
     
-    etl_db = SessionLocal()
+    etl_db = sessao_leitura()
     
     try:
         empresa = crud.obter_empresa(db, empresa_id)
@@ -1816,10 +1955,13 @@ async def bi_reforma(
             raise HTTPException(status_code=404, detail="Empresa não encontrada")
         
         cnpj_filtro = empresa.cnpj.replace(".", "").replace("/", "").replace("-", "")
+        # Notas canceladas ou denegadas não entram nos agregados
+        vigente = filtro_vigente()
         
         # Total de documentos
         total_docs = etl_db.query(func.count(NFe.id)).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).scalar() or 1
         
         # Somar IBS e CBS
@@ -1831,7 +1973,8 @@ async def bi_reforma(
         ).join(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).first()
         
         total_ibs = float(totais_reforma.ibs or 0)
@@ -1846,6 +1989,7 @@ async def bi_reforma(
         ).filter(
             and_(
                 NFe.emitente_cnpj == cnpj_filtro,
+                vigente,
                 NFeItem.valor_ibs.isnot(None)
             )
         ).scalar() or 0
@@ -1857,7 +2001,8 @@ async def bi_reforma(
         ).join(
             NFe, NFe.id == NFeItem.nfe_id
         ).filter(
-            NFe.emitente_cnpj == cnpj_filtro
+            NFe.emitente_cnpj == cnpj_filtro,
+            vigente
         ).first()
         
         total_pis_cofins = float((totais_antigos.pis or 0) + (totais_antigos.cofins or 0))
@@ -1878,6 +2023,7 @@ async def bi_reforma(
         ).filter(
             and_(
                 NFe.emitente_cnpj == cnpj_filtro,
+                vigente,
                 NFeItem.valor_ibs.isnot(None)
             )
         ).group_by(
@@ -1907,6 +2053,7 @@ async def bi_reforma(
         ).filter(
             and_(
                 NFe.emitente_cnpj == cnpj_filtro,
+                vigente,
                 NFeItem.situacao_tributaria_ibscbs.isnot(None)
             )
         ).group_by(
@@ -2168,6 +2315,74 @@ async def listar_analises_empresa(
     return crud.listar_analises_empresa(db, empresa_id, skip=skip, limit=limit)
 
 
+@app.post("/api/analises/incremental", tags=["Análises"])
+async def apurar_analise_incremental(
+    dados: ApuracaoIncrementalRequest,
+    usuario_atual: schemas.UsuarioResponse = Depends(obter_usuario_atual),
+    db: Session = Depends(get_db)
+):
+    """
+    Atualiza a análise do período aplicando apenas o que mudou no datalake.
+    
+    Se ainda não existe análise para (empresa, período), ou se ela foi gerada com
+    outro filtro, a apuração completa é executada e gravada.
+    """
+    if not verificar_acesso_empresa(usuario_atual, dados.empresa_id, db):
+        raise HTTPException(status_code=403, detail="Você não tem acesso a esta empresa")
+    
+    empresa = crud.obter_empresa(db, dados.empresa_id)
+    if not empresa:
+        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+    
+    data_inicio_dt = datetime.strptime(dados.data_inicio, "%Y-%m-%d").date()
+    data_fim_dt = datetime.strptime(dados.data_fim, "%Y-%m-%d").date()
+    periodo = f"{data_inicio_dt.month:02d}/{data_inicio_dt.year}"
+    
+    db_analise = crud.obter_analise_periodo(db, dados.empresa_id, periodo)
+    acumuladores = json.loads(db_analise.acumuladores) \
+        if db_analise and db_analise.acumuladores else None
+    
+    # A réplica só serve se já enxerga tudo o que a análise anterior apurou
+    apurador = ApuradorDatalake(
+        cnpj=empresa.cnpj,
+        data_inicio=data_inicio_dt,
+        data_fim=data_fim_dt,
+        tipo_data=dados.tipo_data,
+        watermark_minimo=db_analise.watermark_etl if db_analise else None
+    )
+    
+    # Watermark e somas são lidos no mesmo snapshot (ver ApuradorDatalake._sessao_consistente)
+    if db_analise and db_analise.watermark_etl and apurador.acumuladores_compativeis(acumuladores):
+        mapa = apurador.apurar_incremental(periodo, acumuladores, db_analise.watermark_etl)
+        # Notas já apuradas alteradas no datalake (upsert) levam à apuração completa
+        modo = "incremental" if apurador.delta is not None else "completo"
+    else:
+        mapa = apurador.apurar_acumulavel(periodo)
+        modo = "completo"
+    watermark = apurador.watermark
+    
+    db_analise = crud.salvar_apuracao_analise(
+        db,
+        dados.empresa_id,
+        mapa,
+        apurador.obter_resumo(),
+        apurador.exportar_acumuladores(),
+        watermark,
+        db_analise=db_analise
+    )
+    
+    return {
+        "success": True,
+        "analise_id": db_analise.id,
+        "periodo": periodo,
+        "modo": modo,
+        "documentos_novos": apurador.delta["novos"] if apurador.delta else None,
+        "documentos_cancelados": apurador.delta["cancelados"] if apurador.delta else None,
+        "total_documentos": db_analise.total_documentos,
+        "watermark_etl": watermark.isoformat() if watermark else None
+    }
+
+
 @app.get("/api/analises/{analise_id}", tags=["Análises"])
 async def obter_analise(analise_id: int, db: Session = Depends(get_db)):
     """Obtém detalhes de uma análise."""
@@ -2196,10 +2411,17 @@ async def deletar_analise(analise_id: int, db: Session = Depends(get_db)):
 @app.get("/api/export/excel", tags=["Exportação"])
 async def exportar_excel(
     analise_id: int = None,
+    streaming: bool = False,
     usuario_atual: db_models.Usuario = Depends(obter_usuario_atual),
     db: Session = Depends(get_db)
 ):
-    """Exporta o relatório para Excel."""
+    """
+    Exporta o relatório para Excel.
+    
+    Com streaming=true o arquivo é gerado em modo write-only em um arquivo
+    temporário (memória independente da quantidade de documentos) e as análises
+    do datalake ainda não detalhadas são lidas em lotes.
+    """
     # Se analise_id foi fornecido, busca do banco
     if analise_id:
         db_analise = crud.obter_analise(db, analise_id)
@@ -2213,8 +2435,19 @@ async def exportar_excel(
         # Carregar dados do banco
         dados_relatorio = json.loads(db_analise.relatorio_completo)
         periodo = db_analise.periodo
+    elif streaming and dados_sessao.get("apurador_pendente") is not None:
+        # Apuração do datalake sem detalhes carregados: ler documentos em lotes
+        documentos = dados_sessao["apurador_pendente"].iterar_documentos()
+        dados_relatorio = {
+            "mapa": dados_sessao["mapa"],
+            "documentos": documentos,
+            "validacoes": _ValidacoesSobDemanda(documentos),
+            "empresa": {}
+        }
+        periodo = dados_sessao["mapa"].periodo
     else:
         # Usar dados da sessão atual
+        _materializar_detalhes()
         if not dados_sessao["documentos"]:
             raise HTTPException(status_code=400, detail="Nenhum documento processado")
         
@@ -2226,15 +2459,26 @@ async def exportar_excel(
         }
         periodo = dados_sessao["mapa"].periodo if dados_sessao["mapa"] else "Período não definido"
     
-    # Gerar Excel
+    nome_arquivo = f"relatorio_fiscal_{periodo.replace('/', '_')}.xlsx"
     exportador = ExportadorRelatorios()
+    
+    if streaming:
+        caminho = await run_in_threadpool(exportador.gerar_excel_streaming, dados_relatorio)
+        return FileResponse(
+            caminho,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename=nome_arquivo,
+            background=BackgroundTask(os.remove, caminho)
+        )
+    
+    # Gerar Excel
     arquivo_excel = exportador.gerar_excel(dados_relatorio)
     
     # Retornar arquivo
     return StreamingResponse(
         arquivo_excel,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=relatorio_fiscal_{periodo.replace('/', '_')}.xlsx"}
+        headers={"Content-Disposition": f"attachment; filename={nome_arquivo}"}
     )
 
 
@@ -2260,6 +2504,7 @@ async def exportar_pdf(
         periodo = db_analise.periodo
     else:
         # Usar dados da sessão atual
+        _materializar_detalhes()
         if not dados_sessao["documentos"]:
             raise HTTPException(status_code=400, detail="Nenhum documento processado")
         
@@ -2283,6 +2528,19 @@ async def exportar_pdf(
     )
 
 
+# ============= DIAGNÓSTICO =============
+
+@app.get("/api/perfil/rotas", tags=["Diagnóstico"])
+async def perfil_rotas(
+    limite: int = 20,
+    usuario_atual: schemas.UsuarioResponse = Depends(obter_usuario_atual)
+):
+    """Rotas e requisições mais lentas, com SQL, CPU e serialização (requer PERFIL_REQUISICOES=true)."""
+    if monitor_perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil de requisições desabilitado (PERFIL_REQUISICOES)")
+    return monitor_perfil.resumo_rotas(limite)
+
+
 if __name__ == "__main__":
     import uvicorn
     print("=" * 80)
@@ -0,0 +1,332 @@
+"""
+Benchmark do núcleo do auditor (leitura → validação → apuração → relatórios).
+
+Gera um corpus sintético determinístico (gerador_nfe) para cada escala,
+medida em linhas de tributo (um Tributo de um item), e mede o tempo e o
+pico de memória (tracemalloc) de cada etapa:
+
+- XMLReader.ler_xml
+- ValidadorTributario.validar_documento
+- ApuradorTributario.apurar
+- cada método público de GeradorRelatorios
+- ExportadorRelatorios.gerar_excel, gerar_excel_streaming e gerar_pdf
+
+O tempo é medido sem tracemalloc e o pico de memória em uma segunda execução
+da etapa (o rastreamento deixa o código várias vezes mais lento). O resultado
+é gravado em JSON, identificado pelo commit, para comparar execuções.
+
+Uma etapa que falha (ex.: MemoryError) é registrada com o erro; as etapas que
+dependem dela são puladas e as demais continuam.
+
+Exemplos:
+    python -m benchmarks.bench_auditor
+    python -m benchmarks.bench_auditor --escalas 1000 100000 1000000 --sem-memoria
+    python -m benchmarks.bench_auditor --escalas 100000 --etapas leitura validacao apuracao
+    python -m benchmarks.bench_auditor --comparar benchmarks/resultados/auditor-20240101-120000-abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RAIZ = Path(__file__).resolve().parent.parent
+DIRETORIO_RESULTADOS = Path(__file__).resolve().parent / 'resultados'
+
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / 'src'))
+
+from benchmarks.bench_etl import _commit  # noqa: E402
+from benchmarks.gerador_nfe import GRUPOS_TRIBUTOS, GeradorNFe  # noqa: E402
+from fiscal_auditor import ApuradorTributario, GeradorRelatorios, ValidadorTributario, XMLReader  # noqa: E402
+from fiscal_auditor.exportador import ExportadorRelatorios  # noqa: E402
+
+ESCALAS_PADRAO = (1000, 100000)
+PERIODO = '2024'
+
+
+def _consumir(partes) -> int:
+    """Percorre um gerador *_stream e retorna o total de caracteres."""
+    return sum(len(parte) for parte in partes)
+
+
+def _remover(caminho: str) -> str:
+    """Remove um arquivo gerado pela etapa."""
+    os.remove(caminho)
+    return caminho
+
+
+# (nome, dependências, função): cada função recebe o estado e retorna o valor
+# guardado em estado[nome], usado pelas etapas seguintes
+ETAPAS: List[Tuple[str, Tuple[str, ...], Callable[[Dict[str, Any]], Any]]] = [
+    ('leitura', (), lambda e: [e['reader'].ler_xml(a) for a in e['arquivos']]),
+    ('validacao', ('leitura',),
+     lambda e: [e['validador'].validar_documento(d) for d in e['leitura']]),
+    ('apuracao', ('leitura',), lambda e: _apurar(e['leitura'])),
+
+    ('relatorios.demonstrativo_entradas', ('leitura',),
+     lambda e: e['relatorios'].gerar_demonstrativo_entradas(e['leitura'])),
+    ('relatorios.demonstrativo_saidas', ('leitura',),
+     lambda e: e['relatorios'].gerar_demonstrativo_saidas(e['leitura'])),
+    ('relatorios.mapa_apuracao', ('apuracao',),
+     lambda e: e['relatorios'].gerar_mapa_apuracao(e['apuracao'])),
+    ('relatorios.validacao', ('validacao',),
+     lambda e: e['relatorios'].gerar_relatorio_validacao(e['validacao'])),
+    ('relatorios.completo', ('leitura', 'apuracao', 'validacao'),
+     lambda e: e['relatorios'].gerar_relatorio_completo(e['leitura'], e['apuracao'], e['validacao'])),
+    ('relatorios.combinados', ('leitura', 'apuracao', 'validacao'),
+     lambda e: e['relatorios'].gerar_relatorios_combinados(e['leitura'], e['apuracao'], e['validacao'])),
+    ('relatorios.por_produto', ('leitura',),
+     lambda e: e['relatorios'].gerar_relatorio_por_produto(e['leitura'])),
+    ('relatorios.analise_tributaria_produtos', ('leitura',),
+     lambda e: e['relatorios'].gerar_analise_tributaria_produtos(e['leitura'])),
+    ('relatorios.exportar_json_str', ('relatorios.completo',),
+     lambda e: len(e['relatorios'].exportar_json_str(e['relatorios.completo']))),
+    ('relatorios.exportar_json', ('relatorios.completo',),
+     lambda e: e['relatorios'].exportar_json(e['relatorios.completo'], str(e['base'] / 'completo.json'))),
+    ('relatorios.demonstrativo_entradas_stream', ('leitura',),
+     lambda e: _consumir(e['relatorios'].gerar_demonstrativo_entradas_stream(e['leitura']))),
+    ('relatorios.demonstrativo_saidas_stream', ('leitura',),
+     lambda e: _consumir(e['relatorios'].gerar_demonstrativo_saidas_stream(e['leitura']))),
+    ('relatorios.completo_stream', ('leitura', 'apuracao', 'validacao'),
+     lambda e: _consumir(e['relatorios'].gerar_relatorio_completo_stream(
+         e['leitura'], e['apuracao'], e['validacao']))),
+    ('relatorios.exportar_json_stream', ('leitura', 'apuracao', 'validacao'),
+     lambda e: e['relatorios'].exportar_json_stream(
+         e['relatorios'].gerar_relatorio_completo_stream(e['leitura'], e['apuracao'], e['validacao']),
+         str(e['base'] / 'completo_stream.json'))),
+
+    ('exportacao.excel', ('sessao',), lambda e: ExportadorRelatorios.gerar_excel(e['sessao']).getbuffer().nbytes),
+    ('exportacao.excel_streaming', ('sessao',),
+     lambda e: _remover(ExportadorRelatorios.gerar_excel_streaming(e['sessao']))),
+    ('exportacao.pdf', ('sessao',), lambda e: ExportadorRelatorios.gerar_pdf(e['sessao']).getbuffer().nbytes),
+]
+
+NOMES_ETAPAS = [nome for nome, _, _ in ETAPAS]
+
+
+def _apurar(documentos):
+    """Apura o período com um apurador novo."""
+    apurador = ApuradorTributario()
+    apurador.adicionar_documentos(documentos)
+    return apurador.apurar(PERIODO)
+
+
+def _linhas_tributo(documento) -> int:
+    """Quantidade de linhas de tributo (tributos de todos os itens) do documento."""
+    return sum(len(item.tributos) for item in documento.items)
+
+
+def gerar_corpus(gerador: GeradorNFe, cnpj: str, linhas: int, diretorio: Path) -> Dict[str, Any]:
+    """
+    Grava documentos até alcançar a quantidade de linhas de tributo.
+
+    As linhas são contadas com o próprio XMLReader (fora da medição).
+
+    Args:
+        gerador: Gerador do corpus
+        cnpj: CNPJ da empresa auditada
+        linhas: Linhas de tributo desejadas
+        diretorio: Diretório dos XMLs
+
+    Returns:
+        Dicionário com arquivos, documentos, itens, linhas e bytes
+    """
+    diretorio.mkdir(parents=True, exist_ok=True)
+    reader = XMLReader(cnpj)
+    corpus = {'arquivos': [], 'documentos': 0, 'itens': 0, 'linhas': 0, 'bytes': 0}
+
+    while corpus['linhas'] < linhas:
+        numero = corpus['documentos'] + 1
+        conteudo = gerador.gerar(numero)
+        caminho = diretorio / f'{numero:09d}-nfe.xml'
+        caminho.write_bytes(conteudo)
+
+        documento = reader.ler_xml_bytes(conteudo)
+        corpus['arquivos'].append(str(caminho))
+        corpus['documentos'] += 1
+        corpus['itens'] += len(documento.items)
+        corpus['linhas'] += _linhas_tributo(documento)
+        corpus['bytes'] += len(conteudo)
+
+    return corpus
+
+
+def _medir(nome: str, funcao: Callable[[], Any], linhas: int, memoria: bool) -> Tuple[Dict[str, Any], Any]:
+    """
+    Executa uma etapa e mede tempo, linhas/s e, opcionalmente, o pico de memória.
+
+    Returns:
+        (medição, valor retornado pela etapa)
+    """
+    inicio = time.perf_counter()
+    valor = funcao()
+    segundos = time.perf_counter() - inicio
+
+    resultado = {
+        'segundos': round(segundos, 4),
+        'linhas_s': round(linhas / segundos, 1) if segundos else None,
+    }
+
+    if memoria:
+        # Só as alocações da própria etapa entram no pico (entradas já existem)
+        tracemalloc.start()
+        try:
+            funcao()
+            resultado['pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        finally:
+            tracemalloc.stop()
+
+    pico = f"{resultado['pico_mb']:>9.1f} MB" if 'pico_mb' in resultado else ''
+    print(f"  {nome:<42} {resultado['segundos']:>9.3f} s  {resultado['linhas_s'] or 0:>12.1f} linhas/s{pico}")
+    return resultado, valor
+
+
+def medir_escala(args, gerador: GeradorNFe, linhas: int, base: Path) -> Dict[str, Any]:
+    """Gera o corpus de uma escala e mede as etapas selecionadas."""
+    cnpj = gerador.emitentes[0]
+
+    print(f"\nEscala {linhas} linhas de tributo: gerando corpus...")
+    corpus = gerar_corpus(gerador, cnpj, linhas, base / 'xml')
+    print(f"  {corpus['documentos']} documentos, {corpus['itens']} itens, "
+          f"{corpus['linhas']} linhas, {corpus['bytes'] / 1024 / 1024:.1f} MB")
+
+    estado: Dict[str, Any] = {
+        'arquivos': corpus.pop('arquivos'),
+        'base': base,
+        'reader': XMLReader(cnpj),
+        'validador': ValidadorTributario(),
+        'relatorios': GeradorRelatorios(),
+    }
+    etapas: Dict[str, Any] = {}
+
+    for nome, dependencias, funcao in ETAPAS:
+        if nome not in args.etapas:
+            continue
+
+        # A sessão de exportação é montada a partir das etapas principais
+        if nome.startswith('exportacao.') and 'sessao' not in estado and \
+                all(d in estado for d in ('leitura', 'apuracao', 'validacao')):
+            estado['sessao'] = {
+                'mapa': estado['apuracao'],
+                'documentos': estado['leitura'],
+                'validacoes': estado['validacao'],
+                'empresa': {'cnpj': cnpj, 'razao_social': 'EMPRESA BENCHMARK'},
+            }
+
+        faltando = [d for d in dependencias if d not in estado]
+        if faltando:
+            etapas[nome] = {'pulada': f"depende de {', '.join(faltando)}"}
+            print(f"  {nome:<42} pulada ({etapas[nome]['pulada']})")
+            continue
+
+        try:
+            etapas[nome], estado[nome] = _medir(nome, lambda: funcao(estado), corpus['linhas'], args.memoria)
+        except Exception as e:  # inclui MemoryError
+            etapas[nome] = {'erro': f'{type(e).__name__}: {e}'}
+            print(f"  {nome:<42} ERRO {etapas[nome]['erro']}")
+
+    for arquivo in estado['arquivos']:
+        os.remove(arquivo)
+
+    return {'corpus': corpus, 'etapas': etapas}
+
+
+def executar(args) -> Dict[str, Any]:
+    """Mede todas as escalas e retorna o resultado."""
+    gerador = GeradorNFe(
+        semente=args.semente,
+        itens=args.itens,
+        grupos=args.grupos,
+        proporcao_nfce=args.proporcao_nfce,
+        proporcao_entradas=args.proporcao_entradas,
+    )
+
+    escalas = {}
+    with tempfile.TemporaryDirectory(prefix='bench_auditor_') as temporario:
+        for linhas in args.escalas:
+            escalas[str(linhas)] = medir_escala(args, gerador, linhas, Path(temporario))
+
+    return {
+        'benchmark': 'auditor',
+        'commit': _commit(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {
+            'semente': args.semente,
+            'itens': list(args.itens),
+            'grupos': list(args.grupos),
+            'proporcao_nfce': args.proporcao_nfce,
+            'proporcao_entradas': args.proporcao_entradas,
+            'memoria': args.memoria,
+            'etapas': list(args.etapas),
+        },
+        'escalas': escalas,
+    }
+
+
+def comparar(atual: Dict[str, Any], anterior: Dict[str, Any]):
+    """Imprime a variação de tempo e de pico de memória por escala e etapa."""
+    print(f"\nComparação com {anterior['commit']} ({anterior['data']}):")
+    if anterior.get('parametros') != atual.get('parametros'):
+        print("  ATENÇÃO: parâmetros diferentes, a comparação não é direta")
+
+    for escala, resultado in atual['escalas'].items():
+        etapas_antes = anterior['escalas'].get(escala, {}).get('etapas', {})
+        if not etapas_antes:
+            continue
+
+        print(f"  Escala {escala}:")
+        for etapa, valores in resultado['etapas'].items():
+            antes = etapas_antes.get(etapa, {})
+            if not antes.get('segundos') or not valores.get('segundos'):
+                continue
+            linha = (f"    {etapa:<42} {antes['segundos']:>9.3f} -> {valores['segundos']:>9.3f} s "
+                     f"({(valores['segundos'] / antes['segundos'] - 1) * 100:+.1f}%)")
+            if antes.get('pico_mb') and valores.get('pico_mb'):
+                linha += f"  {antes['pico_mb']:.1f} -> {valores['pico_mb']:.1f} MB"
+            print(linha)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Ponto de entrada da linha de comando."""
+    parser = argparse.ArgumentParser(description='Benchmark do núcleo do auditor')
+    parser.add_argument('--escalas', type=int, nargs='+', default=list(ESCALAS_PADRAO),
+                        help='Linhas de tributo de cada escala (padrão: 1000 100000)')
+    parser.add_argument('--etapas', nargs='+', default=NOMES_ETAPAS, choices=NOMES_ETAPAS,
+                        help='Etapas medidas (padrão: todas)')
+    parser.add_argument('--sem-memoria', dest='memoria', action='store_false',
+                        help='Não mede o pico de memória (evita a segunda execução de cada etapa)')
+    parser.add_argument('--itens', type=int, nargs=2, default=(1, 20), metavar=('MIN', 'MAX'),
+                        help='Faixa de itens por documento (padrão: 1 20)')
+    parser.add_argument('--grupos', nargs='+', default=list(GRUPOS_TRIBUTOS), choices=GRUPOS_TRIBUTOS,
+                        help='Grupos de tributos gerados (padrão: todos)')
+    parser.add_argument('--proporcao-nfce', type=float, default=0.3, help='Fração de NFC-e (padrão: 0.3)')
+    parser.add_argument('--proporcao-entradas', type=float, default=0.4,
+                        help='Fração das NF-e geradas como entrada (padrão: 0.4)')
+    parser.add_argument('--semente', type=int, default=42, help='Semente do gerador (padrão: 42)')
+    parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: benchmarks/resultados/)')
+    parser.add_argument('--comparar', help='Resultado JSON anterior para comparação')
+    args = parser.parse_args(argv)
+
+    resultado = executar(args)
+
+    saida = Path(args.saida) if args.saida else \
+        DIRETORIO_RESULTADOS / f"auditor-{datetime.now():%Y%m%d-%H%M%S}-{resultado['commit']}.json"
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\nResultado gravado em {saida}")
+
+    if args.comparar:
+        comparar(resultado, json.loads(Path(args.comparar).read_text(encoding='utf-8')))
+
+
+if __name__ == '__main__':
+    main()
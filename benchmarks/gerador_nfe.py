@@ -0,0 +1,443 @@
+"""
+Gerador determinístico de XMLs sintéticos de NF-e/NFC-e para benchmarks.
+
+A ordem dos elementos de cada grupo vem do leiaute oficial
+(leiauteNFe_v4.00.xsd): o gerador monta os campos de cada grupo e os grava na
+sequência declarada no XSD, e um campo que não existe no leiaute é um erro.
+Grupos cujo tipo está em XSDs não incluídos no repositório (ex.: IBSCBS) são
+gravados na ordem em que foram montados, no formato lido pelo XMLExtractor.
+
+A mesma semente gera sempre os mesmos documentos: o documento N depende só da
+semente e de N, e não da ordem ou da quantidade gerada.
+"""
+import random
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from lxml import etree
+
+NS = 'http://www.portalfiscal.inf.br/nfe'
+NS_DSIG = 'http://www.w3.org/2000/09/xmldsig#'
+XS = '{http://www.w3.org/2001/XMLSchema}'
+
+XSD_PADRAO = Path(__file__).resolve().parent.parent / 'leiauteNFe_v4.00.xsd'
+
+GRUPOS_ICMS = ('icms00', 'icms10', 'icms20', 'icms40', 'icms60', 'icms61', 'icmssn102')
+GRUPOS_TRIBUTOS = GRUPOS_ICMS + ('ipi', 'pis_cofins', 'ibscbs')
+
+UFS = (('35', 'SP', '3550308', 'SAO PAULO'), ('33', 'RJ', '3304557', 'RIO DE JANEIRO'),
+       ('31', 'MG', '3106200', 'BELO HORIZONTE'), ('41', 'PR', '4106902', 'CURITIBA'),
+       ('43', 'RS', '4314902', 'PORTO ALEGRE'))
+NCMS = ('22030000', '27101259', '30049099', '39269090', '61091000', '84713012',
+        '85171231', '87089990', '94036000', '21069090')
+PRODUTOS = ('CERVEJA LATA 350ML', 'OLEO DIESEL S10', 'MEDICAMENTO GENERICO', 'PECA PLASTICA',
+            'CAMISETA ALGODAO', 'NOTEBOOK 14 POL', 'SMARTPHONE 128GB', 'PECA AUTOMOTIVA',
+            'MOVEL ESCRITORIO', 'SUPLEMENTO ALIMENTAR')
+CFOPS_SAIDA = ('5101', '5102', '6102')
+CFOPS_ENTRADA = ('1101', '1102', '2102')
+
+CENTAVOS = Decimal('0.01')
+
+
+def _dinheiro(valor: Decimal) -> str:
+    """Formata um valor monetário com 2 casas."""
+    return str(valor.quantize(CENTAVOS, rounding=ROUND_HALF_UP))
+
+
+def _digito_chave(chave43: str) -> str:
+    """Dígito verificador (módulo 11) da chave de acesso."""
+    pesos = [2, 3, 4, 5, 6, 7, 8, 9]
+    soma = sum(int(d) * pesos[i % 8] for i, d in enumerate(reversed(chave43)))
+    resto = soma % 11
+    return '0' if resto < 2 else str(11 - resto)
+
+
+class OrdemLeiaute:
+    """Ordem dos elementos de cada grupo segundo o XSD do leiaute."""
+
+    def __init__(self, caminho_xsd: Path = XSD_PADRAO):
+        """
+        Carrega o XSD.
+
+        Args:
+            caminho_xsd: Caminho do leiauteNFe_v4.00.xsd
+        """
+        self._xsd = etree.parse(str(caminho_xsd))
+        self._tipos = {
+            tipo.get('name'): tipo
+            for tipo in self._xsd.getroot().iter(f'{XS}complexType') if tipo.get('name')
+        }
+        self._cache: Dict[str, Optional[List[str]]] = {}
+
+    def ordem(self, grupo: str) -> Optional[List[str]]:
+        """
+        Retorna os elementos filhos de um grupo na ordem do leiaute.
+
+        Args:
+            grupo: Nome do elemento (ex.: 'ICMS10', 'prod', 'ICMSTot')
+
+        Returns:
+            Lista de nomes, ou None se o grupo não está definido neste XSD
+        """
+        if grupo not in self._cache:
+            self._cache[grupo] = self._ler_ordem(grupo)
+        return self._cache[grupo]
+
+    def _ler_ordem(self, grupo: str) -> Optional[List[str]]:
+        """Localiza a definição do grupo e achata suas sequências/escolhas."""
+        elemento = self._xsd.find(f'.//{XS}element[@name="{grupo}"]')
+        if elemento is None:
+            return None
+
+        tipo = elemento.find(f'{XS}complexType')
+        if tipo is None:
+            tipo = self._tipos.get(elemento.get('type'))
+        if tipo is None:
+            return None
+
+        nomes: List[str] = []
+        self._achatar(tipo, nomes)
+        return nomes
+
+    def _achatar(self, no, nomes: List[str]):
+        """Coleta os nomes dos elementos em ordem, sem entrar nos subgrupos."""
+        for filho in no:
+            if filho.tag == f'{XS}element':
+                nomes.append(filho.get('name') or filho.get('ref', '').split(':')[-1])
+            elif filho.tag in (f'{XS}sequence', f'{XS}choice', f'{XS}complexContent',
+                               f'{XS}extension', f'{XS}all'):
+                self._achatar(filho, nomes)
+
+
+class GeradorNFe:
+    """
+    Gera NF-e (modelo 55) e NFC-e (modelo 65) sintéticas e autorizadas (nfeProc).
+
+    Cada item recebe um grupo de ICMS sorteado entre os grupos de ICMS
+    habilitados e, conforme habilitados, IPI (só NF-e), PIS/COFINS e IBS/CBS.
+    """
+
+    def __init__(
+        self,
+        semente: int = 42,
+        itens: Sequence[int] = (1, 20),
+        grupos: Sequence[str] = GRUPOS_TRIBUTOS,
+        proporcao_nfce: float = 0.3,
+        proporcao_entradas: float = 0.0,
+        tamanho_minimo: int = 0,
+        emitentes: int = 20,
+        caminho_xsd: Path = XSD_PADRAO
+    ):
+        """
+        Configura o gerador.
+
+        Args:
+            semente: Semente dos sorteios
+            itens: Faixa (mínimo, máximo) de itens por documento
+            grupos: Grupos de tributos habilitados (ver GRUPOS_TRIBUTOS)
+            proporcao_nfce: Fração dos documentos gerados como NFC-e
+            proporcao_entradas: Fração das NF-e geradas como entrada
+                (tpNF 0, CFOP 1xxx/2xxx)
+            tamanho_minimo: Tamanho mínimo do XML em bytes, completado em infCpl
+                (até os 5000 caracteres do campo; acima disso, aumente os itens)
+            emitentes: Quantidade de CNPJs emitentes distintos
+            caminho_xsd: XSD que define a ordem dos elementos
+        """
+        desconhecidos = set(grupos) - set(GRUPOS_TRIBUTOS)
+        if desconhecidos:
+            raise ValueError(f"Grupos desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+        self.semente = semente
+        self.itens = (itens[0], itens[1])
+        self.grupos_icms = [g for g in grupos if g in GRUPOS_ICMS] or ['icms00']
+        self.grupos = set(grupos)
+        self.proporcao_nfce = proporcao_nfce
+        self.proporcao_entradas = proporcao_entradas
+        self.tamanho_minimo = tamanho_minimo
+        self.emitentes = [f'{10000000 + i * 7919:08d}0001{i % 90 + 10:02d}' for i in range(emitentes)]
+        self.leiaute = OrdemLeiaute(caminho_xsd)
+
+    # ------------------------------------------------------------------ XML
+
+    def _grupo(self, pai, nome: str, campos: Dict[str, Any]):
+        """
+        Grava um grupo com os campos na ordem do leiaute.
+
+        Valores: str (texto), dict (subgrupo), list (subgrupo repetido);
+        chaves iniciadas por '@' são atributos.
+        """
+        elemento = etree.SubElement(pai, f'{{{NS}}}{nome}')
+        ordem = self.leiaute.ordem(nome)
+
+        chaves = [c for c in campos if not c.startswith('@')]
+        if ordem is not None:
+            fora = [c for c in chaves if c not in ordem]
+            if fora:
+                raise ValueError(f"Campos fora do leiaute em {nome}: {', '.join(fora)}")
+            chaves.sort(key=ordem.index)
+
+        for chave in campos:
+            if chave.startswith('@'):
+                elemento.set(chave[1:], campos[chave])
+
+        for chave in chaves:
+            valor = campos[chave]
+            if isinstance(valor, dict):
+                self._grupo(elemento, chave, valor)
+            elif isinstance(valor, list):
+                for repetido in valor:
+                    self._grupo(elemento, chave, repetido)
+            elif valor is not None:
+                etree.SubElement(elemento, f'{{{NS}}}{chave}').text = valor
+
+        return elemento
+
+    # ------------------------------------------------------------ documento
+
+    def gerar(self, numero: int) -> bytes:
+        """
+        Gera o XML (nfeProc) do documento de número informado.
+
+        Args:
+            numero: Número sequencial do documento (define os sorteios)
+
+        Returns:
+            XML em bytes (UTF-8)
+        """
+        rng = random.Random(self.semente * 1_000_003 + numero)
+        modelo = '65' if rng.random() < self.proporcao_nfce else '55'
+        # Só sorteia quando habilitado, para não alterar os corpus já gerados
+        entrada = modelo == '55' and self.proporcao_entradas > 0 and rng.random() < self.proporcao_entradas
+        c_uf, uf, c_mun, x_mun = rng.choice(UFS)
+        cnpj = self.emitentes[rng.randrange(len(self.emitentes))]
+        mes = rng.randint(1, 12)
+        dia = rng.randint(1, 28)
+        serie = str(rng.randint(1, 3))
+        c_nf = f'{rng.randrange(10 ** 8):08d}'
+
+        chave43 = f'{c_uf}{24:02d}{mes:02d}{cnpj}{modelo}{int(serie):03d}{numero:09d}1{c_nf}'
+        chave = chave43 + _digito_chave(chave43)
+        emissao = f'2024-{mes:02d}-{dia:02d}T{rng.randint(8, 20):02d}:{rng.randint(0, 59):02d}:00-03:00'
+
+        quantidade_itens = rng.randint(*self.itens)
+        itens, totais = self._itens(rng, modelo, uf, quantidade_itens, entrada)
+
+        inf_nfe = {
+            '@Id': f'NFe{chave}',
+            '@versao': '4.00',
+            'ide': {
+                'cUF': c_uf, 'cNF': c_nf,
+                'natOp': 'COMPRA DE MERCADORIA' if entrada else 'VENDA DE MERCADORIA', 'mod': modelo, 'serie': serie, 'nNF': str(numero),
+                'dhEmi': emissao, 'tpNF': '0' if entrada else '1', 'idDest': '1', 'cMunFG': c_mun,
+                'tpImp': '4' if modelo == '65' else '1', 'tpEmis': '1', 'cDV': chave[-1],
+                'tpAmb': '1', 'finNFe': '1', 'indFinal': '1' if modelo == '65' else '0',
+                'indPres': '1', 'procEmi': '0', 'verProc': 'BENCH 1.0',
+            },
+            'emit': {
+                'CNPJ': cnpj,
+                'xNome': f'EMPRESA BENCHMARK {cnpj[:8]} LTDA',
+                'enderEmit': {
+                    'xLgr': 'RUA DO BENCHMARK', 'nro': str(rng.randint(1, 9999)), 'xBairro': 'CENTRO',
+                    'cMun': c_mun, 'xMun': x_mun, 'UF': uf, 'CEP': f'{rng.randrange(10 ** 8):08d}',
+                    'cPais': '1058', 'xPais': 'BRASIL',
+                },
+                'IE': f'{rng.randrange(10 ** 12):012d}',
+                'CRT': '1' if 'icmssn102' in self.grupos_icms and len(self.grupos_icms) == 1 else '3',
+            },
+            'det': itens,
+            'total': {'ICMSTot': totais},
+            'transp': {'modFrete': '9'},
+            'pag': {'detPag': [{'tPag': '01', 'vPag': totais['vNF']}]},
+        }
+
+        if modelo == '55':
+            inf_nfe['dest'] = {
+                'CNPJ': f'{rng.randrange(10 ** 14):014d}',
+                'xNome': 'CLIENTE BENCHMARK LTDA',
+                'enderDest': {
+                    'xLgr': 'AVENIDA DO CLIENTE', 'nro': str(rng.randint(1, 9999)), 'xBairro': 'CENTRO',
+                    'cMun': c_mun, 'xMun': x_mun, 'UF': uf, 'CEP': f'{rng.randrange(10 ** 8):08d}',
+                    'cPais': '1058', 'xPais': 'BRASIL',
+                },
+                'indIEDest': '9',
+            }
+
+        raiz = etree.Element(f'{{{NS}}}nfeProc', nsmap={None: NS})
+        raiz.set('versao', '4.00')
+        nfe = etree.SubElement(raiz, f'{{{NS}}}NFe')
+        info = self._grupo(nfe, 'infNFe', inf_nfe)
+        self._assinatura(nfe, rng, chave)
+
+        self._grupo(raiz, 'protNFe', {
+            '@versao': '4.00',
+            'infProt': {
+                'tpAmb': '1', 'verAplic': 'SVRS202401', 'chNFe': chave,
+                'dhRecbto': emissao, 'nProt': f'1{c_uf}{rng.randrange(10 ** 12):012d}',
+                'digVal': f'{rng.getrandbits(160):040x}', 'cStat': '100',
+                'xMotivo': 'Autorizado o uso da NF-e',
+            },
+        })
+
+        conteudo = etree.tostring(raiz, xml_declaration=True, encoding='UTF-8')
+        if len(conteudo) < self.tamanho_minimo:
+            complemento = 'INFORMACOES COMPLEMENTARES ' * ((self.tamanho_minimo - len(conteudo)) // 27 + 1)
+            self._grupo(info, 'infAdic', {'infCpl': complemento[:5000]})
+            conteudo = etree.tostring(raiz, xml_declaration=True, encoding='UTF-8')
+
+        return conteudo
+
+    def _itens(self, rng: random.Random, modelo: str, uf: str, quantidade: int, entrada: bool = False):
+        """Monta os itens (det) e os totais (ICMSTot) do documento."""
+        itens = []
+        soma = {chave: Decimal('0') for chave in
+                ('vBC', 'vICMS', 'vBCST', 'vST', 'qBCMonoRet', 'vICMSMonoRet',
+                 'vProd', 'vIPI', 'vPIS', 'vCOFINS')}
+
+        for n in range(1, quantidade + 1):
+            indice = rng.randrange(len(PRODUTOS))
+            quantidade_item = Decimal(rng.randint(1, 50))
+            unitario = Decimal(rng.randint(100, 500000)) / 100
+            valor = quantidade_item * unitario
+            soma['vProd'] += valor
+
+            imposto: Dict[str, Any] = {'ICMS': self._icms(rng, valor, quantidade_item, soma)}
+
+            if 'ipi' in self.grupos and modelo == '55':
+                v_ipi = valor * Decimal('0.05')
+                soma['vIPI'] += v_ipi
+                imposto['IPI'] = {'cEnq': '999', 'IPITrib': {
+                    'CST': '50', 'vBC': _dinheiro(valor), 'pIPI': '5.00', 'vIPI': _dinheiro(v_ipi)}}
+
+            if 'pis_cofins' in self.grupos:
+                v_pis, v_cofins = valor * Decimal('0.0165'), valor * Decimal('0.076')
+                soma['vPIS'] += v_pis
+                soma['vCOFINS'] += v_cofins
+                imposto['PIS'] = {'PISAliq': {
+                    'CST': '01', 'vBC': _dinheiro(valor), 'pPIS': '1.65', 'vPIS': _dinheiro(v_pis)}}
+                imposto['COFINS'] = {'COFINSAliq': {
+                    'CST': '01', 'vBC': _dinheiro(valor), 'pCOFINS': '7.60', 'vCOFINS': _dinheiro(v_cofins)}}
+
+            if 'ibscbs' in self.grupos:
+                imposto['IBSCBS'] = {
+                    'CST': '000',
+                    'IBS': {'vBC': _dinheiro(valor), 'pAliq': '0.10', 'vIBS': _dinheiro(valor * Decimal('0.001'))},
+                    'CBS': {'vBC': _dinheiro(valor), 'pAliq': '0.90', 'vCBS': _dinheiro(valor * Decimal('0.009'))},
+                }
+
+            itens.append({
+                '@nItem': str(n),
+                'prod': {
+                    'cProd': f'{indice + 1:06d}', 'cEAN': 'SEM GTIN', 'xProd': PRODUTOS[indice],
+                    'NCM': NCMS[indice], 'CFOP': '5102' if modelo == '65' else rng.choice(CFOPS_ENTRADA if entrada else CFOPS_SAIDA),
+                    'uCom': 'UN', 'qCom': f'{quantidade_item:.4f}', 'vUnCom': f'{unitario:.10f}',
+                    'vProd': _dinheiro(valor), 'cEANTrib': 'SEM GTIN', 'uTrib': 'UN',
+                    'qTrib': f'{quantidade_item:.4f}', 'vUnTrib': f'{unitario:.10f}', 'indTot': '1',
+                },
+                'imposto': imposto,
+            })
+
+        v_nf = soma['vProd'] + soma['vST'] + soma['vIPI']
+        totais = {
+            'vBC': _dinheiro(soma['vBC']), 'vICMS': _dinheiro(soma['vICMS']), 'vICMSDeson': '0.00',
+            'vFCP': '0.00', 'vBCST': _dinheiro(soma['vBCST']), 'vST': _dinheiro(soma['vST']),
+            'vFCPST': '0.00', 'vFCPSTRet': '0.00',
+            'vProd': _dinheiro(soma['vProd']), 'vFrete': '0.00', 'vSeg': '0.00', 'vDesc': '0.00',
+            'vII': '0.00', 'vIPI': _dinheiro(soma['vIPI']), 'vIPIDevol': '0.00',
+            'vPIS': _dinheiro(soma['vPIS']), 'vCOFINS': _dinheiro(soma['vCOFINS']), 'vOutro': '0.00',
+            'vNF': _dinheiro(v_nf),
+        }
+        if soma['qBCMonoRet']:
+            totais['qBCMonoRet'] = f"{soma['qBCMonoRet']:.4f}"
+            totais['vICMSMonoRet'] = _dinheiro(soma['vICMSMonoRet'])
+
+        return itens, totais
+
+    def _icms(self, rng: random.Random, valor: Decimal, quantidade: Decimal, soma: Dict[str, Decimal]) -> dict:
+        """Sorteia e monta o grupo de ICMS de um item, acumulando os totais."""
+        grupo = rng.choice(self.grupos_icms)
+        orig = str(rng.choice((0, 0, 0, 1, 2)))
+
+        if grupo == 'icms00':
+            v_icms = valor * Decimal('0.18')
+            soma['vBC'] += valor
+            soma['vICMS'] += v_icms
+            return {'ICMS00': {'orig': orig, 'CST': '00', 'modBC': '3', 'vBC': _dinheiro(valor),
+                               'pICMS': '18.00', 'vICMS': _dinheiro(v_icms)}}
+
+        if grupo == 'icms10':
+            v_icms = valor * Decimal('0.18')
+            bc_st = valor * Decimal('1.40')
+            v_st = bc_st * Decimal('0.18') - v_icms
+            soma['vBC'] += valor
+            soma['vICMS'] += v_icms
+            soma['vBCST'] += bc_st
+            soma['vST'] += v_st
+            return {'ICMS10': {'orig': orig, 'CST': '10', 'modBC': '3', 'vBC': _dinheiro(valor),
+                               'pICMS': '18.00', 'vICMS': _dinheiro(v_icms), 'modBCST': '4',
+                               'pMVAST': '40.00', 'vBCST': _dinheiro(bc_st), 'pICMSST': '18.00',
+                               'vICMSST': _dinheiro(v_st)}}
+
+        if grupo == 'icms20':
+            base = valor * Decimal('0.6667')
+            v_icms = base * Decimal('0.18')
+            soma['vBC'] += base
+            soma['vICMS'] += v_icms
+            return {'ICMS20': {'orig': orig, 'CST': '20', 'modBC': '3', 'pRedBC': '33.33',
+                               'vBC': _dinheiro(base), 'pICMS': '18.00', 'vICMS': _dinheiro(v_icms)}}
+
+        if grupo == 'icms40':
+            return {'ICMS40': {'orig': orig, 'CST': '40'}}
+
+        if grupo == 'icms60':
+            return {'ICMS60': {'orig': orig, 'CST': '60', 'vBCSTRet': _dinheiro(valor),
+                               'pST': '18.00', 'vICMSSTRet': _dinheiro(valor * Decimal('0.18'))}}
+
+        if grupo == 'icms61':
+            ad_rem = Decimal('1.1200')
+            v_mono = quantidade * ad_rem
+            soma['qBCMonoRet'] += quantidade
+            soma['vICMSMonoRet'] += v_mono
+            return {'ICMS61': {'orig': orig, 'CST': '61', 'qBCMonoRet': f'{quantidade:.4f}',
+                               'adRemICMSRet': f'{ad_rem:.4f}', 'vICMSMonoRet': _dinheiro(v_mono)}}
+
+        return {'ICMSSN102': {'orig': orig, 'CSOSN': '102'}}
+
+    def _assinatura(self, nfe, rng: random.Random, chave: str):
+        """Acrescenta um bloco Signature com o tamanho típico de uma assinatura real."""
+        assinatura = etree.SubElement(nfe, f'{{{NS_DSIG}}}Signature', nsmap={None: NS_DSIG})
+        info = etree.SubElement(assinatura, f'{{{NS_DSIG}}}SignedInfo')
+        referencia = etree.SubElement(info, f'{{{NS_DSIG}}}Reference', URI=f'#NFe{chave}')
+        etree.SubElement(referencia, f'{{{NS_DSIG}}}DigestValue').text = f'{rng.getrandbits(160):040x}'
+        etree.SubElement(assinatura, f'{{{NS_DSIG}}}SignatureValue').text = f'{rng.getrandbits(1024):0256x}'
+        chave_publica = etree.SubElement(etree.SubElement(assinatura, f'{{{NS_DSIG}}}KeyInfo'),
+                                         f'{{{NS_DSIG}}}X509Data')
+        etree.SubElement(chave_publica, f'{{{NS_DSIG}}}X509Certificate').text = \
+            f'{rng.getrandbits(8192):02048x}'
+
+    # ----------------------------------------------------------------- lote
+
+    def gerar_lote(self, diretorio: Path, quantidade: int, inicio: int = 1) -> Dict[str, int]:
+        """
+        Grava documentos em um diretório, um arquivo por documento.
+
+        Args:
+            diretorio: Diretório de destino (criado se não existir)
+            quantidade: Quantidade de documentos
+            inicio: Número do primeiro documento
+
+        Returns:
+            Dicionário com documentos, itens e bytes gerados
+        """
+        diretorio = Path(diretorio)
+        diretorio.mkdir(parents=True, exist_ok=True)
+        resumo = {'documentos': 0, 'itens': 0, 'bytes': 0}
+
+        for numero in range(inicio, inicio + quantidade):
+            conteudo = self.gerar(numero)
+            (diretorio / f'nfe_{numero:09d}.xml').write_bytes(conteudo)
+            resumo['documentos'] += 1
+            resumo['itens'] += conteudo.count(b'<det ')
+            resumo['bytes'] += len(conteudo)
+
+        return resumo
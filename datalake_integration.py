@@ -4,10 +4,10 @@ Integração entre o sistema fiscal-auditor e o datalake ETL.
 Este módulo permite buscar dados já processados do datalake em vez de 
 reprocessar arquivos XML.
 """
-from sqlalchemy import create_engine, func, and_, or_
+from sqlalchemy import create_engine, func, or_, case, select, union_all
 from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from datetime import datetime, date, timedelta
+from typing import List, Optional, Dict, Any, Iterable
 from decimal import Decimal
 import os
 
@@ -17,10 +17,13 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent / "etl_service"))
 
 from etl_service.models import NFe, NFeItem, NFeDuplicata
-from etl_service.database import engine as etl_engine, SessionLocal as ETLSessionLocal
+from etl_service.roteamento import fabrica_leitura, sessao_leitura
 
 # Importar modelos do fiscal-auditor
-from fiscal_auditor.models import DocumentoFiscal, Item, Tributo, TipoTributo, TipoDocumento, TipoMovimento
+from fiscal_auditor.models import (
+    DocumentoFiscal, Item, Tributo, TipoTributo, TipoDocumento, TipoMovimento,
+    ApuracaoTributo, MapaApuracao, MemoriaCalculo
+)
 
 
 
@@ -119,14 +122,200 @@ def converter_nfe_para_documento(nfe: NFe, itens: List[NFeItem] = None) -> Docum
     
     return doc
 
+# Situações em que a NF-e não produz efeito fiscal e fica fora da apuração
+SITUACOES_SEM_EFEITO = ('Cancelada', 'Denegada')
 
-def buscar_documentos_periodo(
+
+def _limpar_cnpj(cnpj: str) -> str:
+    """Remove a formatação de um CNPJ."""
+    return cnpj.replace(".", "").replace("/", "").replace("-", "")
+
+
+def _coluna_data(tipo_data: str):
+    """Retorna a coluna de data da NFe usada no filtro do período."""
+    if tipo_data == 'autorizacao':
+        return NFe.data_autorizacao
+    elif tipo_data == 'saida_entrada':
+        return NFe.data_saida_entrada
+    return NFe.data_emissao  # emissao (padrão)
+
+
+def filtro_vigente():
+    """Critério que exclui as notas canceladas ou denegadas."""
+    return or_(NFe.situacao.is_(None), NFe.situacao.notin_(SITUACOES_SEM_EFEITO))
+
+
+def _ramos_periodo(
+    cnpj_limpo: str,
+    data_inicio: date,
+    data_fim: date,
+    tipo_data: str = 'emissao',
+    tipo_operacao: Optional[str] = None,
+    apenas_vigentes: bool = True
+) -> list:
+    """
+    Monta os critérios dos dois ramos da consulta por empresa e período.
+    
+    Em vez de (emitente_cnpj = X OR destinatario_cnpj = X), que os planejadores
+    nem sempre conseguem resolver com índices, cada ramo filtra uma única
+    coluna de CNPJ e usa seu índice composto (CNPJ, data_emissao):
+    - Ramo 1: documentos emitidos pela empresa
+    - Ramo 2: documentos recebidos, exceto os já cobertos pelo ramo 1
+      (emitente = destinatário), para que UNION ALL não duplique notas
+    
+    Args:
+        cnpj_limpo: CNPJ da empresa (apenas números)
+        data_inicio: Data inicial do período
+        data_fim: Data final do período
+        tipo_data: Tipo de data para filtrar ('emissao', 'autorizacao', 'saida_entrada')
+        tipo_operacao: 'E' para entrada, 'S' para saída, None para ambos
+        apenas_vigentes: Se deve excluir as notas canceladas ou denegadas
+        
+    Returns:
+        Lista com as listas de critérios de cada ramo
+    """
+    coluna_data = _coluna_data(tipo_data)
+    
+    comuns = [
+        coluna_data >= datetime.combine(data_inicio, datetime.min.time()),
+        coluna_data <= datetime.combine(data_fim, datetime.max.time())
+    ]
+    
+    if apenas_vigentes:
+        comuns.append(filtro_vigente())
+    
+    if tipo_operacao == 'E':  # Entrada
+        comuns.append(NFe.tipo_operacao == '0')
+    elif tipo_operacao == 'S':  # Saída
+        comuns.append(NFe.tipo_operacao == '1')
+    
+    emitidos = [NFe.emitente_cnpj == cnpj_limpo] + comuns
+    recebidos = [
+        NFe.destinatario_cnpj == cnpj_limpo,
+        or_(NFe.emitente_cnpj.is_(None), NFe.emitente_cnpj != cnpj_limpo)
+    ] + comuns
+    
+    return [emitidos, recebidos]
+
+
+def _filtros_periodo(
+    cnpj_limpo: str,
+    data_inicio: date,
+    data_fim: date,
+    tipo_data: str = 'emissao',
+    tipo_operacao: Optional[str] = None,
+    apenas_vigentes: bool = True
+) -> list:
+    """
+    Monta os critérios de filtro (CNPJ, período e tipo de operação) da NFe.
+    
+    O filtro é NFe.id IN (ramo emitidos UNION ALL ramo recebidos), ver
+    _ramos_periodo.
+    
+    Args:
+        cnpj_limpo: CNPJ da empresa (apenas números)
+        data_inicio: Data inicial do período
+        data_fim: Data final do período
+        tipo_data: Tipo de data para filtrar ('emissao', 'autorizacao', 'saida_entrada')
+        tipo_operacao: 'E' para entrada, 'S' para saída, None para ambos
+        apenas_vigentes: Se deve excluir as notas canceladas ou denegadas
+        
+    Returns:
+        Lista de critérios para usar em filter()
+    """
+    ramos = _ramos_periodo(cnpj_limpo, data_inicio, data_fim, tipo_data, tipo_operacao, apenas_vigentes)
+    
+    return [NFe.id.in_(union_all(*(select(NFe.id).where(*criterios) for criterios in ramos)))]
+
+
+def contar_documentos_periodo(
+    session: Session,
+    cnpj: str,
+    data_inicio: date,
+    data_fim: date,
+    tipo_data: str = 'emissao',
+    apenas_vigentes: bool = True
+) -> Dict[str, int]:
+    """
+    Conta os documentos do período (total, entradas e saídas) em uma única consulta.
+    
+    Cada ramo de _ramos_periodo é lido pelo seu índice e as três contagens
+    saem da mesma agregação condicional.
+    
+    Args:
+        session: Sessão do datalake
+        cnpj: CNPJ da empresa
+        data_inicio: Data inicial
+        data_fim: Data final
+        tipo_data: Tipo de data para filtrar
+        apenas_vigentes: Se deve excluir as notas canceladas ou denegadas
+        
+    Returns:
+        Dicionário com total, entradas e saidas
+    """
+    ramos = _ramos_periodo(_limpar_cnpj(cnpj), data_inicio, data_fim, tipo_data,
+                           apenas_vigentes=apenas_vigentes)
+    documentos = union_all(
+        *(select(NFe.tipo_operacao.label('tipo_operacao')).where(*criterios) for criterios in ramos)
+    ).subquery()
+    
+    total, entradas, saidas = session.query(
+        func.count(),
+        func.coalesce(func.sum(case((documentos.c.tipo_operacao == '0', 1), else_=0)), 0),
+        func.coalesce(func.sum(case((documentos.c.tipo_operacao == '1', 1), else_=0)), 0)
+    ).select_from(documentos).one()
+    
+    return {
+        'total': total,
+        'entradas': int(entradas),
+        'saidas': int(saidas)
+    }
+
+
+def _consultar_documentos(
+    session: Session,
     cnpj: str,
     data_inicio: date,
     data_fim: date,
     tipo_data: str = 'emissao',
     tipo_operacao: Optional[str] = None,
     incluir_itens: bool = True
+) -> List[DocumentoFiscal]:
+    """
+    Executa a busca de documentos do período na sessão informada.
+    
+    Os itens são lidos com uma consulta nfe_id IN (...) por lote de notas
+    (DocumentosDatalake.TAMANHO_LOTE), e não uma consulta por nota.
+    """
+    filtros = _filtros_periodo(_limpar_cnpj(cnpj), data_inicio, data_fim, tipo_data, tipo_operacao)
+    
+    # Ordenar por data (id desempata notas com a mesma data)
+    nfes = session.query(NFe).filter(*filtros).order_by(_coluna_data(tipo_data), NFe.id).all()
+    
+    itens = {nfe.id: [] for nfe in nfes}
+    if incluir_itens:
+        ids = list(itens)
+        for inicio in range(0, len(ids), DocumentosDatalake.TAMANHO_LOTE):
+            for item in session.query(NFeItem).filter(
+                NFeItem.nfe_id.in_(ids[inicio:inicio + DocumentosDatalake.TAMANHO_LOTE])
+            ).order_by(NFeItem.nfe_id, NFeItem.numero_item):
+                itens[item.nfe_id].append(item)
+    
+    # Converter para DocumentoFiscal
+    return [
+        converter_nfe_para_documento(nfe, itens[nfe.id] if incluir_itens else None)
+        for nfe in nfes
+    ]
+
+
+def buscar_documentos_periodo(
+    cnpj: str,
+    data_inicio: date,
+    data_fim: date,
+    tipo_data: str = 'emissao',
+    tipo_operacao: Optional[str] = None,
+    incluir_itens: bool = True,
+    watermark_minimo: Optional[datetime] = None
 ) -> List[DocumentoFiscal]:
     """
     Busca documentos fiscais do datalake para um CNPJ e período específicos.
@@ -138,83 +327,651 @@ def buscar_documentos_periodo(
         tipo_data: Tipo de data para filtrar ('emissao', 'autorizacao', 'saida_entrada')
         tipo_operacao: Filtrar por tipo ('E' para entrada, 'S' para saída, None para ambos)
         incluir_itens: Se deve incluir os itens dos documentos
+        watermark_minimo: Carga mínima que a leitura precisa enxergar; se a
+            réplica ainda não a alcançou, a busca é feita no primário
         
     Returns:
         Lista de objetos DocumentoFiscal
     """
-    session = ETLSessionLocal()
+    session = sessao_leitura(watermark_minimo)
     
     try:
-        # Limpar CNPJ
-        cnpj_limpo = cnpj.replace(".", "").replace("/", "").replace("-", "")
+        return _consultar_documentos(
+            session, cnpj, data_inicio, data_fim,
+            tipo_data=tipo_data,
+            tipo_operacao=tipo_operacao,
+            incluir_itens=incluir_itens
+        )
+    finally:
+        session.close()
+
+
+class DocumentosDatalake:
+    """
+    Documentos de um período lidos do datalake em lotes.
+    
+    Apenas os IDs das notas ficam em memória; cada lote de notas e itens é
+    convertido, entregue e descartado. Pode ser percorrido várias vezes (cada
+    iteração refaz as consultas), como exigem os relatórios em partes.
+    """
+
+    TAMANHO_LOTE = 500
+
+    def __init__(self, session_factory, criterios: list, coluna_data):
+        """
+        Inicializa a fonte de documentos.
         
-        # Construir query base
-        query = session.query(NFe)
+        Args:
+            session_factory: Fábrica de sessões do datalake
+            criterios: Critérios de filtro da NFe
+            coluna_data: Coluna de data usada na ordenação
+        """
+        self.session_factory = session_factory
+        self.criterios = criterios
+        self.coluna_data = coluna_data
+
+    def __iter__(self):
+        session = self.session_factory()
+        try:
+            ids = [
+                nfe_id for (nfe_id,) in session.query(NFe.id).filter(
+                    *self.criterios
+                ).order_by(self.coluna_data, NFe.id)
+            ]
+            
+            for inicio in range(0, len(ids), self.TAMANHO_LOTE):
+                lote = ids[inicio:inicio + self.TAMANHO_LOTE]
+                
+                nfes = {nfe.id: nfe for nfe in session.query(NFe).filter(NFe.id.in_(lote))}
+                itens = {nfe_id: [] for nfe_id in lote}
+                for item in session.query(NFeItem).filter(
+                    NFeItem.nfe_id.in_(lote)
+                ).order_by(NFeItem.nfe_id, NFeItem.numero_item):
+                    itens[item.nfe_id].append(item)
+                
+                for nfe_id in lote:
+                    yield converter_nfe_para_documento(nfes[nfe_id], itens[nfe_id])
+                
+                session.expunge_all()
+        finally:
+            session.close()
+
+
+class ApuradorDatalake:
+    """
+    Apurador de tributos que executa as somas diretamente no banco do datalake.
+    
+    Produz o mesmo MapaApuracao (inclusive a memória de cálculo com as
+    amostras de 10 débitos/créditos) que o ApuradorTributario produziria
+    sobre os documentos convertidos por converter_nfe_para_documento, mas
+    a partir de consultas agregadas sobre as colunas de nfe_item. Os
+    documentos só são materializados quando ``documentos`` é acessado.
+    """
+
+    # Colunas de nfe_item usadas por converter_nfe_para_documento para cada tributo.
+    # IBS e CBS não são convertidos hoje, portanto são apurados com valor zero.
+    COLUNAS_TRIBUTOS = {
+        TipoTributo.ICMS: NFeItem.valor_icms,
+        TipoTributo.IPI: NFeItem.valor_ipi,
+        TipoTributo.PIS: NFeItem.valor_pis,
+        TipoTributo.COFINS: NFeItem.valor_cofins,
+    }
+
+    def __init__(
+        self,
+        cnpj: str,
+        data_inicio: date,
+        data_fim: date,
+        tipo_data: str = 'emissao',
+        session_factory=None,
+        watermark_minimo: Optional[datetime] = None,
+        sobreposicao: Optional[float] = None
+    ):
+        """
+        Inicializa o apurador.
         
-        # Filtrar por CNPJ (pode ser emitente ou destinatário)
-        query = query.filter(
-            or_(
-                NFe.emitente_cnpj == cnpj_limpo,
-                NFe.destinatario_cnpj == cnpj_limpo
-            )
-        )
+        Args:
+            cnpj: CNPJ da empresa
+            data_inicio: Data inicial do período
+            data_fim: Data final do período
+            tipo_data: Tipo de data para filtrar ('emissao', 'autorizacao', 'saida_entrada')
+            session_factory: Fábrica de sessões do datalake (padrão: roteador de leitura)
+            watermark_minimo: Carga mínima que as leituras precisam enxergar
+                (ex.: watermark da apuração anterior); define réplica ou primário
+            sobreposicao: Segundos antes do watermark anterior relidos pela apuração
+                incremental (padrão: APURACAO_SOBREPOSICAO ou 900); deve cobrir o
+                tempo entre o carimbo e o commit de uma carga e a diferença de
+                relógio entre os hosts do ETL
+        """
+        self.cnpj = _limpar_cnpj(cnpj)
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self.tipo_data = tipo_data
+        self.session_factory = session_factory or fabrica_leitura(watermark_minimo)
+        self.sobreposicao = timedelta(seconds=sobreposicao if sobreposicao is not None
+                                      else float(os.getenv('APURACAO_SOBREPOSICAO', 900)))
         
-        # Filtrar por data
-        if tipo_data == 'autorizacao':
-            query = query.filter(
-                and_(
-                    NFe.data_autorizacao >= datetime.combine(data_inicio, datetime.min.time()),
-                    NFe.data_autorizacao <= datetime.combine(data_fim, datetime.max.time())
+        self._totais: Optional[Dict[TipoTributo, Dict[str, Any]]] = None
+        self._resumo: Optional[Dict[str, Any]] = None
+        self._documentos: Optional[List[DocumentoFiscal]] = None
+        
+        # Notas somadas/subtraídas na última apuração incremental (None se ela
+        # precisou refazer a apuração completa)
+        self.delta: Optional[Dict[str, int]] = None
+        
+        # Watermark e janela de sobreposição da última apuração acumulável
+        self.watermark: Optional[datetime] = None
+        self._janela: Optional[Dict[str, Any]] = None
+
+    @property
+    def documentos(self) -> List[DocumentoFiscal]:
+        """Documentos do período, carregados do datalake no primeiro acesso."""
+        if self._documentos is None:
+            session = self.session_factory()
+            try:
+                self._documentos = _consultar_documentos(
+                    session, self.cnpj, self.data_inicio, self.data_fim,
+                    tipo_data=self.tipo_data,
+                    incluir_itens=True
                 )
-            )
-        elif tipo_data == 'saida_entrada':
-            query = query.filter(
-                and_(
-                    NFe.data_saida_entrada >= datetime.combine(data_inicio, datetime.min.time()),
-                    NFe.data_saida_entrada <= datetime.combine(data_fim, datetime.max.time())
+            finally:
+                session.close()
+        return self._documentos
+
+    def iterar_documentos(self) -> Iterable[DocumentoFiscal]:
+        """Documentos do período lidos em lotes, sem materializar a lista inteira."""
+        if self._documentos is not None:
+            return self._documentos
+        return DocumentosDatalake(self.session_factory, self._filtros(), _coluna_data(self.tipo_data))
+
+    def _filtros(self) -> list:
+        """Critérios de filtro do período."""
+        return _filtros_periodo(self.cnpj, self.data_inicio, self.data_fim, self.tipo_data)
+
+    def _eh_entrada(self):
+        """Expressão SQL equivalente à classificação de converter_nfe_para_documento."""
+        return func.coalesce(NFe.tipo_operacao, '') == '0'
+
+    def _contar_documentos(self, session: Session, criterios: list) -> Dict[str, Any]:
+        """Conta os documentos que atendem aos critérios por tipo de movimento."""
+        eh_entrada = self._eh_entrada()
+        valor = func.coalesce(NFe.valor_total_nota, 0)
+        total, entradas, valor_total, valor_entradas, data_mais_antiga = session.query(
+            func.count(NFe.id),
+            func.sum(case((eh_entrada, 1), else_=0)),
+            func.sum(valor),
+            func.sum(case((eh_entrada, valor), else_=0)),
+            func.min(NFe.data_emissao)
+        ).filter(*criterios).one()
+        
+        total = total or 0
+        entradas = int(entradas or 0)
+        valor_total = Decimal(str(valor_total or 0))
+        valor_entradas = Decimal(str(valor_entradas or 0))
+        return {
+            'total_documentos': total,
+            'entradas': entradas,
+            'saidas': total - entradas,
+            'valor_entradas': valor_entradas,
+            'valor_saidas': valor_total - valor_entradas,
+            'data_mais_antiga': data_mais_antiga,
+        }
+
+    def _somar_tributos(self, session: Session, criterios: list) -> Dict[TipoTributo, Dict[str, Any]]:
+        """Soma e conta os tributos por tipo de movimento em uma única consulta."""
+        movimento = case((self._eh_entrada(), 'E'), else_='S').label('movimento')
+        
+        colunas = [movimento]
+        for coluna in self.COLUNAS_TRIBUTOS.values():
+            # converter_nfe_para_documento só gera o tributo quando o valor é positivo
+            colunas.append(func.sum(case((coluna > 0, coluna), else_=None)))
+            colunas.append(func.count(case((coluna > 0, 1), else_=None)))
+        
+        linhas = session.query(*colunas).select_from(NFeItem).join(
+            NFe, NFe.id == NFeItem.nfe_id
+        ).filter(*criterios).group_by(movimento).all()
+        
+        totais = {
+            tipo: {
+                'debitos': Decimal('0'),
+                'creditos': Decimal('0'),
+                'num_debitos': 0,
+                'num_creditos': 0,
+            }
+            for tipo in TipoTributo
+        }
+        
+        for linha in linhas:
+            chave_valor, chave_num = ('creditos', 'num_creditos') if linha[0] == 'E' else ('debitos', 'num_debitos')
+            for i, tipo in enumerate(self.COLUNAS_TRIBUTOS):
+                soma = linha[1 + 2 * i]
+                totais[tipo][chave_valor] = Decimal(str(soma)) if soma is not None else Decimal('0')
+                totais[tipo][chave_num] = linha[2 + 2 * i] or 0
+        
+        return totais
+
+    def obter_resumo(self) -> Dict[str, Any]:
+        """
+        Retorna a contagem de documentos do período por tipo de movimento.
+        
+        Returns:
+            Dicionário com total_documentos, entradas, saidas, valor_entradas,
+            valor_saidas e data_mais_antiga
+        """
+        if self._resumo is None:
+            session = self.session_factory()
+            try:
+                self._resumo = self._contar_documentos(session, self._filtros())
+            finally:
+                session.close()
+        return self._resumo
+
+    def _calcular_totais(self) -> Dict[TipoTributo, Dict[str, Any]]:
+        """Totais por tributo do período inteiro."""
+        if self._totais is None:
+            session = self.session_factory()
+            try:
+                self._totais = self._somar_tributos(session, self._filtros())
+            finally:
+                session.close()
+        return self._totais
+
+    def _amostras(self, session: Session, tipo_tributo: TipoTributo, entrada: bool) -> List[Dict[str, Any]]:
+        """Busca os 10 primeiros lançamentos de um tributo, na ordem dos documentos."""
+        coluna = self.COLUNAS_TRIBUTOS[tipo_tributo]
+        eh_entrada = self._eh_entrada()
+        
+        linhas = session.query(
+            NFe.numero_nota,
+            NFeItem.codigo_produto,
+            coluna
+        ).select_from(NFeItem).join(
+            NFe, NFe.id == NFeItem.nfe_id
+        ).filter(
+            *self._filtros(),
+            eh_entrada if entrada else ~eh_entrada,
+            coluna > 0
+        ).order_by(
+            _coluna_data(self.tipo_data), NFe.id, NFeItem.numero_item
+        ).limit(10).all()
+        
+        return [
+            {
+                'documento': numero,
+                'item': codigo,
+                'valor': Decimal(str(valor))
+            }
+            for numero, codigo, valor in linhas
+        ]
+
+    def apurar(self, periodo: str) -> MapaApuracao:
+        """
+        Realiza a apuração de todos os tributos no banco de dados.
+        
+        Args:
+            periodo: Período da apuração (ex: "01/2024")
+            
+        Returns:
+            MapaApuracao com os resultados
+        """
+        totais = self._calcular_totais()
+        mapa = MapaApuracao(periodo=periodo)
+        
+        session = self.session_factory()
+        try:
+            for tipo_tributo in [TipoTributo.ICMS, TipoTributo.IPI, TipoTributo.PIS,
+                                 TipoTributo.COFINS, TipoTributo.IBS, TipoTributo.CBS]:
+                total = totais[tipo_tributo]
+                
+                documentos_debito = []
+                documentos_credito = []
+                if tipo_tributo in self.COLUNAS_TRIBUTOS:
+                    if total['num_debitos']:
+                        documentos_debito = self._amostras(session, tipo_tributo, entrada=False)
+                    if total['num_creditos']:
+                        documentos_credito = self._amostras(session, tipo_tributo, entrada=True)
+                
+                saldo = total['debitos'] - total['creditos']
+                
+                memoria = MemoriaCalculo(
+                    descricao=f"Apuração de {tipo_tributo.value}",
+                    valores={
+                        'debitos_saida': total['debitos'],
+                        'creditos_entrada': total['creditos'],
+                        'num_documentos_debito': total['num_debitos'],
+                        'num_documentos_credito': total['num_creditos'],
+                        'documentos_debito': documentos_debito,
+                        'documentos_credito': documentos_credito
+                    },
+                    formula="Saldo = Débitos de Saída - Créditos de Entrada",
+                    resultado=saldo
                 )
-            )
-        else:  # emissao (padrão)
-            query = query.filter(
-                and_(
-                    NFe.data_emissao >= datetime.combine(data_inicio, datetime.min.time()),
-                    NFe.data_emissao <= datetime.combine(data_fim, datetime.max.time())
+                
+                mapa.apuracoes.append(ApuracaoTributo(
+                    tipo=tipo_tributo,
+                    debitos=total['debitos'],
+                    creditos=total['creditos'],
+                    saldo=saldo,
+                    memoria_calculo=memoria
+                ))
+        finally:
+            session.close()
+        
+        return mapa
+
+    def _sessao_consistente(self) -> Session:
+        """
+        Sessão em que todas as consultas leem o mesmo snapshot do banco.
+        
+        No PostgreSQL a transação usa REPEATABLE READ, para que watermark,
+        totais e janela de sobreposição de uma apuração sejam coerentes entre si.
+        """
+        session = self.session_factory()
+        if session.get_bind().dialect.name == 'postgresql':
+            session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        return session
+
+    @staticmethod
+    def _carimbo():
+        """Última alteração da nota (carga ou atualização), comparada com o watermark."""
+        return func.coalesce(NFe.data_atualizacao_etl, NFe.data_processamento_etl)
+
+    def _ler_watermark(self, session: Session) -> Optional[datetime]:
+        """Data da carga ou alteração mais recente visível na sessão."""
+        processamento, atualizacao = session.query(
+            func.max(NFe.data_processamento_etl),
+            func.max(NFe.data_atualizacao_etl)
+        ).one()
+        
+        datas = [d for d in (processamento, atualizacao) if d is not None]
+        return max(datas) if datas else None
+
+    def obter_watermark(self) -> Optional[datetime]:
+        """
+        Retorna a data da carga ou alteração mais recente registrada no datalake.
+        
+        As apurações acumuláveis (apurar_acumulavel e apurar_incremental) leem o
+        watermark no mesmo snapshot das somas e o guardam em ``watermark``.
+        """
+        session = self.session_factory()
+        try:
+            return self._ler_watermark(session)
+        finally:
+            session.close()
+
+    def _ler_janela(self, session: Session, watermark: Optional[datetime]) -> Dict[str, Any]:
+        """
+        Notas já apuradas que a próxima apuração incremental vai reler.
+        
+        Os carimbos das notas são gerados pelo processo do ETL antes do commit:
+        uma nota com carimbo anterior ao watermark pode ficar visível só depois
+        da leitura dele (cargas concorrentes, outro host com relógio
+        adiantado). Por isso a apuração incremental relê a partir de
+        watermark - sobreposicao e descarta, pelo id, as notas desta janela.
+        
+        Returns:
+            Dicionário com recentes (id -> carimbo das notas vigentes apuradas
+            dentro da sobreposição) e sem_efeito (ids das notas canceladas ou
+            denegadas do período, nunca somadas ou já subtraídas)
+        """
+        recentes = {}
+        if watermark is not None:
+            carimbo = self._carimbo()
+            recentes = {
+                str(nfe_id): valor.isoformat()
+                for nfe_id, valor in session.query(NFe.id, carimbo).filter(
+                    *self._filtros(), carimbo > watermark - self.sobreposicao
                 )
-            )
+            }
         
-        # Filtrar por tipo de operação
-        if tipo_operacao == 'E':  # Entrada
-            query = query.filter(NFe.tipo_operacao == '0')
-        elif tipo_operacao == 'S':  # Saída
-            query = query.filter(NFe.tipo_operacao == '1')
-        
-        # Ordenar por data
-        if tipo_data == 'autorizacao':
-            query = query.order_by(NFe.data_autorizacao)
-        elif tipo_data == 'saida_entrada':
-            query = query.order_by(NFe.data_saida_entrada)
-        else:
-            query = query.order_by(NFe.data_emissao)
-        
-        # Executar query
-        nfes = query.all()
-        
-        # Converter para DocumentoFiscal
-        documentos = []
-        for nfe in nfes:
-            itens = None
-            if incluir_itens:
-                itens = session.query(NFeItem).filter(
-                    NFeItem.nfe_id == nfe.id
-                ).order_by(NFeItem.numero_item).all()
+        sem_efeito = sorted(nfe_id for (nfe_id,) in session.query(NFe.id).filter(
+            *self._filtros_sem_efeito()
+        ))
+        
+        return {
+            'sobreposicao': self.sobreposicao.total_seconds(),
+            'recentes': recentes,
+            'sem_efeito': sem_efeito,
+        }
+
+    def _filtros_sem_efeito(self) -> list:
+        """Critérios das notas canceladas ou denegadas do período."""
+        return _filtros_periodo(
+            self.cnpj, self.data_inicio, self.data_fim, self.tipo_data,
+            apenas_vigentes=False
+        ) + [NFe.situacao.in_(SITUACOES_SEM_EFEITO)]
+
+    def apurar_acumulavel(self, periodo: str) -> MapaApuracao:
+        """
+        Apuração completa que também prepara a próxima apuração incremental.
+        
+        Watermark, resumo, totais e janela de sobreposição são lidos no mesmo
+        snapshot (ver _sessao_consistente) e exportados por exportar_acumuladores.
+        
+        Args:
+            periodo: Período da apuração (ex: "01/2024")
             
-            doc = converter_nfe_para_documento(nfe, itens)
-            documentos.append(doc)
+        Returns:
+            MapaApuracao com os resultados
+        """
+        session = self._sessao_consistente()
+        try:
+            self.watermark = self._ler_watermark(session)
+            self._resumo = self._contar_documentos(session, self._filtros())
+            self._totais = self._somar_tributos(session, self._filtros())
+            self._janela = self._ler_janela(session, self.watermark)
+        finally:
+            session.close()
         
-        return documentos
+        return self.apurar(periodo)
+
+    def exportar_acumuladores(self) -> Dict[str, Any]:
+        """
+        Exporta as somas e contagens do período em formato serializável.
         
-    finally:
-        session.close()
+        Deve ser chamado após apurar_acumulavel ou apurar_incremental.
+        
+        Returns:
+            Dicionário (compatível com JSON) com filtro, resumo, tributos e
+            janela de sobreposição
+        """
+        if self._janela is None:
+            raise ValueError("Acumuladores disponíveis apenas após apurar_acumulavel ou apurar_incremental")
+        
+        totais = self._calcular_totais()
+        resumo = self.obter_resumo()
+        data_mais_antiga = resumo['data_mais_antiga']
+        
+        return {
+            'filtro': self._descrever_filtro(),
+            'resumo': {
+                'total_documentos': resumo['total_documentos'],
+                'entradas': resumo['entradas'],
+                'saidas': resumo['saidas'],
+                'valor_entradas': str(resumo['valor_entradas']),
+                'valor_saidas': str(resumo['valor_saidas']),
+                'data_mais_antiga': data_mais_antiga.isoformat() if data_mais_antiga else None,
+            },
+            'tributos': {
+                tipo.value: {
+                    'debitos': str(total['debitos']),
+                    'creditos': str(total['creditos']),
+                    'num_debitos': total['num_debitos'],
+                    'num_creditos': total['num_creditos'],
+                }
+                for tipo, total in totais.items()
+            },
+            'janela': self._janela,
+        }
+
+    def _descrever_filtro(self) -> Dict[str, str]:
+        """Filtro do período em formato serializável."""
+        return {
+            'cnpj': self.cnpj,
+            'data_inicio': self.data_inicio.isoformat(),
+            'data_fim': self.data_fim.isoformat(),
+            'tipo_data': self.tipo_data,
+        }
+
+    def acumuladores_compativeis(self, acumuladores: Optional[Dict[str, Any]]) -> bool:
+        """
+        Verifica se os acumuladores foram gerados com o mesmo filtro deste apurador.
+        
+        Acumuladores anteriores aos valores por movimento (valor_entradas e
+        valor_saidas) ou à janela de sobreposição não são compatíveis e levam
+        a uma apuração completa.
+        """
+        return bool(acumuladores) and acumuladores.get('filtro') == self._descrever_filtro() \
+            and 'valor_entradas' in acumuladores.get('resumo', {}) and 'janela' in acumuladores
+
+    def apurar_incremental(
+        self,
+        periodo: str,
+        acumuladores: Dict[str, Any],
+        watermark_anterior: datetime
+    ) -> MapaApuracao:
+        """
+        Atualiza uma apuração anterior aplicando apenas o que mudou no datalake.
+        
+        Relê as notas alteradas desde watermark_anterior - sobreposicao (ver
+        _ler_janela) e, descartando pelo id as que a apuração anterior já
+        considerou, soma as notas novas e subtrai as já apuradas que foram
+        canceladas ou denegadas. Cartas de correção não alteram valores e por
+        isso não afetam os totais.
+        
+        Notas vigentes já apuradas e depois alteradas no datalake (carga em
+        modo upsert, que atualiza os valores e o data_atualizacao_etl) não
+        podem ser trocadas, pois os acumuladores não guardam a contribuição
+        de cada nota: nesse caso a apuração completa é refeita
+        (apurar_acumulavel) e ``delta`` fica None.
+        
+        Args:
+            periodo: Período da apuração (ex: "01/2024")
+            acumuladores: Resultado de exportar_acumuladores da apuração anterior
+            watermark_anterior: Watermark da apuração anterior
+            
+        Returns:
+            MapaApuracao com os resultados atualizados
+        """
+        janela = acumuladores['janela']
+        limite = watermark_anterior - timedelta(seconds=janela['sobreposicao'])
+        apuradas = [int(nfe_id) for nfe_id in janela['recentes']]
+        sem_efeito = janela['sem_efeito']
+        carimbo = self._carimbo()
+        
+        # Notas vigentes carregadas na janela e ainda não apuradas
+        criterios_novos = self._filtros() + [
+            NFe.data_processamento_etl > limite,
+            NFe.id.notin_(apuradas),
+            NFe.id.notin_(sem_efeito),
+        ]
+        # Notas já apuradas (antes da janela ou dentro dela) que perderam efeito
+        criterios_cancelados = self._filtros_sem_efeito() + [
+            carimbo > limite,
+            NFe.id.notin_(sem_efeito),
+            or_(NFe.data_processamento_etl <= limite, NFe.id.in_(apuradas)),
+        ]
+        
+        session = self._sessao_consistente()
+        try:
+            # Notas já apuradas (antes da janela ou com outro carimbo nela) que foram alteradas
+            alteradas = [
+                nfe_id for nfe_id, valor in session.query(NFe.id, carimbo).filter(
+                    *self._filtros(),
+                    carimbo > limite,
+                    NFe.id.notin_(sem_efeito),
+                    or_(NFe.data_processamento_etl <= limite, NFe.id.in_(apuradas)),
+                )
+                if janela['recentes'].get(str(nfe_id)) != valor.isoformat()
+            ]
+            
+            if not alteradas:
+                self.watermark = self._ler_watermark(session)
+                
+                resumo_novos = self._contar_documentos(session, criterios_novos)
+                resumo_cancelados = self._contar_documentos(session, criterios_cancelados)
+                
+                totais_novos = self._somar_tributos(session, criterios_novos) \
+                    if resumo_novos['total_documentos'] else None
+                totais_cancelados = self._somar_tributos(session, criterios_cancelados) \
+                    if resumo_cancelados['total_documentos'] else None
+                
+                # A nota cancelada pode ser a mais antiga: o mínimo é relido no período
+                data_vigente = session.query(func.min(NFe.data_emissao)).filter(
+                    *self._filtros()
+                ).scalar() if resumo_cancelados['total_documentos'] else None
+                
+                self._janela = self._ler_janela(session, self.watermark)
+        finally:
+            session.close()
+        
+        if alteradas:
+            mapa = self.apurar_acumulavel(periodo)
+            self.delta = None
+            return mapa
+        
+        # Resumo
+        anterior = acumuladores['resumo']
+        resumo = {
+            chave: anterior[chave] + resumo_novos[chave] - resumo_cancelados[chave]
+            for chave in ('total_documentos', 'entradas', 'saidas')
+        }
+        for chave in ('valor_entradas', 'valor_saidas'):
+            resumo[chave] = Decimal(anterior[chave]) + resumo_novos[chave] - resumo_cancelados[chave]
+        if resumo_cancelados['total_documentos']:
+            resumo['data_mais_antiga'] = data_vigente
+        else:
+            datas = [resumo_novos['data_mais_antiga']] if resumo_novos['data_mais_antiga'] else []
+            if anterior.get('data_mais_antiga'):
+                datas.append(datetime.fromisoformat(anterior['data_mais_antiga']))
+            resumo['data_mais_antiga'] = min(datas) if datas else None
+        
+        # Tributos
+        totais = {}
+        for tipo in TipoTributo:
+            valores = acumuladores['tributos'][tipo.value]
+            total = {
+                'debitos': Decimal(valores['debitos']),
+                'creditos': Decimal(valores['creditos']),
+                'num_debitos': valores['num_debitos'],
+                'num_creditos': valores['num_creditos'],
+            }
+            for delta, sinal in ((totais_novos, 1), (totais_cancelados, -1)):
+                if delta:
+                    for chave in total:
+                        total[chave] += sinal * delta[tipo][chave]
+            totais[tipo] = total
+        
+        self._resumo = resumo
+        self._totais = totais
+        self.delta = {
+            'novos': resumo_novos['total_documentos'],
+            'cancelados': resumo_cancelados['total_documentos'],
+        }
+        
+        return self.apurar(periodo)
+
+    def calcular_total_debitos(self, tipo_tributo: TipoTributo) -> Decimal:
+        """Calcula o total de débitos de um tributo."""
+        return self._calcular_totais()[tipo_tributo]['debitos']
+
+    def calcular_total_creditos(self, tipo_tributo: TipoTributo) -> Decimal:
+        """Calcula o total de créditos de um tributo."""
+        return self._calcular_totais()[tipo_tributo]['creditos']
+
+    def calcular_saldo_periodo(self, tipo_tributo: TipoTributo) -> Dict[str, Decimal]:
+        """Calcula débitos, créditos e saldo de um tributo no período."""
+        debitos = self.calcular_total_debitos(tipo_tributo)
+        creditos = self.calcular_total_creditos(tipo_tributo)
+        return {
+            'debitos': debitos,
+            'creditos': creditos,
+            'saldo': debitos - creditos
+        }
+
+    def obter_documentos_por_tipo(self, tipo_movimento: TipoMovimento) -> List[DocumentoFiscal]:
+        """Retorna documentos filtrados por tipo de movimento (materializa os documentos)."""
+        return [doc for doc in self.documentos if doc.tipo_movimento == tipo_movimento]
 
 
 def obter_estatisticas_datalake(cnpj: Optional[str] = None) -> Dict[str, Any]:
@@ -227,7 +984,7 @@ def obter_estatisticas_datalake(cnpj: Optional[str] = None) -> Dict[str, Any]:
     Returns:
         Dicionário com estatísticas
     """
-    session = ETLSessionLocal()
+    session = sessao_leitura()
     
     try:
         query = session.query(NFe)
@@ -241,18 +998,14 @@ def obter_estatisticas_datalake(cnpj: Optional[str] = None) -> Dict[str, Any]:
                 )
             )
         
-        total_documentos = query.count()
-        total_entradas = query.filter(NFe.tipo_operacao == '0').count()
-        total_saidas = query.filter(NFe.tipo_operacao == '1').count()
-        
-        # Datas
-        data_mais_antiga = session.query(func.min(NFe.data_emissao)).filter(
-            query.whereclause if hasattr(query, 'whereclause') else True
-        ).scalar()
-        
-        data_mais_recente = session.query(func.max(NFe.data_emissao)).filter(
-            query.whereclause if hasattr(query, 'whereclause') else True
-        ).scalar()
+        # Contagens e datas em uma única agregação condicional
+        total_documentos, total_entradas, total_saidas, data_mais_antiga, data_mais_recente = query.with_entities(
+            func.count(NFe.id),
+            func.coalesce(func.sum(case((NFe.tipo_operacao == '0', 1), else_=0)), 0),
+            func.coalesce(func.sum(case((NFe.tipo_operacao == '1', 1), else_=0)), 0),
+            func.min(NFe.data_emissao),
+            func.max(NFe.data_emissao)
+        ).one()
         
         return {
             'total_documentos': total_documentos,
@@ -282,31 +1035,11 @@ def verificar_documentos_disponiveis(
     Returns:
         Dicionário com contagens
     """
-    session = ETLSessionLocal()
+    session = sessao_leitura()
     
     try:
-        cnpj_limpo = cnpj.replace(".", "").replace("/", "").replace("-", "")
-        
-        query = session.query(NFe).filter(
-            or_(
-                NFe.emitente_cnpj == cnpj_limpo,
-                NFe.destinatario_cnpj == cnpj_limpo
-            ),
-            and_(
-                NFe.data_emissao >= datetime.combine(data_inicio, datetime.min.time()),
-                NFe.data_emissao <= datetime.combine(data_fim, datetime.max.time())
-            )
-        )
-        
-        total = query.count()
-        entradas = query.filter(NFe.tipo_operacao == '0').count()
-        saidas = query.filter(NFe.tipo_operacao == '1').count()
-        
-        return {
-            'total': total,
-            'entradas': entradas,
-            'saidas': saidas
-        }
+        # Notas canceladas/denegadas também contam como disponíveis
+        return contar_documentos_periodo(session, cnpj, data_inicio, data_fim, apenas_vigentes=False)
         
     finally:
         session.close()
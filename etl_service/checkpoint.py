@@ -0,0 +1,320 @@
+"""
+Checkpoints das execuções do ETL, para retomada após falha.
+
+Ao iniciar uma execução de diretório, a lista de arquivos é gravada em
+etl_processamento_arquivo. A cada lote de arquivos concluído, a posição na
+lista e as estatísticas são gravadas em etl_processamento numa única
+transação. Se o processo cair, a execução pode ser retomada a partir do
+último lote gravado (run_etl.py --resume <id>), sem nova varredura do
+diretório; os arquivos do lote interrompido são reprocessados e caem na
+deduplicação normal. Quando a execução termina como 'concluido', a sua lista
+de arquivos é apagada (limpar_arquivos).
+
+Uma execução 'executando' é considerada abandonada quando o processo que a
+executava não existe mais (mesmo host) ou quando não grava checkpoint há
+mais de ETL_CHECKPOINT_EXPIRACAO segundos.
+"""
+import json
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, or_, update
+
+from .models import ArquivoProcessado, ProcessamentoArquivo, ProcessamentoETL
+
+logger = logging.getLogger(__name__)
+
+# Arquivos por INSERT ao gravar a lista da execução
+TAMANHO_INSERCAO = 5000
+
+# Estatísticas do pipeline gravadas em cada checkpoint ('documentos': registros por plugin)
+ESTATISTICAS = ('processados', 'duplicados', 'atualizados', 'documentos', 'ignorados', 'erros')
+
+
+def identificacao_executor() -> str:
+    """Identificação do processo atual (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _processo_ativo(executor: Optional[str]) -> Optional[bool]:
+    """
+    Se o processo host:pid ainda existe.
+
+    Returns:
+        True/False para processos deste host; None se o executor é de outro
+        host ou desconhecido
+    """
+    if not executor or ':' not in executor:
+        return None
+
+    host, pid = executor.rsplit(':', 1)
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return None
+    return True
+
+
+class ExecucaoAssumida(RuntimeError):
+    """A execução foi assumida por outro processo (checkpoint de outro executor)."""
+
+
+class CheckpointETL:
+    """
+    Grava e lê os checkpoints das execuções em etl_processamento.
+    """
+
+    def __init__(self, session_factory=None, expiracao: Optional[float] = None):
+        """
+        Inicializa o checkpoint.
+
+        Args:
+            session_factory: Fábrica de sessões do datalake (padrão: SessionLocal)
+            expiracao: Segundos sem checkpoint após os quais uma execução
+                'executando' é abandonada (padrão: ETL_CHECKPOINT_EXPIRACAO ou 900)
+        """
+        if session_factory is None:
+            from .database import SessionLocal
+            session_factory = SessionLocal
+
+        self.session_factory = session_factory
+        self.expiracao = expiracao if expiracao is not None \
+            else float(os.getenv('ETL_CHECKPOINT_EXPIRACAO', 900))
+        self.executor = identificacao_executor()
+
+    def registrar_arquivos(self, processamento_id: int, diretorio: str,
+                           recursivo: bool, arquivos: List[str]):
+        """
+        Grava a lista de arquivos da execução e zera o cursor.
+
+        Args:
+            processamento_id: ID do processamento
+            diretorio: Diretório processado
+            recursivo: Se a varredura incluiu subdiretórios
+            arquivos: Arquivos na ordem de processamento
+        """
+        session = self.session_factory()
+        try:
+            for inicio in range(0, len(arquivos), TAMANHO_INSERCAO):
+                session.execute(insert(ProcessamentoArquivo), [
+                    {'processamento_id': processamento_id, 'ordem': ordem, 'caminho_arquivo': caminho}
+                    for ordem, caminho in enumerate(arquivos[inicio:inicio + TAMANHO_INSERCAO], inicio + 1)
+                ])
+
+            session.execute(update(ProcessamentoETL).where(ProcessamentoETL.id == processamento_id).values(
+                diretorio=diretorio,
+                recursivo=recursivo,
+                total_arquivos=len(arquivos),
+                posicao_checkpoint=0,
+                stats_checkpoint=None,
+                data_checkpoint=datetime.now(),
+                executor=self.executor,
+            ))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def registrar_lote(self, processamento_id: int, posicao: int, stats: Dict[str, Any]):
+        """
+        Grava o cursor e as estatísticas após um lote concluído.
+
+        Args:
+            processamento_id: ID do processamento
+            posicao: Quantidade de arquivos da lista já concluídos
+            stats: Estatísticas do pipeline até a posição
+
+        Raises:
+            ExecucaoAssumida: Se outro processo assumiu a execução
+        """
+        session = self.session_factory()
+        try:
+            resultado = session.execute(update(ProcessamentoETL).where(
+                ProcessamentoETL.id == processamento_id,
+                ProcessamentoETL.executor == self.executor,
+            ).values(
+                posicao_checkpoint=posicao,
+                stats_checkpoint=json.dumps({
+                    chave: stats.get(chave, 0) for chave in ESTATISTICAS
+                }),
+                data_checkpoint=datetime.now(),
+            ))
+            session.commit()
+        finally:
+            session.close()
+
+        if resultado.rowcount == 0:
+            raise ExecucaoAssumida(f"Processamento {processamento_id} foi assumido por outro processo")
+
+    def limpar_arquivos(self, processamento_id: int) -> int:
+        """
+        Apaga a lista de arquivos de uma execução concluída (não será retomada).
+
+        Args:
+            processamento_id: ID do processamento
+
+        Returns:
+            Quantidade de arquivos apagados da lista
+        """
+        session = self.session_factory()
+        try:
+            resultado = session.execute(delete(ProcessamentoArquivo).where(
+                ProcessamentoArquivo.processamento_id == processamento_id
+            ))
+            session.commit()
+            return resultado.rowcount
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def arquivos_pendentes(self, processamento_id: int, posicao: int) -> Iterator[str]:
+        """
+        Arquivos da lista da execução após a posição do checkpoint.
+
+        Args:
+            processamento_id: ID do processamento
+            posicao: Quantidade de arquivos já concluídos
+
+        Yields:
+            Caminhos dos arquivos, na ordem original
+        """
+        session = self.session_factory()
+        try:
+            consulta = session.query(ProcessamentoArquivo.caminho_arquivo).filter(
+                ProcessamentoArquivo.processamento_id == processamento_id,
+                ProcessamentoArquivo.ordem > posicao,
+            ).order_by(ProcessamentoArquivo.ordem).yield_per(TAMANHO_INSERCAO)
+
+            for (caminho,) in consulta:
+                yield caminho
+        finally:
+            session.close()
+
+    def arquivo_registrado(self, caminho_arquivo: str) -> bool:
+        """Se o arquivo já tem registro em etl_arquivo_processado (carregado antes da falha)."""
+        session = self.session_factory()
+        try:
+            return session.query(ArquivoProcessado.id).filter(
+                ArquivoProcessado.caminho_arquivo == caminho_arquivo
+            ).first() is not None
+        finally:
+            session.close()
+
+    def abandonada(self, processamento: ProcessamentoETL) -> bool:
+        """
+        Se uma execução 'executando' não tem mais processo ativo.
+
+        Args:
+            processamento: Registro de etl_processamento
+
+        Returns:
+            True se o processo caiu ou parou de gravar checkpoints
+        """
+        if processamento.status != 'executando':
+            return False
+
+        ativo = _processo_ativo(processamento.executor)
+        if ativo is not None:
+            return not ativo
+
+        ultimo = processamento.data_checkpoint or processamento.data_processamento
+        return ultimo < datetime.now() - timedelta(seconds=self.expiracao)
+
+    def localizar_abandonada(self, diretorio: str) -> Optional[int]:
+        """
+        Procura uma execução abandonada do diretório que possa ser retomada.
+
+        Args:
+            diretorio: Diretório da execução
+
+        Returns:
+            ID do processamento mais recente abandonado ou None
+        """
+        session = self.session_factory()
+        try:
+            candidatas = session.query(ProcessamentoETL).filter(
+                ProcessamentoETL.status == 'executando',
+                ProcessamentoETL.diretorio == diretorio,
+                ProcessamentoETL.total_arquivos.isnot(None),
+            ).order_by(ProcessamentoETL.id.desc()).all()
+
+            for processamento in candidatas:
+                if self.abandonada(processamento):
+                    return processamento.id
+            return None
+        finally:
+            session.close()
+
+    def assumir(self, processamento_id: int) -> Dict[str, Any]:
+        """
+        Assume uma execução interrompida para retomá-la.
+
+        A troca de executor é um UPDATE condicional: se dois processos
+        tentarem assumir a mesma execução, apenas um consegue.
+
+        Args:
+            processamento_id: ID do processamento
+
+        Returns:
+            Estado do checkpoint: tipo, modo_carga, diretorio, recursivo, total,
+            posicao e stats
+
+        Raises:
+            ValueError: Se a execução não existe, não tem checkpoint, já foi
+                concluída ou ainda está ativa em outro processo
+        """
+        session = self.session_factory()
+        try:
+            processamento = session.get(ProcessamentoETL, processamento_id)
+            if processamento is None:
+                raise ValueError(f"Processamento {processamento_id} não encontrado")
+            if processamento.total_arquivos is None:
+                raise ValueError(f"Processamento {processamento_id} não tem checkpoint (execução sem lista de arquivos)")
+            if processamento.status == 'concluido':
+                raise ValueError(f"Processamento {processamento_id} já foi concluído")
+            if processamento.status == 'executando' and not self.abandonada(processamento):
+                raise ValueError(
+                    f"Processamento {processamento_id} ainda está em execução ({processamento.executor})"
+                )
+
+            resultado = session.execute(update(ProcessamentoETL).where(
+                ProcessamentoETL.id == processamento_id,
+                ProcessamentoETL.status == processamento.status,
+                or_(ProcessamentoETL.executor == processamento.executor,
+                    ProcessamentoETL.executor.is_(None)),
+            ).values(
+                status='executando',
+                executor=self.executor,
+                data_checkpoint=datetime.now(),
+            ))
+            session.commit()
+
+            if resultado.rowcount == 0:
+                raise ValueError(f"Processamento {processamento_id} foi assumido por outro processo")
+
+            logger.info(f"Processamento {processamento_id} assumido de {processamento.executor}")
+            return {
+                'tipo': processamento.tipo_processamento,
+                'modo_carga': processamento.modo_carga,
+                'diretorio': processamento.diretorio,
+                'recursivo': processamento.recursivo,
+                'total': processamento.total_arquivos,
+                'posicao': processamento.posicao_checkpoint or 0,
+                'stats': json.loads(processamento.stats_checkpoint or '{}'),
+            }
+        finally:
+            session.close()
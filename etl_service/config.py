@@ -5,7 +5,7 @@ Carrega configurações de arquivo .env.etl ou variáveis de ambiente.
 """
 import os
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 
 class ETLConfig:
@@ -50,6 +50,76 @@ class ETLConfig:
         """Diretório de backup."""
         return os.getenv('DIRETORIO_BACKUP')
     
+    @property
+    def descarte_em_segundo_plano(self) -> bool:
+        """Se deve deletar/mover os arquivos em uma thread de I/O, fora do loop de carga."""
+        return os.getenv('DESCARTE_EM_SEGUNDO_PLANO', 'true').lower() == 'true'
+    
+    @property
+    def log_em_lote(self) -> bool:
+        """Se deve gravar os logs de processamento em lote, em segundo plano."""
+        return os.getenv('LOG_EM_LOTE', 'true').lower() == 'true'
+    
+    @property
+    def log_tamanho_lote(self) -> int:
+        """Quantidade de logs que dispara uma gravação em lote."""
+        return int(os.getenv('LOG_TAMANHO_LOTE', '500'))
+    
+    @property
+    def log_intervalo(self) -> float:
+        """Tempo máximo (segundos) entre gravações de logs e entre linhas de progresso."""
+        return float(os.getenv('LOG_INTERVALO', '2'))
+    
+    @property
+    def modo_carga(self) -> str:
+        """Modo de carga: 'inserir' (NF-e já existente é duplicata) ou 'upsert' (atualiza a existente)."""
+        return os.getenv('ETL_MODO_CARGA', 'inserir').lower()
+    
+    @property
+    def plugins(self) -> List[str]:
+        """Módulos de plugins externos de tipos de documento (ex.: NFS-e), separados por vírgula."""
+        return [modulo.strip() for modulo in os.getenv('ETL_PLUGINS', '').split(',') if modulo.strip()]
+    
+    @property
+    def pipeline_estagios(self) -> bool:
+        """Se o diretório é processado em estágios paralelos (leitura, parse, carga) ligados por filas."""
+        return os.getenv('ETL_PIPELINE_ESTAGIOS', 'true').lower() == 'true'
+    
+    @property
+    def leitores(self) -> int:
+        """Threads do estágio de leitura dos arquivos (disco/NAS)."""
+        return max(1, int(os.getenv('ETL_LEITORES', '2')))
+    
+    @property
+    def parsers(self) -> int:
+        """Threads do estágio de parse, extração e transformação."""
+        return max(1, int(os.getenv('ETL_PARSERS', '2')))
+    
+    @property
+    def tamanho_fila(self) -> int:
+        """Capacidade de cada fila entre estágios (limita a memória e aplica contrapressão)."""
+        return max(1, int(os.getenv('ETL_TAMANHO_FILA', '64')))
+    
+    @property
+    def carga_lote(self) -> int:
+        """NF-e por transação no estágio de carga."""
+        return max(1, int(os.getenv('ETL_CARGA_LOTE', '50')))
+    
+    @property
+    def checkpoint_lote(self) -> int:
+        """Arquivos por lote entre dois checkpoints da execução (retomada com --resume)."""
+        return int(os.getenv('ETL_CHECKPOINT_LOTE', '500'))
+    
+    @property
+    def retomar_abandonadas(self) -> bool:
+        """Se uma nova execução do mesmo diretório deve retomar a execução abandonada."""
+        return os.getenv('ETL_RETOMAR_ABANDONADAS', 'true').lower() == 'true'
+    
+    @property
+    def metricas_textfile(self) -> Optional[str]:
+        """Arquivo .prom para o textfile collector do node_exporter (vazio = não grava)."""
+        return os.getenv('ETL_METRICAS_TEXTFILE') or None
+    
     @property
     def validar_por_chave(self) -> bool:
         """Se deve validar duplicatas por chave de acesso."""
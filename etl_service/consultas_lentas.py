@@ -0,0 +1,369 @@
+"""
+Log de consultas lentas do datalake, com captura amostrada do plano.
+
+Quando habilitado (CONSULTAS_LENTAS=true), os engines do datalake ('datalake'
+e 'datalake_leitura') são instrumentados nos eventos before/after_cursor_execute.
+Toda instrução acima de CONSULTA_LENTA_MS é registrada no log com os
+parâmetros e gravada em etl_consulta_lenta por uma thread em segundo plano,
+que também executa o EXPLAIN de uma amostra das consultas
+(CONSULTA_LENTA_EXPLAIN_AMOSTRAGEM) e marca as varreduras sequenciais em nfe
+e nfe_item, que indicam índice faltando ou não utilizado.
+
+No PostgreSQL o plano é obtido com EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON),
+somente para SELECT e dentro de uma transação desfeita; sem ANALYZE
+(CONSULTA_LENTA_EXPLAIN_ANALYZE=false) a consulta não é reexecutada. No
+SQLite é usado EXPLAIN QUERY PLAN.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .engines import obter_engine
+
+logger = logging.getLogger(__name__)
+
+# Tabelas em que uma varredura sequencial é sinalizada
+TABELAS_MONITORADAS = ('nfe', 'nfe_item')
+
+# Tamanho máximo gravado da instrução e dos parâmetros
+LIMITE_INSTRUCAO = 10000
+LIMITE_PARAMETROS = 2000
+
+# Linha do EXPLAIN QUERY PLAN do SQLite para varredura completa ("SCAN nfe")
+_SCAN_SQLITE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# Arquivos ignorados ao procurar a origem da consulta na pilha
+_IGNORAR_ORIGEM = (os.sep + 'sqlalchemy' + os.sep, os.path.abspath(__file__))
+
+
+def consultas_lentas_habilitado() -> bool:
+    """Se o log de consultas lentas está habilitado (CONSULTAS_LENTAS)."""
+    return os.getenv('CONSULTAS_LENTAS', 'false').lower() == 'true'
+
+
+def _origem() -> Optional[str]:
+    """Primeiro frame da pilha fora do SQLAlchemy e deste módulo (arquivo:linha função)."""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if not any(trecho in frame.filename for trecho in _IGNORAR_ORIGEM):
+            return f"{os.path.relpath(frame.filename)}:{frame.lineno} {frame.name}"
+    return None
+
+
+def _formatar_parametros(parametros: Any) -> str:
+    """Representação truncada dos parâmetros da instrução."""
+    texto = repr(parametros)
+    if len(texto) > LIMITE_PARAMETROS:
+        texto = texto[:LIMITE_PARAMETROS] + '...'
+    return texto
+
+
+def varreduras_postgres(plano: Any) -> List[str]:
+    """
+    Tabelas monitoradas lidas por Seq Scan em um plano do PostgreSQL.
+
+    Args:
+        plano: Resultado de EXPLAIN (FORMAT JSON), já decodificado ou em texto
+
+    Returns:
+        Nomes das tabelas, sem repetição, na ordem em que aparecem
+    """
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+
+    tabelas: List[str] = []
+    pendentes = [item.get('Plan', {}) for item in plano] if isinstance(plano, list) else [plano]
+    while pendentes:
+        no = pendentes.pop(0)
+        tabela = no.get('Relation Name')
+        if no.get('Node Type') == 'Seq Scan' and tabela in TABELAS_MONITORADAS and tabela not in tabelas:
+            tabelas.append(tabela)
+        pendentes.extend(no.get('Plans', []))
+    return tabelas
+
+
+def varreduras_sqlite(linhas: Iterable[Tuple]) -> List[str]:
+    """
+    Tabelas monitoradas lidas por varredura completa em um EXPLAIN QUERY PLAN.
+
+    Args:
+        linhas: Linhas (id, parent, notused, detail) do SQLite
+
+    Returns:
+        Nomes das tabelas, sem repetição, na ordem em que aparecem
+    """
+    tabelas: List[str] = []
+    for linha in linhas:
+        encontrado = _SCAN_SQLITE.match(linha[-1])
+        if encontrado and encontrado.group(1) in TABELAS_MONITORADAS and encontrado.group(1) not in tabelas:
+            tabelas.append(encontrado.group(1))
+    return tabelas
+
+
+class MonitorConsultas:
+    """
+    Mede as instruções dos engines instrumentados e grava as lentas.
+
+    Os listeners só medem e enfileiram; o EXPLAIN e a gravação em
+    etl_consulta_lenta rodam na thread do monitor, cujas próprias consultas
+    não são medidas.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        limite_ms: Optional[float] = None,
+        amostragem: Optional[float] = None,
+        analyze: Optional[bool] = None,
+        intervalo_explain: Optional[float] = None
+    ):
+        """
+        Inicializa e inicia a thread de gravação.
+
+        Args:
+            session_factory: Fábrica de sessões do datalake para gravar os
+                registros (padrão: SessionLocal)
+            limite_ms: Duração a partir da qual a instrução é lenta
+                (padrão: CONSULTA_LENTA_MS ou 500)
+            amostragem: Fração das consultas lentas com EXPLAIN, de 0 a 1
+                (padrão: CONSULTA_LENTA_EXPLAIN_AMOSTRAGEM ou 0)
+            analyze: Se o EXPLAIN do PostgreSQL usa ANALYZE e BUFFERS
+                (padrão: CONSULTA_LENTA_EXPLAIN_ANALYZE ou true)
+            intervalo_explain: Segundos mínimos entre dois EXPLAIN da mesma
+                instrução (padrão: CONSULTA_LENTA_EXPLAIN_INTERVALO ou 300)
+        """
+        if session_factory is None:
+            from .database import SessionLocal
+            session_factory = SessionLocal
+
+        self.session_factory = session_factory
+        self.limite_ms = limite_ms if limite_ms is not None \
+            else float(os.getenv('CONSULTA_LENTA_MS', 500))
+        self.amostragem = amostragem if amostragem is not None \
+            else float(os.getenv('CONSULTA_LENTA_EXPLAIN_AMOSTRAGEM', 0))
+        self.analyze = analyze if analyze is not None \
+            else os.getenv('CONSULTA_LENTA_EXPLAIN_ANALYZE', 'true').lower() == 'true'
+        self.intervalo_explain = intervalo_explain if intervalo_explain is not None \
+            else float(os.getenv('CONSULTA_LENTA_EXPLAIN_INTERVALO', 300))
+
+        self.stats = {'lentas': 0, 'explains': 0, 'gravadas': 0, 'erros': 0}
+
+        self._engines: Dict[str, Engine] = {}
+        self._ultimo_explain: Dict[str, float] = {}
+        self._fila: queue.Queue = queue.Queue()
+        self._lock_thread = threading.Lock()
+        self._thread = self._iniciar_thread()
+
+    def instrumentar(self, nome: str, engine: Engine) -> Engine:
+        """
+        Passa a medir as instruções executadas pelo engine.
+
+        Args:
+            nome: Nome do papel do engine (gravado em cada registro)
+            engine: Engine do SQLAlchemy
+
+        Returns:
+            O próprio engine
+        """
+        if self._engines.get(nome) is engine:
+            return engine
+        self._engines[nome] = engine
+
+        def antes(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('consulta_inicio', []).append(time.perf_counter())
+
+        def depois(conn, cursor, statement, parameters, context, executemany):
+            inicios = conn.info.get('consulta_inicio')
+            if not inicios:
+                return
+            duracao_ms = (time.perf_counter() - inicios.pop()) * 1000
+            if duracao_ms < self.limite_ms or threading.current_thread() is self._thread:
+                return
+
+            self.stats['lentas'] += 1
+            parametros = _formatar_parametros(parameters)
+            origem = _origem()
+            logger.warning(
+                f"Consulta lenta ({nome}, {duracao_ms:.0f} ms) em {origem}: "
+                f"{' '.join(statement.split())[:500]} | parâmetros: {parametros}"
+            )
+            self._enfileirar({
+                'engine': nome,
+                'duracao_ms': round(duracao_ms, 3),
+                'instrucao': statement,
+                'parametros': parameters,
+                'parametros_texto': parametros,
+                'executemany': executemany,
+                'origem': origem,
+                'data_hora': datetime.now(),
+            })
+
+        event.listen(engine, 'before_cursor_execute', antes)
+        event.listen(engine, 'after_cursor_execute', depois)
+        return engine
+
+    def _iniciar_thread(self) -> threading.Thread:
+        """Inicia a thread de gravação."""
+        thread = threading.Thread(target=self._executar, name='consultas-lentas', daemon=True)
+        thread.start()
+        return thread
+
+    def _enfileirar(self, registro: Dict[str, Any]):
+        """Enfileira uma consulta lenta, reiniciando a thread se o monitor já foi finalizado."""
+        with self._lock_thread:
+            if not self._thread.is_alive():
+                self._thread = self._iniciar_thread()
+            self._fila.put(registro)
+
+    def finalizar(self, timeout: Optional[float] = None):
+        """
+        Grava os registros pendentes e encerra a thread.
+
+        O monitor continua instrumentando os engines: uma nova consulta lenta
+        inicia outra thread (ex.: uma segunda execução do ETL no mesmo processo).
+
+        Args:
+            timeout: Tempo máximo de espera em segundos (None = sem limite)
+        """
+        with self._lock_thread:
+            if not self._thread.is_alive():
+                return
+            self._fila.put(None)
+            self._thread.join(timeout)
+
+    def _executar(self):
+        """Loop da thread: EXPLAIN amostrado e gravação de cada consulta lenta."""
+        while True:
+            registro = self._fila.get()
+            if registro is None:
+                return
+            try:
+                self._gravar(registro)
+            except Exception as e:
+                self.stats['erros'] += 1
+                logger.error(f"Erro ao gravar consulta lenta: {str(e)}")
+
+    def _sortear_explain(self, registro: Dict[str, Any]) -> bool:
+        """Se a consulta entra na amostra de EXPLAIN (só SELECT, sem repetir a mesma instrução no intervalo)."""
+        if registro['executemany'] or not registro['instrucao'].lstrip().upper().startswith(('SELECT', 'WITH')):
+            return False
+        if self.amostragem <= 0 or random.random() >= self.amostragem:
+            return False
+
+        agora = time.monotonic()
+        ultimo = self._ultimo_explain.get(registro['instrucao'])
+        if ultimo is not None and agora - ultimo < self.intervalo_explain:
+            return False
+        self._ultimo_explain[registro['instrucao']] = agora
+        return True
+
+    def explicar(self, engine: Engine, instrucao: str, parametros: Any) -> Tuple[str, List[str]]:
+        """
+        Executa o EXPLAIN da instrução no mesmo banco em que ela rodou.
+
+        Args:
+            engine: Engine em que a instrução foi executada
+            instrucao: SQL no formato do driver (paramstyle do DBAPI)
+            parametros: Parâmetros no formato do driver
+
+        Returns:
+            Tupla (plano em texto, tabelas monitoradas com varredura sequencial)
+        """
+        with engine.connect() as conexao:
+            if engine.dialect.name == 'postgresql':
+                opcoes = 'ANALYZE, BUFFERS, FORMAT JSON' if self.analyze else 'FORMAT JSON'
+                transacao = conexao.begin()
+                try:
+                    if self.analyze:
+                        # A consulta é reexecutada: limita a 10x o limite de consulta lenta (mínimo 5 s)
+                        timeout_ms = int(max(self.limite_ms * 10, 5000))
+                        conexao.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+                    plano = conexao.exec_driver_sql(f"EXPLAIN ({opcoes}) {instrucao}", parametros).scalar()
+                finally:
+                    transacao.rollback()
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                return json.dumps(plano, ensure_ascii=False), varreduras_postgres(plano)
+
+            if engine.dialect.name == 'sqlite':
+                linhas = conexao.exec_driver_sql(f"EXPLAIN QUERY PLAN {instrucao}", parametros).fetchall()
+                return '\n'.join(linha[-1] for linha in linhas), varreduras_sqlite(linhas)
+
+            linhas = conexao.exec_driver_sql(f"EXPLAIN {instrucao}", parametros).fetchall()
+            return '\n'.join(' '.join(str(coluna) for coluna in linha) for linha in linhas), []
+
+    def _gravar(self, registro: Dict[str, Any]):
+        """Obtém o plano (se sorteado) e insere o registro em etl_consulta_lenta."""
+        from .models import ConsultaLenta
+
+        plano, tabelas = None, []
+        if self._sortear_explain(registro):
+            try:
+                plano, tabelas = self.explicar(
+                    self._engines[registro['engine']], registro['instrucao'], registro['parametros']
+                )
+                self.stats['explains'] += 1
+            except Exception as e:
+                logger.warning(f"Não foi possível obter o plano da consulta lenta: {str(e)}")
+
+        if tabelas:
+            logger.warning(
+                f"Varredura sequencial em {', '.join(tabelas)} na consulta lenta de {registro['origem']}"
+            )
+
+        session = self.session_factory()
+        try:
+            session.add(ConsultaLenta(
+                data_hora=registro['data_hora'],
+                engine=registro['engine'],
+                duracao_ms=registro['duracao_ms'],
+                instrucao=registro['instrucao'][:LIMITE_INSTRUCAO],
+                parametros=registro['parametros_texto'],
+                plano=plano,
+                varredura_sequencial=bool(tabelas) if plano is not None else None,
+                tabelas_varridas=','.join(tabelas) or None,
+                origem=registro['origem'][:500] if registro['origem'] else None,
+            ))
+            session.commit()
+            self.stats['gravadas'] += 1
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+
+_monitor: Optional[MonitorConsultas] = None
+_lock = threading.Lock()
+
+
+def monitorar_engines(nomes: Iterable[str] = ('datalake', 'datalake_leitura')) -> MonitorConsultas:
+    """
+    Instrumenta os engines compartilhados do datalake com o monitor do processo.
+
+    Pode ser chamada mais de uma vez; cada engine é instrumentado uma única vez.
+
+    Args:
+        nomes: Papéis dos engines (ver engines.PAPEIS)
+
+    Returns:
+        Monitor de consultas do processo
+    """
+    global _monitor
+
+    with _lock:
+        if _monitor is None:
+            _monitor = MonitorConsultas()
+        for nome in nomes:
+            _monitor.instrumentar(nome, obter_engine(nome))
+    return _monitor
@@ -0,0 +1,209 @@
+"""
+CT-e (Conhecimento de Transporte Eletrônico) no datalake.
+
+Plugin 'cte' (ver plugins.py): os arquivos cteProc/CTe da pasta de entrada
+são extraídos com um leitor próprio, mais simples que o da NF-e, e gravados
+nas tabelas cte e cte_documento. Como na NF-e, um CT-e cuja chave já está
+no banco é duplicata.
+"""
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .extractor import parse_xml_memoria
+from .metricas import TemporizadorEtapas
+from .models import CTe, CTeDocumento
+from .plugins import PluginDocumento, data_hora_xml, decimal_xml, texto_filho
+from .transformer import determinar_situacao
+
+# Elementos raiz dos XMLs de CT-e (com e sem protocolo, CT-e OS)
+RAIZES_CTE = ('cteProc', 'CTe', 'cteOSProc', 'CTeOS')
+
+# Participante tomador do serviço (toma3/toma) -> elemento com o CNPJ/CPF
+_TOMADORES = {'0': 'rem', '1': 'exped', '2': 'receb', '3': 'dest'}
+
+
+def _documento(elemento) -> Optional[str]:
+    """CNPJ ou CPF de um participante."""
+    return texto_filho(elemento, '{*}CNPJ') or texto_filho(elemento, '{*}CPF')
+
+
+class ExtratorCTe:
+    """
+    Extrator dos XMLs de CT-e.
+    """
+
+    def __init__(self, tempos: Optional[TemporizadorEtapas] = None):
+        """
+        Inicializa o extrator de CT-e.
+
+        Args:
+            tempos: Temporizador das etapas parse/extracao (opcional)
+        """
+        self.tempos = tempos or TemporizadorEtapas()
+
+    def extrair_cte_bytes(self, conteudo, arquivo_original: str = '') -> Dict[str, Any]:
+        """
+        Extrai os dados de um XML de CT-e em memória.
+
+        Args:
+            conteudo: XML em bytes (ou buffer)
+            arquivo_original: Identificação da origem
+
+        Returns:
+            Dicionário com os dados extraídos
+
+        Raises:
+            ValueError: Se o XML não for um CT-e válido
+        """
+        try:
+            with self.tempos.medir('parse'):
+                root = parse_xml_memoria(conteudo)
+        except Exception as e:
+            raise ValueError(f"Erro ao extrair dados do CT-e: {str(e)}")
+
+        with self.tempos.medir('extracao'):
+            inf = next(root.iter('{*}infCte'), None)
+            if inf is None:
+                raise ValueError("XML sem infCte")
+            return self._extrair_dados(root, inf, arquivo_original)
+
+    def _extrair_dados(self, root, inf, arquivo_original: str) -> Dict[str, Any]:
+        """Extrai as seções do CT-e a partir de infCte."""
+        ide = inf.find('{*}ide')
+        emit = inf.find('{*}emit')
+        valores = inf.find('{*}vPrest')
+        normal = inf.find('{*}infCTeNorm')
+        prot = next(root.iter('{*}infProt'), None)
+
+        tomador_tipo = texto_filho(ide, '{*}toma3/{*}toma') or texto_filho(ide, '{*}toma4/{*}toma')
+        if tomador_tipo in _TOMADORES:
+            tomador_cnpj = _documento(inf.find(f'{{*}}{_TOMADORES[tomador_tipo]}'))
+        else:
+            tomador_cnpj = _documento(ide.find('{*}toma4')) if ide is not None else None
+
+        chave = (inf.get('Id') or '').replace('CTe', '') or texto_filho(prot, '{*}chCTe')
+
+        return {
+            'chave_acesso': chave,
+            'numero_cte': texto_filho(ide, '{*}nCT'),
+            'serie': texto_filho(ide, '{*}serie'),
+            'modelo': texto_filho(ide, '{*}mod'),
+            'cfop': texto_filho(ide, '{*}CFOP'),
+            'natureza_operacao': texto_filho(ide, '{*}natOp'),
+            'tipo_cte': texto_filho(ide, '{*}tpCTe'),
+            'tipo_servico': texto_filho(ide, '{*}tpServ'),
+            'modal': texto_filho(ide, '{*}modal'),
+            'data_emissao': data_hora_xml(texto_filho(ide, '{*}dhEmi')),
+            'municipio_inicio': texto_filho(ide, '{*}cMunIni'),
+            'uf_inicio': texto_filho(ide, '{*}UFIni'),
+            'municipio_fim': texto_filho(ide, '{*}cMunFim'),
+            'uf_fim': texto_filho(ide, '{*}UFFim'),
+            'emitente_cnpj': _documento(emit),
+            'emitente_nome': texto_filho(emit, '{*}xNome'),
+            'emitente_uf': texto_filho(emit, '{*}enderEmit/{*}UF'),
+            'remetente_cnpj': _documento(inf.find('{*}rem')),
+            'destinatario_cnpj': _documento(inf.find('{*}dest')),
+            'expedidor_cnpj': _documento(inf.find('{*}exped')),
+            'recebedor_cnpj': _documento(inf.find('{*}receb')),
+            'tomador_tipo': tomador_tipo,
+            'tomador_cnpj': tomador_cnpj,
+            'valor_total_prestacao': texto_filho(valores, '{*}vTPrest'),
+            'valor_receber': texto_filho(valores, '{*}vRec'),
+            'valor_carga': texto_filho(normal, '{*}infCarga/{*}vCarga'),
+            'icms': self._extrair_icms(inf.find('{*}imp/{*}ICMS')),
+            'chaves_nfe': [
+                texto_filho(doc, '{*}chave') for doc in normal.iterfind('{*}infDoc/{*}infNFe')
+            ] if normal is not None else [],
+            'protocolo': {
+                'numero_protocolo': texto_filho(prot, '{*}nProt'),
+                'codigo_status': texto_filho(prot, '{*}cStat'),
+                'motivo': texto_filho(prot, '{*}xMotivo'),
+                'data_recebimento': data_hora_xml(texto_filho(prot, '{*}dhRecbto')),
+            },
+            'arquivo_original': arquivo_original or None,
+        }
+
+    def _extrair_icms(self, icms) -> Dict[str, Any]:
+        """ICMS da prestação (ICMS00, 20, 45, 60, 90, OutraUF ou SN)."""
+        grupo = icms[0] if icms is not None and len(icms) else None
+        if grupo is None:
+            return {}
+
+        def primeiro(*campos):
+            for campo in campos:
+                valor = texto_filho(grupo, f'{{*}}{campo}')
+                if valor is not None:
+                    return valor
+            return None
+
+        return {
+            'situacao_tributaria': primeiro('CST'),
+            'base_calculo': primeiro('vBC', 'vBCOutraUF', 'vBCSTRet'),
+            'aliquota': primeiro('pICMS', 'pICMSOutraUF', 'pICMSSTRet'),
+            'valor': primeiro('vICMS', 'vICMSOutraUF', 'vICMSSTRet'),
+        }
+
+
+def transformar_cte(dados: Dict[str, Any]) -> CTe:
+    """
+    Converte os dados extraídos em um objeto CTe (com os documentos transportados).
+
+    Raises:
+        ValueError: Se faltar a chave, o número ou a data de emissão
+    """
+    if not dados.get('chave_acesso') or not dados.get('numero_cte') or not dados.get('data_emissao'):
+        raise ValueError("CT-e sem chave de acesso, número ou data de emissão")
+
+    icms = dados.get('icms', {})
+    protocolo = dados.get('protocolo', {})
+    campos = {
+        coluna: dados.get(coluna) for coluna in (
+            'chave_acesso', 'numero_cte', 'serie', 'modelo', 'cfop', 'natureza_operacao', 'tipo_cte',
+            'tipo_servico', 'modal', 'data_emissao', 'municipio_inicio', 'uf_inicio', 'municipio_fim',
+            'uf_fim', 'emitente_cnpj', 'emitente_nome', 'emitente_uf', 'remetente_cnpj',
+            'destinatario_cnpj', 'expedidor_cnpj', 'recebedor_cnpj', 'tomador_tipo', 'tomador_cnpj',
+            'arquivo_original',
+        )
+    }
+
+    return CTe(
+        **campos,
+        valor_total_prestacao=decimal_xml(dados.get('valor_total_prestacao')),
+        valor_receber=decimal_xml(dados.get('valor_receber')),
+        valor_carga=decimal_xml(dados.get('valor_carga')),
+        situacao_tributaria_icms=icms.get('situacao_tributaria'),
+        base_calculo_icms=decimal_xml(icms.get('base_calculo')),
+        aliquota_icms=decimal_xml(icms.get('aliquota')),
+        valor_icms=decimal_xml(icms.get('valor')),
+        situacao=determinar_situacao(protocolo.get('codigo_status')),
+        codigo_status=protocolo.get('codigo_status'),
+        motivo_status=protocolo.get('motivo'),
+        protocolo_autorizacao=protocolo.get('numero_protocolo'),
+        data_autorizacao=protocolo.get('data_recebimento'),
+        documentos=[CTeDocumento(chave_nfe=chave) for chave in dados.get('chaves_nfe', []) if chave],
+    )
+
+
+class PluginCTe(PluginDocumento):
+    """Plugin dos XMLs de CT-e (tabelas cte e cte_documento)."""
+
+    nome = 'cte'
+    descricao = 'CT-e'
+    raizes = RAIZES_CTE
+
+    def extrair(self, conteudo, arquivo: str, tempos: TemporizadorEtapas) -> CTe:
+        dados = ExtratorCTe(tempos=tempos).extrair_cte_bytes(conteudo, arquivo)
+        with tempos.medir('transformacao'):
+            return transformar_cte(dados)
+
+    def chave(self, dados: CTe) -> Optional[str]:
+        return dados.chave_acesso
+
+    def gravar(self, session: Session, dados: CTe) -> int:
+        # O autoflush da consulta inclui os CT-e já adicionados no mesmo lote
+        if session.execute(select(CTe.id).where(CTe.chave_acesso == dados.chave_acesso)).first():
+            return 0
+        session.add(dados)
+        return 1
@@ -0,0 +1,210 @@
+"""
+Descarte de arquivos processados - deletar ou mover para backup.
+
+O descarte pode ser feito em segundo plano (DescarteArquivos): o loop de
+extração/carga apenas enfileira os caminhos e uma thread de I/O executa as
+remoções/movimentações em lotes, com novas tentativas para falhas
+transitórias (compartilhamentos de rede), registrando o estado final em
+ArquivoProcessado com um UPDATE em lote.
+"""
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+
+from .config import config
+from .metricas import TemporizadorEtapas
+from .models import ArquivoProcessado
+
+logger = logging.getLogger(__name__)
+
+
+# Máximo de arquivos por lote do worker
+TAMANHO_LOTE_DESCARTE = 200
+
+# Tentativas para falhas transitórias de I/O e espera base entre elas (segundos)
+TENTATIVAS_DESCARTE = 3
+ESPERA_TENTATIVA = 0.5
+
+
+def descartar_arquivo(caminho_arquivo: str) -> Optional[Tuple[bool, Optional[str]]]:
+    """
+    Deleta ou move um arquivo para backup, conforme a configuração.
+
+    Args:
+        caminho_arquivo: Caminho completo do arquivo
+
+    Returns:
+        Tupla (deletado, caminho do backup) ou None se nada foi feito
+    """
+    if not os.path.exists(caminho_arquivo):
+        return None
+
+    if config.deletar_apos_processar:
+        os.remove(caminho_arquivo)
+        logger.info(f"Arquivo deletado: {caminho_arquivo}")
+        return True, None
+
+    if config.mover_para_backup and config.diretorio_backup:
+        backup_dir = config.diretorio_backup
+
+        # Criar diretório de backup se não existir
+        os.makedirs(backup_dir, exist_ok=True)
+
+        # Mover arquivo mantendo o nome original
+        nome_arquivo = os.path.basename(caminho_arquivo)
+        caminho_backup = os.path.join(backup_dir, nome_arquivo)
+
+        # Se já existe no backup, adicionar timestamp
+        if os.path.exists(caminho_backup):
+            nome_base, extensao = os.path.splitext(nome_arquivo)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            nome_arquivo = f"{nome_base}_{timestamp}{extensao}"
+            caminho_backup = os.path.join(backup_dir, nome_arquivo)
+
+        if _mesmo_sistema_arquivos(caminho_arquivo, backup_dir):
+            # Renomear é uma única operação de metadados
+            os.rename(caminho_arquivo, caminho_backup)
+        else:
+            shutil.move(caminho_arquivo, caminho_backup)
+
+        logger.info(f"Arquivo movido para backup: {caminho_backup}")
+        return False, caminho_backup
+
+    return None
+
+
+def _mesmo_sistema_arquivos(caminho_arquivo: str, diretorio: str) -> bool:
+    """Verifica se o arquivo e o diretório estão no mesmo sistema de arquivos."""
+    try:
+        return os.stat(caminho_arquivo).st_dev == os.stat(diretorio).st_dev
+    except OSError:
+        return False
+
+
+class DescarteArquivos:
+    """
+    Worker de I/O em segundo plano para o descarte de arquivos processados.
+
+    O loop principal chama agendar() e segue; a thread agrupa os caminhos
+    pendentes em lotes, descarta cada arquivo (com novas tentativas) e grava
+    deletado/caminho_backup de todo o lote em ArquivoProcessado de uma vez.
+    """
+
+    def __init__(self, session_factory=None, tamanho_lote: int = TAMANHO_LOTE_DESCARTE,
+                 tempos: Optional[TemporizadorEtapas] = None):
+        """
+        Inicializa e inicia o worker.
+
+        Args:
+            session_factory: Fábrica de sessões do datalake (padrão: SessionLocal)
+            tamanho_lote: Máximo de arquivos por lote
+            tempos: Temporizador da etapa 'descarte' (opcional)
+        """
+        if session_factory is None:
+            from .database import SessionLocal
+            session_factory = SessionLocal
+
+        self.session_factory = session_factory
+        self.tamanho_lote = tamanho_lote
+        self.tempos = tempos or TemporizadorEtapas()
+        self.stats = {'descartados': 0, 'erros': 0}
+
+        self._fila: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, name='descarte-arquivos', daemon=True)
+        self._thread.start()
+
+    def agendar(self, caminho_arquivo: str):
+        """Enfileira um arquivo para descarte, sem bloquear."""
+        self._fila.put(caminho_arquivo)
+
+    def finalizar(self, timeout: Optional[float] = None):
+        """
+        Aguarda o descarte dos arquivos pendentes e encerra o worker.
+
+        Args:
+            timeout: Tempo máximo de espera em segundos (None = sem limite)
+        """
+        self._fila.put(None)
+        self._thread.join(timeout)
+
+    def _executar(self):
+        """Loop do worker: consome a fila em lotes até receber o sinal de término."""
+        encerrar = False
+        while not encerrar:
+            lote = [self._fila.get()]
+
+            # Agrupar o que já estiver pendente
+            while len(lote) < self.tamanho_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in lote:
+                encerrar = True
+                lote = [caminho for caminho in lote if caminho is not None]
+
+            if lote:
+                self._processar_lote(lote)
+
+    def _processar_lote(self, lote: List[str]):
+        """Descarta os arquivos do lote e registra o resultado em lote."""
+        atualizacoes = []
+
+        for caminho in lote:
+            with self.tempos.medir('descarte'):
+                resultado = self._descartar_com_tentativas(caminho)
+            if resultado:
+                deletado, caminho_backup = resultado
+                atualizacoes.append({
+                    'b_caminho': caminho,
+                    'b_deletado': deletado,
+                    'b_caminho_backup': caminho_backup,
+                })
+
+        if atualizacoes:
+            self._registrar(atualizacoes)
+
+    def _descartar_com_tentativas(self, caminho: str) -> Optional[Tuple[bool, Optional[str]]]:
+        """Descarta um arquivo, repetindo em falhas transitórias de I/O."""
+        for tentativa in range(1, TENTATIVAS_DESCARTE + 1):
+            try:
+                resultado = descartar_arquivo(caminho)
+                if resultado:
+                    self.stats['descartados'] += 1
+                return resultado
+            except FileNotFoundError:
+                return None
+            except OSError as e:
+                if tentativa == TENTATIVAS_DESCARTE:
+                    self.stats['erros'] += 1
+                    logger.error(f"Erro ao deletar/mover arquivo {caminho}: {str(e)}")
+                    return None
+                time.sleep(ESPERA_TENTATIVA * tentativa)
+
+    def _registrar(self, atualizacoes: List[dict]):
+        """Grava deletado/caminho_backup dos arquivos do lote com um único UPDATE."""
+        tabela = ArquivoProcessado.__table__
+        instrucao = update(tabela).where(
+            tabela.c.caminho_arquivo == bindparam('b_caminho')
+        ).values(
+            deletado=bindparam('b_deletado'),
+            caminho_backup=bindparam('b_caminho_backup')
+        )
+
+        session = self.session_factory()
+        try:
+            session.connection().execute(instrucao, atualizacoes)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao atualizar status dos arquivos: {str(e)}")
+        finally:
+            session.close()
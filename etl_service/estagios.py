@@ -0,0 +1,524 @@
+"""
+Processamento de diretórios em estágios ligados por filas limitadas.
+
+Em vez de ler, interpretar e carregar cada arquivo em sequência (CPU parada
+durante o I/O do banco e banco parado durante o parse), os arquivos passam
+por três estágios que trabalham ao mesmo tempo:
+
+- leitura: threads que leem os arquivos (disco/NAS) e descartam pela chave
+  as NF-e já carregadas, antes do parse
+- parse: threads que interpretam o XML, extraem as seções e montam a NFe
+  (ou, nos demais tipos de documento, extraem pelo plugin do tipo)
+- carga: a thread chamadora, que grava as NF-e e os demais documentos em
+  lotes de uma transação (DataLoader.carregar_lote e carregar_documentos)
+
+As filas entre os estágios têm capacidade limitada: se a carga atrasar, os
+estágios anteriores bloqueiam em vez de acumular arquivos em memória.
+A ocupação de cada estágio e a profundidade das filas ficam disponíveis em
+estatisticas().
+"""
+import hashlib
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .extractor import XMLExtractor, localizar_chave_acesso, LIMITE_BUSCA_CHAVE
+from .plugins import plugin_para
+from .transformer import DataTransformer
+
+logger = logging.getLogger(__name__)
+
+# Fim dos itens de um estágio
+_FIM = object()
+
+# Espera máxima (segundos) de cada tentativa de get/put, para checar a interrupção
+ESPERA_FILA = 0.1
+
+
+class _Interrompido(Exception):
+    """O processamento foi interrompido (falha em outro estágio ou na carga)."""
+
+
+class Estagio:
+    """Itens processados e tempo ocupado dos workers de um estágio."""
+
+    def __init__(self, workers: int):
+        """
+        Inicializa os contadores.
+
+        Args:
+            workers: Quantidade de threads do estágio
+        """
+        self.workers = workers
+        self.itens = 0
+        self.ocupado = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trabalhar(self, itens: int = 1):
+        """Conta o bloco como tempo ocupado do estágio (fora das esperas em fila)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.ocupado += time.perf_counter() - inicio
+                self.itens += itens
+
+    def resumo(self, decorrido: float) -> Dict[str, Any]:
+        """Resumo do estágio: workers, itens, tempo ocupado e utilização (0 a 1)."""
+        capacidade = decorrido * self.workers
+        return {
+            'workers': self.workers,
+            'itens': self.itens,
+            'ocupado': round(self.ocupado, 3),
+            'utilizacao': round(min(1.0, self.ocupado / capacidade), 3) if capacidade > 0 else 0.0,
+        }
+
+
+class PipelineEstagios:
+    """
+    Executa leitura, parse e carga dos arquivos de um ETLPipeline em paralelo.
+    """
+
+    def __init__(self, pipeline, leitores: int = 2, parsers: int = 2,
+                 tamanho_fila: int = 64, tamanho_lote: int = 50):
+        """
+        Inicializa os estágios.
+
+        Args:
+            pipeline: ETLPipeline dono da execução (loader, checkpoint,
+                temporizador, estatísticas)
+            leitores: Threads do estágio de leitura
+            parsers: Threads do estágio de parse
+            tamanho_fila: Capacidade de cada fila entre estágios
+            tamanho_lote: NF-e por transação no estágio de carga
+        """
+        self.pipeline = pipeline
+        self.tamanho_lote = tamanho_lote
+
+        self.estagios = {
+            'leitura': Estagio(leitores),
+            'parse': Estagio(parsers),
+            'carga': Estagio(1),
+        }
+        self.filas = {
+            'leitura': queue.Queue(tamanho_fila),  # leitura -> parse
+            'carga': queue.Queue(tamanho_fila),    # parse -> carga
+        }
+        self._profundidade = {nome: {'soma': 0, 'amostras': 0, 'max': 0} for nome in self.filas}
+        # Estatísticas dos arquivos concluídos além da posição contígua, por índice
+        self._parciais: Dict[int, Dict[str, Any]] = {}
+
+        self._parar = threading.Event()
+        self._falha: Optional[BaseException] = None
+        self._ativos = {'leitura': leitores, 'parse': parsers}
+        self._lock = threading.Lock()
+        self._inicio: Optional[float] = None
+        self._fim: Optional[float] = None
+
+    def executar(self, arquivos: Iterable[str], processamento_id: Optional[int],
+                 posicao: int = 0, retomada: bool = False,
+                 ao_avancar: Optional[Callable[[int], None]] = None):
+        """
+        Processa os arquivos e retorna quando todos foram carregados.
+
+        Os arquivos terminam fora de ordem; ao_avancar recebe a maior posição
+        até a qual todos os arquivos da lista já foram concluídos (usada
+        para o checkpoint). As estatísticas do pipeline só incluem os
+        arquivos até essa posição: os concluídos além dela ficam à parte
+        até a posição alcançá-los, para que o checkpoint não os conte duas
+        vezes numa retomada.
+
+        Args:
+            arquivos: Arquivos após a posição, na ordem da lista da execução
+            processamento_id: ID do processamento ETL
+            posicao: Quantidade de arquivos da lista já concluídos
+            retomada: Se é a retomada de uma execução interrompida
+            ao_avancar: Chamado (na thread chamadora) quando a posição contígua avança
+        """
+        fonte = enumerate(arquivos, posicao + 1)
+        lock_fonte = threading.Lock()
+
+        threads = [
+            threading.Thread(target=self._ler, args=(fonte, lock_fonte, retomada),
+                             name=f'etl-leitura-{i}', daemon=True)
+            for i in range(self.estagios['leitura'].workers)
+        ] + [
+            threading.Thread(target=self._interpretar, name=f'etl-parse-{i}', daemon=True)
+            for i in range(self.estagios['parse'].workers)
+        ]
+
+        self._inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._carregar(processamento_id, posicao, ao_avancar)
+        finally:
+            self._parar.set()
+            for thread in threads:
+                thread.join(timeout=30)
+            self._fim = time.perf_counter()
+
+    def profundidade(self) -> Dict[str, int]:
+        """Itens aguardando em cada fila neste momento."""
+        return {nome: fila.qsize() for nome, fila in self.filas.items()}
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """
+        Ocupação dos estágios e profundidade das filas da execução.
+
+        Returns:
+            Dicionário com 'estagios' (workers, itens, ocupado, utilizacao) e
+            'filas' (capacidade, media e max de itens aguardando)
+        """
+        if self._inicio is None:
+            return {'estagios': {}, 'filas': {}}
+
+        decorrido = (self._fim or time.perf_counter()) - self._inicio
+        return {
+            'estagios': {nome: estagio.resumo(decorrido) for nome, estagio in self.estagios.items()},
+            'filas': {
+                nome: {
+                    'capacidade': self.filas[nome].maxsize,
+                    'media': round(medida['soma'] / medida['amostras'], 1) if medida['amostras'] else 0.0,
+                    'max': medida['max'],
+                }
+                for nome, medida in self._profundidade.items()
+            },
+        }
+
+    def _colocar(self, fila: queue.Queue, item):
+        """Enfileira com contrapressão: bloqueia enquanto a fila está cheia."""
+        while True:
+            if self._parar.is_set():
+                raise _Interrompido()
+            try:
+                fila.put(item, timeout=ESPERA_FILA)
+                return
+            except queue.Full:
+                continue
+
+    def _obter(self, fila: queue.Queue):
+        """Retira o próximo item, aguardando enquanto a fila está vazia."""
+        while True:
+            if self._parar.is_set():
+                raise _Interrompido()
+            try:
+                return fila.get(timeout=ESPERA_FILA)
+            except queue.Empty:
+                continue
+
+    def _falhar(self, erro: BaseException):
+        """Registra a falha inesperada de um worker e interrompe os estágios."""
+        logger.error(f"Falha no pipeline em estágios: {str(erro)}")
+        with self._lock:
+            if self._falha is None:
+                self._falha = erro
+        self._parar.set()
+
+    def _encerrar_worker(self, estagio: str, fila: queue.Queue, sinais: int):
+        """Ao sair o último worker do estágio, sinaliza o fim para o estágio seguinte."""
+        with self._lock:
+            self._ativos[estagio] -= 1
+            ultimo = self._ativos[estagio] == 0
+        if ultimo:
+            for _ in range(sinais):
+                self._colocar(fila, _FIM)
+
+    def _ler(self, fonte, lock_fonte: threading.Lock, retomada: bool):
+        """Worker de leitura: lê os arquivos e descarta as duplicatas pela chave."""
+        try:
+            while True:
+                with lock_fonte:
+                    proximo = next(fonte, None)
+                if proximo is None:
+                    break
+
+                indice, arquivo = proximo
+                with self.estagios['leitura'].trabalhar():
+                    try:
+                        item = self._ler_arquivo(indice, arquivo, retomada)
+                    except Exception as e:
+                        item = {'indice': indice, 'arquivo': arquivo, 'tipo': 'erro',
+                                'mensagem': f'Erro ao processar arquivo: {str(e)}'}
+                self._colocar(self.filas['leitura'], item)
+
+            self._encerrar_worker('leitura', self.filas['leitura'], self.estagios['parse'].workers)
+        except _Interrompido:
+            return
+        except Exception as e:
+            self._falhar(e)
+
+    def _ler_arquivo(self, indice: int, arquivo: str, retomada: bool) -> Dict[str, Any]:
+        """Lê um arquivo e classifica: conteudo, plugin, ignorado, duplicata, ja_carregado ou erro."""
+        item: Dict[str, Any] = {'indice': indice, 'arquivo': arquivo}
+        tempos = self.pipeline.tempos
+
+        # Tipo sem plugin de carga, já registrado numa execução anterior
+        with tempos.medir('deduplicacao'):
+            ignorado = self.pipeline._arquivo_ignorado(arquivo)
+        if ignorado:
+            item['tipo'] = 'ignorado'
+            item['mensagem'] = 'Arquivo ignorado em execução anterior'
+            return item
+
+        try:
+            with tempos.medir('leitura'):
+                with open(arquivo, 'rb') as f:
+                    conteudo = f.read()
+        except OSError as e:
+            if retomada and self.pipeline.checkpoint.arquivo_registrado(arquivo):
+                # Carregado e descartado antes da interrupção
+                item['tipo'] = 'ja_carregado'
+            else:
+                item['tipo'] = 'erro'
+                item['mensagem'] = f'Erro ao processar arquivo: Erro ao ler o arquivo: {str(e)}'
+            return item
+
+        plugin = plugin_para(conteudo)
+        if plugin is not None:
+            if plugin.ignorar:
+                item['tipo'] = 'ignorado'
+                item['plugin'] = plugin
+            else:
+                item['tipo'] = 'plugin'
+                item['plugin'] = plugin
+                item['conteudo'] = conteudo
+            return item
+
+        # Duplicata detectada pela chave, antes do parse (no upsert a NF-e é sempre carregada)
+        with tempos.medir('deduplicacao'):
+            chave = None if self.pipeline.loader.upsert else localizar_chave_acesso(conteudo, LIMITE_BUSCA_CHAVE)
+            duplicada = bool(chave) and self.pipeline._chave_ja_carregada(chave)
+
+        if duplicada:
+            item['tipo'] = 'duplicata'
+            item['chave_acesso'] = chave
+        else:
+            item['tipo'] = 'conteudo'
+            item['conteudo'] = conteudo
+        return item
+
+    def _interpretar(self):
+        """Worker de parse: extrai e transforma o conteúdo lido."""
+        extractor = XMLExtractor(tempos=self.pipeline.tempos)
+        transformer = DataTransformer()
+
+        try:
+            while True:
+                item = self._obter(self.filas['leitura'])
+                if item is _FIM:
+                    break
+
+                if item['tipo'] == 'conteudo':
+                    with self.estagios['parse'].trabalhar():
+                        conteudo = item.pop('conteudo')
+                        try:
+                            dados = extractor.extrair_nfe_bytes(conteudo, item['arquivo'])
+                            with self.pipeline.tempos.medir('transformacao'):
+                                nfe = transformer.transformar_nfe(dados)
+                            item.update(
+                                tipo='documento',
+                                dados=dados,
+                                nfe=nfe,
+                                hash_arquivo=hashlib.sha256(conteudo).hexdigest(),
+                            )
+                        except Exception as e:
+                            item['tipo'] = 'erro'
+                            item['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+
+                elif item['tipo'] == 'plugin':
+                    with self.estagios['parse'].trabalhar():
+                        conteudo = item.pop('conteudo')
+                        try:
+                            item.update(
+                                tipo='outro',
+                                dados=item['plugin'].extrair(conteudo, item['arquivo'], self.pipeline.tempos),
+                                hash_arquivo=hashlib.sha256(conteudo).hexdigest(),
+                            )
+                        except Exception as e:
+                            item['tipo'] = 'erro'
+                            item['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+
+                self._colocar(self.filas['carga'], item)
+
+            self._encerrar_worker('parse', self.filas['carga'], 1)
+        except _Interrompido:
+            return
+        except Exception as e:
+            self._falhar(e)
+
+    def _amostrar_filas(self):
+        """Acumula a profundidade atual das filas (média e máximo da execução)."""
+        for nome, tamanho in self.profundidade().items():
+            medida = self._profundidade[nome]
+            medida['soma'] += tamanho
+            medida['amostras'] += 1
+            medida['max'] = max(medida['max'], tamanho)
+
+    def _carregar(self, processamento_id: Optional[int], posicao: int,
+                  ao_avancar: Optional[Callable[[int], None]]):
+        """Estágio de carga (thread chamadora): grava os documentos em lotes."""
+        pendentes: List[Dict[str, Any]] = []
+        concluidos = set()
+        proxima = posicao + 1
+
+        def concluir(indices: Iterable[int]):
+            nonlocal proxima
+            concluidos.update(indices)
+            inicial = proxima
+            while proxima in concluidos:
+                concluidos.remove(proxima)
+                self.pipeline._somar_stats(self._parciais.pop(proxima, {}))
+                proxima += 1
+            if proxima != inicial and ao_avancar:
+                ao_avancar(proxima - 1)
+
+        while True:
+            self._amostrar_filas()
+            try:
+                item = self.filas['carga'].get(timeout=ESPERA_FILA)
+            except queue.Empty:
+                if self._falha is not None:
+                    raise self._falha
+                # Fila vazia: grava o lote parcial em vez de esperar completá-lo
+                if pendentes:
+                    concluir(self._gravar_lote(pendentes, processamento_id))
+                    pendentes = []
+                continue
+
+            if item is _FIM:
+                break
+
+            if item['tipo'] in ('documento', 'outro'):
+                pendentes.append(item)
+                if len(pendentes) >= self.tamanho_lote:
+                    concluir(self._gravar_lote(pendentes, processamento_id))
+                    pendentes = []
+                continue
+
+            with self.estagios['carga'].trabalhar():
+                self._registrar_item(item, processamento_id)
+            concluir([item['indice']])
+
+        if pendentes:
+            concluir(self._gravar_lote(pendentes, processamento_id))
+
+    def _registrar_item(self, item: Dict[str, Any], processamento_id: Optional[int]):
+        """Contabiliza um item que não passa pela carga em lote."""
+        pipeline = self.pipeline
+
+        if item['tipo'] == 'ja_carregado':
+            self._parciais[item['indice']] = {'duplicados': 1}
+            return
+
+        resultado = {
+            'sucesso': False,
+            'duplicado': False,
+            'ignorado': item['tipo'] == 'ignorado',
+            'mensagem': item.get('mensagem', ''),
+            'chave_acesso': None,
+        }
+        if item['tipo'] == 'duplicata':
+            try:
+                resultado = pipeline.loader.registrar_duplicata_previa(
+                    item['arquivo'], item['chave_acesso'], processamento_id
+                )
+            except Exception as e:
+                resultado['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+        elif item['tipo'] == 'ignorado' and item.get('plugin') is not None:
+            # Primeira vez: registra para as próximas execuções o pularem
+            resultado = pipeline._registrar_ignorado(item['arquivo'], item['plugin'], processamento_id)
+        self._contabilizar(item, resultado)
+
+    def _gravar_lote(self, itens: List[Dict[str, Any]], processamento_id: Optional[int]) -> List[int]:
+        """
+        Grava as NF-e e os demais documentos do lote; se uma transação falhar, um a um.
+
+        Returns:
+            Índices dos arquivos concluídos
+        """
+        pipeline = self.pipeline
+        documentos = [item for item in itens if item['tipo'] == 'documento']
+        outros: Dict[str, List[Dict[str, Any]]] = {}
+        for item in itens:
+            if item['tipo'] == 'outro':
+                outros.setdefault(item['plugin'].nome, []).append(item)
+
+        with self.estagios['carga'].trabalhar(len(itens)):
+            resultados = dict(zip(
+                (item['indice'] for item in documentos), self._gravar_documentos(documentos, processamento_id)
+            ))
+            for grupo in outros.values():
+                resultados.update(zip(
+                    (item['indice'] for item in grupo), self._gravar_outros(grupo, processamento_id)
+                ))
+
+        for item in itens:
+            resultado = resultados[item['indice']]
+            # Só as chaves de NF-e: a de um evento é a da NF-e cancelada/corrigida, que pode não estar carregada
+            if item['tipo'] == 'documento' and (resultado.get('sucesso') or resultado.get('duplicado')):
+                pipeline._chaves_carregadas.add(resultado['chave_acesso'])
+            self._contabilizar(item, resultado)
+
+        return [item['indice'] for item in itens]
+
+    def _contabilizar(self, item: Dict[str, Any], resultado: dict):
+        """Contabiliza o resultado de um arquivo à parte, até a posição contígua alcançá-lo."""
+        self.pipeline._contabilizar(resultado, item['arquivo'], self._parciais.setdefault(item['indice'], {}))
+
+    def _gravar_documentos(self, itens: List[Dict[str, Any]], processamento_id: Optional[int]) -> List[dict]:
+        """Grava as NF-e numa transação; se ela falhar, uma a uma."""
+        pipeline = self.pipeline
+
+        resultados = pipeline.loader.carregar_lote([
+            {
+                'nfe': item['nfe'],
+                'arquivo': item['arquivo'],
+                'dados_emitente': item['dados'].get('emitente', {}),
+                'hash_arquivo': item['hash_arquivo'],
+            }
+            for item in itens
+        ], processamento_id)
+
+        if resultados is None:
+            # As NFe do lote desfeito são montadas de novo a partir dos dados extraídos
+            resultados = []
+            for item in itens:
+                resultado = {'sucesso': False, 'duplicado': False, 'mensagem': '', 'chave_acesso': None}
+                try:
+                    pipeline._transformar_e_carregar(item['dados'], item['arquivo'], processamento_id, resultado)
+                except Exception as e:
+                    resultado['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+                resultados.append(resultado)
+
+        return resultados
+
+    def _gravar_outros(self, itens: List[Dict[str, Any]], processamento_id: Optional[int]) -> List[dict]:
+        """Grava os documentos de um plugin numa transação; se ela falhar, arquivo a arquivo."""
+        loader = self.pipeline.loader
+        plugin = itens[0]['plugin']
+
+        documentos = [
+            {'arquivo': item['arquivo'], 'dados': item['dados'], 'hash_arquivo': item['hash_arquivo']}
+            for item in itens
+        ]
+        resultados = loader.carregar_documentos(plugin, documentos, processamento_id)
+
+        if resultados is None:
+            resultados = []
+            for documento in documentos:
+                resultado = loader.carregar_documentos(plugin, [documento], processamento_id)
+                resultados.append(resultado[0] if resultado else {
+                    'sucesso': False,
+                    'duplicado': False,
+                    'mensagem': f'Erro ao carregar {plugin.descricao}',
+                    'chave_acesso': plugin.chave(documento['dados']),
+                })
+
+        return resultados
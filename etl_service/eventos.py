@@ -0,0 +1,221 @@
+"""
+Eventos de NF-e: cancelamento, carta de correção e manifestação do destinatário.
+
+Os arquivos procEventoNFe são carregados pelo plugin 'evento' (ver
+plugins.py), sem o parse completo da NF-e: o XML do evento é pequeno e só
+os campos de infEvento e retEvento são lidos. Os eventos vão para
+nfe_evento (um registro por chave, tipo e sequência, o que torna a carga
+idempotente) e os cancelamentos registrados pela SEFAZ marcam a NF-e como
+'Cancelada' com um UPDATE em lote.
+
+Como um evento pode chegar antes da própria nota, aplicar_cancelamentos()
+também é executado ao fim de cada execução, para as NF-e carregadas depois
+do seu cancelamento.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from lxml import etree
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from .extractor import parse_xml_memoria
+from .metricas import TemporizadorEtapas
+from .models import NFe, NFeEvento
+from .plugins import PluginDocumento, data_hora_xml, texto_filho
+
+# Elementos raiz dos XMLs de evento
+RAIZES_EVENTO = ('procEventoNFe', 'envEvento', 'evento')
+
+# Descrição dos tipos de evento (tpEvento)
+TIPOS_EVENTO = {
+    '110110': 'Carta de Correção',
+    '110111': 'Cancelamento',
+    '110112': 'Cancelamento por substituição',
+    '210200': 'Confirmação da Operação',
+    '210210': 'Ciência da Operação',
+    '210220': 'Desconhecimento da Operação',
+    '210240': 'Operação não Realizada',
+}
+
+# Eventos que cancelam a NF-e
+EVENTOS_CANCELAMENTO = ('110111', '110112')
+
+# cStat do evento registrado (vinculado ou não à NF-e; 155 = cancelamento fora de prazo)
+STATUS_REGISTRADO = ('135', '136', '155')
+
+SITUACAO_CANCELADA = 'Cancelada'
+
+
+class ExtratorEventos:
+    """
+    Extrator dos XMLs de evento de NF-e (procEventoNFe e envEvento).
+    """
+
+    def __init__(self, tempos: Optional[TemporizadorEtapas] = None):
+        """
+        Inicializa o extrator de eventos.
+
+        Args:
+            tempos: Temporizador das etapas parse/extracao (opcional)
+        """
+        self.tempos = tempos or TemporizadorEtapas()
+
+    def extrair_eventos_bytes(self, conteudo, arquivo_original: str = '') -> List[Dict[str, Any]]:
+        """
+        Extrai os eventos de um XML em memória.
+
+        Args:
+            conteudo: XML em bytes (ou buffer)
+            arquivo_original: Identificação da origem
+
+        Returns:
+            Lista de eventos (um por elemento evento do XML)
+
+        Raises:
+            ValueError: Se o XML não for um evento de NF-e válido
+        """
+        try:
+            with self.tempos.medir('parse'):
+                root = parse_xml_memoria(conteudo)
+        except etree.XMLSyntaxError as e:
+            raise ValueError(f"Erro ao extrair evento do XML: {str(e)}")
+
+        with self.tempos.medir('extracao'):
+            eventos = [
+                self._extrair_evento(inf_evento, root, arquivo_original)
+                for inf_evento in root.iter('{*}infEvento')
+                if inf_evento.getparent() is not None and etree.QName(inf_evento.getparent()).localname == 'evento'
+            ]
+
+        if not eventos:
+            raise ValueError("XML sem evento de NF-e (infEvento)")
+        for evento in eventos:
+            if not evento['chave_acesso'] or not evento['tipo_evento']:
+                raise ValueError("Evento sem chave de acesso (chNFe) ou tipo (tpEvento)")
+        return eventos
+
+    def _extrair_evento(self, inf_evento, root, arquivo_original: str) -> Dict[str, Any]:
+        """Extrai um evento e o seu retorno (retEvento) correspondente."""
+        chave = texto_filho(inf_evento, '{*}chNFe')
+        tipo = texto_filho(inf_evento, '{*}tpEvento')
+        sequencia = int(texto_filho(inf_evento, '{*}nSeqEvento') or 1)
+        detalhe = inf_evento.find('{*}detEvento')
+        retorno = self._localizar_retorno(root, chave, tipo, sequencia)
+
+        return {
+            'chave_acesso': chave,
+            'tipo_evento': tipo,
+            'sequencia': sequencia,
+            'descricao_evento': texto_filho(detalhe, '{*}descEvento') or TIPOS_EVENTO.get(tipo),
+            'data_evento': data_hora_xml(texto_filho(inf_evento, '{*}dhEvento')),
+            'orgao': texto_filho(inf_evento, '{*}cOrgao'),
+            'ambiente': texto_filho(inf_evento, '{*}tpAmb'),
+            'autor_cnpj': texto_filho(inf_evento, '{*}CNPJ') or texto_filho(inf_evento, '{*}CPF'),
+            'protocolo_nfe': texto_filho(detalhe, '{*}nProt'),
+            'justificativa': texto_filho(detalhe, '{*}xJust'),
+            'correcao': texto_filho(detalhe, '{*}xCorrecao'),
+            'codigo_status': texto_filho(retorno, '{*}cStat'),
+            'motivo_status': texto_filho(retorno, '{*}xMotivo'),
+            'protocolo_evento': texto_filho(retorno, '{*}nProt'),
+            'data_registro': data_hora_xml(texto_filho(retorno, '{*}dhRegEvento')),
+            'arquivo_original': arquivo_original or None,
+        }
+
+    def _localizar_retorno(self, root, chave: Optional[str], tipo: Optional[str], sequencia: int):
+        """infEvento do retEvento do mesmo evento (ou None, se o evento não foi registrado)."""
+        for ret in root.iter('{*}retEvento'):
+            inf = ret.find('{*}infEvento')
+            if inf is not None and texto_filho(inf, '{*}chNFe') == chave and texto_filho(inf, '{*}tpEvento') == tipo \
+                    and int(texto_filho(inf, '{*}nSeqEvento') or 1) == sequencia:
+                return inf
+        return None
+
+
+def registrar_eventos(session: Session, eventos: List[Dict[str, Any]]) -> int:
+    """
+    Grava os eventos que ainda não estão em nfe_evento e aplica os cancelamentos.
+
+    Não faz commit: as alterações entram na transação da sessão.
+
+    Args:
+        session: Sessão do datalake
+        eventos: Eventos extraídos (ExtratorEventos)
+
+    Returns:
+        Quantidade de eventos novos gravados
+    """
+    if not eventos:
+        return 0
+
+    chaves = sorted({evento['chave_acesso'] for evento in eventos})
+    existentes = set(session.execute(
+        select(NFeEvento.chave_acesso, NFeEvento.tipo_evento, NFeEvento.sequencia).where(
+            NFeEvento.chave_acesso.in_(chaves)
+        )
+    ).tuples())
+
+    novos = []
+    for evento in eventos:
+        identificacao = (evento['chave_acesso'], evento['tipo_evento'], evento['sequencia'])
+        if identificacao not in existentes:
+            existentes.add(identificacao)
+            novos.append(dict(evento, data_processamento_etl=datetime.now()))
+
+    if novos:
+        session.execute(insert(NFeEvento), novos)
+        aplicar_cancelamentos(session, chaves=[
+            evento['chave_acesso'] for evento in novos if evento['tipo_evento'] in EVENTOS_CANCELAMENTO
+        ])
+    return len(novos)
+
+
+def aplicar_cancelamentos(session: Session, chaves: Optional[Iterable[str]] = None) -> int:
+    """
+    Marca como 'Cancelada' as NF-e com evento de cancelamento registrado.
+
+    Um único UPDATE em lote, que só altera (e só atualiza data_atualizacao_etl
+    de) NF-e ainda não canceladas. Não faz commit.
+
+    Args:
+        session: Sessão do datalake
+        chaves: Restringe às chaves informadas (padrão: todos os cancelamentos)
+
+    Returns:
+        Quantidade de NF-e canceladas
+    """
+    criterios = [
+        NFeEvento.tipo_evento.in_(EVENTOS_CANCELAMENTO),
+        NFeEvento.codigo_status.in_(STATUS_REGISTRADO),
+    ]
+    if chaves is not None:
+        chaves = sorted(set(chaves))
+        if not chaves:
+            return 0
+        criterios.append(NFeEvento.chave_acesso.in_(chaves))
+
+    resultado = session.execute(
+        update(NFe).where(
+            NFe.chave_acesso.in_(select(NFeEvento.chave_acesso).where(and_(*criterios))),
+            or_(NFe.situacao.is_(None), NFe.situacao != SITUACAO_CANCELADA),
+        ).values(situacao=SITUACAO_CANCELADA, data_atualizacao_etl=datetime.now()),
+        execution_options={'synchronize_session': False},
+    )
+    return resultado.rowcount or 0
+
+
+class PluginEventos(PluginDocumento):
+    """Plugin dos XMLs de evento de NF-e: um arquivo gera um ou mais eventos."""
+
+    nome = 'evento'
+    descricao = 'Eventos de NF-e'
+    raizes = RAIZES_EVENTO
+
+    def extrair(self, conteudo, arquivo: str, tempos: TemporizadorEtapas) -> List[Dict[str, Any]]:
+        return ExtratorEventos(tempos=tempos).extrair_eventos_bytes(conteudo, arquivo)
+
+    def chave(self, dados: List[Dict[str, Any]]) -> Optional[str]:
+        return dados[0]['chave_acesso']
+
+    def gravar(self, session: Session, dados: List[Dict[str, Any]]) -> int:
+        return registrar_eventos(session, dados)
@@ -5,9 +5,89 @@ Este módulo é responsável por extrair todos os dados dos arquivos XML
 de NF-e e NFC-e, sem fazer nenhuma transformação.
 """
 from lxml import etree
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, BinaryIO
 from datetime import datetime
 import os
+import re
+import stat
+
+from .metricas import TemporizadorEtapas
+
+
+# Chave de acesso no atributo Id de infNFe (NF-e e NFC-e)
+_PADRAO_CHAVE = re.compile(rb'<(?:\w+:)?infNFe\b[^>]*?\bId\s*=\s*["\']NFe(\d{44})["\']')
+
+# Bytes iniciais examinados em busca da chave (infNFe fica no início do XML)
+LIMITE_BUSCA_CHAVE = 8192
+
+# Primeiro elemento do XML, após a declaração, comentários e DOCTYPE
+_PADRAO_RAIZ = re.compile(rb'<(?![?!])(?:[\w.-]+:)?([\w.-]+)')
+
+
+def localizar_chave_acesso(conteudo, limite: int = LIMITE_BUSCA_CHAVE) -> Optional[str]:
+    """
+    Localiza a chave de acesso nos primeiros bytes do XML, sem interpretá-lo.
+    
+    Permite descartar duplicatas antes de qualquer trabalho do lxml.
+    
+    Args:
+        conteudo: Início do XML em bytes (ou buffer)
+        limite: Quantidade máxima de bytes examinados
+        
+    Returns:
+        Chave de acesso (44 dígitos) ou None se não encontrada
+    """
+    resultado = _PADRAO_CHAVE.search(bytes(conteudo[:limite]))
+    return resultado.group(1).decode('ascii') if resultado else None
+
+
+def tag_raiz(conteudo, limite: int = LIMITE_BUSCA_CHAVE) -> Optional[str]:
+    """
+    Nome do elemento raiz do XML (sem prefixo), a partir dos primeiros bytes.
+    
+    Identifica o tipo de documento (nfeProc, procEventoNFe...) sem
+    interpretar o XML.
+    
+    Args:
+        conteudo: Início do XML em bytes (ou buffer)
+        limite: Quantidade máxima de bytes examinados
+        
+    Returns:
+        Nome local do elemento raiz ou None se não encontrado
+    """
+    resultado = _PADRAO_RAIZ.search(bytes(conteudo[:limite]))
+    return resultado.group(1).decode('ascii', 'replace') if resultado else None
+
+
+def parse_xml_memoria(conteudo):
+    """
+    Interpreta um XML em memória sem copiar o buffer.
+    
+    Versões recentes do lxml aceitam qualquer objeto com protocolo de buffer
+    (memoryview, mmap); nas anteriores o conteúdo é convertido para bytes.
+    
+    Args:
+        conteudo: XML em bytes, bytearray, memoryview, mmap ou str
+        
+    Returns:
+        Elemento raiz do XML
+    """
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode('utf-8')
+    
+    try:
+        return etree.fromstring(conteudo)
+    except (TypeError, ValueError):
+        if isinstance(conteudo, bytes):
+            raise
+        return etree.fromstring(bytes(conteudo))
+
+
+def tamanho_conteudo(conteudo) -> int:
+    """Tamanho em bytes de um XML em memória (bytes, memoryview, mmap)."""
+    if isinstance(conteudo, memoryview):
+        return conteudo.nbytes
+    return len(conteudo)
 
 
 class XMLExtractor:
@@ -23,14 +103,37 @@ class XMLExtractor:
         'nfe': 'http://www.portalfiscal.inf.br/nfe',
     }
 
-    def __init__(self):
-        """Inicializa o extrator XML."""
-        pass
+    # Seções da NF-e e o método que extrai cada uma, na ordem do dicionário retornado
+    SECOES = (
+        ('identificacao', '_extrair_identificacao'),
+        ('emitente', '_extrair_emitente'),
+        ('destinatario', '_extrair_destinatario'),
+        ('itens', '_extrair_itens'),
+        ('totais', '_extrair_totais'),
+        ('transporte', '_extrair_transporte'),
+        ('cobranca', '_extrair_cobranca'),
+        ('pagamento', '_extrair_pagamento'),
+        ('informacoes_adicionais', '_extrair_informacoes_adicionais'),
+        ('intermediador', '_extrair_intermediador'),
+        ('protocolo', '_extrair_protocolo'),
+    )
+
+    def __init__(self, tempos: Optional[TemporizadorEtapas] = None):
+        """
+        Inicializa o extrator XML.
+        
+        Args:
+            tempos: Temporizador das etapas leitura/parse/extracao (opcional)
+        """
+        self.tempos = tempos or TemporizadorEtapas()
 
     def extrair_nfe(self, caminho_arquivo: str) -> Dict[str, Any]:
         """
         Extrai todos os dados de um arquivo XML de NF-e ou NFC-e.
         
+        Valida o caminho, lê o arquivo inteiro e delega para extrair_nfe_bytes,
+        de modo que a leitura (disco/NAS) e o parse sejam medidos separadamente.
+        
         Args:
             caminho_arquivo: Caminho para o arquivo XML
             
@@ -41,74 +144,138 @@ class XMLExtractor:
             ValueError: Se o arquivo não for um XML válido de NF-e
         """
         try:
-            # Verificar se o arquivo existe
-            if not os.path.exists(caminho_arquivo):
+            # Uma única chamada ao sistema de arquivos para existência, tipo e tamanho
+            try:
+                info = os.stat(caminho_arquivo)
+            except FileNotFoundError:
                 raise ValueError(f"Arquivo não encontrado: {caminho_arquivo}")
             
             # Verificar se é um arquivo (não diretório)
-            if os.path.isdir(caminho_arquivo):
+            if stat.S_ISDIR(info.st_mode):
                 raise ValueError(f"O caminho informado é um DIRETÓRIO, não um arquivo: {caminho_arquivo}")
             
             # Verificar extensão
             if not caminho_arquivo.lower().endswith('.xml'):
                 raise ValueError(f"O arquivo não tem extensão .xml: {caminho_arquivo}")
             
-            tree = etree.parse(caminho_arquivo)
-            root = tree.getroot()
-            
-            # Verificar se é NF-e
-            nfe_proc = root.find('.//nfe:NFe', self.NAMESPACES)
-            if nfe_proc is None:
-                nfe_proc = root.find('.//nfe:nfeProc/nfe:NFe', self.NAMESPACES)
-            if nfe_proc is None:
-                raise ValueError("Arquivo não é uma NF-e válida")
-            
-            # Extrair dados
-            dados = {
-                'arquivo_original': caminho_arquivo,
-                'tamanho_arquivo': os.path.getsize(caminho_arquivo) if os.path.exists(caminho_arquivo) else 0,
-                'data_extracao': datetime.now(),
-                'xml_completo': etree.tostring(root, encoding='unicode'),
-            }
-            
-            # Extrair identificação
-            dados['identificacao'] = self._extrair_identificacao(root)
+            with self.tempos.medir('leitura'):
+                with open(caminho_arquivo, 'rb') as arquivo:
+                    conteudo = arquivo.read()
             
-            # Extrair emitente
-            dados['emitente'] = self._extrair_emitente(root)
+        except Exception as e:
+            raise ValueError(f"Erro ao extrair dados do XML: {str(e)}")
+        
+        return self.extrair_nfe_bytes(conteudo, caminho_arquivo)
+
+    def extrair_nfe_stream(
+        self,
+        arquivo: BinaryIO,
+        arquivo_original: Optional[str] = None,
+        tamanho_arquivo: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Extrai todos os dados de um XML de NF-e lido de um objeto arquivo.
+        
+        O parser lê o arquivo em blocos, sem carregar o conteúdo inteiro em
+        memória. Serve para uploads, membros de arquivos ZIP e similares.
+        
+        Args:
+            arquivo: Objeto arquivo binário (com método read)
+            arquivo_original: Identificação da origem (padrão: atributo name do arquivo)
+            tamanho_arquivo: Tamanho do XML em bytes (padrão: tamanho do arquivo, se posicionável)
             
-            # Extrair destinatário
-            dados['destinatario'] = self._extrair_destinatario(root)
+        Returns:
+            Dicionário com todos os dados extraídos
             
-            # Extrair itens
-            dados['itens'] = self._extrair_itens(root)
+        Raises:
+            ValueError: Se o conteúdo não for um XML válido de NF-e
+        """
+        try:
+            if arquivo_original is None:
+                arquivo_original = str(getattr(arquivo, 'name', ''))
             
-            # Extrair totais
-            dados['totais'] = self._extrair_totais(root)
+            with self.tempos.medir('parse'):
+                root = etree.parse(arquivo).getroot()
             
-            # Extrair transporte
-            dados['transporte'] = self._extrair_transporte(root)
+            if tamanho_arquivo is None:
+                try:
+                    tamanho_arquivo = arquivo.seek(0, os.SEEK_END)
+                except (AttributeError, OSError):
+                    tamanho_arquivo = 0
             
-            # Extrair cobrança
-            dados['cobranca'] = self._extrair_cobranca(root)
+            with self.tempos.medir('extracao'):
+                return self._extrair_dados(root, arquivo_original, tamanho_arquivo)
             
-            # Extrair pagamento
-            dados['pagamento'] = self._extrair_pagamento(root)
+        except Exception as e:
+            raise ValueError(f"Erro ao extrair dados do XML: {str(e)}")
+
+    def extrair_nfe_bytes(self, conteudo, arquivo_original: str = '') -> Dict[str, Any]:
+        """
+        Extrai todos os dados de um XML de NF-e ou NFC-e já carregado em memória.
+        
+        Evita gravar arquivos temporários quando o XML vem do banco
+        (ex.: nfe.xml_completo), de uma fila ou de um upload. Aceita qualquer
+        objeto com protocolo de buffer (bytes, bytearray, memoryview, mmap),
+        sem copiá-lo, o que permite ler arquivos grandes mapeados em memória.
+        
+        Args:
+            conteudo: XML em bytes, memoryview, mmap ou str
+            arquivo_original: Identificação da origem, gravada em 'arquivo_original'
             
-            # Extrair informações adicionais
-            dados['informacoes_adicionais'] = self._extrair_informacoes_adicionais(root)
+        Returns:
+            Dicionário com todos os dados extraídos
             
-            # Extrair intermediador
-            dados['intermediador'] = self._extrair_intermediador(root)
+        Raises:
+            ValueError: Se o conteúdo não for um XML válido de NF-e
+        """
+        try:
+            if isinstance(conteudo, str):
+                conteudo = conteudo.encode('utf-8')
             
-            # Extrair protocolo de autorização
-            dados['protocolo'] = self._extrair_protocolo(root)
+            with self.tempos.medir('parse'):
+                root = parse_xml_memoria(conteudo)
             
-            return dados
+            with self.tempos.medir('extracao'):
+                return self._extrair_dados(root, arquivo_original, tamanho_conteudo(conteudo))
             
         except Exception as e:
             raise ValueError(f"Erro ao extrair dados do XML: {str(e)}")
 
+    def _extrair_dados(self, root, arquivo_original: str, tamanho_arquivo: int) -> Dict[str, Any]:
+        """
+        Extrai as seções da NF-e a partir do elemento raiz do XML.
+        
+        Args:
+            root: Elemento raiz do XML
+            arquivo_original: Origem do XML
+            tamanho_arquivo: Tamanho do XML em bytes
+            
+        Returns:
+            Dicionário com todos os dados extraídos
+        """
+        # Verificar se é NF-e
+        nfe_proc = root.find('.//nfe:NFe', self.NAMESPACES)
+        if nfe_proc is None:
+            nfe_proc = root.find('.//nfe:nfeProc/nfe:NFe', self.NAMESPACES)
+        if nfe_proc is None:
+            raise ValueError("Arquivo não é uma NF-e válida")
+        
+        # Extrair dados
+        dados = {
+            'arquivo_original': arquivo_original,
+            'tamanho_arquivo': tamanho_arquivo,
+            'data_extracao': datetime.now(),
+        }
+        with self.tempos.medir('extracao.xml'):
+            dados['xml_completo'] = etree.tostring(root, encoding='unicode')
+        
+        # Extrair cada seção, medindo-a como uma etapa própria (extracao.<seção>)
+        for secao, extrair in self.SECOES:
+            with self.tempos.medir(f'extracao.{secao}'):
+                dados[secao] = getattr(self, extrair)(root)
+        
+        return dados
+
     def _extrair_identificacao(self, root) -> Dict[str, Any]:
         """Extrai dados de identificação da NF-e."""
         ide = root.find('.//nfe:ide', self.NAMESPACES)
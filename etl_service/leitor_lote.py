@@ -0,0 +1,182 @@
+"""
+Leitor de arquivos XML em lote - dumps com muitas NF-e concatenadas.
+
+Alguns ERPs exportam um único arquivo (às vezes com vários GB) contendo
+milhares de documentos <nfeProc> em sequência. Em vez de carregar o arquivo
+inteiro com etree.parse, este módulo:
+- Mapeia o arquivo em memória (mmap), sem lê-lo
+- Localiza os limites de cada documento pelos offsets de <nfeProc ... </nfeProc>
+- Interpreta cada fatia de forma independente (XMLExtractor.extrair_nfe_bytes)
+- Envia aos processos do pool apenas o intervalo de offsets; cada processo
+  mapeia o arquivo por conta própria, sem cópia entre processos
+"""
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .extractor import XMLExtractor
+
+
+# Documentos por tarefa enviada ao pool
+DOCUMENTOS_POR_TAREFA = 50
+
+# Arquivos mapeados por processo (caminho -> mmap), reaproveitados entre tarefas
+_mapeamentos: Dict[str, mmap.mmap] = {}
+_extractor: Optional[XMLExtractor] = None
+
+
+def localizar_documentos(buffer, tag: str = 'nfeProc') -> Iterator[Tuple[int, int]]:
+    """
+    Localiza os documentos de um buffer pelos offsets de abertura e fechamento da tag.
+
+    A busca é feita em bytes (mmap.find), sem interpretar o XML. Conteúdo
+    fora das tags (declaração XML, elemento raiz do dump, espaços) é ignorado.
+
+    Args:
+        buffer: Conteúdo do arquivo (mmap ou bytes)
+        tag: Nome da tag que delimita cada documento
+
+    Yields:
+        Tuplas (início, fim) de cada documento, com fim exclusivo
+    """
+    abertura = f'<{tag}'.encode('ascii')
+    fechamento = f'</{tag}>'.encode('ascii')
+
+    posicao = 0
+    while True:
+        inicio = buffer.find(abertura, posicao)
+        if inicio < 0:
+            return
+
+        # Ignorar tags com o mesmo prefixo (ex.: <nfeProcXYZ)
+        proximo = inicio + len(abertura)
+        if proximo < len(buffer) and buffer[proximo:proximo + 1] not in (b' ', b'\t', b'\r', b'\n', b'>', b'/'):
+            posicao = proximo
+            continue
+
+        fim = buffer.find(fechamento, proximo)
+        if fim < 0:
+            raise ValueError(f"Documento sem fechamento {fechamento.decode()} no offset {inicio}")
+
+        fim += len(fechamento)
+        yield inicio, fim
+        posicao = fim
+
+
+def _mapear(caminho: str) -> mmap.mmap:
+    """Retorna o mapeamento do arquivo no processo atual, criando-o na primeira chamada."""
+    mapeamento = _mapeamentos.get(caminho)
+    if mapeamento is None:
+        with open(caminho, 'rb') as arquivo:
+            mapeamento = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        _mapeamentos[caminho] = mapeamento
+    return mapeamento
+
+
+def _extrair_fatias(tarefa: Tuple[str, List[Tuple[int, int]]],
+                    mapeamento: Optional[mmap.mmap] = None) -> List[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Interpreta um grupo de documentos do arquivo mapeado.
+
+    Executado nos processos do pool: recebe apenas o caminho e os offsets.
+
+    Args:
+        tarefa: Tupla (caminho do arquivo, lista de (início, fim))
+        mapeamento: Arquivo já mapeado (padrão: mapeamento do processo)
+
+    Returns:
+        Lista de tuplas (origem, dados extraídos, mensagem de erro)
+    """
+    global _extractor
+    if _extractor is None:
+        _extractor = XMLExtractor()
+
+    caminho, intervalos = tarefa
+    if mapeamento is None:
+        mapeamento = _mapear(caminho)
+
+    resultados = []
+    with memoryview(mapeamento) as visao:
+        for inicio, fim in intervalos:
+            origem = f"{caminho}#{inicio}-{fim}"
+            with visao[inicio:fim] as fatia:
+                try:
+                    dados = _extractor.extrair_nfe_bytes(fatia, arquivo_original=origem)
+                    resultados.append((origem, dados, None))
+                except Exception as e:
+                    resultados.append((origem, None, str(e)))
+
+    return resultados
+
+
+class LeitorLoteXML:
+    """
+    Lê um arquivo com várias NF-e concatenadas, documento a documento.
+
+    Iterável: cada iteração mapeia o arquivo e produz, em ordem, tuplas
+    (origem, dados extraídos, erro), onde origem identifica o documento
+    como "caminho#início-fim". O arquivo deve estar em UTF-8, a codificação
+    exigida para NF-e, já que cada fatia é interpretada sem a declaração XML.
+    """
+
+    def __init__(self, caminho: str, processos: Optional[int] = None,
+                 tag: str = 'nfeProc', documentos_por_tarefa: int = DOCUMENTOS_POR_TAREFA):
+        """
+        Inicializa o leitor.
+
+        Args:
+            caminho: Caminho do arquivo em lote
+            processos: Processos do pool (None = número de CPUs, 1 = sem pool)
+            tag: Tag que delimita cada documento
+            documentos_por_tarefa: Quantidade de documentos enviados por tarefa ao pool
+        """
+        self.caminho = os.path.abspath(caminho)
+        self.processos = processos or os.cpu_count() or 1
+        self.tag = tag
+        self.documentos_por_tarefa = documentos_por_tarefa
+
+    def contar(self) -> int:
+        """Conta os documentos do arquivo (apenas varredura de bytes)."""
+        with self._abrir() as mapeamento:
+            return sum(1 for _ in localizar_documentos(mapeamento, self.tag))
+
+    def __iter__(self) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+        with self._abrir() as mapeamento:
+            tarefas = self._tarefas(mapeamento)
+
+            if self.processos <= 1:
+                for tarefa in tarefas:
+                    yield from _extrair_fatias(tarefa, mapeamento)
+                return
+
+            # Número limitado de tarefas em andamento: o consumo (carga no
+            # banco) costuma ser mais lento que a extração, e os resultados
+            # não podem se acumular em memória.
+            with ProcessPoolExecutor(max_workers=self.processos) as executor:
+                pendentes = deque()
+                for tarefa in tarefas:
+                    pendentes.append(executor.submit(_extrair_fatias, tarefa))
+                    if len(pendentes) >= self.processos * 2:
+                        yield from pendentes.popleft().result()
+                while pendentes:
+                    yield from pendentes.popleft().result()
+
+    def _abrir(self) -> mmap.mmap:
+        """Mapeia o arquivo para leitura."""
+        if os.path.getsize(self.caminho) == 0:
+            raise ValueError(f"Arquivo vazio: {self.caminho}")
+        with open(self.caminho, 'rb') as arquivo:
+            return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _tarefas(self, mapeamento) -> Iterator[Tuple[str, List[Tuple[int, int]]]]:
+        """Agrupa os offsets dos documentos em tarefas para o pool."""
+        grupo = []
+        for intervalo in localizar_documentos(mapeamento, self.tag):
+            grupo.append(intervalo)
+            if len(grupo) >= self.documentos_por_tarefa:
+                yield self.caminho, grupo
+                grupo = []
+        if grupo:
+            yield self.caminho, grupo
@@ -4,20 +4,25 @@ Loader de dados - Módulo de Carregamento do ETL.
 Este módulo é responsável por carregar (persistir) os dados transformados
 no banco de dados, gerenciando transações e tratando duplicações.
 """
-from typing import List, Optional
+from typing import List, Optional, Set
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 import time
 import hashlib
+import json
 import os
-import shutil
 import logging
 
 from .models import NFe, LogProcessamento, ProcessamentoETL, ArquivoProcessado
 from .database import SessionLocal
 from .config import config
 from .empresa_service import EmpresaService
+from .descarte import DescarteArquivos, descartar_arquivo
+from .registro_log import BufferLogProcessamento
+from .metricas import TemporizadorEtapas
+from .upsert import atualizar_nfes
+from .eventos import aplicar_cancelamentos
 
 logger = logging.getLogger(__name__)
 
@@ -30,16 +35,38 @@ class DataLoader:
     integridade e registrando logs do processo.
     """
 
-    def __init__(self, db_session: Optional[Session] = None):
+    def __init__(self, db_session: Optional[Session] = None,
+                 descarte: Optional[DescarteArquivos] = None,
+                 logs: Optional[BufferLogProcessamento] = None,
+                 tempos: Optional[TemporizadorEtapas] = None,
+                 modo: Optional[str] = None):
         """
         Inicializa o loader.
         
         Args:
             db_session: Sessão do banco de dados (opcional)
+            descarte: Worker de descarte em segundo plano (opcional; sem ele
+                os arquivos são deletados/movidos na hora)
+            logs: Buffer de logs de processamento (opcional; sem ele cada log
+                é gravado na transação da carga)
+            tempos: Temporizador das etapas deduplicacao/empresa/banco/descarte (opcional)
+            modo: 'inserir' (NF-e já existente é duplicata) ou 'upsert' (NF-e
+                já existente é atualizada; padrão: ETL_MODO_CARGA)
         """
         self.db_session = db_session
+        self.descarte = descarte
+        self.logs = logs
+        self.tempos = tempos or TemporizadorEtapas()
+        self.modo = modo or config.modo_carga
+        if self.modo not in ('inserir', 'upsert'):
+            raise ValueError(f"Modo de carga inválido: {self.modo} (use 'inserir' ou 'upsert')")
         self.empresa_service = None
     
+    @property
+    def upsert(self) -> bool:
+        """Se NF-e já existentes são atualizadas em vez de tratadas como duplicatas."""
+        return self.modo == 'upsert'
+    
     def arquivo_ja_processado(self, caminho_arquivo: str) -> bool:
         """
         Verifica se um arquivo já foi processado anteriormente.
@@ -121,24 +148,15 @@ class DataLoader:
         }
         
         # Validar e cadastrar empresa se necessário
-        try:
-            if dados_emitente and nfe.emitente_cnpj:
-                if not self.empresa_service:
-                    self.empresa_service = EmpresaService(session)
-                
-                empresa_id = self.empresa_service.validar_ou_cadastrar_empresa(
-                    cnpj=nfe.emitente_cnpj,
-                    dados_emitente=dados_emitente
-                )
-                
-                if empresa_id:
-                    logger.debug(f"Empresa validada/cadastrada. ID: {empresa_id}")
-        except Exception as e:
-            logger.warning(f"Erro ao validar/cadastrar empresa: {str(e)}")
+        self._validar_empresa(session, nfe, dados_emitente)
         
         try:
             # Verificar se arquivo já foi processado
-            if arquivo and self.arquivo_ja_processado(arquivo):
+            with self.tempos.medir('deduplicacao'):
+                # No upsert o arquivo é reprocessado mesmo que já tenha sido carregado
+                arquivo_repetido = bool(arquivo) and not self.upsert and self.arquivo_ja_processado(arquivo)
+            
+            if arquivo_repetido:
                 resultado['duplicado'] = True
                 resultado['mensagem'] = 'Arquivo já foi processado anteriormente'
                 
@@ -162,9 +180,34 @@ class DataLoader:
                 return resultado
             
             # Verificar se já existe por chave de acesso
-            nfe_existente = session.query(NFe).filter(
-                NFe.chave_acesso == nfe.chave_acesso
-            ).first()
+            with self.tempos.medir('deduplicacao'):
+                nfe_existente = session.query(NFe).filter(
+                    NFe.chave_acesso == nfe.chave_acesso
+                ).first()
+            
+            if nfe_existente and self.upsert:
+                with self.tempos.medir('banco'):
+                    atualizada = bool(atualizar_nfes(session, {nfe_existente.id: nfe}))
+                    self._registrar_log(
+                        session=session,
+                        processamento_id=processamento_id,
+                        arquivo=arquivo,
+                        chave_acesso=nfe.chave_acesso,
+                        status='atualizado',
+                        mensagem='NF-e atualizada (upsert)' if atualizada else 'NF-e sem alterações (upsert)',
+                        tempo=time.time() - inicio
+                    )
+                    if not self.db_session:
+                        session.commit()
+                
+                if arquivo:
+                    self.registrar_arquivo_processado(arquivo, nfe.chave_acesso, 'processado')
+                    self.deletar_ou_mover_arquivo(arquivo)
+                
+                resultado['sucesso'] = True
+                resultado['atualizado'] = atualizada
+                resultado['mensagem'] = 'NF-e atualizada' if atualizada else 'NF-e sem alterações'
+                return resultado
             
             if nfe_existente:
                 resultado['duplicado'] = True
@@ -191,26 +234,27 @@ class DataLoader:
                 
                 return resultado
             
-            # Adicionar nova NF-e
-            session.add(nfe)
-            
-            # Fazer flush para obter o ID da NF-e
-            session.flush()
-            
-            # Registrar log de sucesso
-            self._registrar_log(
-                session=session,
-                processamento_id=processamento_id,
-                arquivo=arquivo,
-                chave_acesso=nfe.chave_acesso,
-                status='sucesso',
-                mensagem='NF-e processada com sucesso',
-                tempo=time.time() - inicio
-            )
-            
-            # Commit obrigatório
-            if not self.db_session:
-                session.commit()
+            with self.tempos.medir('banco'):
+                # Adicionar nova NF-e
+                session.add(nfe)
+                
+                # Fazer flush para obter o ID da NF-e
+                session.flush()
+                
+                # Registrar log de sucesso
+                self._registrar_log(
+                    session=session,
+                    processamento_id=processamento_id,
+                    arquivo=arquivo,
+                    chave_acesso=nfe.chave_acesso,
+                    status='sucesso',
+                    mensagem='NF-e processada com sucesso',
+                    tempo=time.time() - inicio
+                )
+                
+                # Commit obrigatório
+                if not self.db_session:
+                    session.commit()
             
             # Registrar arquivo como processado com sucesso
             if arquivo:
@@ -283,6 +327,354 @@ class DataLoader:
         
         return resultado
 
+    def _validar_empresa(self, session: Session, nfe: NFe, dados_emitente: Optional[dict]):
+        """Valida e cadastra a empresa emitente, se necessário (falhas apenas geram aviso)."""
+        try:
+            if dados_emitente and nfe.emitente_cnpj:
+                with self.tempos.medir('empresa'):
+                    if not self.empresa_service:
+                        self.empresa_service = EmpresaService(session)
+                    
+                    empresa_id = self.empresa_service.validar_ou_cadastrar_empresa(
+                        cnpj=nfe.emitente_cnpj,
+                        dados_emitente=dados_emitente
+                    )
+                
+                if empresa_id:
+                    logger.debug(f"Empresa validada/cadastrada. ID: {empresa_id}")
+        except Exception as e:
+            logger.warning(f"Erro ao validar/cadastrar empresa: {str(e)}")
+
+    def carregar_lote(self, documentos: List[dict],
+                      processamento_id: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        Carrega várias NF-e numa única transação.
+        
+        Mesmas regras de carregar_nfe, com as verificações de duplicidade
+        feitas por consultas IN para o lote inteiro e os registros de
+        ArquivoProcessado gravados na mesma transação das NF-e. Os arquivos
+        são descartados (deletados/movidos) só após o commit. No modo upsert,
+        as NF-e já existentes são atualizadas em lote (ver upsert.atualizar_nfes).
+        
+        Args:
+            documentos: Dicionários com 'nfe', 'arquivo', 'dados_emitente' e
+                'hash_arquivo' (SHA256 do conteúdo já lido)
+            processamento_id: ID do processamento ETL
+            
+        Returns:
+            Resultados na ordem dos documentos, ou None se a transação falhou
+            (nada foi gravado; carregue os documentos um a um com carregar_nfe)
+        """
+        if not documentos:
+            return []
+        
+        inicio = time.time()
+        session = SessionLocal()
+        resultados = [{
+            'sucesso': False,
+            'duplicado': False,
+            'mensagem': '',
+            'chave_acesso': documento['nfe'].chave_acesso,
+        } for documento in documentos]
+        
+        try:
+            for documento in documentos:
+                self._validar_empresa(session, documento['nfe'], documento.get('dados_emitente'))
+            
+            with self.tempos.medir('deduplicacao_lote'):
+                caminhos = [documento['arquivo'] for documento in documentos]
+                hashes = [documento['hash_arquivo'] for documento in documentos if documento.get('hash_arquivo')]
+                chaves = [documento['nfe'].chave_acesso for documento in documentos]
+                
+                caminhos_repetidos = set()
+                if config.validar_por_chave and not self.upsert:
+                    caminhos_repetidos = {caminho for (caminho,) in session.query(ArquivoProcessado.caminho_arquivo).filter(
+                        ArquivoProcessado.caminho_arquivo.in_(caminhos),
+                        ArquivoProcessado.status == 'processado'
+                    )}
+                
+                hashes_repetidos = set()
+                if config.validar_por_hash and hashes and not self.upsert:
+                    hashes_repetidos = {valor for (valor,) in session.query(ArquivoProcessado.hash_arquivo).filter(
+                        ArquivoProcessado.hash_arquivo.in_(hashes),
+                        ArquivoProcessado.status == 'processado'
+                    )}
+                
+                ids_existentes = dict(session.query(NFe.chave_acesso, NFe.id).filter(
+                    NFe.chave_acesso.in_(chaves)
+                ))
+                chaves_existentes = set(ids_existentes)
+            
+            descartar, logs = [], []
+            atualizar = {}
+            with self.tempos.medir('banco_lote'):
+                for documento, resultado in zip(documentos, resultados):
+                    nfe, arquivo = documento['nfe'], documento['arquivo']
+                    
+                    if arquivo in caminhos_repetidos or documento.get('hash_arquivo') in hashes_repetidos:
+                        resultado['duplicado'] = True
+                        resultado['mensagem'] = 'Arquivo já foi processado anteriormente'
+                        self._registrar_log(session, processamento_id, arquivo, nfe.chave_acesso,
+                                            'duplicado', 'Arquivo já processado anteriormente', time.time() - inicio, logs)
+                        descartar.append(arquivo)
+                        continue
+                    
+                    if self.upsert and nfe.chave_acesso in ids_existentes:
+                        # Atualizada em lote após o laço; a chave repetida no lote é duplicata
+                        atualizar[ids_existentes.pop(nfe.chave_acesso)] = (nfe, resultado, arquivo)
+                        resultado['sucesso'] = True
+                        status_arquivo = 'processado'
+                    elif nfe.chave_acesso in chaves_existentes:
+                        resultado['duplicado'] = True
+                        resultado['mensagem'] = 'NF-e já existe no banco de dados'
+                        self._registrar_log(session, processamento_id, arquivo, nfe.chave_acesso,
+                                            'duplicado', 'NF-e já processada anteriormente', time.time() - inicio, logs)
+                        status_arquivo = 'duplicado'
+                    else:
+                        # Chave repetida dentro do próprio lote também é duplicata
+                        chaves_existentes.add(nfe.chave_acesso)
+                        session.add(nfe)
+                        resultado['sucesso'] = True
+                        resultado['mensagem'] = 'NF-e carregada com sucesso'
+                        self._registrar_log(session, processamento_id, arquivo, nfe.chave_acesso,
+                                            'sucesso', 'NF-e processada com sucesso', time.time() - inicio, logs)
+                        status_arquivo = 'processado'
+                    
+                    session.add(ArquivoProcessado(
+                        caminho_arquivo=arquivo,
+                        nome_arquivo=os.path.basename(arquivo),
+                        hash_arquivo=documento.get('hash_arquivo'),
+                        chave_acesso=nfe.chave_acesso,
+                        status=status_arquivo,
+                        data_processamento=datetime.now(),
+                        deletado=False
+                    ))
+                    descartar.append(arquivo)
+                
+                if atualizar:
+                    alterados = atualizar_nfes(session, {nfe_id: nfe for nfe_id, (nfe, _, _) in atualizar.items()})
+                    for nfe_id, (nfe, resultado, arquivo) in atualizar.items():
+                        resultado['atualizado'] = nfe_id in alterados
+                        resultado['mensagem'] = 'NF-e atualizada' if resultado['atualizado'] else 'NF-e sem alterações'
+                        self._registrar_log(session, processamento_id, arquivo, resultado['chave_acesso'], 'atualizado',
+                                            f"{resultado['mensagem']} (upsert)", time.time() - inicio, logs)
+                
+                session.commit()
+            
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Falha na carga em lote de {len(documentos)} NF-e, carregando individualmente: {str(e)}")
+            return None
+        
+        finally:
+            session.close()
+        
+        for registro in logs:
+            self.logs.adicionar(registro)
+        for arquivo in descartar:
+            self.deletar_ou_mover_arquivo(arquivo)
+        
+        return resultados
+
+    def carregar_documentos(self, plugin, documentos: List[dict],
+                            processamento_id: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        Carrega documentos de um plugin (CT-e, eventos de NF-e...) numa única transação.
+        
+        Cada plugin decide o que é repetido (ver PluginDocumento.gravar); os
+        registros de ArquivoProcessado entram na mesma transação e os arquivos
+        são descartados só após o commit, como em carregar_lote.
+        
+        Args:
+            plugin: PluginDocumento do tipo dos documentos
+            documentos: Dicionários com 'arquivo', 'dados' (PluginDocumento.extrair)
+                e 'hash_arquivo' (SHA256 do conteúdo já lido)
+            processamento_id: ID do processamento ETL
+            
+        Returns:
+            Resultados na ordem dos documentos (com 'tipo_documento' e
+            'registros' novos do arquivo), ou None se a transação falhou
+        """
+        if not documentos:
+            return []
+        
+        inicio = time.time()
+        session = SessionLocal()
+        resultados = []
+        descartar, logs = [], []
+        
+        try:
+            with self.tempos.medir('banco_lote'):
+                for documento in documentos:
+                    arquivo = documento['arquivo']
+                    chave = plugin.chave(documento['dados'])
+                    novos = plugin.gravar(session, documento['dados'])
+                    
+                    resultado = {
+                        'sucesso': novos > 0,
+                        'duplicado': novos == 0,
+                        'mensagem': f'{plugin.descricao} carregado' if novos
+                                    else f'{plugin.descricao} já existe no banco de dados',
+                        'chave_acesso': chave,
+                        'tipo_documento': plugin.nome,
+                        'registros': novos,
+                    }
+                    resultados.append(resultado)
+                    self._registrar_log(session, processamento_id, arquivo, chave,
+                                        'sucesso' if novos else 'duplicado', resultado['mensagem'],
+                                        time.time() - inicio, logs)
+                    
+                    session.add(ArquivoProcessado(
+                        caminho_arquivo=arquivo,
+                        nome_arquivo=os.path.basename(arquivo),
+                        hash_arquivo=documento.get('hash_arquivo'),
+                        chave_acesso=chave,
+                        status='processado' if novos else 'duplicado',
+                        data_processamento=datetime.now(),
+                        deletado=False
+                    ))
+                    descartar.append(arquivo)
+                
+                session.commit()
+        
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Falha na carga de {len(documentos)} arquivo(s) de {plugin.descricao}: {str(e)}")
+            return None
+        
+        finally:
+            session.close()
+        
+        for registro in logs:
+            self.logs.adicionar(registro)
+        for arquivo in descartar:
+            self.deletar_ou_mover_arquivo(arquivo)
+        
+        return resultados
+
+    def aplicar_cancelamentos_pendentes(self) -> int:
+        """
+        Aplica os cancelamentos de nfe_evento às NF-e carregadas depois do evento.
+        
+        Returns:
+            Quantidade de NF-e canceladas
+        """
+        session = SessionLocal()
+        
+        try:
+            with self.tempos.medir('banco_lote'):
+                canceladas = aplicar_cancelamentos(session)
+                session.commit()
+            return canceladas
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def registrar_duplicata_previa(self, arquivo: str, chave_acesso: str,
+                                   processamento_id: Optional[int] = None) -> dict:
+        """
+        Registra como duplicado um arquivo cuja chave já está no banco, sem carregá-lo.
+        
+        Usado quando a duplicidade é detectada antes da extração (chave
+        localizada nos primeiros bytes do XML); o tratamento do arquivo é o
+        mesmo de carregar_nfe para NF-e já existentes.
+        
+        Args:
+            arquivo: Caminho do arquivo
+            chave_acesso: Chave de acesso da NF-e
+            processamento_id: ID do processamento ETL
+            
+        Returns:
+            Dicionário com resultado da operação
+        """
+        session = self.db_session or SessionLocal()
+        resultado = {
+            'sucesso': False,
+            'duplicado': True,
+            'mensagem': 'NF-e já existe no banco de dados',
+            'chave_acesso': chave_acesso,
+        }
+        
+        try:
+            self._registrar_log(
+                session=session,
+                processamento_id=processamento_id,
+                arquivo=arquivo,
+                chave_acesso=chave_acesso,
+                status='duplicado',
+                mensagem='NF-e já processada anteriormente (detectada antes da extração)',
+                tempo=0
+            )
+            
+            if not self.db_session:
+                session.commit()
+        finally:
+            if not self.db_session:
+                session.close()
+        
+        self.registrar_arquivo_processado(arquivo, chave_acesso, 'duplicado')
+        self.deletar_ou_mover_arquivo(arquivo)
+        
+        return resultado
+
+    def registrar_ignorado(self, arquivo: str, mensagem: str,
+                           processamento_id: Optional[int] = None) -> dict:
+        """
+        Registra um arquivo de tipo sem plugin de carga (ex.: NFS-e), sem descartá-lo.
+        
+        O arquivo fica na pasta, para um plugin registrado depois, e as
+        próximas execuções o pulam pelo caminho (ver arquivos_ignorados).
+        
+        Args:
+            arquivo: Caminho do arquivo
+            mensagem: Motivo, gravado no log do processamento
+            processamento_id: ID do processamento ETL
+            
+        Returns:
+            Dicionário com resultado da operação
+        """
+        session = self.db_session or SessionLocal()
+        
+        try:
+            self._registrar_log(
+                session=session,
+                processamento_id=processamento_id,
+                arquivo=arquivo,
+                chave_acesso=None,
+                status='ignorado',
+                mensagem=mensagem,
+                tempo=0
+            )
+            
+            if not self.db_session:
+                session.commit()
+        finally:
+            if not self.db_session:
+                session.close()
+        
+        self.registrar_arquivo_processado(arquivo, None, 'ignorado')
+        
+        return {
+            'sucesso': False,
+            'duplicado': False,
+            'ignorado': True,
+            'mensagem': mensagem,
+            'chave_acesso': None,
+        }
+
+    def arquivos_ignorados(self) -> Set[str]:
+        """Caminhos dos arquivos registrados como ignorados (tipo sem plugin de carga)."""
+        session = SessionLocal()
+        
+        try:
+            return {caminho for (caminho,) in session.query(ArquivoProcessado.caminho_arquivo).filter(
+                ArquivoProcessado.status == 'ignorado'
+            )}
+        finally:
+            session.close()
+
     def carregar_nfes_lote(self, nfes: List[NFe], arquivos: List[str],
                            processamento_id: Optional[int] = None,
                            tamanho_lote: int = 100) -> dict:
@@ -348,6 +740,7 @@ class DataLoader:
             processamento = ProcessamentoETL(
                 data_processamento=datetime.now(),
                 tipo_processamento=tipo,
+                modo_carga=self.modo,
                 status='executando'
             )
             
@@ -364,7 +757,8 @@ class DataLoader:
                                 status: str, mensagem: Optional[str] = None,
                                 arquivos_processados: int = 0,
                                 arquivos_erro: int = 0,
-                                tempo_execucao: Optional[float] = None):
+                                tempo_execucao: Optional[float] = None,
+                                tempos_etapas: Optional[dict] = None):
         """
         Finaliza um processamento ETL.
         
@@ -375,6 +769,7 @@ class DataLoader:
             arquivos_processados: Quantidade de arquivos processados
             arquivos_erro: Quantidade de arquivos com erro
             tempo_execucao: Tempo de execução em segundos
+            tempos_etapas: Resumo dos tempos por etapa (TemporizadorEtapas.resumo())
         """
         session = SessionLocal()
         
@@ -389,6 +784,8 @@ class DataLoader:
                 processamento.arquivos_processados = arquivos_processados
                 processamento.arquivos_erro = arquivos_erro
                 processamento.tempo_execucao = tempo_execucao
+                if tempos_etapas:
+                    processamento.tempos_etapas = json.dumps(tempos_etapas)
                 
                 session.commit()
             
@@ -402,8 +799,13 @@ class DataLoader:
         Args:
             caminho_arquivo: Caminho completo do arquivo
             chave_acesso: Chave de acesso da NF-e
-            status: Status do processamento ('processado', 'duplicado', 'erro')
+            status: Status do processamento ('processado', 'duplicado', 'ignorado', 'erro')
         """
+        with self.tempos.medir('banco'):
+            self._gravar_arquivo_processado(caminho_arquivo, chave_acesso, status)
+
+    def _gravar_arquivo_processado(self, caminho_arquivo: str, chave_acesso: str, status: str):
+        """Grava o registro de ArquivoProcessado (ver registrar_arquivo_processado)."""
         session = SessionLocal()
         
         try:
@@ -415,6 +817,7 @@ class DataLoader:
             # Criar registro
             arquivo_proc = ArquivoProcessado(
                 caminho_arquivo=caminho_arquivo,
+                nome_arquivo=os.path.basename(caminho_arquivo),
                 hash_arquivo=hash_arquivo,
                 chave_acesso=chave_acesso,
                 status=status,
@@ -435,48 +838,25 @@ class DataLoader:
         """
         Deleta ou move um arquivo para backup após processamento.
         
+        Com um worker de descarte configurado, apenas enfileira o arquivo.
+        
         Args:
             caminho_arquivo: Caminho completo do arquivo
         """
-        if not os.path.exists(caminho_arquivo):
+        if self.descarte:
+            self.descarte.agendar(caminho_arquivo)
             return
         
         try:
-            # Verificar configuração
-            if config.deletar_apos_processar:
-                # Deletar arquivo
-                os.remove(caminho_arquivo)
-                logger.info(f"Arquivo deletado: {caminho_arquivo}")
-                
-                # Atualizar registro no banco
-                self._atualizar_status_arquivo(caminho_arquivo, deletado=True)
-                
-            elif config.mover_para_backup and config.diretorio_backup:
-                # Mover para diretório de backup
-                backup_dir = config.diretorio_backup
-                
-                # Criar diretório de backup se não existir
-                if not os.path.exists(backup_dir):
-                    os.makedirs(backup_dir)
-                
-                # Mover arquivo mantendo o nome original
-                nome_arquivo = os.path.basename(caminho_arquivo)
-                caminho_backup = os.path.join(backup_dir, nome_arquivo)
-                
-                # Se já existe no backup, adicionar timestamp
-                if os.path.exists(caminho_backup):
-                    nome_base, extensao = os.path.splitext(nome_arquivo)
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    nome_arquivo = f"{nome_base}_{timestamp}{extensao}"
-                    caminho_backup = os.path.join(backup_dir, nome_arquivo)
-                
-                shutil.move(caminho_arquivo, caminho_backup)
-                logger.info(f"Arquivo movido para backup: {caminho_backup}")
-                
-                # Atualizar registro no banco
-                self._atualizar_status_arquivo(caminho_arquivo, 
-                                               deletado=False, 
-                                               caminho_backup=caminho_backup)
+            with self.tempos.medir('descarte'):
+                resultado = descartar_arquivo(caminho_arquivo)
+                if resultado:
+                    deletado, caminho_backup = resultado
+                    
+                    # Atualizar registro no banco
+                    self._atualizar_status_arquivo(caminho_arquivo,
+                                                   deletado=deletado,
+                                                   caminho_backup=caminho_backup)
                 
         except Exception as e:
             logger.error(f"Erro ao deletar/mover arquivo {caminho_arquivo}: {str(e)}")
@@ -534,7 +914,7 @@ class DataLoader:
 
     def _registrar_log(self, session: Session, processamento_id: Optional[int],
                       arquivo: str, chave_acesso: str, status: str,
-                      mensagem: str, tempo: float):
+                      mensagem: str, tempo: float, pendentes: Optional[list] = None):
         """
         Registra log de processamento de um arquivo.
         
@@ -546,10 +926,10 @@ class DataLoader:
             status: Status do processamento
             mensagem: Mensagem descritiva
             tempo: Tempo de processamento em segundos
+            pendentes: Lista que recebe o registro em vez do buffer, para
+                enfileirá-lo só após o commit (carregar_lote)
         """
-        import os
-        
-        log = LogProcessamento(
+        registro = dict(
             processamento_id=processamento_id,
             data_hora=datetime.now(),
             arquivo=arquivo,
@@ -560,4 +940,10 @@ class DataLoader:
             tamanho_arquivo=os.path.getsize(arquivo) if os.path.exists(arquivo) else None
         )
         
-        session.add(log)
+        # Com buffer, o log é gravado em lote fora da transação da carga
+        if self.logs and pendentes is not None:
+            pendentes.append(registro)
+        elif self.logs:
+            self.logs.adicionar(registro)
+        else:
+            session.add(LogProcessamento(**registro))
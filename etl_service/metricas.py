@@ -0,0 +1,309 @@
+"""
+Tempos por etapa do ETL e exportação no formato texto do Prometheus.
+
+Cada execução do pipeline mede, por arquivo, as etapas abaixo em um
+TemporizadorEtapas; as etapas '*_lote' são medidas uma vez por lote de
+arquivos (carga em lote), e não devem ser comparadas com as por arquivo.
+O resumo (contagem, soma, máximo e buckets de histograma) é gravado em
+etl_processamento.tempos_etapas e pode ser exposto como histograma
+Prometheus pelo endpoint /metrics do portal administrativo, que soma os
+resumos gravados, ou por um arquivo para o textfile collector do
+node_exporter (ETL_METRICAS_TEXTFILE), gravado ao fim de cada execução.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+# Etapas medidas, na ordem do processamento de um arquivo
+ETAPAS = (
+    'descoberta',     # localização dos arquivos XML (uma vez por execução)
+    'deduplicacao',   # chave prévia, arquivo já processado, NF-e já existente
+    'leitura',        # leitura do arquivo (disco/NAS)
+    'parse',          # parse do XML (lxml)
+    'extracao',       # extração das seções da NF-e (total)
+    'extracao.xml',   # serialização do XML completo (xml_completo)
+    *(f'extracao.{secao}' for secao in (
+        'identificacao', 'emitente', 'destinatario', 'itens', 'totais', 'transporte',
+        'cobranca', 'pagamento', 'informacoes_adicionais', 'intermediador', 'protocolo',
+    )),
+    'transformacao',  # DataTransformer.transformar_nfe
+    'empresa',        # validação/cadastro da empresa emitente
+    'banco',          # flush/commit da NF-e e registro do arquivo processado
+    'deduplicacao_lote',  # consultas de repetidos de um lote inteiro (carregar_lote)
+    'banco_lote',         # gravação e commit de um lote inteiro (cargas em lote, cancelamentos pendentes)
+    'descarte',       # deleção ou movimentação para backup
+)
+
+# Limites superiores (segundos) dos buckets do histograma; o último bucket é +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIXO = 'fiscal_etl'
+
+
+def _etapa_vazia() -> Dict[str, Any]:
+    """Resumo de uma etapa sem medições."""
+    return {'contagem': 0, 'total': 0.0, 'max': 0.0, 'buckets': [0] * (len(BUCKETS) + 1)}
+
+
+class TemporizadorEtapas:
+    """
+    Acumula os tempos das etapas de uma execução do ETL.
+
+    Pode ser usado por várias threads (o worker de descarte mede a etapa
+    'descarte' na sua própria thread).
+    """
+
+    def __init__(self):
+        """Inicializa o temporizador sem medições."""
+        self._lock = threading.Lock()
+        self._etapas: Dict[str, Dict[str, Any]] = {}
+
+    def reiniciar(self):
+        """Descarta as medições acumuladas (início de uma nova execução)."""
+        with self._lock:
+            self._etapas = {}
+
+    @contextmanager
+    def medir(self, etapa: str):
+        """
+        Mede o bloco como uma ocorrência da etapa, mesmo que ele lance exceção.
+
+        Args:
+            etapa: Nome da etapa (ver ETAPAS)
+        """
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(etapa, time.perf_counter() - inicio)
+
+    def registrar(self, etapa: str, segundos: float):
+        """
+        Registra uma ocorrência da etapa.
+
+        Args:
+            etapa: Nome da etapa
+            segundos: Duração da ocorrência
+        """
+        with self._lock:
+            medicao = self._etapas.get(etapa)
+            if medicao is None:
+                medicao = self._etapas[etapa] = _etapa_vazia()
+
+            medicao['contagem'] += 1
+            medicao['total'] += segundos
+            medicao['max'] = max(medicao['max'], segundos)
+            medicao['buckets'][bisect_left(BUCKETS, segundos)] += 1
+
+    def resumo(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Retorna o resumo das etapas medidas, na ordem de ETAPAS.
+
+        Returns:
+            Dicionário etapa -> {contagem, total, media, max, buckets}
+        """
+        with self._lock:
+            etapas = sorted(self._etapas, key=lambda e: (ETAPAS.index(e) if e in ETAPAS else len(ETAPAS), e))
+            return {
+                etapa: {
+                    'contagem': self._etapas[etapa]['contagem'],
+                    'total': round(self._etapas[etapa]['total'], 6),
+                    'media': round(self._etapas[etapa]['total'] / self._etapas[etapa]['contagem'], 6),
+                    'max': round(self._etapas[etapa]['max'], 6),
+                    'buckets': list(self._etapas[etapa]['buckets']),
+                }
+                for etapa in etapas
+            }
+
+
+def somar_resumos(resumos: Iterable[Optional[Dict[str, Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Soma resumos de várias execuções (ex.: gravados em etl_processamento).
+
+    Resumos vazios ou com buckets de outra configuração são ignorados.
+
+    Args:
+        resumos: Resumos retornados por TemporizadorEtapas.resumo()
+
+    Returns:
+        Resumo combinado, no mesmo formato
+    """
+    soma: Dict[str, Dict[str, Any]] = {}
+    for resumo in resumos:
+        for etapa, medicao in (resumo or {}).items():
+            if len(medicao.get('buckets', ())) != len(BUCKETS) + 1:
+                continue
+
+            total = soma.setdefault(etapa, _etapa_vazia())
+            total['contagem'] += medicao['contagem']
+            total['total'] += medicao['total']
+            total['max'] = max(total['max'], medicao['max'])
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], medicao['buckets'])]
+
+    for medicao in soma.values():
+        medicao['media'] = medicao['total'] / medicao['contagem'] if medicao['contagem'] else 0.0
+    return soma
+
+
+def ler_resumo(valor: Optional[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Lê o resumo gravado em etl_processamento.tempos_etapas (None se vazio ou inválido)."""
+    if not valor:
+        return None
+    try:
+        return json.loads(valor)
+    except ValueError:
+        return None
+
+
+def _valor(numero: float) -> str:
+    """Formata um número para o formato texto do Prometheus."""
+    return repr(float(numero)) if isinstance(numero, float) else str(numero)
+
+
+def _rotulos(rotulos: Dict[str, Any]) -> str:
+    """Formata os rótulos de uma amostra ({a="1",b="2"})."""
+    if not rotulos:
+        return ''
+    itens = []
+    for nome, valor in rotulos.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        itens.append(f'{nome}="{valor}"')
+    return '{' + ','.join(itens) + '}'
+
+
+def formatar_metrica(nome: str, tipo: str, ajuda: str, amostras: Iterable[tuple]) -> List[str]:
+    """
+    Formata uma métrica simples (counter ou gauge).
+
+    Args:
+        nome: Nome da métrica, sem o prefixo
+        tipo: 'counter' ou 'gauge'
+        ajuda: Texto de ajuda
+        amostras: Pares (rótulos, valor)
+
+    Returns:
+        Linhas no formato texto do Prometheus
+    """
+    linhas = [f'# HELP {PREFIXO}_{nome} {ajuda}', f'# TYPE {PREFIXO}_{nome} {tipo}']
+    linhas.extend(f'{PREFIXO}_{nome}{_rotulos(rotulos)} {_valor(valor)}' for rotulos, valor in amostras)
+    return linhas
+
+
+def formatar_histograma(resumo: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Formata o resumo das etapas como o histograma fiscal_etl_etapa_segundos.
+
+    Args:
+        resumo: Resumo de uma ou mais execuções
+
+    Returns:
+        Linhas no formato texto do Prometheus
+    """
+    nome = f'{PREFIXO}_etapa_segundos'
+    linhas = [f'# HELP {nome} Duração de cada ocorrência das etapas do ETL',
+              f'# TYPE {nome} histogram']
+
+    for etapa, medicao in resumo.items():
+        acumulado = 0
+        for limite, quantidade in zip(BUCKETS + ('+Inf',), medicao['buckets']):
+            acumulado += quantidade
+            rotulos = _rotulos({'etapa': etapa, 'le': limite})
+            linhas.append(f'{nome}_bucket{rotulos} {acumulado}')
+        linhas.append(f'{nome}_sum{_rotulos({"etapa": etapa})} {_valor(float(medicao["total"]))}')
+        linhas.append(f'{nome}_count{_rotulos({"etapa": etapa})} {medicao["contagem"]}')
+
+    return linhas
+
+
+def metricas_processamentos(session) -> List[str]:
+    """
+    Métricas das execuções gravadas em etl_processamento.
+
+    O histograma soma os tempos_etapas de todas as execuções, de modo que
+    os valores só crescem (semântica de counter do Prometheus) enquanto as
+    execuções não forem apagadas.
+
+    Args:
+        session: Sessão do datalake
+
+    Returns:
+        Linhas no formato texto do Prometheus
+    """
+    from sqlalchemy import func
+
+    from .models import ProcessamentoETL
+
+    por_status = session.query(
+        ProcessamentoETL.status,
+        func.count(ProcessamentoETL.id),
+        func.coalesce(func.sum(ProcessamentoETL.arquivos_processados), 0),
+        func.coalesce(func.sum(ProcessamentoETL.arquivos_erro), 0),
+    ).group_by(ProcessamentoETL.status).order_by(ProcessamentoETL.status).all()
+
+    tempos = session.query(ProcessamentoETL.tempos_etapas).filter(
+        ProcessamentoETL.tempos_etapas.isnot(None)
+    ).yield_per(500)
+
+    ultima = session.query(func.max(ProcessamentoETL.data_processamento)).filter(
+        ProcessamentoETL.status != 'executando'
+    ).scalar()
+
+    linhas = formatar_histograma(somar_resumos(ler_resumo(valor) for (valor,) in tempos))
+    linhas += formatar_metrica('execucoes_total', 'counter', 'Execuções do ETL por status',
+                               (({'status': status}, quantidade) for status, quantidade, _, _ in por_status))
+    linhas += formatar_metrica('arquivos_total', 'counter', 'Arquivos processados pelo ETL por resultado', [
+        ({'resultado': 'processado'}, sum(int(processados) for _, _, processados, _ in por_status)),
+        ({'resultado': 'erro'}, sum(int(erros) for _, _, _, erros in por_status)),
+    ])
+    if ultima:
+        linhas += formatar_metrica('ultima_execucao_timestamp', 'gauge', 'Início da última execução finalizada (epoch)',
+                                   [({}, ultima.timestamp())])
+    return linhas
+
+
+# Execuções deste processo, exportadas para o textfile collector
+_acumulado_processo: Dict[str, Dict[str, Any]] = {}
+_execucoes_processo: Dict[str, int] = {}
+_lock_processo = threading.Lock()
+
+
+def gravar_textfile(caminho: str, resumo: Dict[str, Dict[str, Any]], status: str):
+    """
+    Acumula a execução e grava as métricas do processo para o textfile collector.
+
+    O arquivo é substituído de forma atômica (gravação em temporário + rename),
+    como exige o node_exporter.
+
+    Args:
+        caminho: Arquivo .prom de destino
+        resumo: Resumo da execução que terminou
+        status: Status final da execução ('concluido' ou 'erro')
+    """
+    global _acumulado_processo
+
+    with _lock_processo:
+        _acumulado_processo = somar_resumos([_acumulado_processo, resumo])
+        _execucoes_processo[status] = _execucoes_processo.get(status, 0) + 1
+
+        linhas = formatar_histograma(_acumulado_processo)
+        linhas += formatar_metrica('execucoes_total', 'counter', 'Execuções do ETL por status final',
+                                   (({'status': s}, n) for s, n in sorted(_execucoes_processo.items())))
+        linhas += formatar_metrica('ultima_execucao_timestamp', 'gauge', 'Fim da última execução (epoch)',
+                                   [({}, time.time())])
+
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(diretorio, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=diretorio, prefix='.etl_metricas_', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(linhas) + '\n')
+        os.replace(temporario, caminho)
+    except Exception:
+        os.remove(temporario)
+        raise
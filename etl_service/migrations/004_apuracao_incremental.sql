@@ -0,0 +1,17 @@
+-- Migração: Suporte à apuração incremental
+-- Data: 2026-10-19
+-- Descrição: Registra a data da última alteração de cada NF-e para que a apuração
+--            possa aplicar apenas o que mudou desde a análise anterior (watermark)
+
+ALTER TABLE nfe ADD COLUMN IF NOT EXISTS data_atualizacao_etl TIMESTAMP;
+
+-- Notas já existentes: última alteração = data da carga
+UPDATE nfe SET data_atualizacao_etl = data_processamento_etl WHERE data_atualizacao_etl IS NULL;
+
+ALTER TABLE nfe ALTER COLUMN data_atualizacao_etl SET DEFAULT CURRENT_TIMESTAMP;
+
+-- Índices usados para localizar as notas carregadas/alteradas após o watermark
+CREATE INDEX IF NOT EXISTS ix_nfe_data_processamento_etl ON nfe(data_processamento_etl);
+CREATE INDEX IF NOT EXISTS ix_nfe_data_atualizacao_etl ON nfe(data_atualizacao_etl);
+
+COMMENT ON COLUMN nfe.data_atualizacao_etl IS 'Data da última alteração da NF-e no datalake (ex.: cancelamento)';
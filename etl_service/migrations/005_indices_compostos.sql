@@ -0,0 +1,24 @@
+-- Migração: Índices compostos e de cobertura para as consultas por empresa/período
+-- Data: 2026-10-19
+-- Descrição: Quase todas as consultas do fiscal-auditor filtram
+--            (emitente_cnpj = X OR destinatario_cnpj = X) AND data_emissao BETWEEN ...
+--            e agregam nfe_item por NCM/CFOP com join em nfe_id.
+
+-- NFe: um índice por lado do OR, ambos com o período
+CREATE INDEX IF NOT EXISTS ix_nfe_emitente_data_emissao ON nfe(emitente_cnpj, data_emissao);
+CREATE INDEX IF NOT EXISTS ix_nfe_destinatario_data_emissao ON nfe(destinatario_cnpj, data_emissao);
+
+-- NFeItem: agregações por NCM/CFOP respondidas só pelo índice (index-only scan)
+CREATE INDEX IF NOT EXISTS ix_nfe_item_nfe_ncm ON nfe_item(nfe_id, ncm)
+    INCLUDE (quantidade_comercial, valor_total_item, valor_icms, valor_ipi, valor_pis, valor_cofins, valor_ibs, valor_cbs);
+CREATE INDEX IF NOT EXISTS ix_nfe_item_nfe_cfop ON nfe_item(nfe_id, cfop)
+    INCLUDE (quantidade_comercial, valor_total_item, valor_icms, valor_ipi, valor_pis, valor_cofins, valor_ibs, valor_cbs);
+
+-- Os índices simples ficam cobertos pelos compostos (mesma coluna inicial)
+DROP INDEX IF EXISTS ix_nfe_emitente_cnpj;
+DROP INDEX IF EXISTS ix_nfe_destinatario_cnpj;
+DROP INDEX IF EXISTS ix_nfe_item_nfe_id;
+
+-- Atualizar estatísticas para o planejador
+ANALYZE nfe;
+ANALYZE nfe_item
@@ -0,0 +1,7 @@
+-- Migração: Tempos por etapa de cada execução do ETL
+-- Data: 2026-10-19
+-- Descrição: Guarda em etl_processamento o resumo dos tempos por etapa (descoberta,
+--            leitura, parse, extração, transformação, deduplicação, empresa, banco e
+--            descarte), em JSON, exposto como histograma no /metrics do portal
+
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS tempos_etapas TEXT;
@@ -0,0 +1,20 @@
+-- Migração: Log de consultas lentas do datalake
+-- Data: 2026-10-19
+-- Descrição: Cria etl_consulta_lenta, onde as instruções acima de CONSULTA_LENTA_MS são
+--            gravadas com parâmetros, origem e, para uma amostra, o plano (EXPLAIN) e a
+--            indicação de varredura sequencial em nfe/nfe_item
+
+CREATE TABLE IF NOT EXISTS etl_consulta_lenta (
+    id SERIAL PRIMARY KEY,
+    data_hora TIMESTAMP NOT NULL DEFAULT NOW(),
+    engine VARCHAR(50) NOT NULL,
+    duracao_ms NUMERIC(12, 3) NOT NULL,
+    instrucao TEXT NOT NULL,
+    parametros TEXT,
+    plano TEXT,
+    varredura_sequencial BOOLEAN,
+    tabelas_varridas VARCHAR(200),
+    origem VARCHAR(500)
+);
+
+CREATE INDEX IF NOT EXISTS ix_etl_consulta_lenta_data_hora ON etl_consulta_lenta (data_hora);
@@ -0,0 +1,22 @@
+-- Migração: Checkpoints das execuções do ETL
+-- Data: 2026-10-19
+-- Descrição: Guarda em etl_processamento o diretório, o total de arquivos, a posição do
+--            último lote concluído e o processo executor, e cria etl_processamento_arquivo
+--            com a lista de arquivos de cada execução, para retomada com --resume
+
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS diretorio VARCHAR(500);
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS recursivo BOOLEAN;
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS total_arquivos INTEGER;
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS posicao_checkpoint INTEGER;
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS stats_checkpoint TEXT;
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS data_checkpoint TIMESTAMP;
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS executor VARCHAR(100);
+
+CREATE TABLE IF NOT EXISTS etl_processamento_arquivo (
+    processamento_id INTEGER NOT NULL REFERENCES etl_processamento(id) ON DELETE CASCADE,
+    ordem INTEGER NOT NULL,
+    caminho_arquivo VARCHAR(500) NOT NULL,
+    PRIMARY KEY (processamento_id, ordem)
+);
+
+CREATE INDEX IF NOT EXISTS ix_etl_processamento_executando ON etl_processamento (diretorio) WHERE status = 'executando';
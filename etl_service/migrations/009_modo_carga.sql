@@ -0,0 +1,8 @@
+-- Migração: Modo de carga das execuções do ETL
+-- Data: 2026-10-19
+-- Descrição: Guarda em etl_processamento o modo de carga ('inserir' ou 'upsert'),
+--            para que uma execução retomada com --resume use o modo original
+
+ALTER TABLE etl_processamento ADD COLUMN IF NOT EXISTS modo_carga VARCHAR(20);
+
+COMMENT ON COLUMN etl_processamento.modo_carga IS 'Modo de carga: inserir (NF-e existente é duplicata) ou upsert (NF-e existente é atualizada)';
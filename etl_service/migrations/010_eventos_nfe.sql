@@ -0,0 +1,37 @@
+-- Migração: Eventos de NF-e (cancelamento, carta de correção, manifestação)
+-- Data: 2026-10-19
+-- Descrição: Cria nfe_evento, com os eventos carregados dos XMLs procEventoNFe,
+--            e indexa nfe.situacao, atualizada em lote pelos cancelamentos, para
+--            que a apuração e o BI excluam as notas canceladas sem reler XML
+
+CREATE TABLE IF NOT EXISTS nfe_evento (
+    id SERIAL PRIMARY KEY,
+    chave_acesso VARCHAR(44) NOT NULL,
+    tipo_evento VARCHAR(6) NOT NULL,
+    sequencia INTEGER NOT NULL DEFAULT 1,
+    descricao_evento VARCHAR(60),
+    data_evento TIMESTAMP,
+    orgao VARCHAR(2),
+    ambiente VARCHAR(1),
+    autor_cnpj VARCHAR(14),
+    protocolo_nfe VARCHAR(20),
+    justificativa TEXT,
+    correcao TEXT,
+    codigo_status VARCHAR(3),
+    motivo_status TEXT,
+    protocolo_evento VARCHAR(20),
+    data_registro TIMESTAMP,
+    arquivo_original VARCHAR(500),
+    data_processamento_etl TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_nfe_evento_chave_tipo_sequencia UNIQUE (chave_acesso, tipo_evento, sequencia)
+);
+
+CREATE INDEX IF NOT EXISTS ix_nfe_evento_id ON nfe_evento(id);
+CREATE INDEX IF NOT EXISTS ix_nfe_evento_tipo_chave ON nfe_evento(tipo_evento, chave_acesso);
+
+-- Filtro das notas canceladas/denegadas na apuração e no BI
+CREATE INDEX IF NOT EXISTS ix_nfe_situacao ON nfe(situacao);
+
+COMMENT ON TABLE nfe_evento IS 'Eventos de NF-e (procEventoNFe), ligados à nota pela chave de acesso';
+COMMENT ON COLUMN nfe_evento.tipo_evento IS 'tpEvento: 110111 cancelamento, 110112 cancelamento por substituição, 110110 CC-e, 2102xx manifestação';
+COMMENT ON COLUMN nfe_evento.codigo_status IS 'cStat do retorno do evento (135, 136 e 155 = registrado)';
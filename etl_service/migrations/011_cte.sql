@@ -0,0 +1,68 @@
+-- Migração: CT-e no datalake
+-- Data: 2026-10-19
+-- Descrição: Cria cte e cte_documento, carregadas pelo plugin de CT-e do ETL
+--            (etl_service/cte.py) a partir dos XMLs cteProc da mesma pasta das NF-e
+
+CREATE TABLE IF NOT EXISTS cte (
+    id SERIAL PRIMARY KEY,
+    chave_acesso VARCHAR(44) NOT NULL UNIQUE,
+    numero_cte VARCHAR(20) NOT NULL,
+    serie VARCHAR(3),
+    modelo VARCHAR(2),
+    cfop VARCHAR(4),
+    natureza_operacao VARCHAR(60),
+    tipo_cte VARCHAR(1),
+    tipo_servico VARCHAR(1),
+    modal VARCHAR(2),
+    data_emissao TIMESTAMP NOT NULL,
+    municipio_inicio VARCHAR(7),
+    uf_inicio VARCHAR(2),
+    municipio_fim VARCHAR(7),
+    uf_fim VARCHAR(2),
+    emitente_cnpj VARCHAR(14),
+    emitente_nome VARCHAR(200),
+    emitente_uf VARCHAR(2),
+    remetente_cnpj VARCHAR(14),
+    destinatario_cnpj VARCHAR(14),
+    expedidor_cnpj VARCHAR(14),
+    recebedor_cnpj VARCHAR(14),
+    tomador_tipo VARCHAR(1),
+    tomador_cnpj VARCHAR(14),
+    valor_total_prestacao NUMERIC(15, 2),
+    valor_receber NUMERIC(15, 2),
+    valor_carga NUMERIC(15, 2),
+    situacao_tributaria_icms VARCHAR(3),
+    base_calculo_icms NUMERIC(15, 2),
+    aliquota_icms NUMERIC(5, 2),
+    valor_icms NUMERIC(15, 2),
+    situacao VARCHAR(20),
+    codigo_status VARCHAR(3),
+    motivo_status TEXT,
+    protocolo_autorizacao VARCHAR(20),
+    data_autorizacao TIMESTAMP,
+    arquivo_original VARCHAR(500),
+    data_processamento_etl TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    data_atualizacao_etl TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_cte_id ON cte(id);
+CREATE INDEX IF NOT EXISTS ix_cte_chave_acesso ON cte(chave_acesso);
+CREATE INDEX IF NOT EXISTS ix_cte_situacao ON cte(situacao);
+CREATE INDEX IF NOT EXISTS ix_cte_data_processamento_etl ON cte(data_processamento_etl);
+CREATE INDEX IF NOT EXISTS ix_cte_data_atualizacao_etl ON cte(data_atualizacao_etl);
+CREATE INDEX IF NOT EXISTS ix_cte_emitente_data_emissao ON cte(emitente_cnpj, data_emissao);
+CREATE INDEX IF NOT EXISTS ix_cte_tomador_data_emissao ON cte(tomador_cnpj, data_emissao);
+
+CREATE TABLE IF NOT EXISTS cte_documento (
+    id SERIAL PRIMARY KEY,
+    cte_id INTEGER NOT NULL REFERENCES cte(id) ON DELETE CASCADE,
+    chave_nfe VARCHAR(44)
+);
+
+CREATE INDEX IF NOT EXISTS ix_cte_documento_id ON cte_documento(id);
+CREATE INDEX IF NOT EXISTS ix_cte_documento_cte_id ON cte_documento(cte_id);
+CREATE INDEX IF NOT EXISTS ix_cte_documento_chave_nfe ON cte_documento(chave_nfe);
+
+COMMENT ON TABLE cte IS 'Conhecimentos de Transporte Eletrônico (cteProc), carregados pelo plugin de CT-e do ETL';
+COMMENT ON TABLE cte_documento IS 'Chaves das NF-e transportadas pelo CT-e (infCTeNorm/infDoc/infNFe)';
+COMMENT ON COLUMN cte.tomador_tipo IS 'toma3/toma4: 0 remetente, 1 expedidor, 2 recebedor, 3 destinatário, 4 outros';
@@ -6,7 +6,7 @@ os dados extraídos dos arquivos XML de NF-e e NFC-e.
 """
 from sqlalchemy import (
     Column, Integer, String, DateTime, ForeignKey, 
-    Numeric, Boolean, Text, Date
+    Numeric, Boolean, Text, Date, Index, UniqueConstraint
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -25,6 +25,26 @@ class ProcessamentoETL(Base):
     tempo_execucao = Column(Numeric(10, 2))  # em segundos
     status = Column(String(20), nullable=False)  # 'executando', 'concluido', 'erro'
     mensagem = Column(Text)
+    tempos_etapas = Column(Text)  # JSON: resumo dos tempos por etapa (etl_service/metricas.py)
+
+    # Checkpoint para retomada (etl_service/checkpoint.py)
+    diretorio = Column(String(500))
+    recursivo = Column(Boolean)
+    total_arquivos = Column(Integer)
+    posicao_checkpoint = Column(Integer)  # arquivos da lista já concluídos
+    stats_checkpoint = Column(Text)  # JSON: processados, duplicados e erros até a posição
+    data_checkpoint = Column(DateTime)  # último lote concluído (batimento da execução)
+    executor = Column(String(100))  # host:pid do processo que executa
+    modo_carga = Column(String(20))  # 'inserir' ou 'upsert'
+
+
+class ProcessamentoArquivo(Base):
+    """Lista de arquivos de uma execução do ETL, na ordem de processamento."""
+    __tablename__ = 'etl_processamento_arquivo'
+
+    processamento_id = Column(Integer, ForeignKey('etl_processamento.id', ondelete='CASCADE'), primary_key=True)
+    ordem = Column(Integer, primary_key=True)  # posição na lista, a partir de 1
+    caminho_arquivo = Column(String(500), nullable=False)
 
 
 class NFe(Base):
@@ -59,16 +79,17 @@ class NFe(Base):
     data_emissao = Column(DateTime, nullable=False, index=True)
     data_saida_entrada = Column(DateTime)
     data_autorizacao = Column(DateTime)
-    data_processamento_etl = Column(DateTime, default=datetime.now, nullable=False)
+    data_processamento_etl = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    data_atualizacao_etl = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
     
     # Situação
-    situacao = Column(String(20))  # 'Autorizada', 'Cancelada', 'Denegada', etc
+    situacao = Column(String(20), index=True)  # 'Autorizada', 'Cancelada' (protocolo ou evento), 'Denegada', etc
     codigo_status = Column(String(3))
     motivo_status = Column(Text)
     protocolo_autorizacao = Column(String(20))
     
     # Emitente
-    emitente_cnpj = Column(String(14), index=True)
+    emitente_cnpj = Column(String(14))  # indexado em ix_nfe_emitente_data_emissao
     emitente_cpf = Column(String(11))
     emitente_razao_social = Column(String(200))
     emitente_nome_fantasia = Column(String(200))
@@ -88,7 +109,7 @@ class NFe(Base):
     emitente_email = Column(String(200))
     
     # Destinatário
-    destinatario_cnpj = Column(String(14), index=True)
+    destinatario_cnpj = Column(String(14))  # indexado em ix_nfe_destinatario_data_emissao
     destinatario_cpf = Column(String(11))
     destinatario_razao_social = Column(String(200))
     destinatario_ie = Column(String(20))
@@ -202,10 +223,19 @@ class NFe(Base):
     itens = relationship("NFeItem", back_populates="nfe", cascade="all, delete-orphan")
     duplicatas = relationship("NFeDuplicata", back_populates="nfe", cascade="all, delete-orphan")
     
-    # Índices adicionais
-    # data_emissao já tem index
-    # emitente_cnpj já tem index
-    # destinatario_cnpj já tem index
+    # Índices compostos para o filtro padrão das consultas:
+    # (emitente_cnpj = X OR destinatario_cnpj = X) AND data_emissao BETWEEN ...
+    __table_args__ = (
+        Index('ix_nfe_emitente_data_emissao', 'emitente_cnpj', 'data_emissao'),
+        Index('ix_nfe_destinatario_data_emissao', 'destinatario_cnpj', 'data_emissao'),
+    )
+
+
+# Colunas de valor incluídas nos índices de cobertura de nfe_item
+COLUNAS_VALORES_ITEM = [
+    'quantidade_comercial', 'valor_total_item',
+    'valor_icms', 'valor_ipi', 'valor_pis', 'valor_cofins', 'valor_ibs', 'valor_cbs',
+]
 
 
 class NFeItem(Base):
@@ -213,7 +243,7 @@ class NFeItem(Base):
     __tablename__ = 'nfe_item'
 
     id = Column(Integer, primary_key=True, index=True)
-    nfe_id = Column(Integer, ForeignKey('nfe.id', ondelete='CASCADE'), nullable=False, index=True)
+    nfe_id = Column(Integer, ForeignKey('nfe.id', ondelete='CASCADE'), nullable=False)  # indexado em ix_nfe_item_nfe_ncm
     
     # Identificação do item
     numero_item = Column(Integer, nullable=False)
@@ -368,6 +398,15 @@ class NFeItem(Base):
     
     # Relacionamento
     nfe = relationship("NFe", back_populates="itens")
+    
+    # Índices de cobertura para as agregações por NCM/CFOP (join por nfe_id);
+    # no PostgreSQL os valores somados ficam no índice (INCLUDE)
+    __table_args__ = (
+        Index('ix_nfe_item_nfe_ncm', 'nfe_id', 'ncm',
+              postgresql_include=COLUNAS_VALORES_ITEM),
+        Index('ix_nfe_item_nfe_cfop', 'nfe_id', 'cfop',
+              postgresql_include=COLUNAS_VALORES_ITEM),
+    )
 
 
 class NFeDuplicata(Base):
@@ -385,6 +424,128 @@ class NFeDuplicata(Base):
     nfe = relationship("NFe", back_populates="duplicatas")
 
 
+class NFeEvento(Base):
+    """
+    Evento de NF-e (cancelamento, carta de correção, manifestação do destinatário).
+    
+    Ligado à NF-e pela chave de acesso, pois o evento pode ser carregado
+    antes da própria nota (ver etl_service/eventos.py).
+    """
+    __tablename__ = 'nfe_evento'
+
+    id = Column(Integer, primary_key=True, index=True)
+    chave_acesso = Column(String(44), nullable=False)  # indexada por uq_nfe_evento_chave_tipo_sequencia
+    
+    # Identificação do evento
+    tipo_evento = Column(String(6), nullable=False)  # '110111' cancelamento, '110110' CC-e, '2102xx' manifestação
+    sequencia = Column(Integer, nullable=False, default=1)  # nSeqEvento
+    descricao_evento = Column(String(60))
+    data_evento = Column(DateTime)
+    orgao = Column(String(2))  # cOrgao
+    ambiente = Column(String(1))
+    autor_cnpj = Column(String(14))  # CNPJ ou CPF do autor
+    
+    # Detalhe
+    protocolo_nfe = Column(String(20))  # nProt da NF-e (cancelamento)
+    justificativa = Column(Text)  # xJust (cancelamento, operação não realizada)
+    correcao = Column(Text)  # xCorrecao (CC-e)
+    
+    # Retorno da SEFAZ
+    codigo_status = Column(String(3))  # 135/136/155 = evento registrado
+    motivo_status = Column(Text)
+    protocolo_evento = Column(String(20))
+    data_registro = Column(DateTime)
+    
+    # Controle
+    arquivo_original = Column(String(500))
+    data_processamento_etl = Column(DateTime, default=datetime.now, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('chave_acesso', 'tipo_evento', 'sequencia', name='uq_nfe_evento_chave_tipo_sequencia'),
+        Index('ix_nfe_evento_tipo_chave', 'tipo_evento', 'chave_acesso'),
+    )
+
+
+class CTe(Base):
+    """Conhecimento de Transporte Eletrônico - Dados principais (etl_service/cte.py)."""
+    __tablename__ = 'cte'
+
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # Identificação
+    chave_acesso = Column(String(44), unique=True, index=True, nullable=False)
+    numero_cte = Column(String(20), nullable=False)
+    serie = Column(String(3))
+    modelo = Column(String(2))  # 57 = CT-e, 67 = CT-e OS
+    cfop = Column(String(4))
+    natureza_operacao = Column(String(60))
+    tipo_cte = Column(String(1))  # 0 normal, 1 complemento, 2 anulação, 3 substituto
+    tipo_servico = Column(String(1))  # 0 normal, 1 subcontratação, 2 redespacho...
+    modal = Column(String(2))  # 01 rodoviário, 02 aéreo, 03 aquaviário, 04 ferroviário...
+    data_emissao = Column(DateTime, nullable=False)
+    
+    # Trajeto
+    municipio_inicio = Column(String(7))
+    uf_inicio = Column(String(2))
+    municipio_fim = Column(String(7))
+    uf_fim = Column(String(2))
+    
+    # Participantes (CNPJ ou CPF)
+    emitente_cnpj = Column(String(14))
+    emitente_nome = Column(String(200))
+    emitente_uf = Column(String(2))
+    remetente_cnpj = Column(String(14))
+    destinatario_cnpj = Column(String(14))
+    expedidor_cnpj = Column(String(14))
+    recebedor_cnpj = Column(String(14))
+    tomador_tipo = Column(String(1))  # 0 remetente, 1 expedidor, 2 recebedor, 3 destinatário, 4 outros
+    tomador_cnpj = Column(String(14))
+    
+    # Valores
+    valor_total_prestacao = Column(Numeric(15, 2))
+    valor_receber = Column(Numeric(15, 2))
+    valor_carga = Column(Numeric(15, 2))
+    
+    # ICMS da prestação
+    situacao_tributaria_icms = Column(String(3))
+    base_calculo_icms = Column(Numeric(15, 2))
+    aliquota_icms = Column(Numeric(5, 2))
+    valor_icms = Column(Numeric(15, 2))
+    
+    # Situação
+    situacao = Column(String(20), index=True)
+    codigo_status = Column(String(3))
+    motivo_status = Column(Text)
+    protocolo_autorizacao = Column(String(20))
+    data_autorizacao = Column(DateTime)
+    
+    # Controle
+    arquivo_original = Column(String(500))
+    data_processamento_etl = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    data_atualizacao_etl = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+    
+    # Relacionamentos
+    documentos = relationship("CTeDocumento", back_populates="cte", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('ix_cte_emitente_data_emissao', 'emitente_cnpj', 'data_emissao'),
+        Index('ix_cte_tomador_data_emissao', 'tomador_cnpj', 'data_emissao'),
+    )
+
+
+class CTeDocumento(Base):
+    """Documentos transportados pelo CT-e (chaves de NF-e em infDoc)."""
+    __tablename__ = 'cte_documento'
+
+    id = Column(Integer, primary_key=True, index=True)
+    cte_id = Column(Integer, ForeignKey('cte.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    chave_nfe = Column(String(44), index=True)
+    
+    # Relacionamento
+    cte = relationship("CTe", back_populates="documentos")
+
+
 class LogProcessamento(Base):
     """Log detalhado do processamento de cada arquivo."""
     __tablename__ = 'etl_log_processamento'
@@ -395,7 +556,7 @@ class LogProcessamento(Base):
     data_hora = Column(DateTime, default=datetime.now, nullable=False)
     arquivo = Column(String(500), nullable=False)
     chave_acesso = Column(String(44), index=True)
-    status = Column(String(20), nullable=False)  # 'sucesso', 'erro', 'duplicado'
+    status = Column(String(20), nullable=False)  # 'sucesso', 'erro', 'duplicado', 'atualizado'
     mensagem = Column(Text)
     tempo_processamento = Column(Numeric(10, 3))  # em segundos
     tamanho_arquivo = Column(Integer)  # em bytes
@@ -422,7 +583,26 @@ class ArquivoProcessado(Base):
     data_modificacao_arquivo = Column(DateTime)
     
     # Status
-    status = Column(String(20), nullable=False)  # 'processado', 'erro', 'deletado', 'movido'
+    status = Column(String(20), nullable=False)  # 'processado', 'duplicado', 'ignorado', 'erro', 'deletado', 'movido'
     caminho_backup = Column(String(500))  # Se foi movido para backup
     deletado = Column(Boolean, default=False)
 
+
+
+class ConsultaLenta(Base):
+    """Consulta do datalake acima do limite de lentidão (etl_service/consultas_lentas.py)."""
+    __tablename__ = 'etl_consulta_lenta'
+
+    id = Column(Integer, primary_key=True, index=True)
+    data_hora = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    engine = Column(String(50), nullable=False)  # 'datalake', 'datalake_leitura'
+    duracao_ms = Column(Numeric(12, 3), nullable=False)
+    instrucao = Column(Text, nullable=False)
+    parametros = Column(Text)
+
+    # Plano (EXPLAIN) de uma amostra das consultas
+    plano = Column(Text)
+    varredura_sequencial = Column(Boolean)  # Seq Scan em nfe/nfe_item; None se sem plano
+    tabelas_varridas = Column(String(200))
+
+    origem = Column(String(500))  # arquivo:linha função que executou a consulta
@@ -2,20 +2,30 @@
 Pipeline ETL principal para processamento de arquivos XML fiscais.
 
 Este módulo orquestra o processo completo de ETL:
-- Extract: Leitura dos arquivos XML
+- Extract: Leitura dos arquivos XML (individuais ou em lote)
 - Transform: Conversão dos dados para modelos do banco
 - Load: Persistência no banco de dados
 """
 import os
 import glob
-from typing import List, Optional
+import hashlib
+import threading
+from typing import Iterable, List, Optional
 from pathlib import Path
 import time
 from datetime import datetime
 
-from .extractor import XMLExtractor
+from .extractor import XMLExtractor, localizar_chave_acesso, LIMITE_BUSCA_CHAVE
+from .plugins import carregar_plugins, plugin_para, plugins_registrados
 from .transformer import DataTransformer
 from .loader import DataLoader
+from .leitor_lote import LeitorLoteXML
+from .descarte import DescarteArquivos
+from .registro_log import BufferLogProcessamento, ProgressoETL
+from .checkpoint import CheckpointETL, ExecucaoAssumida, ESTATISTICAS
+from .estagios import PipelineEstagios
+from .metricas import TemporizadorEtapas, gravar_textfile
+from .consultas_lentas import consultas_lentas_habilitado, monitorar_engines
 from .database import init_database
 from .config import config
 
@@ -28,20 +38,44 @@ class ETLPipeline:
     e armazenando em um datalake estruturado.
     """
 
-    def __init__(self):
-        """Inicializa o pipeline ETL."""
-        self.extractor = XMLExtractor()
+    def __init__(self, modo_carga: Optional[str] = None):
+        """
+        Inicializa o pipeline ETL.
+        
+        Args:
+            modo_carga: 'inserir' ou 'upsert' (padrão: ETL_MODO_CARGA; ver DataLoader)
+        """
+        # Tempos por etapa da execução atual (gravados em etl_processamento)
+        self.tempos = TemporizadorEtapas()
+        
+        # Log de consultas lentas do engine de escrita (opt-in: CONSULTAS_LENTAS=true)
+        self.monitor = monitorar_engines(('datalake',)) if consultas_lentas_habilitado() else None
+        
+        self.extractor = XMLExtractor(tempos=self.tempos)
+        # Plugins externos de tipos de documento (ETL_PLUGINS)
+        carregar_plugins(config.plugins)
         self.transformer = DataTransformer()
-        self.loader = DataLoader()
+        self.loader = DataLoader(tempos=self.tempos, modo=modo_carga)
+        self.checkpoint = CheckpointETL()
         
         # Estatísticas
         self.stats = {
             'total_arquivos': 0,
             'processados': 0,
             'duplicados': 0,
+            'atualizados': 0,
+            'documentos': {},
+            'ignorados': 0,
             'erros': 0,
             'tempo_total': 0,
         }
+        
+        # Chaves já carregadas (ou confirmadas no banco) nesta execução
+        self._chaves_carregadas = set()
+        
+        # Arquivos ignorados (tipo sem plugin de carga) registrados no banco; lidos no primeiro uso
+        self._ignorados: Optional[set] = None
+        self._lock_ignorados = threading.Lock()
 
     def processar_diretorio(self, diretorio: str = None, 
                            tipo_processamento: str = 'completo',
@@ -49,6 +83,11 @@ class ETLPipeline:
         """
         Processa todos os arquivos XML de um diretório.
         
+        A lista de arquivos e a posição de cada lote concluído são gravadas
+        como checkpoint (ver CheckpointETL). Se houver uma execução abandonada
+        do mesmo diretório, ela é retomada em vez de iniciar uma nova
+        (ETL_RETOMAR_ABANDONADAS).
+        
         Args:
             diretorio: Caminho do diretório (usa config.diretorio_padrao se None)
             tipo_processamento: Tipo de processamento ('completo' ou 'incremental')
@@ -63,35 +102,33 @@ class ETLPipeline:
             if not diretorio:
                 raise ValueError("Nenhum diretório foi especificado e não há diretório padrão configurado!")
         
-        print(f"\n{'='*80}")
-        print(f"Iniciando processamento ETL")
-        print(f"Diretório: {diretorio}")
-        print(f"Tipo: {tipo_processamento}")
-        print(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-        if config.deletar_apos_processar:
-            print(f"Modo: Deletar arquivos após processamento")
-        elif config.mover_para_backup:
-            print(f"Modo: Mover arquivos para backup ({config.diretorio_backup})")
-        else:
-            print(f"Modo: Manter arquivos originais")
-        print(f"{'='*80}\n")
+        if config.retomar_abandonadas:
+            abandonada = self.checkpoint.localizar_abandonada(diretorio)
+            if abandonada:
+                print(f"\n⚠ Execução {abandonada} deste diretório foi interrompida; retomando do último checkpoint")
+                return self.retomar_processamento(abandonada)
+        
+        self._exibir_cabecalho(diretorio, tipo_processamento)
         
         inicio_total = time.time()
+        self.tempos.reiniciar()
         
         # Iniciar processamento
         processamento_id = self.loader.iniciar_processamento(tipo_processamento)
+        self._iniciar_workers_io()
         print(f"ID do Processamento: {processamento_id}\n")
         
         try:
             # Localizar arquivos XML
-            arquivos_xml = self._localizar_arquivos_xml(diretorio, recursivo)
+            with self.tempos.medir('descoberta'):
+                arquivos_xml = self._localizar_arquivos_xml(diretorio, recursivo)
             self.stats['total_arquivos'] = len(arquivos_xml)
             
             print(f"Arquivos XML encontrados: {len(arquivos_xml)}\n")
             
             if not arquivos_xml:
                 print("Nenhum arquivo XML encontrado!")
-                self.loader.finalizar_processamento(
+                self._finalizar_execucao(
                     processamento_id=processamento_id,
                     status='concluido',
                     mensagem='Nenhum arquivo encontrado',
@@ -99,31 +136,15 @@ class ETLPipeline:
                 )
                 return self.stats
             
-            # Processar cada arquivo
-            for i, arquivo in enumerate(arquivos_xml, 1):
-                print(f"[{i}/{len(arquivos_xml)}] Processando: {Path(arquivo).name}")
-                
-                resultado = self.processar_arquivo(
-                    arquivo=arquivo,
-                    processamento_id=processamento_id
-                )
-                
-                if resultado['sucesso']:
-                    self.stats['processados'] += 1
-                    print(f"  ✓ Sucesso - Chave: {resultado.get('chave_acesso', 'N/A')}")
-                elif resultado['duplicado']:
-                    self.stats['duplicados'] += 1
-                    print(f"  ⚠ Duplicado - Chave: {resultado.get('chave_acesso', 'N/A')}")
-                else:
-                    self.stats['erros'] += 1
-                    print(f"  ✗ Erro - {resultado.get('mensagem', 'Erro desconhecido')}")
-                
-                print()
+            # Lista de arquivos e cursor persistidos para retomada (--resume)
+            self.checkpoint.registrar_arquivos(processamento_id, diretorio, recursivo, arquivos_xml)
+            
+            self._processar_com_checkpoint(processamento_id, arquivos_xml, posicao=0)
             
             # Finalizar processamento
             self.stats['tempo_total'] = time.time() - inicio_total
             
-            self.loader.finalizar_processamento(
+            self._finalizar_execucao(
                 processamento_id=processamento_id,
                 status='concluido',
                 mensagem='Processamento concluído com sucesso',
@@ -135,10 +156,14 @@ class ETLPipeline:
             # Exibir resumo
             self._exibir_resumo()
             
+        except ExecucaoAssumida:
+            # Outro processo retomou a execução; o registro é dele
+            raise
+        
         except Exception as e:
             self.stats['tempo_total'] = time.time() - inicio_total
             
-            self.loader.finalizar_processamento(
+            self._finalizar_execucao(
                 processamento_id=processamento_id,
                 status='erro',
                 mensagem=f'Erro no processamento: {str(e)}',
@@ -150,13 +175,174 @@ class ETLPipeline:
             print(f"\n❌ ERRO NO PROCESSAMENTO: {str(e)}\n")
             raise
         
+        finally:
+            self._finalizar_workers_io()
+        
+        return self.stats
+
+    def retomar_processamento(self, processamento_id: int) -> dict:
+        """
+        Retoma uma execução interrompida a partir do último checkpoint.
+        
+        A lista de arquivos gravada na execução original é usada sem nova
+        varredura do diretório. Os arquivos do lote interrompido são
+        processados de novo e tratados pela deduplicação; os que já foram
+        carregados e descartados (deletados/movidos) antes da falha contam
+        como duplicados.
+        
+        Args:
+            processamento_id: ID do processamento a retomar
+            
+        Returns:
+            Dicionário com estatísticas do processamento (acumuladas desde o
+            início da execução original)
+            
+        Raises:
+            ValueError: Se a execução não pode ser retomada (ver CheckpointETL.assumir)
+        """
+        estado = self.checkpoint.assumir(processamento_id)
+        if estado['modo_carga']:
+            # Mantém o modo de carga da execução original
+            self.loader.modo = estado['modo_carga']
+        
+        self._exibir_cabecalho(estado['diretorio'], estado['tipo'])
+        print(f"Retomando processamento {processamento_id}: "
+              f"{estado['posicao']}/{estado['total']} arquivos já concluídos\n")
+        
+        inicio_total = time.time()
+        self.tempos.reiniciar()
+        self._iniciar_workers_io()
+        
+        self.stats['total_arquivos'] = estado['total']
+        for chave in ESTATISTICAS:
+            self.stats[chave] = estado['stats'].get(chave, self.stats[chave])
+        
+        try:
+            self._processar_com_checkpoint(
+                processamento_id,
+                self.checkpoint.arquivos_pendentes(processamento_id, estado['posicao']),
+                posicao=estado['posicao'],
+                retomada=True
+            )
+            
+            self.stats['tempo_total'] = time.time() - inicio_total
+            
+            self._finalizar_execucao(
+                processamento_id=processamento_id,
+                status='concluido',
+                mensagem=f"Processamento retomado na posição {estado['posicao']} e concluído",
+                arquivos_processados=self.stats['processados'] + self.stats['duplicados'],
+                arquivos_erro=self.stats['erros'],
+                tempo_execucao=self.stats['tempo_total']
+            )
+            
+            self._exibir_resumo()
+            
+        except ExecucaoAssumida:
+            raise
+        
+        except Exception as e:
+            self.stats['tempo_total'] = time.time() - inicio_total
+            
+            self._finalizar_execucao(
+                processamento_id=processamento_id,
+                status='erro',
+                mensagem=f'Erro no processamento retomado: {str(e)}',
+                arquivos_processados=self.stats['processados'],
+                arquivos_erro=self.stats['erros'],
+                tempo_execucao=self.stats['tempo_total']
+            )
+            
+            print(f"\n❌ ERRO NO PROCESSAMENTO: {str(e)}\n")
+            raise
+        
+        finally:
+            self._finalizar_workers_io()
+        
         return self.stats
 
+    def _processar_com_checkpoint(self, processamento_id: int, arquivos: Iterable[str],
+                                  posicao: int, retomada: bool = False):
+        """
+        Processa os arquivos gravando um checkpoint a cada lote concluído.
+        
+        Com ETL_PIPELINE_ESTAGIOS (padrão), leitura, parse e carga rodam em
+        estágios paralelos (ver PipelineEstagios); sem ele, um arquivo por vez.
+        O checkpoint grava a posição até a qual todos os arquivos da lista
+        foram concluídos e as estatísticas numa única transação.
+        
+        Args:
+            processamento_id: ID do processamento
+            arquivos: Arquivos após a posição, na ordem da lista da execução
+            posicao: Quantidade de arquivos da lista já concluídos
+            retomada: Se é a retomada de uma execução interrompida
+        """
+        total = self.stats['total_arquivos']
+        lote = max(1, config.checkpoint_lote)
+        progresso = ProgressoETL(total, intervalo=config.log_intervalo, inicial=posicao)
+        ultimo_checkpoint = posicao
+        estagios = None
+        
+        def avancar(concluidos: int):
+            nonlocal ultimo_checkpoint
+            if concluidos - ultimo_checkpoint >= lote or concluidos == total:
+                self.checkpoint.registrar_lote(processamento_id, concluidos, self.stats)
+                ultimo_checkpoint = concluidos
+            if estagios:
+                self.stats['filas'] = estagios.profundidade()
+            progresso.atualizar(concluidos, self.stats, forcar=concluidos == total)
+        
+        if config.pipeline_estagios:
+            estagios = PipelineEstagios(
+                self,
+                leitores=config.leitores,
+                parsers=config.parsers,
+                tamanho_fila=config.tamanho_fila,
+                tamanho_lote=config.carga_lote
+            )
+            try:
+                estagios.executar(arquivos, processamento_id, posicao, retomada, ao_avancar=avancar)
+            finally:
+                self.stats.pop('filas', None)
+                self.stats['estagios'] = estagios.estatisticas()
+            return
+        
+        for i, arquivo in enumerate(arquivos, posicao + 1):
+            if retomada and not os.path.exists(arquivo) and self.checkpoint.arquivo_registrado(arquivo):
+                # Carregado e descartado antes da interrupção
+                self.stats['duplicados'] += 1
+            else:
+                resultado = self.processar_arquivo(
+                    arquivo=arquivo,
+                    processamento_id=processamento_id
+                )
+                self._contabilizar(resultado, arquivo)
+            
+            avancar(i)
+
+    def _exibir_cabecalho(self, diretorio: str, tipo_processamento: str):
+        """Exibe o cabeçalho de uma execução de diretório."""
+        print(f"\n{'='*80}")
+        print(f"Iniciando processamento ETL")
+        print(f"Diretório: {diretorio}")
+        print(f"Tipo: {tipo_processamento}")
+        print(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        if config.deletar_apos_processar:
+            print(f"Modo: Deletar arquivos após processamento")
+        elif config.mover_para_backup:
+            print(f"Modo: Mover arquivos para backup ({config.diretorio_backup})")
+        else:
+            print(f"Modo: Manter arquivos originais")
+        print(f"{'='*80}\n")
+
     def processar_arquivo(self, arquivo: str, 
                          processamento_id: Optional[int] = None) -> dict:
         """
         Processa um único arquivo XML.
         
+        Os demais tipos de documento (eventos, CT-e, NFS-e) são identificados
+        pelo elemento raiz e seguem o plugin do tipo (_processar_documento).
+        
         Args:
             arquivo: Caminho do arquivo XML
             processamento_id: ID do processamento ETL
@@ -172,27 +358,370 @@ class ETLPipeline:
         }
         
         try:
+            with self.tempos.medir('deduplicacao'):
+                if self._arquivo_ignorado(arquivo):
+                    return {'sucesso': False, 'duplicado': False, 'ignorado': True,
+                            'mensagem': 'Arquivo ignorado em execução anterior', 'chave_acesso': None}
+                inicio = self._ler_inicio(arquivo)
+            
+            plugin = plugin_para(inicio)
+            if plugin is not None and plugin.ignorar:
+                return self._registrar_ignorado(arquivo, plugin, processamento_id)
+            if plugin is not None:
+                return self._processar_documento(plugin, arquivo, processamento_id)
+            
+            # Duplicata detectada pela chave, antes da extração (no upsert a NF-e é sempre extraída)
+            with self.tempos.medir('deduplicacao'):
+                chave_previa = None if self.loader.upsert else localizar_chave_acesso(inicio)
+                duplicada = bool(chave_previa) and self._chave_ja_carregada(chave_previa)
+            
+            if duplicada:
+                return self.loader.registrar_duplicata_previa(arquivo, chave_previa, processamento_id)
+            
             # Extract
             dados_extraidos = self.extractor.extrair_nfe(arquivo)
-            resultado['chave_acesso'] = dados_extraidos.get('identificacao', {}).get('chave_acesso')
             
-            # Transform
+            # Transform + Load
+            self._transformar_e_carregar(dados_extraidos, arquivo, processamento_id, resultado)
+            
+        except Exception as e:
+            resultado['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+        
+        return resultado
+
+    def _transformar_e_carregar(self, dados_extraidos: dict, arquivo: str,
+                                processamento_id: Optional[int], resultado: dict):
+        """
+        Executa as etapas Transform e Load de um documento já extraído.
+        
+        Args:
+            dados_extraidos: Dados retornados pelo XMLExtractor
+            arquivo: Caminho (ou identificação) do documento de origem
+            processamento_id: ID do processamento ETL
+            resultado: Dicionário de resultado, atualizado com a carga
+        """
+        resultado['chave_acesso'] = dados_extraidos.get('identificacao', {}).get('chave_acesso')
+        
+        # Transform
+        with self.tempos.medir('transformacao'):
             nfe = self.transformer.transformar_nfe(dados_extraidos)
+        
+        # Load
+        resultado_carga = self.loader.carregar_nfe(
+            nfe=nfe,
+            arquivo=arquivo,
+            processamento_id=processamento_id,
+            dados_emitente=dados_extraidos.get('emitente', {})
+        )
+        
+        resultado.update(resultado_carga)
+        
+        if resultado_carga.get('sucesso') or resultado_carga.get('duplicado'):
+            self._chaves_carregadas.add(nfe.chave_acesso)
+
+    def _contabilizar(self, resultado: dict, arquivo: str, stats: Optional[dict] = None):
+        """
+        Atualiza as estatísticas com o resultado de um arquivo.
+        
+        Apenas os erros são exibidos no console; o detalhe de todos os
+        arquivos fica em etl_log_processamento.
+        
+        Args:
+            resultado: Resultado do processamento do arquivo
+            arquivo: Caminho do arquivo
+            stats: Estatísticas a atualizar (padrão: as da execução; ver _somar_stats)
+        """
+        if stats is None:
+            stats = self.stats
+        
+        if resultado['sucesso']:
+            stats['processados'] = stats.get('processados', 0) + 1
+            if resultado.get('atualizado'):
+                stats['atualizados'] = stats.get('atualizados', 0) + 1
+            if resultado.get('tipo_documento'):
+                documentos = stats.setdefault('documentos', {})
+                documentos[resultado['tipo_documento']] = \
+                    documentos.get(resultado['tipo_documento'], 0) + resultado.get('registros', 0)
+        elif resultado['duplicado']:
+            stats['duplicados'] = stats.get('duplicados', 0) + 1
+        elif resultado.get('ignorado'):
+            stats['ignorados'] = stats.get('ignorados', 0) + 1
+        else:
+            stats['erros'] = stats.get('erros', 0) + 1
+            print(f"  ✗ {Path(arquivo).name} - {resultado.get('mensagem', 'Erro desconhecido')}")
+
+    def _somar_stats(self, parcial: dict):
+        """Soma às estatísticas da execução as contabilizadas à parte (ver PipelineEstagios)."""
+        for chave, valor in parcial.items():
+            if chave == 'documentos':
+                for tipo, registros in valor.items():
+                    self.stats['documentos'][tipo] = self.stats['documentos'].get(tipo, 0) + registros
+            else:
+                self.stats[chave] += valor
+
+    def _iniciar_workers_io(self):
+        """Inicia, conforme a configuração, o descarte de arquivos e o buffer de logs em segundo plano."""
+        if config.descarte_em_segundo_plano and not self.loader.descarte:
+            self.loader.descarte = DescarteArquivos(tempos=self.tempos)
+        
+        if config.log_em_lote and not self.loader.logs:
+            self.loader.logs = BufferLogProcessamento(
+                tamanho_lote=config.log_tamanho_lote,
+                intervalo=config.log_intervalo
+            )
+
+    def _finalizar_workers_io(self):
+        """Grava os logs pendentes, aguarda os descartes pendentes e encerra os workers."""
+        logs = self.loader.logs
+        if logs:
+            self.loader.logs = None
+            logs.finalizar()
+        
+        descarte = self.loader.descarte
+        if descarte:
+            self.loader.descarte = None
+            print("Aguardando descarte dos arquivos processados...")
+            descarte.finalizar()
+            if descarte.stats['erros']:
+                print(f"⚠ {descarte.stats['erros']} arquivo(s) não puderam ser deletados/movidos")
+
+    def _finalizar_execucao(self, processamento_id: int, status: str, **kwargs):
+        """
+        Encerra os workers de I/O e grava o fim da execução com os tempos por etapa.
+        
+        Os workers são encerrados antes para que o descarte em segundo plano
+        entre no resumo. Numa execução concluída, a lista de arquivos gravada
+        para a retomada é apagada. Com ETL_METRICAS_TEXTFILE, as métricas também são
+        gravadas para o textfile collector do node_exporter. Por último, o
+        monitor de consultas lentas grava as consultas ainda na fila, que se
+        perderiam com o fim do processo (a thread é daemon).
+        
+        Args:
+            processamento_id: ID do processamento
+            status: Status final ('concluido' ou 'erro')
+            **kwargs: Demais argumentos de DataLoader.finalizar_processamento
+        """
+        self._finalizar_workers_io()
+        
+        if status == 'concluido':
+            # NF-e carregadas depois do próprio cancelamento (evento chegou antes da nota)
+            try:
+                canceladas = self.loader.aplicar_cancelamentos_pendentes()
+                if canceladas:
+                    print(f"{canceladas} NF-e marcadas como canceladas por eventos já registrados")
+            except Exception as e:
+                print(f"⚠ Não foi possível aplicar os cancelamentos pendentes: {str(e)}")
+            
+            # A lista de arquivos só serve para retomar a execução
+            try:
+                self.checkpoint.limpar_arquivos(processamento_id)
+            except Exception as e:
+                print(f"⚠ Não foi possível apagar a lista de arquivos da execução: {str(e)}")
+        
+        resumo = self.tempos.resumo()
+        
+        self.loader.finalizar_processamento(
+            processamento_id=processamento_id,
+            status=status,
+            tempos_etapas=resumo,
+            **kwargs
+        )
+        
+        if config.metricas_textfile:
+            try:
+                gravar_textfile(config.metricas_textfile, resumo, status)
+            except OSError as e:
+                print(f"⚠ Não foi possível gravar as métricas em {config.metricas_textfile}: {str(e)}")
+        
+        if self.monitor is not None:
+            self.monitor.finalizar()
+
+    def _ler_inicio(self, arquivo: str) -> bytes:
+        """
+        Lê apenas o início do arquivo, onde ficam o elemento raiz e a chave de acesso.
+        
+        Args:
+            arquivo: Caminho do arquivo XML
+            
+        Returns:
+            Primeiros bytes do arquivo (vazio se o arquivo é ilegível)
+        """
+        try:
+            with open(arquivo, 'rb') as f:
+                return f.read(LIMITE_BUSCA_CHAVE)
+        except OSError:
+            return b''
+
+    def _processar_documento(self, plugin, arquivo: str, processamento_id: Optional[int]) -> dict:
+        """
+        Carrega um XML de outro tipo de documento (eventos de NF-e, CT-e) pelo seu plugin.
+        
+        Args:
+            plugin: PluginDocumento do tipo do arquivo
+            arquivo: Caminho do arquivo XML
+            processamento_id: ID do processamento ETL
             
-            # Load
-            resultado_carga = self.loader.carregar_nfe(
-                nfe=nfe,
-                arquivo=arquivo,
+        Returns:
+            Dicionário com resultado do processamento
+        """
+        resultado = {
+            'sucesso': False,
+            'duplicado': False,
+            'mensagem': '',
+            'chave_acesso': None,
+        }
+        
+        with self.tempos.medir('leitura'):
+            with open(arquivo, 'rb') as f:
+                conteudo = f.read()
+        
+        dados = plugin.extrair(conteudo, arquivo, self.tempos)
+        resultados = self.loader.carregar_documentos(plugin, [{
+            'arquivo': arquivo,
+            'dados': dados,
+            'hash_arquivo': hashlib.sha256(conteudo).hexdigest(),
+        }], processamento_id)
+        
+        if resultados is None:
+            resultado['chave_acesso'] = plugin.chave(dados)
+            resultado['mensagem'] = f'Erro ao carregar {plugin.descricao}'
+            return resultado
+        return resultados[0]
+
+    def _arquivo_ignorado(self, arquivo: str) -> bool:
+        """
+        Verifica se o arquivo foi ignorado numa execução anterior (tipo sem plugin de carga).
+        
+        Os caminhos são lidos do banco uma vez por pipeline, e só enquanto
+        algum tipo de documento continua sem plugin: ao registrar o plugin
+        que faltava (ETL_PLUGINS), os arquivos ignorados são lidos de novo.
+        
+        Args:
+            arquivo: Caminho do arquivo
+            
+        Returns:
+            True se o arquivo deve ser pulado sem leitura
+        """
+        with self._lock_ignorados:
+            if self._ignorados is None:
+                sem_plugin = any(plugin.ignorar for plugin in plugins_registrados())
+                self._ignorados = self.loader.arquivos_ignorados() if sem_plugin else set()
+            return arquivo in self._ignorados
+
+    def _registrar_ignorado(self, arquivo: str, plugin, processamento_id: Optional[int]) -> dict:
+        """Registra um arquivo de tipo sem plugin de carga, para as próximas execuções o pularem."""
+        mensagem = f'{plugin.descricao} sem plugin registrado (ETL_PLUGINS)'
+        try:
+            resultado = self.loader.registrar_ignorado(arquivo, mensagem, processamento_id)
+        except Exception as e:
+            print(f"⚠ Não foi possível registrar o arquivo ignorado {Path(arquivo).name}: {str(e)}")
+            resultado = {'sucesso': False, 'duplicado': False, 'ignorado': True,
+                         'mensagem': mensagem, 'chave_acesso': None}
+        return resultado
+
+    def _chave_ja_carregada(self, chave_acesso: str) -> bool:
+        """
+        Verifica se a chave já foi carregada nesta execução ou está no banco.
+        
+        A consulta usa o índice único de nfe.chave_acesso.
+        
+        Args:
+            chave_acesso: Chave de acesso da NF-e
+            
+        Returns:
+            True se a NF-e já existe
+        """
+        if chave_acesso in self._chaves_carregadas:
+            return True
+        
+        if self.loader.obter_chaves_existentes([chave_acesso]):
+            self._chaves_carregadas.add(chave_acesso)
+            return True
+        
+        return False
+
+    def processar_arquivo_lote(self, caminho_arquivo: str,
+                               tipo_processamento: str = 'completo',
+                               processos: Optional[int] = None) -> dict:
+        """
+        Processa um arquivo único com várias NF-e concatenadas (dump de ERP).
+        
+        O arquivo é mapeado em memória e cada documento <nfeProc> é extraído
+        separadamente (em paralelo, ver LeitorLoteXML), passando depois pelas
+        mesmas etapas Transform e Load dos arquivos individuais. Cada documento
+        é registrado como "caminho#início-fim"; o arquivo em lote não é
+        deletado nem movido.
+        
+        Args:
+            caminho_arquivo: Caminho do arquivo em lote
+            tipo_processamento: 'completo' ou 'incremental'
+            processos: Processos para a extração (None = número de CPUs)
+            
+        Returns:
+            Dicionário com estatísticas do processamento
+        """
+        leitor = LeitorLoteXML(caminho_arquivo, processos=processos)
+        
+        print(f"\n{'='*80}")
+        print(f"Iniciando processamento ETL de arquivo em lote")
+        print(f"Arquivo: {caminho_arquivo}")
+        print(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        print(f"{'='*80}\n")
+        
+        inicio_total = time.time()
+        self.tempos.reiniciar()
+        processamento_id = self.loader.iniciar_processamento(tipo_processamento)
+        self._iniciar_workers_io()
+        
+        progresso = ProgressoETL(0, intervalo=config.log_intervalo)
+        
+        try:
+            for origem, dados_extraidos, erro in leitor:
+                self.stats['total_arquivos'] += 1
+                resultado = {
+                    'sucesso': False,
+                    'duplicado': False,
+                    'mensagem': f'Erro ao processar documento: {erro}' if erro else '',
+                    'chave_acesso': None,
+                }
+                
+                if not erro:
+                    try:
+                        self._transformar_e_carregar(dados_extraidos, origem, processamento_id, resultado)
+                    except Exception as e:
+                        resultado['mensagem'] = f'Erro ao processar documento: {str(e)}'
+                
+                self._contabilizar(resultado, origem)
+                progresso.atualizar(self.stats['total_arquivos'], self.stats)
+            
+            progresso.atualizar(self.stats['total_arquivos'], self.stats, forcar=True)
+            
+            self.stats['tempo_total'] = time.time() - inicio_total
+            
+            self._finalizar_execucao(
                 processamento_id=processamento_id,
-                dados_emitente=dados_extraidos.get('emitente', {})
+                status='concluido',
+                mensagem='Processamento de arquivo em lote concluído',
+                arquivos_processados=self.stats['processados'] + self.stats['duplicados'],
+                arquivos_erro=self.stats['erros'],
+                tempo_execucao=self.stats['tempo_total']
             )
             
-            resultado.update(resultado_carga)
+            self._exibir_resumo()
             
         except Exception as e:
-            resultado['mensagem'] = f'Erro ao processar arquivo: {str(e)}'
+            self._finalizar_execucao(
+                processamento_id=processamento_id,
+                status='erro',
+                mensagem=str(e),
+                tempo_execucao=time.time() - inicio_total
+            )
+            raise
         
-        return resultado
+        finally:
+            self._finalizar_workers_io()
+        
+        return self.stats
 
     def processar_arquivos_lista(self, arquivos: List[str],
                                 tipo_processamento: str = 'completo') -> dict:
@@ -213,29 +742,27 @@ class ETLPipeline:
         print(f"{'='*80}\n")
         
         inicio_total = time.time()
+        self.tempos.reiniciar()
         processamento_id = self.loader.iniciar_processamento(tipo_processamento)
+        self._iniciar_workers_io()
         
         self.stats['total_arquivos'] = len(arquivos)
         
         try:
+            progresso = ProgressoETL(len(arquivos), intervalo=config.log_intervalo)
+            
             for i, arquivo in enumerate(arquivos, 1):
-                print(f"[{i}/{len(arquivos)}] Processando: {Path(arquivo).name}")
-                
                 resultado = self.processar_arquivo(
                     arquivo=arquivo,
                     processamento_id=processamento_id
                 )
                 
-                if resultado['sucesso']:
-                    self.stats['processados'] += 1
-                elif resultado['duplicado']:
-                    self.stats['duplicados'] += 1
-                else:
-                    self.stats['erros'] += 1
+                self._contabilizar(resultado, arquivo)
+                progresso.atualizar(i, self.stats, forcar=i == len(arquivos))
             
             self.stats['tempo_total'] = time.time() - inicio_total
             
-            self.loader.finalizar_processamento(
+            self._finalizar_execucao(
                 processamento_id=processamento_id,
                 status='concluido',
                 mensagem='Processamento concluído',
@@ -247,7 +774,7 @@ class ETLPipeline:
             self._exibir_resumo()
             
         except Exception as e:
-            self.loader.finalizar_processamento(
+            self._finalizar_execucao(
                 processamento_id=processamento_id,
                 status='erro',
                 mensagem=str(e),
@@ -255,6 +782,9 @@ class ETLPipeline:
             )
             raise
         
+        finally:
+            self._finalizar_workers_io()
+        
         return self.stats
 
     def _localizar_arquivos_xml(self, diretorio: str, recursivo: bool = True) -> List[str]:
@@ -285,6 +815,13 @@ class ETLPipeline:
         print(f"Total de arquivos:     {self.stats['total_arquivos']:>6}")
         print(f"Processados:           {self.stats['processados']:>6}")
         print(f"Duplicados (ignorados):{self.stats['duplicados']:>6}")
+        if self.loader.upsert:
+            print(f"Atualizados (upsert):  {self.stats['atualizados']:>6}")
+        for plugin in plugins_registrados():
+            if self.stats['documentos'].get(plugin.nome):
+                print(f"{plugin.descricao + ':':<23}{self.stats['documentos'][plugin.nome]:>6}")
+        if self.stats['ignorados']:
+            print(f"Ignorados (sem plugin):{self.stats['ignorados']:>6}")
         print(f"Erros:                 {self.stats['erros']:>6}")
         print(f"Tempo total:           {self.stats['tempo_total']:>6.2f}s")
         
@@ -295,6 +832,21 @@ class ETLPipeline:
             tempo_medio = self.stats['tempo_total'] / self.stats['total_arquivos']
             print(f"Tempo médio/arquivo:   {tempo_medio:>6.2f}s")
         
+        estagios = self.stats.get('estagios', {})
+        if estagios.get('estagios'):
+            print(f"\nEstágio      workers    itens  ocupação")
+            for nome, estagio in estagios['estagios'].items():
+                print(f"  {nome:<10} {estagio['workers']:>7} {estagio['itens']:>8} {estagio['utilizacao'] * 100:>8.1f}%")
+            for nome, fila in estagios['filas'].items():
+                print(f"  Fila {nome:<8} média {fila['media']:>5.1f} / máx. {fila['max']} de {fila['capacidade']}")
+        
+        resumo = self.tempos.resumo()
+        if resumo:
+            print(f"\nTempo por etapa:         total      média     máximo")
+            for etapa, medicao in resumo.items():
+                print(f"  {etapa:<15} {medicao['total']:>10.2f}s {medicao['media'] * 1000:>8.1f}ms "
+                      f"{medicao['max'] * 1000:>8.1f}ms")
+        
         print(f"{'='*80}\n")
 
 
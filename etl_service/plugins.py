@@ -0,0 +1,215 @@
+"""
+Plugins de tipos de documento fiscal além da NF-e.
+
+O pipeline identifica o tipo de cada arquivo pelo elemento raiz, lido nos
+primeiros bytes (extractor.tag_raiz), sem tentar interpretar o XML como
+NF-e. Cada tipo é tratado por um plugin, com extração, transformação e
+carga próprias:
+
+- evento: eventos de NF-e (etl_service/eventos.py)
+- cte: CT-e (etl_service/cte.py)
+- nfse: sem plugin por padrão. Os arquivos de NFS-e são reconhecidos e
+  ignorados (não contam como erro) até que um plugin seja registrado
+
+Plugins externos são módulos que chamam registrar_plugin() ao serem
+importados, listados em ETL_PLUGINS (ex.: ETL_PLUGINS=minha_empresa.nfse_abrasf).
+"""
+import importlib
+import logging
+import threading
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .extractor import tag_raiz
+from .metricas import TemporizadorEtapas
+
+logger = logging.getLogger(__name__)
+
+
+class PluginDocumento:
+    """
+    Tipo de documento carregado pelo pipeline.
+
+    Subclasses definem nome, descricao e raizes e implementam extrair e
+    gravar. Os métodos são chamados por várias threads (estágio de parse)
+    e não devem guardar estado da execução.
+    """
+
+    # Identificação do tipo (ex.: 'cte'), usada nas estatísticas
+    nome = ''
+    # Nome exibido no resumo (ex.: 'CT-e')
+    descricao = ''
+    # Elementos raiz (sem prefixo) dos XMLs do tipo
+    raizes: Tuple[str, ...] = ()
+    # Se os arquivos do tipo são apenas reconhecidos e ignorados (sem carga)
+    ignorar = False
+
+    def extrair(self, conteudo, arquivo: str, tempos: TemporizadorEtapas) -> Any:
+        """
+        Extrai e transforma o conteúdo de um arquivo.
+
+        Args:
+            conteudo: XML em bytes
+            arquivo: Caminho do arquivo de origem
+            tempos: Temporizador das etapas parse/extracao/transformacao
+
+        Returns:
+            Dados prontos para gravar
+
+        Raises:
+            ValueError: Se o conteúdo não é um documento válido do tipo
+        """
+        raise NotImplementedError
+
+    def chave(self, dados: Any) -> Optional[str]:
+        """Chave de acesso do documento extraído (registros e logs)."""
+        raise NotImplementedError
+
+    def gravar(self, session: Session, dados: Any) -> int:
+        """
+        Grava um documento extraído, sem commit.
+
+        Args:
+            session: Sessão do datalake (transação do lote)
+            dados: Retorno de extrair
+
+        Returns:
+            Quantidade de registros novos (0 = já estava gravado)
+        """
+        raise NotImplementedError
+
+
+class DocumentoSemPlugin(PluginDocumento):
+    """Tipo reconhecido pelo elemento raiz, mas sem plugin de carga registrado."""
+
+    ignorar = True
+
+    def __init__(self, nome: str, descricao: str, raizes: Tuple[str, ...]):
+        self.nome = nome
+        self.descricao = descricao
+        self.raizes = raizes
+
+
+# Plugin por elemento raiz
+_plugins: Dict[str, PluginDocumento] = {}
+_modulos_carregados = set()
+_padrao_registrado = False
+_lock = threading.RLock()
+
+
+def registrar_plugin(plugin: PluginDocumento):
+    """
+    Registra um plugin para os elementos raiz que ele declara.
+
+    Substitui o plugin anterior das mesmas raízes (ex.: um plugin de NFS-e
+    no lugar de DocumentoSemPlugin).
+
+    Args:
+        plugin: Instância do plugin
+    """
+    if not plugin.raizes:
+        raise ValueError(f"Plugin {plugin.nome or type(plugin).__name__} não declara elementos raiz")
+
+    with _lock:
+        _registrar_padrao()
+        for raiz in plugin.raizes:
+            anterior = _plugins.get(raiz)
+            if anterior is not None and anterior is not plugin:
+                logger.info(f"Plugin {plugin.nome} substitui {anterior.nome} para <{raiz}>")
+            _plugins[raiz] = plugin
+
+
+def plugin_para(conteudo) -> Optional[PluginDocumento]:
+    """
+    Plugin do documento a partir dos primeiros bytes do XML.
+
+    Args:
+        conteudo: Início do XML em bytes (ou buffer)
+
+    Returns:
+        Plugin registrado para o elemento raiz, ou None (NF-e ou tipo desconhecido,
+        tratados pelo extrator de NF-e)
+    """
+    if not _padrao_registrado:
+        _registrar_padrao()
+    return _plugins.get(tag_raiz(conteudo))
+
+
+def plugins_registrados() -> List[PluginDocumento]:
+    """Plugins registrados, sem repetição."""
+    with _lock:
+        _registrar_padrao()
+        return list({id(plugin): plugin for plugin in _plugins.values()}.values())
+
+
+def carregar_plugins(modulos: Iterable[str]):
+    """
+    Importa os módulos de plugins externos (que chamam registrar_plugin).
+
+    Args:
+        modulos: Nomes de módulos importáveis (ETL_PLUGINS)
+    """
+    for modulo in modulos:
+        if modulo in _modulos_carregados:
+            continue
+        importlib.import_module(modulo)
+        _modulos_carregados.add(modulo)
+        logger.info(f"Plugin de documentos carregado: {modulo}")
+
+
+def texto_filho(elemento, caminho: str) -> Optional[str]:
+    """Texto do filho indicado (use '{*}' para qualquer namespace) ou None."""
+    if elemento is None:
+        return None
+    valor = elemento.findtext(caminho)
+    return valor.strip() if valor and valor.strip() else None
+
+
+def data_hora_xml(valor: Optional[str]) -> Optional[datetime]:
+    """Converte data/hora do XML (com fuso) para datetime sem fuso, como no extrator da NF-e."""
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(valor).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def decimal_xml(valor: Optional[str]) -> Optional[Decimal]:
+    """Converte um valor numérico do XML para Decimal (None se vazio ou inválido)."""
+    if not valor:
+        return None
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        return None
+
+
+def _registrar_padrao():
+    """
+    Registra, uma única vez, os plugins que acompanham o ETL.
+
+    Feito no primeiro uso (e não na importação) porque os módulos dos plugins
+    importam este módulo, e antes de qualquer plugin externo, para que este
+    possa substituir os padrões.
+    """
+    global _padrao_registrado
+
+    with _lock:
+        if _padrao_registrado:
+            return
+        _padrao_registrado = True
+
+        from .cte import PluginCTe
+        from .eventos import PluginEventos
+
+        registrar_plugin(PluginEventos())
+        registrar_plugin(PluginCTe())
+        # NFS-e: layouts ABRASF e nacional, sem plugin de carga por padrão
+        registrar_plugin(DocumentoSemPlugin('nfse', 'NFS-e', (
+            'CompNfse', 'ListaNfse', 'ConsultarNfseResposta', 'ConsultarNfseServicoPrestadoResposta',
+            'ConsultarLoteRpsResposta', 'NFSe',
+        )))
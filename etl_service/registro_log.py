@@ -0,0 +1,174 @@
+"""
+Gravação em lote dos logs de processamento do ETL.
+
+Em vez de inserir um LogProcessamento por arquivo dentro da transação da
+carga, os registros são enfileirados e uma thread os grava em
+etl_log_processamento com um INSERT em lote a cada N registros ou T segundos
+(o que ocorrer primeiro). O detalhe por arquivo continua consultável na
+tabela; o console mostra apenas uma linha de progresso (ProgressoETL).
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from .models import LogProcessamento
+
+logger = logging.getLogger(__name__)
+
+
+class BufferLogProcessamento:
+    """
+    Buffer assíncrono de registros de etl_log_processamento.
+
+    adicionar() apenas enfileira; a thread do buffer grava os registros
+    acumulados quando atingem tamanho_lote ou quando intervalo segundos se
+    passam desde a última gravação.
+    """
+
+    def __init__(self, session_factory=None, tamanho_lote: int = 500, intervalo: float = 2.0):
+        """
+        Inicializa e inicia a thread de gravação.
+
+        Args:
+            session_factory: Fábrica de sessões do datalake (padrão: SessionLocal)
+            tamanho_lote: Quantidade de registros que dispara uma gravação
+            intervalo: Tempo máximo em segundos entre gravações
+        """
+        if session_factory is None:
+            from .database import SessionLocal
+            session_factory = SessionLocal
+
+        self.session_factory = session_factory
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.stats = {'gravados': 0, 'gravacoes': 0, 'erros': 0}
+
+        self._fila: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, name='buffer-log-etl', daemon=True)
+        self._thread.start()
+
+    def adicionar(self, registro: Dict[str, Any]):
+        """
+        Enfileira um registro de log, sem acessar o banco.
+
+        Args:
+            registro: Valores das colunas de LogProcessamento
+        """
+        self._fila.put(registro)
+
+    def finalizar(self, timeout: Optional[float] = None):
+        """
+        Grava os registros pendentes e encerra a thread.
+
+        Args:
+            timeout: Tempo máximo de espera em segundos (None = sem limite)
+        """
+        self._fila.put(None)
+        self._thread.join(timeout)
+
+    def _executar(self):
+        """Loop da thread: acumula registros e grava por tamanho ou por tempo."""
+        pendentes: List[Dict[str, Any]] = []
+        limite = time.monotonic() + self.intervalo
+
+        while True:
+            try:
+                registro = self._fila.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                registro = False
+
+            if registro is None:
+                self._gravar(pendentes)
+                return
+
+            if registro:
+                pendentes.append(registro)
+
+            if len(pendentes) >= self.tamanho_lote or time.monotonic() >= limite:
+                self._gravar(pendentes)
+                pendentes = []
+                limite = time.monotonic() + self.intervalo
+
+    def _gravar(self, registros: List[Dict[str, Any]]):
+        """Insere os registros com um único INSERT em lote."""
+        if not registros:
+            return
+
+        session = self.session_factory()
+        try:
+            session.execute(insert(LogProcessamento), registros)
+            session.commit()
+            self.stats['gravados'] += len(registros)
+            self.stats['gravacoes'] += 1
+        except Exception as e:
+            session.rollback()
+            self.stats['erros'] += len(registros)
+            logger.error(f"Erro ao gravar {len(registros)} logs de processamento: {str(e)}")
+        finally:
+            session.close()
+
+
+class ProgressoETL:
+    """
+    Linha de progresso do processamento, com taxa e tempo restante.
+
+    Substitui as mensagens por arquivo no console: imprime no máximo uma
+    linha a cada intervalo segundos (e sempre ao final).
+    """
+
+    def __init__(self, total: int, intervalo: float = 2.0, inicial: int = 0):
+        """
+        Inicializa o progresso.
+
+        Args:
+            total: Quantidade total de itens (0 se desconhecida)
+            intervalo: Tempo mínimo em segundos entre duas linhas
+            inicial: Itens já concluídos antes do início (execução retomada),
+                fora do cálculo da taxa
+        """
+        self.total = total
+        self.intervalo = intervalo
+        self.inicial = inicial
+        self.inicio = time.monotonic()
+        self._ultima_exibicao = self.inicio
+
+    def atualizar(self, concluidos: int, stats: Dict[str, Any], forcar: bool = False):
+        """
+        Exibe a linha de progresso se o intervalo já passou.
+
+        Args:
+            concluidos: Itens concluídos até agora
+            stats: Estatísticas do pipeline (processados, duplicados, erros)
+            forcar: Exibir mesmo antes do intervalo
+        """
+        agora = time.monotonic()
+        if not forcar and agora - self._ultima_exibicao < self.intervalo:
+            return
+
+        self._ultima_exibicao = agora
+        print(self.formatar(concluidos, stats, agora - self.inicio))
+
+    def formatar(self, concluidos: int, stats: Dict[str, Any], decorrido: float) -> str:
+        """Monta a linha de progresso."""
+        taxa = (concluidos - self.inicial) / decorrido if decorrido > 0 else 0.0
+
+        if self.total:
+            restante = (self.total - concluidos) / taxa if taxa > 0 else 0.0
+            inicio = f"[{concluidos}/{self.total}] {concluidos * 100 // self.total}%"
+            eta = f" - Restante: {restante / 60:.1f} min"
+        else:
+            inicio = f"[{concluidos}]"
+            eta = ""
+
+        linha = (
+            f"{inicio} - {taxa:.1f} arq/s{eta} - "
+            f"✓ {stats.get('processados', 0)} ⚠ {stats.get('duplicados', 0)} ✗ {stats.get('erros', 0)}"
+        )
+        # Itens aguardando nas filas entre estágios (pipeline em estágios)
+        if stats.get('filas'):
+            linha += " - filas: " + " ".join(f"{nome} {tamanho}" for nome, tamanho in stats['filas'].items())
+        return linha
@@ -0,0 +1,313 @@
+"""
+Reprocessamento em lote do XML armazenado das NF-e.
+
+Usado para preencher colunas novas do datalake (ex.: campos da Fase 1) a partir
+de nfe.xml_completo, sem reler os arquivos originais:
+- Paginação por chave (id > último id), com custo constante por lote
+- XML interpretado em memória (XMLExtractor.extrair_nfe_bytes)
+- Interpretação dos XMLs em paralelo, em um pool de processos
+- Itens indexados por (nfe_id, numero_item)
+- Um UPDATE em lote por tabela a cada lote
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+
+from .database import SessionLocal
+from .extractor import XMLExtractor
+from .models import NFe, NFeItem
+from .transformer import DataTransformer
+
+
+# Instâncias por processo (criadas sob demanda nos processos do pool)
+_extractor: Optional[XMLExtractor] = None
+_transformer: Optional[DataTransformer] = None
+
+
+def _extrair_registro(registro: Tuple[int, str, Callable]) -> Tuple[int, Dict, Dict, Optional[str]]:
+    """
+    Interpreta o XML de uma NF-e e extrai os campos a preencher.
+
+    Executado nos processos do pool; recebe e devolve apenas dados simples
+    para reduzir o custo de comunicação entre processos.
+
+    Args:
+        registro: Tupla (id da NF-e, XML completo, função de extração de campos)
+
+    Returns:
+        Tupla (id, campos da NF-e, campos por numero_item, mensagem de erro)
+    """
+    global _extractor
+    if _extractor is None:
+        _extractor = XMLExtractor()
+
+    nfe_id, xml, extrair_campos = registro
+    try:
+        dados = _extractor.extrair_nfe_bytes(xml, arquivo_original=f"nfe#{nfe_id}")
+        campos_nfe, campos_itens = extrair_campos(dados)
+        return nfe_id, campos_nfe, campos_itens, None
+    except Exception as e:
+        return nfe_id, {}, {}, str(e)
+
+
+class ReprocessadorNFe:
+    """
+    Preenche colunas de NFe/NFeItem reprocessando o XML armazenado no banco.
+
+    Por padrão só preenche valores vazios, como nos scripts de migração:
+    valores já gravados nunca são sobrescritos.
+    """
+
+    def __init__(
+        self,
+        colunas_nfe: List[str],
+        colunas_item: List[str],
+        extrair_campos: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], Dict[int, Dict[str, Any]]]],
+        session_factory=None,
+        tamanho_lote: int = 500,
+        processos: Optional[int] = None
+    ):
+        """
+        Inicializa o reprocessador.
+
+        Args:
+            colunas_nfe: Colunas de NFe que podem ser preenchidas
+            colunas_item: Colunas de NFeItem que podem ser preenchidas
+            extrair_campos: Função (definida em nível de módulo, para poder ser
+                enviada aos processos) que recebe os dados do XMLExtractor e
+                retorna (campos da NF-e, {numero_item: campos do item})
+            session_factory: Fábrica de sessões do datalake (padrão: SessionLocal)
+            tamanho_lote: Quantidade de NF-e por lote
+            processos: Processos do pool (None = número de CPUs, 1 = sem pool)
+        """
+        self.colunas_nfe = colunas_nfe
+        self.colunas_item = colunas_item
+        self.extrair_campos = extrair_campos
+        self.session_factory = session_factory or SessionLocal
+        self.tamanho_lote = tamanho_lote
+        self.processos = processos or os.cpu_count() or 1
+
+        self.stats = {
+            'processadas': 0,
+            'atualizadas': 0,
+            'itens_atualizados': 0,
+            'erros': 0,
+        }
+        self.erros: List[Tuple[int, str]] = []
+
+    def contar(self) -> int:
+        """Conta as NF-e com XML armazenado."""
+        session = self.session_factory()
+        try:
+            return session.query(NFe.id).filter(NFe.xml_completo.isnot(None)).count()
+        finally:
+            session.close()
+
+    def executar(self, progresso: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """
+        Reprocessa todas as NF-e com XML armazenado.
+
+        Enquanto um lote é interpretado pelo pool, o próximo é lido do banco
+        e o anterior é gravado.
+
+        Args:
+            progresso: Função chamada com as estatísticas ao final de cada lote
+
+        Returns:
+            Dicionário com estatísticas do reprocessamento
+        """
+        session = self.session_factory()
+        executor = ProcessPoolExecutor(max_workers=self.processos) if self.processos > 1 else None
+
+        try:
+            ultimo_id = 0
+            pendente = None  # (registros do lote, resultados em andamento)
+
+            while True:
+                registros = self._buscar_lote(session, ultimo_id)
+                if registros:
+                    ultimo_id = registros[-1][0]
+                    lote = [(nfe_id, xml, self.extrair_campos) for nfe_id, xml, _ in registros]
+                    if executor:
+                        chunksize = max(1, len(lote) // (self.processos * 4))
+                        resultados = executor.map(_extrair_registro, lote, chunksize=chunksize)
+                    else:
+                        resultados = map(_extrair_registro, lote)
+
+                if pendente:
+                    self._gravar_lote(session, *pendente)
+                    if progresso:
+                        progresso(self.stats)
+
+                if not registros:
+                    break
+                pendente = (registros, resultados)
+
+            return self.stats
+
+        finally:
+            if executor:
+                executor.shutdown()
+            session.close()
+
+    def _buscar_lote(self, session, ultimo_id: int) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Busca o próximo lote por chave (id > ultimo_id), com os valores atuais das colunas."""
+        colunas = [getattr(NFe, coluna) for coluna in self.colunas_nfe]
+
+        linhas = session.query(NFe.id, NFe.xml_completo, *colunas).filter(
+            NFe.id > ultimo_id,
+            NFe.xml_completo.isnot(None)
+        ).order_by(NFe.id).limit(self.tamanho_lote).all()
+
+        return [
+            (linha[0], linha[1], dict(zip(self.colunas_nfe, linha[2:])))
+            for linha in linhas
+        ]
+
+    def _buscar_itens(self, session, ids: List[int]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """Indexa os itens das NF-e do lote por (nfe_id, numero_item)."""
+        colunas = [getattr(NFeItem, coluna) for coluna in self.colunas_item]
+
+        linhas = session.query(NFeItem.id, NFeItem.nfe_id, NFeItem.numero_item, *colunas).filter(
+            NFeItem.nfe_id.in_(ids)
+        ).all()
+
+        return {
+            (linha[1], linha[2]): {'id': linha[0], **dict(zip(self.colunas_item, linha[3:]))}
+            for linha in linhas
+        }
+
+    def _gravar_lote(self, session, registros, resultados):
+        """Aplica os campos extraídos de um lote com um UPDATE em lote por tabela."""
+        atuais = {nfe_id: valores for nfe_id, _, valores in registros}
+        itens = self._buscar_itens(session, list(atuais)) if self.colunas_item else {}
+
+        atualizacoes_nfe = []
+        atualizacoes_itens = []
+
+        for nfe_id, campos_nfe, campos_itens, erro in resultados:
+            self.stats['processadas'] += 1
+
+            if erro:
+                self.stats['erros'] += 1
+                self.erros.append((nfe_id, erro))
+                continue
+
+            novos = _somente_vazios(campos_nfe, atuais[nfe_id])
+            if novos:
+                atualizacoes_nfe.append({'id': nfe_id, **novos})
+
+            itens_alterados = 0
+            for numero_item, campos_item in campos_itens.items():
+                item = itens.get((nfe_id, numero_item))
+                if item is None:
+                    continue
+                novos_item = _somente_vazios(campos_item, item)
+                if novos_item:
+                    atualizacoes_itens.append({'id': item['id'], **novos_item})
+                    itens_alterados += 1
+
+            if novos or itens_alterados:
+                self.stats['atualizadas'] += 1
+                self.stats['itens_atualizados'] += itens_alterados
+
+        if atualizacoes_nfe:
+            session.execute(update(NFe), atualizacoes_nfe)
+        if atualizacoes_itens:
+            session.execute(update(NFeItem), atualizacoes_itens)
+
+        # Commit a cada lote
+        session.commit()
+
+
+def _somente_vazios(campos: Dict[str, Any], atuais: Dict[str, Any]) -> Dict[str, Any]:
+    """Mantém apenas os campos com valor novo cuja coluna ainda está vazia."""
+    return {
+        coluna: valor
+        for coluna, valor in campos.items()
+        if valor is not None and atuais.get(coluna) is None
+    }
+
+
+# ============= CAMPOS DA FASE 1 =============
+
+COLUNAS_NFE_FASE1 = [
+    'codigo_municipio_fg_ibs', 'indicador_intermediador', 'natureza_operacao',
+    'indicador_final', 'indicador_presenca', 'processo_emissao', 'versao_processo',
+    'quantidade_bc_mono', 'valor_icms_mono',
+    'tipo_integracao_pagamento', 'cnpj_instituicao_pagamento',
+    'cnpj_intermediador', 'identificador_intermediador',
+]
+
+COLUNAS_ITEM_FASE1 = [
+    'codigo_beneficio_fiscal', 'codigo_beneficio_fiscal_ibs', 'indicador_escala_relevante',
+    'cnpj_fabricante', 'quantidade_bc_mono', 'valor_icms_mono',
+    'codigo_credito_presumido', 'percentual_credito_presumido', 'valor_credito_presumido',
+]
+
+
+def extrair_campos_fase1(dados: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[int, Dict[str, Any]]]:
+    """
+    Extrai os campos críticos da Fase 1 dos dados de uma NF-e.
+
+    Args:
+        dados: Dados retornados pelo XMLExtractor
+
+    Returns:
+        Tupla (campos da NF-e, {numero_item: campos do item})
+    """
+    global _transformer
+    if _transformer is None:
+        _transformer = DataTransformer()
+
+    identificacao = dados.get('identificacao', {})
+    totais = dados.get('totais', {})
+    pagamento = dados.get('pagamento', {})
+    intermediador = dados.get('intermediador', {})
+    detalhes_pag = pagamento.get('detalhes', [{}])[0] if pagamento.get('detalhes') else {}
+
+    campos_nfe = {
+        'codigo_municipio_fg_ibs': identificacao.get('codigo_municipio_fg_ibs'),
+        'indicador_intermediador': identificacao.get('indicador_intermediador'),
+        'natureza_operacao': identificacao.get('natureza_operacao'),
+        'indicador_final': identificacao.get('consumidor_final'),
+        'indicador_presenca': identificacao.get('presenca_comprador'),
+        'processo_emissao': identificacao.get('processo_emissao'),
+        'versao_processo': identificacao.get('versao_processo'),
+        # ICMS Monofásico
+        'quantidade_bc_mono': _transformer._to_decimal(totais.get('quantidade_bc_mono')),
+        'valor_icms_mono': _transformer._to_decimal(totais.get('valor_icms_mono')),
+        # Pagamento
+        'tipo_integracao_pagamento': detalhes_pag.get('tipo_integracao'),
+        'cnpj_instituicao_pagamento': detalhes_pag.get('cnpj_credenciadora'),
+        # Intermediador
+        'cnpj_intermediador': intermediador.get('cnpj'),
+        'identificador_intermediador': intermediador.get('id_cadastro'),
+    }
+
+    campos_itens = {}
+    for item_data in dados.get('itens', []):
+        numero_item = item_data.get('numero_item')
+        if not numero_item:
+            continue
+
+        produto = item_data.get('produto', {})
+        icms = item_data.get('impostos', {}).get('icms', {})
+        creditos = produto.get('creditos_presumidos', [])
+        primeiro_credito = creditos[0] if creditos else {}
+
+        campos_itens[int(numero_item)] = {
+            'codigo_beneficio_fiscal': produto.get('codigo_beneficio_fiscal'),
+            'codigo_beneficio_fiscal_ibs': produto.get('codigo_beneficio_fiscal_ibs'),
+            'indicador_escala_relevante': produto.get('indicador_escala_relevante'),
+            'cnpj_fabricante': produto.get('cnpj_fabricante'),
+            'quantidade_bc_mono': _transformer._to_decimal(icms.get('quantidade_bc_mono')),
+            'valor_icms_mono': _transformer._to_decimal(icms.get('valor_icms_mono')),
+            'codigo_credito_presumido': primeiro_credito.get('codigo'),
+            'percentual_credito_presumido': _transformer._to_decimal(primeiro_credito.get('percentual')),
+            'valor_credito_presumido': _transformer._to_decimal(primeiro_credito.get('valor')),
+        }
+
+    return campos_nfe, campos_itens
@@ -0,0 +1,175 @@
+"""
+Roteamento das consultas de leitura entre a réplica e o primário do datalake.
+
+Dashboards e análises leem pelo engine 'datalake_leitura', que pode apontar
+para uma réplica ou banco analítico (ETL_READ_DATABASE_URL). Como a réplica
+pode estar atrasada em relação ao ETL, quem consulta pode exigir um watermark
+mínimo (data_processamento_etl/data_atualizacao_etl): se a réplica ainda não
+o alcançou, a consulta vai para o primário.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .engines import obter_engine
+from .models import NFe
+
+logger = logging.getLogger(__name__)
+
+
+class RoteadorLeitura:
+    """
+    Escolhe o banco de cada leitura conforme o atraso da réplica.
+
+    Sem réplica configurada (mesma URL do primário), todas as leituras usam o
+    pool de leitura. O watermark da réplica é lido no máximo uma vez a cada
+    cache_segundos.
+    """
+
+    def __init__(
+        self,
+        engine_replica: Optional[Engine] = None,
+        engine_primario: Optional[Engine] = None,
+        cache_segundos: Optional[float] = None
+    ):
+        """
+        Inicializa o roteador.
+
+        Args:
+            engine_replica: Engine de leitura (padrão: 'datalake_leitura')
+            engine_primario: Engine do primário (padrão: 'datalake')
+            cache_segundos: Validade do watermark lido da réplica
+                (padrão: ETL_READ_CACHE_WATERMARK ou 5 segundos)
+        """
+        self.engine_replica = engine_replica or obter_engine('datalake_leitura')
+        self.engine_primario = engine_primario or obter_engine('datalake')
+        self.cache_segundos = cache_segundos if cache_segundos is not None \
+            else float(os.getenv('ETL_READ_CACHE_WATERMARK', 5))
+
+        self.stats = {'replica': 0, 'primario': 0, 'atrasos': 0}
+
+        self._fabricas = {
+            engine: sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            for engine in (self.engine_replica, self.engine_primario)
+        }
+        self._watermark: Optional[datetime] = None
+        self._lido_em: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def possui_replica(self) -> bool:
+        """Se a leitura aponta para um banco diferente do primário."""
+        return self.engine_replica.url != self.engine_primario.url
+
+    def watermark_replica(self) -> Optional[datetime]:
+        """
+        Retorna a carga ou alteração mais recente visível na réplica.
+
+        Mesmo critério de ApuradorDatalake.obter_watermark.
+        """
+        with self._lock:
+            if self._lido_em is not None and time.monotonic() - self._lido_em < self.cache_segundos:
+                return self._watermark
+
+            session = self._fabricas[self.engine_replica]()
+            try:
+                processamento, atualizacao = session.query(
+                    func.max(NFe.data_processamento_etl),
+                    func.max(NFe.data_atualizacao_etl)
+                ).one()
+            finally:
+                session.close()
+
+            datas = [d for d in (processamento, atualizacao) if d is not None]
+            self._watermark = max(datas) if datas else None
+            self._lido_em = time.monotonic()
+            return self._watermark
+
+    def escolher_engine(self, watermark_minimo: Optional[datetime] = None) -> Engine:
+        """
+        Escolhe o engine de uma leitura.
+
+        Args:
+            watermark_minimo: Dados que a leitura precisa enxergar (None = qualquer)
+
+        Returns:
+            Engine da réplica, ou do primário se a réplica estiver atrasada
+            ou inacessível
+        """
+        if not self.possui_replica or watermark_minimo is None:
+            self.stats['replica'] += 1
+            return self.engine_replica
+
+        try:
+            watermark = self.watermark_replica()
+        except Exception as e:
+            logger.warning(f"Réplica inacessível, lendo do primário: {str(e)}")
+            self.stats['primario'] += 1
+            return self.engine_primario
+
+        if watermark is None or watermark < watermark_minimo:
+            logger.info(f"Réplica atrasada ({watermark} < {watermark_minimo}), lendo do primário")
+            self.stats['atrasos'] += 1
+            self.stats['primario'] += 1
+            return self.engine_primario
+
+        self.stats['replica'] += 1
+        return self.engine_replica
+
+    def fabrica(self, watermark_minimo: Optional[datetime] = None) -> sessionmaker:
+        """
+        Retorna uma fábrica de sessões presa ao banco escolhido agora.
+
+        Todas as sessões da fábrica leem do mesmo banco, o que mantém
+        consistentes as várias consultas de uma mesma apuração.
+
+        Args:
+            watermark_minimo: Dados que as leituras precisam enxergar
+
+        Returns:
+            sessionmaker do banco escolhido
+        """
+        return self._fabricas[self.escolher_engine(watermark_minimo)]
+
+    def sessao(self, watermark_minimo: Optional[datetime] = None) -> Session:
+        """
+        Abre uma sessão de leitura.
+
+        Args:
+            watermark_minimo: Dados que a leitura precisa enxergar
+
+        Returns:
+            Sessão na réplica ou no primário
+        """
+        return self.fabrica(watermark_minimo)()
+
+
+_roteador: Optional[RoteadorLeitura] = None
+_lock_roteador = threading.Lock()
+
+
+def obter_roteador() -> RoteadorLeitura:
+    """Retorna o roteador de leitura do processo."""
+    global _roteador
+
+    with _lock_roteador:
+        if _roteador is None:
+            _roteador = RoteadorLeitura()
+        return _roteador
+
+
+def fabrica_leitura(watermark_minimo: Optional[datetime] = None) -> sessionmaker:
+    """Atalho para obter_roteador().fabrica(watermark_minimo)."""
+    return obter_roteador().fabrica(watermark_minimo)
+
+
+def sessao_leitura(watermark_minimo: Optional[datetime] = None) -> Session:
+    """Atalho para obter_roteador().sessao(watermark_minimo)."""
+    return obter_roteador().sessao(watermark_minimo)
@@ -12,6 +12,35 @@ import json
 from .models import NFe, NFeItem, NFeDuplicata
 
 
+def determinar_situacao(codigo_status: Optional[str]) -> Optional[str]:
+    """
+    Determina a situação do documento pelo código de status (cStat) do protocolo.
+    
+    Usada pela NF-e e pelo CT-e, que seguem as mesmas regras.
+    
+    Args:
+        codigo_status: cStat do protocolo de autorização
+        
+    Returns:
+        Autorizada, Cancelada, Denegada, Inutilizada ou Rejeitada (None sem protocolo)
+    """
+    if not codigo_status:
+        return None
+    
+    codigo = codigo_status.strip()
+    
+    if codigo == '100':
+        return 'Autorizada'
+    elif codigo in ['101', '151', '155']:
+        return 'Cancelada'
+    elif codigo in ['110', '205', '301', '302', '303']:
+        return 'Denegada'
+    elif codigo in ['217', '218']:
+        return 'Inutilizada'
+    else:
+        return 'Rejeitada'
+
+
 class DataTransformer:
     """
     Transformador de dados extraídos para modelos do banco de dados.
@@ -65,7 +94,7 @@ class DataTransformer:
             codigo_status=protocolo.get('codigo_status'),
             motivo_status=protocolo.get('motivo'),
             protocolo_autorizacao=protocolo.get('numero_protocolo'),
-            situacao=self._determinar_situacao(protocolo.get('codigo_status')),
+            situacao=determinar_situacao(protocolo.get('codigo_status')),
             
             # Emitente
             emitente_cnpj=emitente.get('cnpj'),
@@ -374,24 +403,6 @@ class DataTransformer:
             valor_duplicata=self._to_decimal(dup_data.get('valor')),
         )
 
-    def _determinar_situacao(self, codigo_status: Optional[str]) -> Optional[str]:
-        """Determina a situação da NF-e baseado no código de status."""
-        if not codigo_status:
-            return None
-        
-        codigo = codigo_status.strip()
-        
-        if codigo == '100':
-            return 'Autorizada'
-        elif codigo in ['101', '151', '155']:
-            return 'Cancelada'
-        elif codigo in ['110', '205', '301', '302', '303']:
-            return 'Denegada'
-        elif codigo in ['217', '218']:
-            return 'Inutilizada'
-        else:
-            return 'Rejeitada'
-
     def _to_decimal(self, value: Any) -> Optional[Decimal]:
         """Converte valor para Decimal."""
         if value is None or value == '':
@@ -0,0 +1,143 @@
+"""
+Atualização idempotente (upsert) de NF-e já existentes no datalake.
+
+Usada pelo modo de carga 'upsert' (run_etl.py --modo upsert), que reprocessa
+documentos já carregados em vez de rejeitá-los como duplicados, por exemplo
+para preencher colunas novas com o pipeline normal:
+- Cabeçalho: apenas as colunas com valor extraído diferente do gravado são
+  atualizadas, com um UPDATE em lote por conjunto de colunas. Valores não
+  extraídos (None) não apagam o que está no banco.
+- Itens e duplicatas: os filhos de cada NF-e são comparados com os gravados
+  e, se diferirem, substituídos com um DELETE ... WHERE nfe_id IN (...) e um
+  INSERT em lote.
+- data_atualizacao_etl só muda nas NF-e que realmente mudaram. A apuração
+  incremental não consegue trocar os valores de uma nota já apurada: ao
+  encontrar uma nota alterada, ela refaz a apuração completa do período
+  (ApuradorDatalake.apurar_incremental); reprocessar o mesmo XML não a força.
+- Uma NF-e cancelada por evento (nfe_evento) continua 'Cancelada': o
+  protocolo de autorização do XML da nota não reverte o cancelamento.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Set, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from .eventos import SITUACAO_CANCELADA
+from .models import NFe, NFeDuplicata, NFeItem
+
+# Colunas de NFe que o upsert nunca altera a partir do XML
+COLUNAS_CONTROLE_NFE = ('id', 'chave_acesso', 'data_processamento_etl', 'data_atualizacao_etl')
+
+# Filhos substituídos em bloco: (modelo, atributo de NFe)
+FILHOS = ((NFeItem, 'itens'), (NFeDuplicata, 'duplicatas'))
+
+
+def _comparavel(valor: Any) -> Any:
+    """Normaliza valores numéricos para comparar o extraído com o gravado."""
+    if isinstance(valor, float):
+        return Decimal(repr(valor))
+    return valor
+
+
+def _colunas(tabela, ignorar: Tuple[str, ...]) -> List[str]:
+    """Nomes das colunas da tabela, exceto as ignoradas."""
+    return [coluna.name for coluna in tabela.columns if coluna.name not in ignorar]
+
+
+def _filhos_alterados(session: Session, modelo, atributo: str,
+                      existentes: Dict[int, NFe]) -> Tuple[Set[int], Dict[int, List[Dict[str, Any]]]]:
+    """
+    Compara os filhos extraídos com os gravados, em uma consulta para o lote.
+
+    Returns:
+        Tupla (ids das NF-e cujos filhos mudaram, linhas novas por id da NF-e)
+    """
+    tabela = modelo.__table__
+    colunas = _colunas(tabela, ('id', 'nfe_id'))
+
+    novos = {
+        nfe_id: [{coluna: getattr(filho, coluna) for coluna in colunas} for filho in getattr(nfe, atributo)]
+        for nfe_id, nfe in existentes.items()
+    }
+
+    gravados: Dict[int, List[tuple]] = defaultdict(list)
+    consulta = select(tabela).where(tabela.c.nfe_id.in_(list(existentes))).order_by(tabela.c.nfe_id, tabela.c.id)
+    for linha in session.execute(consulta):
+        gravados[linha.nfe_id].append(tuple(_comparavel(linha._mapping[coluna]) for coluna in colunas))
+
+    alterados = {
+        nfe_id for nfe_id, linhas in novos.items()
+        if [tuple(_comparavel(linha[coluna]) for coluna in colunas) for linha in linhas] != gravados.get(nfe_id, [])
+    }
+    return alterados, novos
+
+
+def atualizar_nfes(session: Session, existentes: Dict[int, NFe]) -> Set[int]:
+    """
+    Atualiza NF-e já gravadas com os dados de uma nova extração.
+
+    Não faz commit: as alterações entram na transação da sessão.
+
+    Args:
+        session: Sessão do datalake
+        existentes: NFe transformadas (não anexadas à sessão) por id da NF-e gravada
+
+    Returns:
+        Ids das NF-e que tiveram cabeçalho ou filhos alterados
+    """
+    if not existentes:
+        return set()
+
+    tabela = NFe.__table__
+    colunas = _colunas(tabela, COLUNAS_CONTROLE_NFE)
+    gravadas = {
+        linha.id: linha._mapping
+        for linha in session.execute(select(tabela).where(tabela.c.id.in_(list(existentes))))
+    }
+
+    cabecalhos: Dict[int, Dict[str, Any]] = {}
+    for nfe_id, nfe in existentes.items():
+        alteradas = {}
+        for coluna in colunas:
+            if coluna == 'situacao' and gravadas[nfe_id]['situacao'] == SITUACAO_CANCELADA:
+                continue
+            valor = getattr(nfe, coluna)
+            if valor is not None and _comparavel(valor) != _comparavel(gravadas[nfe_id][coluna]):
+                alteradas[coluna] = valor
+        if alteradas:
+            cabecalhos[nfe_id] = alteradas
+
+    alterados = set(cabecalhos)
+
+    # Filhos: DELETE + INSERT em lote das NF-e com itens/duplicatas diferentes
+    for modelo, atributo in FILHOS:
+        substituir, novos = _filhos_alterados(session, modelo, atributo, existentes)
+        if not substituir:
+            continue
+
+        filhos = modelo.__table__
+        session.execute(delete(filhos).where(filhos.c.nfe_id.in_(sorted(substituir))))
+        linhas = [dict(linha, nfe_id=nfe_id) for nfe_id in sorted(substituir) for linha in novos[nfe_id]]
+        if linhas:
+            session.execute(insert(filhos), linhas)
+        alterados |= substituir
+
+    # Cabeçalhos: um UPDATE em lote por conjunto de colunas alteradas
+    agora = datetime.now()
+    grupos: Dict[Tuple[str, ...], List[Dict[str, Any]]] = defaultdict(list)
+    for nfe_id in sorted(alterados):
+        valores = cabecalhos.get(nfe_id, {})
+        grupos[tuple(sorted(valores))].append(
+            {'b_id': nfe_id, 'b_data_atualizacao_etl': agora, **{f'b_{c}': v for c, v in valores.items()}}
+        )
+
+    for chaves, parametros in grupos.items():
+        instrucao = update(tabela).where(tabela.c.id == bindparam('b_id')).values(
+            {coluna: bindparam(f'b_{coluna}') for coluna in chaves + ('data_atualizacao_etl',)}
+        )
+        session.execute(instrucao, parametros)
+
+    return alterados
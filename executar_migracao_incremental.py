@@ -0,0 +1,77 @@
+"""
+Script para executar a migração 004 - Apuração incremental.
+
+Adiciona a data de atualização das NF-e no datalake e as colunas de
+watermark/acumuladores na tabela de análises do fiscal-auditor.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from etl_service.database import engine as etl_engine
+from fiscal_auditor.database import engine as app_engine
+from sqlalchemy import text
+
+
+# Colunas novas da tabela analises (banco do fiscal-auditor)
+SQL_ANALISES = [
+    "ALTER TABLE analises ADD COLUMN IF NOT EXISTS watermark_etl TIMESTAMP",
+    "ALTER TABLE analises ADD COLUMN IF NOT EXISTS acumuladores TEXT",
+]
+
+
+def executar_migracao():
+    """Executa a migração nos bancos do datalake e do fiscal-auditor."""
+
+    print("\n" + "="*80)
+    print("EXECUTANDO MIGRAÇÃO 004: Apuração incremental")
+    print("="*80 + "\n")
+
+    sql_file = Path(__file__).parent / "etl_service" / "migrations" / "004_apuracao_incremental.sql"
+
+    if not sql_file.exists():
+        print(f"❌ Erro: Arquivo SQL não encontrado: {sql_file}")
+        return 1
+
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_content = f.read()
+
+    try:
+        print("Datalake (tabela nfe)...")
+        with etl_engine.connect() as conn:
+            statements = [s.strip() for s in sql_content.split(';') if s.strip()]
+
+            for i, statement in enumerate(statements, 1):
+                print(f"[{i}/{len(statements)}] Executando statement...")
+                conn.execute(text(statement))
+                conn.commit()
+
+        print("\nFiscal-auditor (tabela analises)...")
+        with app_engine.connect() as conn:
+            for i, statement in enumerate(SQL_ANALISES, 1):
+                print(f"[{i}/{len(SQL_ANALISES)}] Executando statement...")
+                conn.execute(text(statement))
+                conn.commit()
+
+        print("\n" + "="*80)
+        print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+        print("="*80 + "\n")
+
+        return 0
+
+    except Exception as e:
+        print("\n" + "="*80)
+        print("❌ ERRO AO EXECUTAR MIGRAÇÃO")
+        print("="*80)
+        print(f"\nErro: {str(e)}\n")
+
+        import traceback
+        traceback.print_exc()
+
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(executar_migracao())
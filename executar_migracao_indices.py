@@ -0,0 +1,62 @@
+"""
+Script para executar a migração 005 - Índices compostos e de cobertura.
+
+Cria os índices (emitente_cnpj, data_emissao) e (destinatario_cnpj, data_emissao)
+em nfe e os índices de cobertura de nfe_item para as agregações por NCM/CFOP.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from etl_service.database import engine
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """Executa a migração no banco do datalake."""
+
+    print("\n" + "="*80)
+    print("EXECUTANDO MIGRAÇÃO 005: Índices compostos e de cobertura")
+    print("="*80 + "\n")
+
+    sql_file = Path(__file__).parent / "etl_service" / "migrations" / "005_indices_compostos.sql"
+
+    if not sql_file.exists():
+        print(f"❌ Erro: Arquivo SQL não encontrado: {sql_file}")
+        return 1
+
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        sql_content = f.read()
+
+    # Remover comentários antes de separar os statements
+    linhas = [linha for linha in sql_content.splitlines() if not linha.strip().startswith('--')]
+    statements = [s.strip() for s in "\n".join(linhas).split(';') if s.strip()]
+
+    try:
+        with engine.connect() as conn:
+            for i, statement in enumerate(statements, 1):
+                print(f"[{i}/{len(statements)}] {statement.splitlines()[0][:70]}")
+                conn.execute(text(statement))
+                conn.commit()
+
+        print("\n" + "="*80)
+        print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+        print("="*80 + "\n")
+
+        return 0
+
+    except Exception as e:
+        print("\n" + "="*80)
+        print("❌ ERRO AO EXECUTAR MIGRAÇÃO")
+        print("="*80)
+        print(f"\nErro: {str(e)}\n")
+
+        import traceback
+        traceback.print_exc()
+
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(executar_migracao())
@@ -0,0 +1,395 @@
+"""
+Perfil de requisições da aplicação web (opt-in).
+
+Com PERFIL_REQUISICOES=true, cada requisição registra:
+- quantidade e tempo das instruções SQL (eventos do SQLAlchemy em todos os engines);
+- tempo de CPU do processo durante a requisição;
+- tempo de serialização (do retorno do endpoint até o início da resposta).
+
+O resumo fica em memória, agregado por rota, e é devolvido no cabeçalho
+Server-Timing de cada resposta. Instruções idênticas executadas muitas vezes
+na mesma requisição (N+1, COUNTs repetidos) ficam destacadas por rota.
+
+Uma amostra das requisições (PERFIL_AMOSTRAGEM) ou as que enviarem o
+cabeçalho X-Perfil: 1 também são perfiladas com pyinstrument (se instalado)
+ou cProfile, e o resultado é gravado em PERFIL_DIRETORIO.
+"""
+import cProfile
+import functools
+import inspect
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from pyinstrument import Profiler as _Pyinstrument
+except ImportError:  # pragma: no cover - dependência opcional
+    _Pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+CABECALHO_PERFIL = 'x-perfil'
+
+# Execuções da mesma instrução, na mesma requisição, a partir das quais ela é destacada
+LIMITE_REPETICOES = 5
+
+# Requisições mais lentas mantidas em memória
+MAXIMO_LENTAS = 50
+
+
+def perfil_habilitado() -> bool:
+    """Se o perfil de requisições está habilitado (PERFIL_REQUISICOES)."""
+    return os.getenv('PERFIL_REQUISICOES', 'false').lower() == 'true'
+
+
+class PerfilRequisicao:
+    """Medições de uma requisição em andamento."""
+
+    def __init__(self, metodo: str, caminho: str):
+        """
+        Inicia as medições.
+
+        Args:
+            metodo: Método HTTP
+            caminho: Caminho requisitado
+        """
+        self.metodo = metodo
+        self.caminho = caminho
+        self.rota = caminho
+        self.status: Optional[int] = None
+        self.inicio = time.perf_counter()
+        self.inicio_cpu = time.process_time()
+        self.sql_consultas = 0
+        self.sql_segundos = 0.0
+        self.instrucoes: Counter = Counter()
+        self.fim_endpoint: Optional[float] = None
+        self.serializacao_segundos = 0.0
+        self.total_segundos = 0.0
+        self.cpu_segundos = 0.0
+        self.arquivo_perfil: Optional[str] = None
+
+    def registrar_sql(self, instrucao: str, segundos: float):
+        """Contabiliza uma instrução SQL executada durante a requisição."""
+        self.sql_consultas += 1
+        self.sql_segundos += segundos
+        self.instrucoes[instrucao] += 1
+
+    def marcar_resposta(self, status: int):
+        """Registra o início da resposta e calcula o tempo de serialização."""
+        self.status = status
+        if self.fim_endpoint is not None:
+            self.serializacao_segundos = time.perf_counter() - self.fim_endpoint
+
+    def finalizar(self):
+        """Fecha as medições de tempo total e de CPU."""
+        self.total_segundos = time.perf_counter() - self.inicio
+        self.cpu_segundos = time.process_time() - self.inicio_cpu
+
+    def repetidas(self) -> Dict[str, int]:
+        """Instruções executadas ao menos LIMITE_REPETICOES vezes."""
+        return {sql: n for sql, n in self.instrucoes.items() if n >= LIMITE_REPETICOES}
+
+    def server_timing(self) -> str:
+        """Valor do cabeçalho Server-Timing (durações em milissegundos)."""
+        decorrido = time.perf_counter() - self.inicio
+        return (
+            f'sql;dur={self.sql_segundos * 1000:.1f};desc="{self.sql_consultas} consultas", '
+            f'cpu;dur={(time.process_time() - self.inicio_cpu) * 1000:.1f}, '
+            f'serializacao;dur={self.serializacao_segundos * 1000:.1f}, '
+            f'total;dur={decorrido * 1000:.1f}'
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Resumo da requisição."""
+        return {
+            'metodo': self.metodo,
+            'rota': self.rota,
+            'caminho': self.caminho,
+            'status': self.status,
+            'total_ms': round(self.total_segundos * 1000, 1),
+            'cpu_ms': round(self.cpu_segundos * 1000, 1),
+            'sql_consultas': self.sql_consultas,
+            'sql_ms': round(self.sql_segundos * 1000, 1),
+            'serializacao_ms': round(self.serializacao_segundos * 1000, 1),
+            'consultas_repetidas': self.repetidas(),
+            'arquivo_perfil': self.arquivo_perfil,
+        }
+
+
+_perfil_atual: ContextVar[Optional[PerfilRequisicao]] = ContextVar('perfil_requisicao', default=None)
+
+
+def _antes_execucao(conn, cursor, statement, parameters, context, executemany):
+    """Marca o início de uma instrução executada dentro de uma requisição perfilada."""
+    if _perfil_atual.get() is not None:
+        conn.info.setdefault('perfil_inicio', []).append(time.perf_counter())
+
+
+def _depois_execucao(conn, cursor, statement, parameters, context, executemany):
+    """Contabiliza a instrução na requisição atual."""
+    perfil = _perfil_atual.get()
+    inicios = conn.info.get('perfil_inicio')
+    if perfil is not None and inicios:
+        perfil.registrar_sql(statement, time.perf_counter() - inicios.pop())
+
+
+def instrumentar_sql():
+    """Registra os eventos de SQL em todos os engines (uma única vez)."""
+    if not event.contains(Engine, 'before_cursor_execute', _antes_execucao):
+        event.listen(Engine, 'before_cursor_execute', _antes_execucao)
+        event.listen(Engine, 'after_cursor_execute', _depois_execucao)
+
+
+def _marcar_fim_endpoint(endpoint: Callable) -> Callable:
+    """Envolve o endpoint para registrar quando ele retorna (início da serialização)."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def envolvido(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                perfil = _perfil_atual.get()
+                if perfil is not None:
+                    perfil.fim_endpoint = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def envolvido(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                perfil = _perfil_atual.get()
+                if perfil is not None:
+                    perfil.fim_endpoint = time.perf_counter()
+    return envolvido
+
+
+class RotaPerfilada(APIRoute):
+    """
+    Rota que marca o fim da execução do endpoint.
+
+    O que acontece entre esse ponto e o início da resposta (validação do
+    response_model, jsonable_encoder e render) é contado como serialização.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _marcar_fim_endpoint(endpoint), **kwargs)
+
+
+class MonitorPerfil:
+    """Agrega os perfis das requisições por rota e grava os perfis amostrados."""
+
+    def __init__(self, amostragem: Optional[float] = None, diretorio: Optional[str] = None,
+                 ferramenta: Optional[str] = None):
+        """
+        Configura o monitor.
+
+        Args:
+            amostragem: Fração das requisições perfiladas (padrão: PERFIL_AMOSTRAGEM ou 0)
+            diretorio: Destino dos perfis (padrão: PERFIL_DIRETORIO ou 'perfis')
+            ferramenta: 'pyinstrument' ou 'cprofile' (padrão: PERFIL_FERRAMENTA,
+                ou pyinstrument quando instalado)
+        """
+        self.amostragem = amostragem if amostragem is not None \
+            else float(os.getenv('PERFIL_AMOSTRAGEM', '0'))
+        self.diretorio = diretorio or os.getenv('PERFIL_DIRETORIO', 'perfis')
+        self.ferramenta = (ferramenta or os.getenv('PERFIL_FERRAMENTA')
+                           or ('pyinstrument' if _Pyinstrument else 'cprofile')).lower()
+        if self.ferramenta == 'pyinstrument' and _Pyinstrument is None:
+            logger.warning("pyinstrument não instalado; usando cProfile")
+            self.ferramenta = 'cprofile'
+
+        self._lock = threading.Lock()
+        # Só um cProfile pode estar ativo por vez no processo
+        self._lock_cprofile = threading.Lock()
+        self._rotas: Dict[str, Dict[str, Any]] = {}
+        self._lentas: List[Dict[str, Any]] = []
+
+    def deve_perfilar(self, cabecalhos: Dict[str, str]) -> bool:
+        """Se a requisição deve gerar um arquivo de perfil (cabeçalho ou amostragem)."""
+        if cabecalhos.get(CABECALHO_PERFIL, '').lower() in ('1', 'true'):
+            return True
+        return self.amostragem > 0 and random.random() < self.amostragem
+
+    def iniciar_profiler(self):
+        """Inicia o profiler configurado (None se não houver um disponível agora)."""
+        if self.ferramenta == 'pyinstrument':
+            profiler = _Pyinstrument(async_mode='enabled')
+            profiler.start()
+            return profiler
+
+        if not self._lock_cprofile.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Outra ferramenta de profiling já está ativa
+            self._lock_cprofile.release()
+            return None
+        return profiler
+
+    def gravar_profiler(self, profiler, perfil: PerfilRequisicao):
+        """Para o profiler e grava o resultado em self.diretorio."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        nome_rota = re.sub(r'[^A-Za-z0-9_-]+', '_', perfil.rota).strip('_') or 'raiz'
+        base = os.path.join(
+            self.diretorio,
+            f"{datetime.now():%Y%m%d-%H%M%S-%f}-{perfil.metodo}-{nome_rota}"
+        )
+
+        if isinstance(profiler, cProfile.Profile):
+            try:
+                profiler.disable()
+                perfil.arquivo_perfil = f'{base}.prof'
+                profiler.dump_stats(perfil.arquivo_perfil)
+            finally:
+                self._lock_cprofile.release()
+        else:
+            profiler.stop()
+            perfil.arquivo_perfil = f'{base}.html'
+            with open(perfil.arquivo_perfil, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+
+    def registrar(self, perfil: PerfilRequisicao):
+        """Acumula a requisição finalizada nas estatísticas da sua rota."""
+        chave = f'{perfil.metodo} {perfil.rota}'
+        resumo = perfil.to_dict()
+
+        with self._lock:
+            rota = self._rotas.get(chave)
+            if rota is None:
+                rota = self._rotas[chave] = {
+                    'rota': chave, 'requisicoes': 0, 'erros': 0,
+                    'total_s': 0.0, 'max_s': 0.0, 'cpu_s': 0.0, 'sql_s': 0.0,
+                    'sql_consultas': 0, 'serializacao_s': 0.0,
+                    'consultas_repetidas': defaultdict(int),
+                }
+            rota['requisicoes'] += 1
+            rota['erros'] += 1 if (perfil.status or 500) >= 500 else 0
+            rota['total_s'] += perfil.total_segundos
+            rota['max_s'] = max(rota['max_s'], perfil.total_segundos)
+            rota['cpu_s'] += perfil.cpu_segundos
+            rota['sql_s'] += perfil.sql_segundos
+            rota['sql_consultas'] += perfil.sql_consultas
+            rota['serializacao_s'] += perfil.serializacao_segundos
+            for sql, vezes in resumo['consultas_repetidas'].items():
+                rota['consultas_repetidas'][sql] = max(rota['consultas_repetidas'][sql], vezes)
+
+            self._lentas.append(resumo)
+            self._lentas.sort(key=lambda r: r['total_ms'], reverse=True)
+            del self._lentas[MAXIMO_LENTAS:]
+
+    def resumo_rotas(self, limite: int = 20) -> Dict[str, Any]:
+        """
+        Retorna as rotas mais lentas (por tempo médio) e as requisições mais lentas.
+
+        Args:
+            limite: Quantidade de rotas e de requisições
+
+        Returns:
+            Dicionário com 'rotas' e 'requisicoes_lentas'
+        """
+        with self._lock:
+            rotas = []
+            for rota in self._rotas.values():
+                n = rota['requisicoes']
+                repetidas = sorted(rota['consultas_repetidas'].items(), key=lambda i: i[1], reverse=True)
+                rotas.append({
+                    'rota': rota['rota'],
+                    'requisicoes': n,
+                    'erros': rota['erros'],
+                    'media_ms': round(rota['total_s'] / n * 1000, 1),
+                    'max_ms': round(rota['max_s'] * 1000, 1),
+                    'cpu_media_ms': round(rota['cpu_s'] / n * 1000, 1),
+                    'sql_media_consultas': round(rota['sql_consultas'] / n, 1),
+                    'sql_media_ms': round(rota['sql_s'] / n * 1000, 1),
+                    'serializacao_media_ms': round(rota['serializacao_s'] / n * 1000, 1),
+                    'consultas_repetidas': [
+                        {'sql': sql[:500], 'max_por_requisicao': vezes} for sql, vezes in repetidas[:5]
+                    ],
+                })
+            lentas = list(self._lentas[:limite])
+
+        rotas.sort(key=lambda r: r['media_ms'], reverse=True)
+        return {'rotas': rotas[:limite], 'requisicoes_lentas': lentas}
+
+
+class MiddlewarePerfil:
+    """Middleware ASGI que mede cada requisição HTTP e perfila as selecionadas."""
+
+    def __init__(self, app, monitor: MonitorPerfil):
+        """
+        Args:
+            app: Aplicação ASGI
+            monitor: Monitor que agrega os perfis
+        """
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        perfil = PerfilRequisicao(scope['method'], scope['path'])
+        token = _perfil_atual.set(perfil)
+
+        cabecalhos = {nome.decode('latin-1').lower(): valor.decode('latin-1')
+                      for nome, valor in scope.get('headers', [])}
+        profiler = self.monitor.iniciar_profiler() if self.monitor.deve_perfilar(cabecalhos) else None
+
+        async def enviar(mensagem):
+            if mensagem['type'] == 'http.response.start':
+                perfil.marcar_resposta(mensagem['status'])
+                mensagem.setdefault('headers', [])
+                mensagem['headers'] = list(mensagem['headers']) + [
+                    (b'server-timing', perfil.server_timing().encode('latin-1'))
+                ]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            perfil.finalizar()
+            rota = scope.get('route')
+            if rota is not None and getattr(rota, 'path', None):
+                perfil.rota = rota.path
+            _perfil_atual.reset(token)
+
+            if profiler is not None:
+                try:
+                    self.monitor.gravar_profiler(profiler, perfil)
+                except Exception as e:
+                    logger.warning(f"Não foi possível gravar o perfil de {perfil.caminho}: {str(e)}")
+            self.monitor.registrar(perfil)
+
+
+def instalar_perfil(app, monitor: Optional[MonitorPerfil] = None) -> MonitorPerfil:
+    """
+    Instala o perfil de requisições na aplicação FastAPI.
+
+    Deve ser chamado antes da declaração das rotas, para que usem RotaPerfilada.
+
+    Args:
+        app: Aplicação FastAPI
+        monitor: Monitor a usar (padrão: configurado pelas variáveis de ambiente)
+
+    Returns:
+        Monitor instalado
+    """
+    monitor = monitor or MonitorPerfil()
+    instrumentar_sql()
+    app.router.route_class = RotaPerfilada
+    app.add_middleware(MiddlewarePerfil, monitor=monitor)
+    return monitor
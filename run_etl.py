@@ -42,6 +42,15 @@ Exemplos de uso:
 
   # Processar arquivos específicos
   python run_etl.py --arquivos "nota1.xml" "nota2.xml" "nota3.xml"
+
+  # Processar um arquivo único com várias NF-e concatenadas (dump de ERP)
+  python run_etl.py --lote "exportacao_erp.xml" --processos 4
+
+  # Reprocessar XMLs já carregados atualizando as NF-e existentes
+  python run_etl.py --diretorio "C:\\XMLs\\2024" --no-delete --modo upsert
+
+  # Retomar uma execução interrompida a partir do último checkpoint
+  python run_etl.py --resume 42
         """
     )
     
@@ -64,6 +73,26 @@ Exemplos de uso:
         help='Lista de arquivos XML específicos para processar'
     )
     
+    parser.add_argument(
+        '--lote', '-l',
+        type=str,
+        help='Arquivo único com várias NF-e (<nfeProc>) concatenadas'
+    )
+    
+    parser.add_argument(
+        '--processos',
+        type=int,
+        default=None,
+        help='Processos para extrair os documentos do --lote (padrão: número de CPUs)'
+    )
+    
+    parser.add_argument(
+        '--resume',
+        type=int,
+        metavar='PROCESSAMENTO_ID',
+        help='Retoma a execução de diretório interrompida a partir do último checkpoint'
+    )
+    
     parser.add_argument(
         '--no-recursivo',
         action='store_true',
@@ -77,6 +106,14 @@ Exemplos de uso:
         help='Tipo de processamento (padrão: completo)'
     )
     
+    parser.add_argument(
+        '--modo',
+        choices=['inserir', 'upsert'],
+        default=None,
+        help='Modo de carga: inserir (NF-e já existente é ignorada) ou upsert '
+             '(NF-e já existente é atualizada) (padrão: ETL_MODO_CARGA ou inserir)'
+    )
+    
     parser.add_argument(
         '--config',
         type=str,
@@ -130,20 +167,42 @@ Exemplos de uso:
             return 1
     
     # Validar argumentos - permitir execução sem argumentos para usar diretório padrão
-    if not args.diretorio and not args.arquivos:
+    if not args.diretorio and not args.arquivos and not args.lote and not args.resume:
         if not config.diretorio_padrao:
-            print("Erro: Você deve especificar --diretorio, --arquivos ou configurar DIRETORIO_PADRAO no .env.etl")
+            print("Erro: Você deve especificar --diretorio, --arquivos, --lote ou configurar DIRETORIO_PADRAO no .env.etl")
             print("Use --help para ver as opções disponíveis")
             return 1
         
         print(f"Usando diretório padrão: {config.diretorio_padrao}\n")
     
     # Criar pipeline
-    pipeline = ETLPipeline()
+    pipeline = ETLPipeline(modo_carga=args.modo)
+    if pipeline.loader.upsert:
+        print("Modo de carga: upsert (NF-e já existentes serão atualizadas)\n")
     
     try:
+        # Retomar execução interrompida
+        if args.resume:
+            try:
+                stats = pipeline.retomar_processamento(args.resume)
+            except ValueError as e:
+                print(f"Erro: {e}")
+                return 1
+        
+        # Processar arquivo em lote
+        elif args.lote:
+            if not os.path.isfile(args.lote):
+                print(f"Erro: Arquivo não encontrado: {args.lote}")
+                return 1
+            
+            stats = pipeline.processar_arquivo_lote(
+                caminho_arquivo=args.lote,
+                tipo_processamento=args.tipo,
+                processos=args.processos
+            )
+        
         # Processar diretório
-        if args.diretorio or not args.arquivos:
+        elif args.diretorio or not args.arquivos:
             diretorio = args.diretorio or config.diretorio_padrao
             
             if not os.path.isdir(diretorio):
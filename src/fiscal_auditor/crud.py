@@ -235,6 +235,71 @@ def criar_analise(
     return db_analise
 
 
+def obter_analise_periodo(db: Session, empresa_id: int, periodo: str) -> Optional[db_models.Analise]:
+    """Obtém a análise mais recente de uma empresa para o período."""
+    return db.query(db_models.Analise)\
+        .filter(
+            db_models.Analise.empresa_id == empresa_id,
+            db_models.Analise.periodo == periodo
+        )\
+        .order_by(db_models.Analise.data_processamento.desc())\
+        .first()
+
+
+def salvar_apuracao_analise(
+    db: Session,
+    empresa_id: int,
+    mapa,
+    resumo: dict,
+    acumuladores: dict,
+    watermark_etl,
+    db_analise: Optional[db_models.Analise] = None
+) -> db_models.Analise:
+    """
+    Grava o resultado de uma apuração do datalake, criando ou atualizando a análise.
+    
+    Args:
+        db: Sessão do banco
+        empresa_id: ID da empresa
+        mapa: MapaApuracao resultante
+        resumo: Contagem de documentos (total_documentos, entradas, saidas)
+        acumuladores: Somas e contagens usadas na próxima apuração incremental
+        watermark_etl: Última carga do datalake considerada
+        db_analise: Análise existente a atualizar (None para criar uma nova)
+    """
+    import json
+    from datetime import datetime
+    from .reports import DecimalEncoder, GeradorRelatorios
+    
+    if db_analise is None:
+        db_analise = db_models.Analise(empresa_id=empresa_id, periodo=mapa.periodo)
+        db.add(db_analise)
+    
+    db_analise.data_processamento = datetime.now()
+    db_analise.total_documentos = resumo['total_documentos']
+    db_analise.total_entradas = resumo['entradas']
+    db_analise.total_saidas = resumo['saidas']
+    
+    for apuracao in mapa.apuracoes:
+        tributo = apuracao.tipo.value.lower()
+        setattr(db_analise, f'{tributo}_debito', apuracao.debitos)
+        setattr(db_analise, f'{tributo}_credito', apuracao.creditos)
+        setattr(db_analise, f'{tributo}_saldo', apuracao.saldo)
+    
+    # Só o mapa é substituído: o restante do relatório gravado (demonstrativos,
+    # validações) é mantido, no mesmo formato de gerar_relatorio_completo
+    relatorio = json.loads(db_analise.relatorio_completo) if db_analise.relatorio_completo else {}
+    relatorio["periodo"] = mapa.periodo
+    relatorio["mapa_apuracao"] = GeradorRelatorios().gerar_mapa_apuracao(mapa)
+    db_analise.relatorio_completo = json.dumps(relatorio, cls=DecimalEncoder, ensure_ascii=False)
+    db_analise.acumuladores = json.dumps(acumuladores)
+    db_analise.watermark_etl = watermark_etl
+    
+    db.commit()
+    db.refresh(db_analise)
+    return db_analise
+
+
 def listar_analises_empresa(
     db: Session,
     empresa_id: int,
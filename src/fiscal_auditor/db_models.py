@@ -99,6 +99,10 @@ class Analise(Base):
     # Dados completos em JSON
     relatorio_completo = Column(Text)  # JSON com todos os detalhes
     
+    # Apuração incremental
+    watermark_etl = Column(DateTime)  # Última carga do datalake considerada
+    acumuladores = Column(Text)  # JSON com somas e contagens por tributo
+    
     # Relacionamentos
     empresa = relationship('Empresa', back_populates='analises')
     documentos = relationship('DocumentoFiscalDB', back_populates='analise', cascade='all, delete-orphan')
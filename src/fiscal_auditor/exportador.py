@@ -2,6 +2,7 @@
 Gerador de relatórios exportáveis (Excel e PDF).
 """
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
 from reportlab.lib import colors
@@ -13,8 +14,64 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from io import BytesIO
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict
+from typing import List, Dict, Iterable
 import json
+import os
+import tempfile
+
+
+TRIBUTOS_EXCEL = ["ICMS", "IPI", "PIS", "COFINS", "IBS", "CBS"]
+
+CABECALHO_DOCUMENTOS = ["Chave", "Número", "Tipo", "Movimento", "Emissão", "CNPJ Emitente", "CNPJ Destinatário", "Valor Total"]
+CABECALHO_MOVIMENTO = ["Documento", "Data", "Fornecedor/Cliente", "Valor"] + TRIBUTOS_EXCEL
+CABECALHO_VALIDACOES = ["Documento", "Status", "Mensagens", "Créditos Aproveitáveis", "Créditos Indevidos", "Créditos Glosáveis"]
+
+LARGURAS_DOCUMENTOS = [45, 15, 15, 15, 15, 20, 20, 15]
+LARGURAS_VALIDACOES = [50, 60, 12, 20, 20, 20]
+
+
+def _linha_documento(doc) -> list:
+    """Valores da linha de um documento na aba Documentos."""
+    return [
+        doc.chave,
+        doc.numero,
+        doc.tipo.value,
+        doc.tipo_movimento.value,
+        doc.data_emissao.strftime("%d/%m/%Y") if doc.data_emissao else "",
+        doc.cnpj_emitente,
+        doc.cnpj_destinatario,
+        float(doc.valor_total),
+    ]
+
+
+def _linha_movimento(doc, entrada: bool) -> list:
+    """Valores da linha de um documento nas abas Entradas/Saídas."""
+    # Somar tributos do documento
+    tributos_totais = {tipo: 0 for tipo in TRIBUTOS_EXCEL}
+    for item in doc.items:
+        for tributo in item.tributos:
+            if tributo.tipo.value in tributos_totais:
+                tributos_totais[tributo.tipo.value] += float(tributo.valor)
+    
+    return [
+        f"{doc.numero}/{doc.serie}",
+        doc.data_emissao.strftime("%d/%m/%Y") if doc.data_emissao else "",
+        # Fornecedor ou cliente dependendo do movimento
+        doc.cnpj_emitente if entrada else doc.cnpj_destinatario,
+        float(doc.valor_total),
+    ] + [tributos_totais[tipo] for tipo in TRIBUTOS_EXCEL]
+
+
+def _linha_validacao(val) -> list:
+    """Valores da linha de uma validação na aba Validações."""
+    return [
+        val.chave_acesso,
+        "Válido" if val.valido else "Com Problemas",
+        len(val.mensagens),
+        len(val.creditos_aproveitaveis),
+        len(val.creditos_indevidos),
+        len(val.creditos_glosaveis),
+    ]
 
 
 class ExportadorRelatorios:
@@ -159,8 +216,7 @@ class ExportadorRelatorios:
         """Cria aba de documentos."""
         documentos = dados.get("documentos", [])
         
-        headers = ["Chave", "Número", "Tipo", "Movimento", "Emissão", "CNPJ Emitente", "CNPJ Destinatário", "Valor Total"]
-        for col, header in enumerate(headers, 1):
+        for col, header in enumerate(CABECALHO_DOCUMENTOS, 1):
             cell = ws.cell(1, col, header)
             cell.fill = header_fill
             cell.font = header_font
@@ -169,25 +225,13 @@ class ExportadorRelatorios:
         
         row = 2
         for doc in documentos:
-            ws.cell(row, 1, doc.chave).border = border
-            ws.cell(row, 2, doc.numero).border = border
-            ws.cell(row, 3, doc.tipo.value).border = border
-            ws.cell(row, 4, doc.tipo_movimento.value).border = border
-            ws.cell(row, 5, doc.data_emissao.strftime("%d/%m/%Y") if doc.data_emissao else "").border = border
-            ws.cell(row, 6, doc.cnpj_emitente).border = border
-            ws.cell(row, 7, doc.cnpj_destinatario).border = border
-            ws.cell(row, 8, float(doc.valor_total)).border = border
+            for col, valor in enumerate(_linha_documento(doc), 1):
+                ws.cell(row, col, valor).border = border
             ws.cell(row, 8).number_format = '#,##0.00'
             row += 1
         
-        ws.column_dimensions['A'].width = 45
-        ws.column_dimensions['B'].width = 15
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 20
-        ws.column_dimensions['G'].width = 20
-        ws.column_dimensions['H'].width = 15
+        for col, largura in enumerate(LARGURAS_DOCUMENTOS, 1):
+            ws.column_dimensions[get_column_letter(col)].width = largura
     
     @staticmethod
     def _criar_aba_entradas(ws, dados, header_fill, header_font, border):
@@ -207,8 +251,7 @@ class ExportadorRelatorios:
         ws['A1'] = titulo
         ws['A1'].font = Font(bold=True, size=14)
         
-        headers = ["Documento", "Data", "Fornecedor/Cliente", "Valor", "ICMS", "IPI", "PIS", "COFINS", "IBS", "CBS"]
-        for col, header in enumerate(headers, 1):
+        for col, header in enumerate(CABECALHO_MOVIMENTO, 1):
             cell = ws.cell(3, col, header)
             cell.fill = header_fill
             cell.font = header_font
@@ -216,29 +259,10 @@ class ExportadorRelatorios:
         
         row = 4
         for doc in documentos:
-            ws.cell(row, 1, f"{doc.numero}/{doc.serie}").border = border
-            ws.cell(row, 2, doc.data_emissao.strftime("%d/%m/%Y") if doc.data_emissao else "").border = border
-            
-            # Fornecedor ou cliente dependendo do movimento
-            cnpj = doc.cnpj_emitente if titulo == "ENTRADAS" else doc.cnpj_destinatario
-            ws.cell(row, 3, cnpj).border = border
-            
-            ws.cell(row, 4, float(doc.valor_total)).border = border
-            ws.cell(row, 4).number_format = '#,##0.00'
-            
-            # Somar tributos do documento
-            tributos_totais = {"ICMS": 0, "IPI": 0, "PIS": 0, "COFINS": 0, "IBS": 0, "CBS": 0}
-            for item in doc.items:
-                for tributo in item.tributos:
-                    if tributo.tipo.value in tributos_totais:
-                        tributos_totais[tributo.tipo.value] += float(tributo.valor)
-            
-            col = 5
-            for tipo_trib in ["ICMS", "IPI", "PIS", "COFINS", "IBS", "CBS"]:
-                ws.cell(row, col, tributos_totais[tipo_trib]).border = border
-                ws.cell(row, col).number_format = '#,##0.00'
-                col += 1
-            
+            for col, valor in enumerate(_linha_movimento(doc, titulo == "ENTRADAS"), 1):
+                ws.cell(row, col, valor).border = border
+                if col >= 4:
+                    ws.cell(row, col).number_format = '#,##0.00'
             row += 1
         
         for col in range(1, 11):
@@ -249,8 +273,7 @@ class ExportadorRelatorios:
         """Cria aba de validações."""
         validacoes = dados.get("validacoes", [])
         
-        headers = ["Documento", "Status", "Mensagens", "Créditos Aproveitáveis", "Créditos Indevidos", "Créditos Glosáveis"]
-        for col, header in enumerate(headers, 1):
+        for col, header in enumerate(CABECALHO_VALIDACOES, 1):
             cell = ws.cell(1, col, header)
             cell.fill = header_fill
             cell.font = header_font
@@ -258,12 +281,8 @@ class ExportadorRelatorios:
         
         row = 2
         for val in validacoes:
-            ws.cell(row, 1, val.chave_acesso).border = border
-            ws.cell(row, 2, "Válido" if val.valido else "Com Problemas").border = border
-            ws.cell(row, 3, len(val.mensagens)).border = border
-            ws.cell(row, 4, len(val.creditos_aproveitaveis)).border = border
-            ws.cell(row, 5, len(val.creditos_indevidos)).border = border
-            ws.cell(row, 6, len(val.creditos_glosaveis)).border = border
+            for col, valor in enumerate(_linha_validacao(val), 1):
+                ws.cell(row, col, valor).border = border
             row += 1
             
             # Detalhar mensagens
@@ -273,12 +292,150 @@ class ExportadorRelatorios:
                     ws['B' + str(row)].font = Font(color="FF6600", italic=True)
                     row += 1
         
-        ws.column_dimensions['A'].width = 50
-        ws.column_dimensions['B'].width = 60
-        ws.column_dimensions['C'].width = 12
-        ws.column_dimensions['D'].width = 20
-        ws.column_dimensions['E'].width = 20
-        ws.column_dimensions['F'].width = 20
+        for col, largura in enumerate(LARGURAS_VALIDACOES, 1):
+            ws.column_dimensions[get_column_letter(col)].width = largura
+    
+    @staticmethod
+    def gerar_excel_streaming(dados_sessao: dict, caminho_arquivo: str = None) -> str:
+        """
+        Gera o mesmo Excel de gerar_excel em modo write-only, gravando direto em arquivo.
+        
+        Documentos e validações são percorridos uma única vez e cada linha é
+        escrita assim que lida, portanto podem ser iteradores (ex.: lotes do
+        datalake). A memória usada não depende da quantidade de linhas, exceto
+        pela tabela de textos compartilhados do próprio formato xlsx.
+        
+        Args:
+            dados_sessao: Dicionário com documentos, mapa, validações e empresa
+            caminho_arquivo: Arquivo de saída (padrão: arquivo temporário)
+            
+        Returns:
+            Caminho do arquivo Excel gerado (o chamador é responsável por removê-lo)
+        """
+        if caminho_arquivo is None:
+            fd, caminho_arquivo = tempfile.mkstemp(prefix="relatorio_fiscal_", suffix=".xlsx")
+            os.close(fd)
+        
+        wb = Workbook(write_only=True)
+        
+        # Estilos
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF")
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        
+        def celula(ws, valor, **estilo):
+            cell = WriteOnlyCell(ws, value=valor)
+            for atributo, valor_estilo in estilo.items():
+                setattr(cell, atributo, valor_estilo)
+            return cell
+        
+        def cabecalho(ws, titulos, centralizar=False):
+            extra = {'alignment': Alignment(horizontal='center')} if centralizar else {}
+            return [
+                celula(ws, titulo, fill=header_fill, font=header_font, border=border, **extra)
+                for titulo in titulos
+            ]
+        
+        def linha(ws, valores, primeira_coluna_numerica=None):
+            return [
+                celula(ws, valor, border=border, number_format='#,##0.00')
+                if primeira_coluna_numerica and col >= primeira_coluna_numerica
+                else celula(ws, valor, border=border)
+                for col, valor in enumerate(valores, 1)
+            ]
+        
+        # As abas são criadas na ordem final; cada uma é escrita em um arquivo próprio,
+        # então o Resumo pode ser preenchido por último, com as contagens.
+        # Larguras de coluna precisam ser definidas antes da primeira linha.
+        ws_resumo = wb.create_sheet("Resumo")
+        ws_resumo.column_dimensions['A'].width = 25
+        ws_resumo.column_dimensions['B'].width = 40
+        
+        ws_mapa = wb.create_sheet("Mapa de Apuração")
+        for col in range(1, 5):
+            ws_mapa.column_dimensions[get_column_letter(col)].width = 20
+        
+        ws_docs = wb.create_sheet("Documentos")
+        for col, largura in enumerate(LARGURAS_DOCUMENTOS, 1):
+            ws_docs.column_dimensions[get_column_letter(col)].width = largura
+        
+        ws_entradas = wb.create_sheet("Entradas")
+        ws_saidas = wb.create_sheet("Saídas")
+        for ws in (ws_entradas, ws_saidas):
+            for col in range(1, 11):
+                ws.column_dimensions[get_column_letter(col)].width = 15
+        
+        ws_validacoes = wb.create_sheet("Validações")
+        for col, largura in enumerate(LARGURAS_VALIDACOES, 1):
+            ws_validacoes.column_dimensions[get_column_letter(col)].width = largura
+        
+        # Aba 2: Mapa de Apuração
+        mapa = dados_sessao.get("mapa")
+        if mapa:
+            ws_mapa.append(cabecalho(ws_mapa, ["Tributo", "Débitos", "Créditos", "Saldo"], centralizar=True))
+            for apuracao in mapa.apuracoes:
+                ws_mapa.append(linha(ws_mapa, [
+                    apuracao.tipo.value,
+                    float(apuracao.debitos),
+                    float(apuracao.creditos),
+                    float(apuracao.saldo)
+                ], 2))
+        else:
+            ws_mapa.append(["Nenhum mapa de apuração disponível"])
+        
+        # Abas 3, 4 e 5: Documentos, Entradas e Saídas em uma única passada
+        ws_docs.append(cabecalho(ws_docs, CABECALHO_DOCUMENTOS, centralizar=True))
+        for ws, titulo in ((ws_entradas, "ENTRADAS"), (ws_saidas, "SAÍDAS")):
+            ws.append([celula(ws, titulo, font=Font(bold=True, size=14))])
+            ws.append([])
+            ws.append(cabecalho(ws, CABECALHO_MOVIMENTO))
+        
+        total_documentos = entradas = saidas = 0
+        for doc in dados_sessao.get("documentos", []):
+            total_documentos += 1
+            ws_docs.append(linha(ws_docs, _linha_documento(doc), 8))
+            
+            if doc.tipo_movimento.value == "Entrada":
+                entradas += 1
+                ws_entradas.append(linha(ws_entradas, _linha_movimento(doc, True), 4))
+            elif doc.tipo_movimento.value == "Saída":
+                saidas += 1
+                ws_saidas.append(linha(ws_saidas, _linha_movimento(doc, False), 4))
+        
+        # Aba 6: Validações
+        fonte_mensagem = Font(color="FF6600", italic=True)
+        ws_validacoes.append(cabecalho(ws_validacoes, CABECALHO_VALIDACOES))
+        for val in dados_sessao.get("validacoes", []):
+            ws_validacoes.append(linha(ws_validacoes, _linha_validacao(val)))
+            
+            # Detalhar mensagens
+            for msg in val.mensagens:
+                ws_validacoes.append([None, celula(ws_validacoes, msg, border=border, font=fonte_mensagem)])
+        
+        # Aba 1: Resumo
+        empresa = dados_sessao.get("empresa", {})
+        negrito = Font(bold=True)
+        ws_resumo.append([celula(ws_resumo, "RELATÓRIO DE APURAÇÃO TRIBUTÁRIA", font=Font(bold=True, size=14))])
+        ws_resumo.append([])
+        for rotulo, valor in (
+            ("Empresa:", empresa.get("razao_social", "N/A")),
+            ("CNPJ:", empresa.get("cnpj", "N/A")),
+            ("Período:", mapa.periodo if mapa else "N/A"),
+            ("Data do Relatório:", datetime.now().strftime("%d/%m/%Y %H:%M")),
+        ):
+            ws_resumo.append([celula(ws_resumo, rotulo, font=negrito), valor])
+        ws_resumo.append([])
+        ws_resumo.append([celula(ws_resumo, "Total de Documentos:", font=negrito), total_documentos])
+        ws_resumo.append(["Entradas:", entradas])
+        ws_resumo.append(["Saídas:", saidas])
+        
+        wb.save(caminho_arquivo)
+        return caminho_arquivo
     
     @staticmethod
     def gerar_pdf(dados_sessao: dict) -> BytesIO:
@@ -4,7 +4,7 @@ Módulo para geração de relatórios fiscais.
 import json
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Callable
 from .models import (
     DocumentoFiscal,
     MapaApuracao,
@@ -22,6 +22,221 @@ class DecimalEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+def _somar_tributos_documento(doc: DocumentoFiscal) -> Dict[str, Decimal]:
+    """Soma os tributos dos itens de um documento, por tipo."""
+    tributos = {}
+    for item in doc.items:
+        for tributo in item.tributos:
+            tipo_str = tributo.tipo.value
+            if tipo_str not in tributos:
+                tributos[tipo_str] = Decimal('0')
+            tributos[tipo_str] += tributo.valor
+    return tributos
+
+
+def _info_documento(
+    doc: DocumentoFiscal,
+    campo_cnpj: str,
+    tributos_totais: Dict[str, Decimal]
+) -> Dict[str, Any]:
+    """
+    Monta a entrada de um documento nos demonstrativos e acumula seus tributos.
+    
+    Args:
+        doc: Documento fiscal
+        campo_cnpj: 'cnpj_emitente' (entradas) ou 'cnpj_destinatario' (saídas)
+        tributos_totais: Totais por tipo de tributo, atualizados in-place
+        
+    Returns:
+        Dicionário com as informações do documento
+    """
+    tributos = _somar_tributos_documento(doc)
+    
+    # Acumula no total geral
+    for tipo_str, valor in tributos.items():
+        if tipo_str not in tributos_totais:
+            tributos_totais[tipo_str] = Decimal('0')
+        tributos_totais[tipo_str] += valor
+    
+    return {
+        "tipo_documento": doc.tipo.value,
+        "chave": doc.chave,
+        "numero": doc.numero,
+        "serie": doc.serie,
+        "data_emissao": doc.data_emissao.isoformat(),
+        campo_cnpj: getattr(doc, campo_cnpj),
+        "valor_total": str(doc.valor_total),
+        # Converte Decimals para strings
+        "tributos": {k: str(v) for k, v in tributos.items()}
+    }
+
+
+def _novos_contadores_creditos() -> Dict[str, Dict[str, Any]]:
+    """Contadores zerados de créditos aproveitáveis, indevidos e glosáveis."""
+    return {
+        categoria: {"quantidade": 0, "valor_total": Decimal('0')}
+        for categoria in ("aproveitaveis", "indevidos", "glosaveis")
+    }
+
+
+def _acumular_creditos(contadores: Dict[str, Dict[str, Any]], validacao: ResultadoValidacao):
+    """Acumula os créditos de uma validação nos contadores."""
+    for categoria, creditos in (
+        ("aproveitaveis", validacao.creditos_aproveitaveis),
+        ("indevidos", validacao.creditos_indevidos),
+        ("glosaveis", validacao.creditos_glosaveis),
+    ):
+        contadores[categoria]["quantidade"] += len(creditos)
+        for credito in creditos:
+            contadores[categoria]["valor_total"] += credito.valor
+
+
+def _formatar_resumo_creditos(contadores: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Formata os contadores de créditos para o relatório de validação."""
+    return {
+        categoria: {
+            "quantidade": valores["quantidade"],
+            "valor_total": str(valores["valor_total"])
+        }
+        for categoria, valores in contadores.items()
+    }
+
+
+class _AcumuladorDemonstrativo:
+    """Acumula os documentos de um movimento para montar o demonstrativo."""
+
+    def __init__(self, titulo: str, campo_cnpj: str):
+        self.titulo = titulo
+        self.campo_cnpj = campo_cnpj
+        self.documentos = []
+        self.valor_total = 0
+        self.tributos_totais = {}
+
+    def adicionar(self, doc: DocumentoFiscal):
+        """Adiciona um documento ao demonstrativo."""
+        self.valor_total += doc.valor_total
+        self.documentos.append(_info_documento(doc, self.campo_cnpj, self.tributos_totais))
+
+    def montar(self, data_geracao: str) -> Dict[str, Any]:
+        """Monta o demonstrativo no mesmo formato de gerar_demonstrativo_entradas/saidas."""
+        return {
+            "tipo": self.titulo,
+            "data_geracao": data_geracao,
+            "quantidade_documentos": len(self.documentos),
+            "valor_total": str(self.valor_total),
+            "documentos": self.documentos,
+            "tributos_totais": {k: str(v) for k, v in self.tributos_totais.items()}
+        }
+
+
+# ============= ESCRITA DE JSON EM PARTES =============
+
+# Tamanho aproximado de cada parte entregue pelos geradores *_stream
+TAMANHO_PARTE_JSON = 64 * 1024
+
+
+class _ObjetoJSON(dict):
+    """Objeto JSON serializado chave a chave (pode conter listas e valores adiados)."""
+
+
+class _ListaJSON:
+    """Lista JSON serializada item a item, à medida que o iterador é consumido."""
+
+    def __init__(self, itens: Iterable[Any]):
+        self.itens = itens
+
+
+class _ValorAdiado:
+    """Valor JSON calculado apenas quando o escritor chega nele."""
+
+    def __init__(self, funcao: Callable[[], Any]):
+        self.funcao = funcao
+
+
+def _iterar_json(valor: Any, nivel: int = 0) -> Iterator[str]:
+    """
+    Serializa um valor em partes, com saída idêntica a json.dumps(indent=2).
+    
+    Apenas _ObjetoJSON e _ListaJSON são percorridos em partes; os demais
+    valores são serializados de uma vez com o DecimalEncoder.
+    """
+    if isinstance(valor, _ValorAdiado):
+        valor = valor.funcao()
+    
+    recuo = '\n' + '  ' * (nivel + 1)
+    
+    if isinstance(valor, _ObjetoJSON):
+        if not valor:
+            yield '{}'
+            return
+        separador = '{'
+        for chave, item in valor.items():
+            yield separador + recuo + json.dumps(chave, ensure_ascii=False) + ': '
+            yield from _iterar_json(item, nivel + 1)
+            separador = ','
+        yield '\n' + '  ' * nivel + '}'
+    elif isinstance(valor, _ListaJSON):
+        separador = '['
+        for item in valor.itens:
+            yield separador + recuo
+            yield from _iterar_json(item, nivel + 1)
+            separador = ','
+        yield '[]' if separador == '[' else '\n' + '  ' * nivel + ']'
+    else:
+        texto = json.dumps(valor, ensure_ascii=False, indent=2, cls=DecimalEncoder)
+        yield texto.replace('\n', '\n' + '  ' * nivel) if nivel else texto
+
+
+def _agrupar_partes(partes: Iterable[str], tamanho: int = TAMANHO_PARTE_JSON) -> Iterator[str]:
+    """Junta partes pequenas em blocos de aproximadamente ``tamanho`` caracteres."""
+    buffer = []
+    acumulado = 0
+    for parte in partes:
+        buffer.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamanho:
+            yield ''.join(buffer)
+            buffer = []
+            acumulado = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _totais_movimento(documentos: Iterable[DocumentoFiscal]) -> Dict[TipoMovimento, Dict[str, Any]]:
+    """Conta os documentos e soma o valor total por tipo de movimento, em uma passada."""
+    totais = {
+        movimento: {"quantidade": 0, "valor_total": 0}
+        for movimento in (TipoMovimento.ENTRADA, TipoMovimento.SAIDA)
+    }
+    for doc in documentos:
+        if doc.tipo_movimento in totais:
+            totais[doc.tipo_movimento]["quantidade"] += 1
+            totais[doc.tipo_movimento]["valor_total"] += doc.valor_total
+    return totais
+
+
+def _gerar_infos_documentos(
+    documentos: Iterable[DocumentoFiscal],
+    tipo_movimento: TipoMovimento,
+    campo_cnpj: str,
+    tributos_totais: Dict[str, Decimal]
+) -> Iterator[Dict[str, Any]]:
+    """Gera as entradas dos documentos de um movimento, acumulando os tributos."""
+    for doc in documentos:
+        if doc.tipo_movimento == tipo_movimento:
+            yield _info_documento(doc, campo_cnpj, tributos_totais)
+
+
+def _gerar_detalhes_validacao(
+    validacoes: Iterable[ResultadoValidacao],
+    contadores: Dict[str, Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """Gera os detalhes das validações, acumulando os créditos."""
+    for validacao in validacoes:
+        _acumular_creditos(contadores, validacao)
+        yield validacao.to_dict()
+
+
 class GeradorRelatorios:
     """Gerador de relatórios estruturados."""
 
@@ -53,33 +268,9 @@ class GeradorRelatorios:
         tributos_totais = {}
         
         for doc in entradas:
-            doc_info = {
-                "tipo_documento": doc.tipo.value,
-                "chave": doc.chave,
-                "numero": doc.numero,
-                "serie": doc.serie,
-                "data_emissao": doc.data_emissao.isoformat(),
-                "cnpj_emitente": doc.cnpj_emitente,
-                "valor_total": str(doc.valor_total),
-                "tributos": {}
-            }
-
-            # Agrupa tributos do documento
-            for item in doc.items:
-                for tributo in item.tributos:
-                    tipo_str = tributo.tipo.value
-                    if tipo_str not in doc_info["tributos"]:
-                        doc_info["tributos"][tipo_str] = Decimal('0')
-                    doc_info["tributos"][tipo_str] += tributo.valor
-
-                    # Acumula no total geral
-                    if tipo_str not in tributos_totais:
-                        tributos_totais[tipo_str] = Decimal('0')
-                    tributos_totais[tipo_str] += tributo.valor
-
-            # Converte Decimals para strings
-            doc_info["tributos"] = {k: str(v) for k, v in doc_info["tributos"].items()}
-            relatorio["documentos"].append(doc_info)
+            relatorio["documentos"].append(
+                _info_documento(doc, "cnpj_emitente", tributos_totais)
+            )
 
         # Adiciona totais de tributos
         relatorio["tributos_totais"] = {k: str(v) for k, v in tributos_totais.items()}
@@ -110,33 +301,9 @@ class GeradorRelatorios:
         tributos_totais = {}
         
         for doc in saidas:
-            doc_info = {
-                "tipo_documento": doc.tipo.value,
-                "chave": doc.chave,
-                "numero": doc.numero,
-                "serie": doc.serie,
-                "data_emissao": doc.data_emissao.isoformat(),
-                "cnpj_destinatario": doc.cnpj_destinatario,
-                "valor_total": str(doc.valor_total),
-                "tributos": {}
-            }
-
-            # Agrupa tributos do documento
-            for item in doc.items:
-                for tributo in item.tributos:
-                    tipo_str = tributo.tipo.value
-                    if tipo_str not in doc_info["tributos"]:
-                        doc_info["tributos"][tipo_str] = Decimal('0')
-                    doc_info["tributos"][tipo_str] += tributo.valor
-
-                    # Acumula no total geral
-                    if tipo_str not in tributos_totais:
-                        tributos_totais[tipo_str] = Decimal('0')
-                    tributos_totais[tipo_str] += tributo.valor
-
-            # Converte Decimals para strings
-            doc_info["tributos"] = {k: str(v) for k, v in doc_info["tributos"].items()}
-            relatorio["documentos"].append(doc_info)
+            relatorio["documentos"].append(
+                _info_documento(doc, "cnpj_destinatario", tributos_totais)
+            )
 
         # Adiciona totais de tributos
         relatorio["tributos_totais"] = {k: str(v) for k, v in tributos_totais.items()}
@@ -175,41 +342,13 @@ class GeradorRelatorios:
         }
 
         # Contadores de créditos
-        total_aproveitaveis = 0
-        total_indevidos = 0
-        total_glosaveis = 0
-        valor_aproveitaveis = Decimal('0')
-        valor_indevidos = Decimal('0')
-        valor_glosaveis = Decimal('0')
+        contadores = _novos_contadores_creditos()
 
         for validacao in validacoes:
-            total_aproveitaveis += len(validacao.creditos_aproveitaveis)
-            total_indevidos += len(validacao.creditos_indevidos)
-            total_glosaveis += len(validacao.creditos_glosaveis)
-
-            for credito in validacao.creditos_aproveitaveis:
-                valor_aproveitaveis += credito.valor
-            for credito in validacao.creditos_indevidos:
-                valor_indevidos += credito.valor
-            for credito in validacao.creditos_glosaveis:
-                valor_glosaveis += credito.valor
-
+            _acumular_creditos(contadores, validacao)
             relatorio["detalhes"].append(validacao.to_dict())
 
-        relatorio["resumo_creditos"] = {
-            "aproveitaveis": {
-                "quantidade": total_aproveitaveis,
-                "valor_total": str(valor_aproveitaveis)
-            },
-            "indevidos": {
-                "quantidade": total_indevidos,
-                "valor_total": str(valor_indevidos)
-            },
-            "glosaveis": {
-                "quantidade": total_glosaveis,
-                "valor_total": str(valor_glosaveis)
-            }
-        }
+        relatorio["resumo_creditos"] = _formatar_resumo_creditos(contadores)
 
         return relatorio
 
@@ -230,14 +369,74 @@ class GeradorRelatorios:
         Returns:
             Dicionário com o relatório completo
         """
+        return self.gerar_relatorios_combinados(documentos, mapa, validacoes)["completo"]
+
+    def gerar_relatorios_combinados(
+        self,
+        documentos: List[DocumentoFiscal],
+        mapa: MapaApuracao,
+        validacoes: List[ResultadoValidacao]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Gera todos os relatórios percorrendo documentos e validações uma única vez.
+        
+        Cada documento tem seus tributos somados uma vez e entra no demonstrativo
+        do seu movimento; o relatório completo reaproveita as mesmas seções.
+        
+        Args:
+            documentos: Lista de documentos fiscais
+            mapa: Mapa de apuração
+            validacoes: Lista de validações
+            
+        Returns:
+            Dicionário com os relatórios 'entradas', 'saidas', 'mapa', 'validacao' e 'completo'
+        """
+        data_geracao = datetime.now().isoformat()
+        
+        movimentos = {
+            TipoMovimento.ENTRADA: _AcumuladorDemonstrativo("Demonstrativo de Entradas", "cnpj_emitente"),
+            TipoMovimento.SAIDA: _AcumuladorDemonstrativo("Demonstrativo de Saídas", "cnpj_destinatario"),
+        }
+        for doc in documentos:
+            movimentos[doc.tipo_movimento].adicionar(doc)
+        
+        # Validações
+        contadores = _novos_contadores_creditos()
+        validos = 0
+        detalhes = []
+        for validacao in validacoes:
+            validos += 1 if validacao.valido else 0
+            _acumular_creditos(contadores, validacao)
+            detalhes.append(validacao.to_dict())
+        
+        relatorio_validacao = {
+            "tipo": "Relatório de Validação",
+            "data_geracao": data_geracao,
+            "total_validacoes": len(detalhes),
+            "validos": validos,
+            "invalidos": len(detalhes) - validos,
+            "detalhes": detalhes,
+            "resumo_creditos": _formatar_resumo_creditos(contadores)
+        }
+        
+        entradas = movimentos[TipoMovimento.ENTRADA].montar(data_geracao)
+        saidas = movimentos[TipoMovimento.SAIDA].montar(data_geracao)
+        relatorio_mapa = self.gerar_mapa_apuracao(mapa)
+        
         return {
-            "tipo": "Relatório Completo de Auditoria Fiscal",
-            "data_geracao": datetime.now().isoformat(),
-            "periodo": mapa.periodo,
-            "demonstrativo_entradas": self.gerar_demonstrativo_entradas(documentos),
-            "demonstrativo_saidas": self.gerar_demonstrativo_saidas(documentos),
-            "mapa_apuracao": self.gerar_mapa_apuracao(mapa),
-            "validacao": self.gerar_relatorio_validacao(validacoes)
+            "entradas": entradas,
+            "saidas": saidas,
+            "mapa": relatorio_mapa,
+            "validacao": relatorio_validacao,
+            "completo": {
+                "tipo": "Relatório Completo de Auditoria Fiscal",
+                "data_geracao": data_geracao,
+                "periodo": mapa.periodo,
+                "demonstrativo_entradas": entradas,
+                "demonstrativo_saidas": saidas,
+                "mapa_apuracao": relatorio_mapa,
+                "validacao": relatorio_validacao
+            }
         }
 
     def exportar_json(self, relatorio: Dict[str, Any], caminho_arquivo: str):
@@ -485,3 +684,134 @@ class GeradorRelatorios:
             "total_produtos": len(produtos_lista),
             "produtos": produtos_lista
         }
+
+    # ============= RELATÓRIOS EM PARTES (STREAMING) =============
+
+    def _estrutura_demonstrativo(
+        self,
+        documentos: Iterable[DocumentoFiscal],
+        tipo_movimento: TipoMovimento,
+        totais: Dict[str, Any]
+    ) -> _ObjetoJSON:
+        """Estrutura do demonstrativo com os documentos gerados sob demanda."""
+        if tipo_movimento == TipoMovimento.ENTRADA:
+            titulo, campo_cnpj = "Demonstrativo de Entradas", "cnpj_emitente"
+        else:
+            titulo, campo_cnpj = "Demonstrativo de Saídas", "cnpj_destinatario"
+        
+        tributos_totais = {}
+        
+        relatorio = _ObjetoJSON()
+        relatorio["tipo"] = titulo
+        relatorio["data_geracao"] = datetime.now().isoformat()
+        relatorio["quantidade_documentos"] = totais["quantidade"]
+        relatorio["valor_total"] = str(totais["valor_total"])
+        relatorio["documentos"] = _ListaJSON(
+            _gerar_infos_documentos(documentos, tipo_movimento, campo_cnpj, tributos_totais)
+        )
+        relatorio["tributos_totais"] = _ValorAdiado(
+            lambda: {k: str(v) for k, v in tributos_totais.items()}
+        )
+        return relatorio
+
+    def _estrutura_validacao(self, validacoes: Iterable[ResultadoValidacao]) -> _ObjetoJSON:
+        """Estrutura do relatório de validação com os detalhes gerados sob demanda."""
+        total = validos = 0
+        for validacao in validacoes:
+            total += 1
+            validos += 1 if validacao.valido else 0
+        
+        contadores = _novos_contadores_creditos()
+        
+        relatorio = _ObjetoJSON()
+        relatorio["tipo"] = "Relatório de Validação"
+        relatorio["data_geracao"] = datetime.now().isoformat()
+        relatorio["total_validacoes"] = total
+        relatorio["validos"] = validos
+        relatorio["invalidos"] = total - validos
+        relatorio["detalhes"] = _ListaJSON(_gerar_detalhes_validacao(validacoes, contadores))
+        relatorio["resumo_creditos"] = _ValorAdiado(lambda: _formatar_resumo_creditos(contadores))
+        return relatorio
+
+    def gerar_demonstrativo_entradas_stream(self, documentos: Iterable[DocumentoFiscal]) -> Iterator[str]:
+        """
+        Gera o JSON do demonstrativo de entradas em partes, sem montar o relatório em memória.
+        
+        A saída é idêntica a exportar_json_str(gerar_demonstrativo_entradas(...)).
+        
+        Args:
+            documentos: Documentos fiscais; o iterável é percorrido duas vezes
+                (contagem e documentos), portanto não pode ser um gerador
+            
+        Returns:
+            Iterador de partes do JSON
+        """
+        totais = _totais_movimento(documentos)[TipoMovimento.ENTRADA]
+        relatorio = self._estrutura_demonstrativo(documentos, TipoMovimento.ENTRADA, totais)
+        return _agrupar_partes(_iterar_json(relatorio))
+
+    def gerar_demonstrativo_saidas_stream(self, documentos: Iterable[DocumentoFiscal]) -> Iterator[str]:
+        """
+        Gera o JSON do demonstrativo de saídas em partes, sem montar o relatório em memória.
+        
+        A saída é idêntica a exportar_json_str(gerar_demonstrativo_saidas(...)).
+        
+        Args:
+            documentos: Documentos fiscais; o iterável é percorrido duas vezes
+                (contagem e documentos), portanto não pode ser um gerador
+            
+        Returns:
+            Iterador de partes do JSON
+        """
+        totais = _totais_movimento(documentos)[TipoMovimento.SAIDA]
+        relatorio = self._estrutura_demonstrativo(documentos, TipoMovimento.SAIDA, totais)
+        return _agrupar_partes(_iterar_json(relatorio))
+
+    def gerar_relatorio_completo_stream(
+        self,
+        documentos: Iterable[DocumentoFiscal],
+        mapa: MapaApuracao,
+        validacoes: Iterable[ResultadoValidacao]
+    ) -> Iterator[str]:
+        """
+        Gera o JSON do relatório completo em partes, sem montar o relatório em memória.
+        
+        A saída é idêntica a exportar_json_str(gerar_relatorio_completo(...)).
+        
+        Args:
+            documentos: Documentos fiscais; percorrido três vezes (contagem,
+                entradas e saídas), portanto não pode ser um gerador
+            mapa: Mapa de apuração
+            validacoes: Validações; percorrido duas vezes (contagem e detalhes)
+            
+        Returns:
+            Iterador de partes do JSON
+        """
+        relatorio = _ObjetoJSON()
+        relatorio["tipo"] = "Relatório Completo de Auditoria Fiscal"
+        relatorio["data_geracao"] = datetime.now().isoformat()
+        relatorio["periodo"] = mapa.periodo
+        
+        totais = _totais_movimento(documentos)
+        relatorio["demonstrativo_entradas"] = self._estrutura_demonstrativo(
+            documentos, TipoMovimento.ENTRADA, totais[TipoMovimento.ENTRADA]
+        )
+        relatorio["demonstrativo_saidas"] = self._estrutura_demonstrativo(
+            documentos, TipoMovimento.SAIDA, totais[TipoMovimento.SAIDA]
+        )
+        relatorio["mapa_apuracao"] = self.gerar_mapa_apuracao(mapa)
+        relatorio["validacao"] = self._estrutura_validacao(validacoes)
+        
+        return _agrupar_partes(_iterar_json(relatorio))
+
+    def exportar_json_stream(self, partes: Iterable[str], caminho_arquivo: str):
+        """
+        Grava em arquivo um relatório gerado por um dos métodos *_stream.
+        
+        Args:
+            partes: Partes do JSON
+            caminho_arquivo: Caminho do arquivo de saída
+        """
+        with open(caminho_arquivo, 'w', encoding='utf-8') as f:
+            for parte in partes:
+                f.write(parte)
@@ -4,7 +4,7 @@ Módulo para leitura e classificação de arquivos XML de documentos fiscais.
 from datetime import datetime
 from decimal import Decimal
 from lxml import etree
-from typing import Optional
+from typing import BinaryIO, Optional
 from .models import DocumentoFiscal, Item, Tributo, TipoDocumento, TipoMovimento, TipoTributo
 
 
@@ -36,9 +36,49 @@ class XMLReader:
         Returns:
             DocumentoFiscal com os dados extraídos
         """
-        tree = etree.parse(caminho_arquivo)
-        root = tree.getroot()
+        with open(caminho_arquivo, 'rb') as arquivo:
+            return self.ler_xml_stream(arquivo)
 
+    def ler_xml_stream(self, arquivo: BinaryIO) -> DocumentoFiscal:
+        """
+        Lê um XML a partir de um objeto arquivo binário (upload, membro de ZIP etc.).
+        
+        Args:
+            arquivo: Objeto arquivo binário (com método read)
+            
+        Returns:
+            DocumentoFiscal com os dados extraídos
+        """
+        return self._ler_documento(etree.parse(arquivo).getroot())
+
+    def ler_xml_bytes(self, conteudo) -> DocumentoFiscal:
+        """
+        Lê um XML já carregado em memória, sem gravar arquivo temporário.
+        
+        Aceita bytes, str ou qualquer objeto com protocolo de buffer
+        (memoryview, mmap); o buffer não é copiado quando o lxml o suporta.
+        
+        Args:
+            conteudo: XML em bytes, bytearray, memoryview, mmap ou str
+            
+        Returns:
+            DocumentoFiscal com os dados extraídos
+        """
+        if isinstance(conteudo, str):
+            conteudo = conteudo.encode('utf-8')
+        
+        try:
+            root = etree.fromstring(conteudo)
+        except (TypeError, ValueError):
+            # lxml sem suporte a protocolo de buffer
+            if isinstance(conteudo, bytes):
+                raise
+            root = etree.fromstring(bytes(conteudo))
+        
+        return self._ler_documento(root)
+
+    def _ler_documento(self, root) -> DocumentoFiscal:
+        """Identifica o tipo do documento e lê seus dados a partir do elemento raiz."""
         # Identifica o tipo de documento
         tipo_doc = self._identificar_tipo_documento(root)
         
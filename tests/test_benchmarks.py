@@ -0,0 +1,64 @@
+"""
+Tests for the synthetic NF-e generator used by the benchmarks.
+"""
+import io
+import json
+
+import pytest
+
+from benchmarks.gerador_nfe import GeradorNFe, OrdemLeiaute
+from etl_service.extractor import XMLExtractor
+
+
+def test_gerador_deterministico_e_lido_pelo_extrator():
+    """Test documents depend only on seed/number and round-trip through the extractor."""
+    gerador = GeradorNFe(semente=7, itens=(2, 4), proporcao_nfce=0)
+
+    conteudo = gerador.gerar(3)
+    assert conteudo == GeradorNFe(semente=7, itens=(2, 4), proporcao_nfce=0).gerar(3)
+    assert conteudo != gerador.gerar(4)
+
+    dados = XMLExtractor().extrair_nfe_stream(io.BytesIO(conteudo))
+    chave = dados['identificacao']['chave_acesso']
+
+    assert len(chave) == 44
+    assert chave[20:22] == "55"
+    assert 2 <= len(dados['itens']) <= 4
+    assert dados['protocolo']['codigo_status'] == "100"
+
+
+def test_gerador_segue_ordem_do_leiaute():
+    """Test group fields follow the XSD sequence and unknown fields are rejected."""
+    assert OrdemLeiaute().ordem("ICMS61") == ['orig', 'CST', 'qBCMonoRet', 'adRemICMSRet', 'vICMSMonoRet']
+
+    gerador = GeradorNFe(itens=(1, 1), grupos=['icms61'], tamanho_minimo=8000)
+    conteudo = gerador.gerar(1)
+
+    assert len(conteudo) >= 8000
+    assert b"<ICMS61><orig>" in conteudo
+    with pytest.raises(ValueError):
+        GeradorNFe(grupos=['icms99'])
+
+
+def test_bench_auditor_mede_tempo_e_memoria(tmp_path):
+    """Test the auditor benchmark records time and memory peak per stage in its JSON output."""
+    from benchmarks import bench_auditor
+
+    saida = tmp_path / "auditor.json"
+    bench_auditor.main([
+        "--escalas", "200", "--itens", "2", "4", "--proporcao-entradas", "0.5",
+        "--etapas", "leitura", "validacao", "apuracao", "relatorios.demonstrativo_entradas",
+        "relatorios.completo", "exportacao.pdf",
+        "--saida", str(saida),
+    ])
+
+    resultado = json.loads(saida.read_text(encoding="utf-8"))
+    escala = resultado["escalas"]["200"]
+    assert escala["corpus"]["linhas"] >= 200
+    assert set(escala["etapas"]) == {
+        "leitura", "validacao", "apuracao", "relatorios.demonstrativo_entradas",
+        "relatorios.completo", "exportacao.pdf",
+    }
+    for medicao in escala["etapas"].values():
+        assert medicao["segundos"] >= 0
+        assert medicao["pico_mb"] >= 0
@@ -0,0 +1,285 @@
+"""
+Tests for datalake integration (SQL-side apuration).
+"""
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from etl_service.database import Base
+from etl_service.extractor import XMLExtractor
+from etl_service.transformer import DataTransformer
+from fiscal_auditor import ApuradorTributario, TipoTributo
+from datalake_integration import ApuradorDatalake, _consultar_documentos
+
+
+CNPJ_EMPRESA = "12345678000190"
+
+
+@pytest.fixture
+def session_factory():
+    """Datalake em SQLite com as NF-e de exemplo carregadas."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    extractor = XMLExtractor()
+    transformer = DataTransformer()
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+    session = factory()
+    for nome in ("nfe_entrada.xml", "nfe_saida.xml"):
+        dados = extractor.extrair_nfe(os.path.join(base_path, nome))
+        session.add(transformer.transformar_nfe(dados))
+    session.commit()
+    session.close()
+
+    return factory
+
+
+def test_apurar_datalake_igual_apurador_python(session_factory):
+    """Test SQL apuration matches the in-memory apuration."""
+    apurador_sql = ApuradorDatalake(
+        CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31),
+        session_factory=session_factory
+    )
+    mapa_sql = apurador_sql.apurar("01/2024")
+
+    session = session_factory()
+    documentos = _consultar_documentos(session, CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31))
+    session.close()
+
+    apurador = ApuradorTributario()
+    apurador.adicionar_documentos(documentos)
+    mapa = apurador.apurar("01/2024")
+
+    assert len(mapa_sql.apuracoes) == len(mapa.apuracoes)
+    for esperado, obtido in zip(mapa.apuracoes, mapa_sql.apuracoes):
+        assert obtido.tipo == esperado.tipo
+        assert obtido.debitos == esperado.debitos
+        assert obtido.creditos == esperado.creditos
+        assert obtido.saldo == esperado.saldo
+        assert obtido.memoria_calculo.valores == esperado.memoria_calculo.valores
+
+    icms = apurador_sql.calcular_saldo_periodo(TipoTributo.ICMS)
+    assert icms["debitos"] == Decimal("180.00")
+    assert icms["creditos"] == Decimal("90.00")
+    assert icms["saldo"] == Decimal("90.00")
+
+
+def test_apurar_datalake_nao_materializa_documentos(session_factory):
+    """Test documents are only loaded when accessed."""
+    apurador = ApuradorDatalake(
+        CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31),
+        session_factory=session_factory
+    )
+
+    resumo = apurador.obter_resumo()
+    apurador.apurar("01/2024")
+
+    assert resumo["total_documentos"] == 2
+    assert resumo["entradas"] == 1
+    assert resumo["saidas"] == 1
+    assert apurador._documentos is None
+
+    chaves_em_lotes = [doc.chave for doc in apurador.iterar_documentos()]
+    assert apurador._documentos is None
+
+    assert [doc.chave for doc in apurador.documentos] == chaves_em_lotes
+    assert len(chaves_em_lotes) == 2
+
+    # Valores por movimento do resumo (dashboard sem detalhes) iguais aos dos documentos
+    from fiscal_auditor.models import TipoMovimento
+    for movimento, chave in ((TipoMovimento.ENTRADA, "valor_entradas"), (TipoMovimento.SAIDA, "valor_saidas")):
+        assert resumo[chave] == sum(
+            (doc.valor_total for doc in apurador.documentos if doc.tipo_movimento == movimento), Decimal("0")
+        )
+    assert all(doc.items for doc in apurador.documentos)
+
+
+def test_apurar_incremental_igual_apuracao_completa():
+    """Test incremental apuration matches a full one after new and cancelled notes."""
+    from datetime import datetime
+    from etl_service.models import NFe
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    extractor = XMLExtractor()
+    transformer = DataTransformer()
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+    def carregar(nome, data_carga):
+        session = factory()
+        nfe = transformer.transformar_nfe(extractor.extrair_nfe(os.path.join(base_path, nome)))
+        nfe.data_processamento_etl = data_carga
+        nfe.data_atualizacao_etl = data_carga
+        session.add(nfe)
+        session.commit()
+        session.close()
+
+    def novo_apurador():
+        return ApuradorDatalake(
+            CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31),
+            session_factory=factory
+        )
+
+    def comparar(apurador_incremental, mapa_incremental):
+        completo = novo_apurador()
+        mapa = completo.apurar("01/2024")
+        assert apurador_incremental.obter_resumo()['data_mais_antiga'] == completo.obter_resumo()['data_mais_antiga']
+        for esperado, obtido in zip(mapa.apuracoes, mapa_incremental.apuracoes):
+            assert obtido.debitos == esperado.debitos
+            assert obtido.creditos == esperado.creditos
+            assert obtido.saldo == esperado.saldo
+            assert obtido.memoria_calculo.valores == esperado.memoria_calculo.valores
+
+    # Primeira apuração só com a nota de entrada
+    carregar("nfe_entrada.xml", datetime(2024, 2, 1, 10, 0))
+    apurador = novo_apurador()
+    apurador.apurar_acumulavel("01/2024")
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+    assert watermark == datetime(2024, 2, 1, 10, 0)
+
+    # Chega a nota de saída
+    carregar("nfe_saida.xml", datetime(2024, 2, 2, 10, 0))
+    apurador = novo_apurador()
+    assert apurador.acumuladores_compativeis(acumuladores)
+    mapa = apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta == {'novos': 1, 'cancelados': 0}
+    assert apurador.obter_resumo()['total_documentos'] == 2
+    comparar(apurador, mapa)
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+
+    # A nota de entrada, a mais antiga do período, é cancelada
+    session = factory()
+    nfe = session.query(NFe).filter(NFe.tipo_operacao == '0').one()
+    nfe.situacao = 'Cancelada'
+    nfe.data_atualizacao_etl = datetime(2024, 2, 3, 10, 0)
+    session.commit()
+    session.close()
+
+    apurador = novo_apurador()
+    mapa = apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta == {'novos': 0, 'cancelados': 1}
+    assert apurador.obter_resumo()['entradas'] == 0
+    assert apurador.obter_resumo()['data_mais_antiga'].date() == date(2024, 1, 15)
+    assert apurador.calcular_total_creditos(TipoTributo.ICMS) == Decimal("0")
+    comparar(apurador, mapa)
+
+    # Reaplicar sem mudanças no datalake não soma nem subtrai de novo
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+    apurador = novo_apurador()
+    comparar(apurador, apurador.apurar_incremental("01/2024", acumuladores, watermark))
+    assert apurador.delta == {'novos': 0, 'cancelados': 0}
+
+
+def test_apurar_incremental_inclui_carga_com_carimbo_anterior_ao_watermark():
+    """Test a note stamped before the watermark but committed after it is applied exactly once."""
+    from datetime import datetime
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    extractor = XMLExtractor()
+    transformer = DataTransformer()
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+    def carregar(nome, data_carga):
+        session = factory()
+        nfe = transformer.transformar_nfe(extractor.extrair_nfe(os.path.join(base_path, nome)))
+        nfe.data_processamento_etl = data_carga
+        nfe.data_atualizacao_etl = data_carga
+        session.add(nfe)
+        session.commit()
+        session.close()
+
+    def novo_apurador():
+        return ApuradorDatalake(
+            CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31),
+            session_factory=factory, sobreposicao=600
+        )
+
+    carregar("nfe_entrada.xml", datetime(2024, 2, 1, 10, 0))
+    apurador = novo_apurador()
+    apurador.apurar_acumulavel("01/2024")
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+
+    # Outro processo do ETL carimbou a nota 2 minutos antes do watermark, mas só fez commit depois
+    carregar("nfe_saida.xml", datetime(2024, 2, 1, 9, 58))
+
+    apurador = novo_apurador()
+    mapa = apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta == {'novos': 1, 'cancelados': 0}
+    assert apurador.watermark == watermark
+    esperado = novo_apurador().apurar("01/2024")
+    assert [a.saldo for a in mapa.apuracoes] == [a.saldo for a in esperado.apuracoes]
+
+    # A nota de entrada (dentro da sobreposição) não é somada de novo na execução seguinte
+    acumuladores = apurador.exportar_acumuladores()
+    apurador = novo_apurador()
+    apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta == {'novos': 0, 'cancelados': 0}
+    assert apurador.obter_resumo()['total_documentos'] == 2
+
+
+def test_apurar_incremental_refaz_apuracao_completa_se_nota_apurada_foi_alterada():
+    """Test an already applied note updated in place (upsert) triggers a full apuration."""
+    from datetime import datetime
+    from etl_service.models import NFe
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    extractor = XMLExtractor()
+    transformer = DataTransformer()
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+    for nome, data_carga in (("nfe_entrada.xml", datetime(2024, 2, 1, 10, 0)),
+                             ("nfe_saida.xml", datetime(2024, 2, 1, 10, 5))):
+        session = factory()
+        nfe = transformer.transformar_nfe(extractor.extrair_nfe(os.path.join(base_path, nome)))
+        nfe.data_processamento_etl = data_carga
+        nfe.data_atualizacao_etl = data_carga
+        session.add(nfe)
+        session.commit()
+        session.close()
+
+    def novo_apurador():
+        return ApuradorDatalake(
+            CNPJ_EMPRESA, date(2024, 1, 1), date(2024, 1, 31),
+            session_factory=factory, sobreposicao=600
+        )
+
+    apurador = novo_apurador()
+    apurador.apurar_acumulavel("01/2024")
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+
+    # Upsert: a nota de saída, já apurada e dentro da sobreposição, muda de valor
+    session = factory()
+    nfe = session.query(NFe).filter(NFe.tipo_operacao == '1').one()
+    nfe.itens[0].valor_icms += Decimal("100.00")
+    nfe.data_atualizacao_etl = datetime(2024, 2, 2, 10, 0)
+    session.commit()
+    session.close()
+
+    apurador = novo_apurador()
+    mapa = apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta is None
+    assert apurador.watermark == datetime(2024, 2, 2, 10, 0)
+    assert apurador.calcular_total_debitos(TipoTributo.ICMS) == \
+        Decimal(acumuladores['tributos'][TipoTributo.ICMS.value]['debitos']) + Decimal("100.00")
+    esperado = novo_apurador().apurar("01/2024")
+    assert [a.saldo for a in mapa.apuracoes] == [a.saldo for a in esperado.apuracoes]
+
+    # A apuração refeita volta a aceitar a incremental
+    acumuladores, watermark = apurador.exportar_acumuladores(), apurador.watermark
+    apurador = novo_apurador()
+    apurador.apurar_incremental("01/2024", acumuladores, watermark)
+    assert apurador.delta == {'novos': 0, 'cancelados': 0}
@@ -0,0 +1,874 @@
+"""
+Tests for the ETL service (reprocessing, extraction and pipeline).
+"""
+import io
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from etl_service import engines
+from etl_service.consultas_lentas import MonitorConsultas, varreduras_postgres
+from etl_service.database import Base
+from etl_service.engines import opcoes_engine
+from etl_service.extractor import XMLExtractor
+from etl_service.models import ConsultaLenta, NFe, NFeItem
+from etl_service.roteamento import RoteadorLeitura
+from etl_service.transformer import DataTransformer
+from etl_service.reprocessador import (
+    ReprocessadorNFe,
+    COLUNAS_NFE_FASE1,
+    COLUNAS_ITEM_FASE1,
+    extrair_campos_fase1
+)
+
+
+def _criar_datalake():
+    """Datalake em SQLite com as NF-e de exemplo."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    extractor = XMLExtractor()
+    transformer = DataTransformer()
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+    session = factory()
+    for nome in ("nfe_entrada.xml", "nfe_saida.xml"):
+        dados = extractor.extrair_nfe(os.path.join(base_path, nome))
+        session.add(transformer.transformar_nfe(dados))
+    session.commit()
+    session.close()
+
+    return factory
+
+
+def test_extrair_nfe_de_memoria_igual_ao_arquivo():
+    """Test the path API matches bytes, memoryview and stream extraction."""
+    extractor = XMLExtractor()
+    caminho = os.path.join(os.path.dirname(__file__), "fixtures", "nfe_saida.xml")
+    esperado = extractor.extrair_nfe(caminho)
+
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+
+    for dados in (
+        extractor.extrair_nfe_bytes(conteudo, caminho),
+        extractor.extrair_nfe_bytes(memoryview(conteudo), caminho),
+        extractor.extrair_nfe_stream(io.BytesIO(conteudo), caminho),
+    ):
+        dados.pop('data_extracao')
+        assert dados == {k: v for k, v in esperado.items() if k != 'data_extracao'}
+
+
+def test_reprocessar_preenche_somente_campos_vazios():
+    """Test reprocessing fills empty columns and keeps existing values."""
+    factory = _criar_datalake()
+
+    session = factory()
+    entrada, saida = session.query(NFe).order_by(NFe.id).all()
+    natureza_original = saida.natureza_operacao
+    assert natureza_original
+
+    saida.natureza_operacao = None
+    entrada.natureza_operacao = "Valor já corrigido"
+    session.query(NFeItem).update({NFeItem.cnpj_fabricante: None})
+    session.commit()
+    session.close()
+
+    reprocessador = ReprocessadorNFe(
+        COLUNAS_NFE_FASE1,
+        COLUNAS_ITEM_FASE1,
+        extrair_campos_fase1,
+        session_factory=factory,
+        tamanho_lote=1,
+        processos=1
+    )
+    progresso = []
+    stats = reprocessador.executar(progresso=lambda s: progresso.append(s['processadas']))
+
+    assert stats['processadas'] == 2
+    assert stats['erros'] == 0
+    assert progresso == [1, 2]
+
+    session = factory()
+    entrada, saida = session.query(NFe).order_by(NFe.id).all()
+    assert saida.natureza_operacao == natureza_original
+    assert entrada.natureza_operacao == "Valor já corrigido"
+    session.close()
+
+
+def test_reprocessar_grava_valor_zero_somente_em_coluna_nula():
+    """Test reprocessing writes zero values into NULL columns and keeps existing zeros."""
+    factory = _criar_datalake()
+
+    session = factory()
+    entrada, saida = session.query(NFe).order_by(NFe.id).all()
+    entrada.valor_icms_mono = Decimal("0.00")
+    saida.valor_icms_mono = None
+    session.commit()
+    session.close()
+
+    def extrair_com_zero(dados):
+        campos_nfe, campos_itens = extrair_campos_fase1(dados)
+        return {**campos_nfe, 'valor_icms_mono': Decimal("0.00")}, campos_itens
+
+    reprocessador = ReprocessadorNFe(
+        COLUNAS_NFE_FASE1,
+        [],
+        extrair_com_zero,
+        session_factory=factory,
+        processos=1
+    )
+    stats = reprocessador.executar()
+
+    assert stats['erros'] == 0
+    assert stats['atualizadas'] == 1
+
+    session = factory()
+    entrada, saida = session.query(NFe).order_by(NFe.id).all()
+    assert entrada.valor_icms_mono == Decimal("0.00")
+    assert saida.valor_icms_mono == Decimal("0.00")
+    session.close()
+
+
+def test_reprocessar_com_pool_de_processos():
+    """Test reprocessing with a process pool and an invalid XML."""
+    factory = _criar_datalake()
+
+    session = factory()
+    saida = session.query(NFe).filter(NFe.tipo_operacao == '1').one()
+    saida.natureza_operacao = None
+    entrada = session.query(NFe).filter(NFe.tipo_operacao == '0').one()
+    entrada.xml_completo = "<invalido"
+    id_invalido = entrada.id
+    session.commit()
+    session.close()
+
+    reprocessador = ReprocessadorNFe(
+        COLUNAS_NFE_FASE1,
+        COLUNAS_ITEM_FASE1,
+        extrair_campos_fase1,
+        session_factory=factory,
+        processos=2
+    )
+    stats = reprocessador.executar()
+
+    assert stats['processadas'] == 2
+    assert stats['erros'] == 1
+    assert stats['atualizadas'] == 1
+    assert reprocessador.erros[0][0] == id_invalido
+
+    session = factory()
+    assert session.query(NFe).filter(NFe.tipo_operacao == '1').one().natureza_operacao
+    session.close()
+
+
+def test_pipeline_descarta_duplicata_antes_da_extracao(tmp_path, monkeypatch):
+    """Test a re-sent XML is recognised by its access key without being parsed."""
+    import shutil
+    from etl_service import loader as loader_module
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setenv("DELETAR_APOS_PROCESSAR", "false")
+    monkeypatch.setenv("MOVER_PARA_BACKUP", "false")
+
+    origem = os.path.join(os.path.dirname(__file__), "fixtures", "nfe_saida.xml")
+    copias = [shutil.copy(origem, tmp_path / f"copia_{i}.xml") for i in range(2)]
+
+    pipeline = ETLPipeline()
+    extracoes = []
+    extrair_nfe = pipeline.extractor.extrair_nfe
+    monkeypatch.setattr(
+        pipeline.extractor, "extrair_nfe",
+        lambda arquivo: extracoes.append(arquivo) or extrair_nfe(arquivo)
+    )
+
+    primeiro = pipeline.processar_arquivo(str(copias[0]))
+    segundo = pipeline.processar_arquivo(str(copias[1]))
+
+    assert primeiro['sucesso']
+    assert segundo['duplicado']
+    assert segundo['chave_acesso'] == primeiro['chave_acesso']
+    assert extracoes == [str(copias[0])]
+
+    # Nova execução: a chave é encontrada no banco
+    pipeline = ETLPipeline()
+    assert pipeline.processar_arquivo(str(copias[1]))['duplicado']
+
+
+def test_descarte_em_segundo_plano_move_e_registra_em_lote(tmp_path, monkeypatch):
+    """Test background disposal moves files, retries transient errors and records state in bulk."""
+    from etl_service import descarte as descarte_module
+    from etl_service.descarte import DescarteArquivos
+    from etl_service.models import ArquivoProcessado
+
+    # Uma única conexão compartilhada com a thread do worker
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    backup = tmp_path / "backup"
+    monkeypatch.setenv("DELETAR_APOS_PROCESSAR", "false")
+    monkeypatch.setenv("MOVER_PARA_BACKUP", "true")
+    monkeypatch.setenv("DIRETORIO_BACKUP", str(backup))
+    monkeypatch.setattr(descarte_module, "ESPERA_TENTATIVA", 0)
+
+    # Primeira tentativa de renomear falha (ex.: compartilhamento de rede ocupado)
+    falhas = []
+    rename = os.rename
+
+    def rename_instavel(origem, destino):
+        if not falhas:
+            falhas.append(origem)
+            raise PermissionError("arquivo em uso")
+        rename(origem, destino)
+
+    monkeypatch.setattr(descarte_module.os, "rename", rename_instavel)
+
+    session = factory()
+    caminhos = []
+    for i in range(3):
+        caminho = tmp_path / f"nota_{i}.xml"
+        caminho.write_text("<nfeProc/>")
+        caminhos.append(str(caminho))
+        session.add(ArquivoProcessado(
+            caminho_arquivo=str(caminho), nome_arquivo=caminho.name, status='processado'
+        ))
+    session.commit()
+    session.close()
+
+    descarte = DescarteArquivos(session_factory=factory)
+    for caminho in caminhos + [str(tmp_path / "inexistente.xml")]:
+        descarte.agendar(caminho)
+    descarte.finalizar()
+
+    assert descarte.stats == {'descartados': 3, 'erros': 0}
+    assert falhas
+    assert sorted(p.name for p in backup.iterdir()) == ["nota_0.xml", "nota_1.xml", "nota_2.xml"]
+    assert not any(os.path.exists(c) for c in caminhos)
+
+    session = factory()
+    registros = session.query(ArquivoProcessado).order_by(ArquivoProcessado.id).all()
+    assert [r.caminho_backup for r in registros] == [str(backup / f"nota_{i}.xml") for i in range(3)]
+    assert not any(r.deletado for r in registros)
+    session.close()
+
+
+def test_buffer_de_logs_grava_em_lote():
+    """Test buffered log records are inserted in bulk by size and on shutdown."""
+    from datetime import datetime
+    from etl_service.models import LogProcessamento
+    from etl_service.registro_log import BufferLogProcessamento
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    logs = BufferLogProcessamento(session_factory=factory, tamanho_lote=2, intervalo=60)
+    for i in range(5):
+        logs.adicionar(dict(
+            data_hora=datetime.now(), arquivo=f"nota_{i}.xml", status='sucesso',
+            mensagem='NF-e processada com sucesso', tempo_processamento=0.1
+        ))
+    logs.finalizar()
+
+    assert logs.stats == {'gravados': 5, 'gravacoes': 3, 'erros': 0}
+    session = factory()
+    assert [log.arquivo for log in session.query(LogProcessamento).order_by(LogProcessamento.id)] == [
+        f"nota_{i}.xml" for i in range(5)
+    ]
+    session.close()
+
+
+def test_progresso_etl_formata_taxa_e_restante():
+    """Test the progress line shows rate, ETA and counters."""
+    from etl_service.registro_log import ProgressoETL
+
+    linha = ProgressoETL(100).formatar(25, {'processados': 20, 'duplicados': 3, 'erros': 2}, 10.0)
+
+    assert linha == "[25/100] 25% - 2.5 arq/s - Restante: 0.5 min - ✓ 20 ⚠ 3 ✗ 2"
+
+
+def test_opcoes_engine_por_papel(monkeypatch):
+    """Test pool options come from the role prefix and PostgreSQL gets timeouts/read-only."""
+    monkeypatch.setenv("ETL_LEITURA_DB_POOL_SIZE", "3")
+    monkeypatch.delenv("ETL_LEITURA_DB_STATEMENT_TIMEOUT", raising=False)
+
+    leitura = opcoes_engine("datalake_leitura", "postgresql://u:s@replica:5432/fiscal_datalake")
+    escrita = opcoes_engine("datalake", "postgresql://u:s@primario:5432/fiscal_datalake")
+
+    assert leitura["pool_size"] == 3
+    assert leitura["pool_pre_ping"] is True
+    assert leitura["connect_args"]["options"] == (
+        "-c statement_timeout=60000 -c default_transaction_read_only=on"
+    )
+    assert "connect_args" not in escrita
+    assert opcoes_engine("datalake", "sqlite:///datalake.db") == {"pool_pre_ping": True}
+
+
+def test_registro_compartilha_engine_e_conta_conexoes(tmp_path, monkeypatch):
+    """Test the registry returns one engine per role and reports its pool counters."""
+    monkeypatch.setattr(engines, "_engines", {})
+    monkeypatch.setattr(engines, "_metricas", {})
+    monkeypatch.setenv("ETL_READ_DATABASE_URL", f"sqlite:///{tmp_path / 'replica.db'}")
+
+    engine = engines.obter_engine("datalake_leitura")
+    assert engines.obter_engine("datalake_leitura") is engine
+
+    with engine.connect() as conexao:
+        conexao.execute(text("SELECT 1"))
+
+    estatisticas = engines.estatisticas_pools()["datalake_leitura"]
+    assert estatisticas["pool"] == "QueuePool"
+    assert estatisticas["em_uso"] == 0
+    assert estatisticas["conexoes"] == 1
+    assert estatisticas["checkouts"] == 1
+
+    # Registrar de novo o mesmo engine não duplica os listeners nem zera os contadores
+    assert engines.registrar_engine("datalake_leitura", engine) is engine
+    with engine.connect() as conexao:
+        conexao.execute(text("SELECT 1"))
+    assert engines.estatisticas_pools()["datalake_leitura"]["checkouts"] == 2
+    engine.dispose()
+
+
+def test_portal_admin_compartilha_engine_do_datalake(tmp_path):
+    """Test the admin portal and etl_service.database share the registered datalake engine."""
+    import subprocess
+    import sys
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        ETL_DATABASE_URL=f"sqlite:///{tmp_path / 'datalake.db'}",
+        FISCAL_AUDITOR_DATABASE_URL=f"sqlite:///{tmp_path / 'fiscal_auditor.db'}",
+    )
+    env.pop("ADMIN_DATABASE_URL", None)
+    # Processo separado: aqui etl_service.database já foi importado por outros testes
+    codigo = (
+        "import admin_portal.app_admin as app_admin\n"
+        "import etl_service.database as database\n"
+        "from etl_service.engines import obter_engine\n"
+        "app_admin.scheduler.shutdown(wait=False)\n"
+        "assert database.engine is obter_engine('datalake')\n"
+        "with app_admin.app.app_context():\n"
+        "    assert app_admin.db.engine is obter_engine('datalake')\n"
+    )
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=tmp_path, env=dict(env, PYTHONPATH=raiz),
+        capture_output=True, text=True, timeout=120,
+    )
+    assert resultado.returncode == 0, resultado.stderr
+
+
+def test_banco_fiscal_auditor_importa_sem_etl_service(tmp_path, monkeypatch):
+    """Test the packaged fiscal_auditor.database builds its own engine when etl_service is absent."""
+    import importlib.util
+    import sys
+
+    import fiscal_auditor.database
+
+    monkeypatch.setitem(sys.modules, "etl_service.engines", None)
+    monkeypatch.setenv("FISCAL_AUDITOR_DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+
+    spec = importlib.util.spec_from_file_location("fiscal_auditor_database_isolado",
+                                                  fiscal_auditor.database.__file__)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+
+    assert modulo.obter_engine is None
+    assert modulo.engine.url.database == str(tmp_path / "app.db")
+    modulo.engine.dispose()
+
+
+def test_roteador_usa_primario_quando_replica_atrasada(tmp_path):
+    """Test reads go to the replica unless it has not reached the caller's watermark."""
+    primario = create_engine(f"sqlite:///{tmp_path / 'primario.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    carga_antiga, carga_nova = datetime(2024, 1, 1), datetime(2024, 1, 2)
+
+    for engine, cargas in ((primario, (carga_antiga, carga_nova)), (replica, (carga_antiga,))):
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.add_all([
+            NFe(chave_acesso=str(i) * 44, numero_nota=str(i), serie="1", modelo="55",
+                data_emissao=carga, data_processamento_etl=carga, data_atualizacao_etl=carga)
+            for i, carga in enumerate(cargas, 1)
+        ])
+        session.commit()
+        session.close()
+
+    roteador = RoteadorLeitura(replica, primario, cache_segundos=60)
+
+    assert roteador.escolher_engine() is replica
+    assert roteador.escolher_engine(carga_antiga) is replica
+    assert roteador.escolher_engine(carga_nova) is primario
+    assert roteador.watermark_replica() == carga_antiga
+    assert roteador.stats == {"replica": 2, "primario": 1, "atrasos": 1}
+
+    session = roteador.sessao(carga_nova)
+    assert session.query(NFe).count() == 2
+    session.close()
+
+
+def test_pipeline_grava_tempos_por_etapa(tmp_path, monkeypatch):
+    """Test a run stores per-stage timings and exports them as a Prometheus histogram."""
+    import shutil
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.metricas import BUCKETS, formatar_histograma, ler_resumo, metricas_processamentos
+    from etl_service.models import ProcessamentoETL
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_METRICAS_TEXTFILE", str(tmp_path / "metricas" / "etl.prom"))
+
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    shutil.copy(os.path.join(os.path.dirname(__file__), "fixtures", "nfe_saida.xml"), xmls / "nota.xml")
+
+    ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+
+    session = Session()
+    resumo = ler_resumo(session.query(ProcessamentoETL.tempos_etapas).scalar())
+    assert {"descoberta", "deduplicacao", "leitura", "parse", "extracao", "transformacao", "banco_lote"} <= set(resumo)
+    assert resumo["parse"]["contagem"] == 1
+    assert resumo["extracao.itens"]["contagem"] == 1
+    assert resumo["extracao.totais"]["contagem"] == 1
+    assert list(resumo).index("extracao") < list(resumo).index("extracao.itens") < list(resumo).index("banco_lote")
+    assert sum(resumo["parse"]["buckets"]) == 1
+    assert len(resumo["parse"]["buckets"]) == len(BUCKETS) + 1
+
+    linhas = metricas_processamentos(session)
+    session.close()
+    assert 'fiscal_etl_etapa_segundos_bucket{etapa="parse",le="+Inf"} 1' in linhas
+    assert 'fiscal_etl_etapa_segundos_count{etapa="parse"} 1' in linhas
+    assert 'fiscal_etl_execucoes_total{status="concluido"} 1' in linhas
+    assert formatar_histograma(resumo)[2] in (tmp_path / "metricas" / "etl.prom").read_text(encoding="utf-8")
+
+
+def test_monitor_grava_consulta_lenta_com_varredura_sequencial(tmp_path):
+    """Test slow statements are stored with params and origin, and seq scans on nfe are flagged."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'datalake.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    # Leituras do teste por outro engine, não medido pelo monitor
+    leitura = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'datalake.db'}"))
+
+    monitor = MonitorConsultas(session_factory=factory, limite_ms=0, amostragem=1, intervalo_explain=300)
+    monitor.instrumentar('datalake', engine)
+
+    with engine.connect() as conexao:
+        for _ in range(2):
+            conexao.execute(text("SELECT id FROM nfe WHERE natureza_operacao = :natureza"), {"natureza": "VENDA"})
+        conexao.execute(text("SELECT id FROM nfe WHERE chave_acesso = :chave"), {"chave": "1" * 44})
+    monitor.finalizar(timeout=10)
+
+    session = leitura()
+    consultas = session.query(ConsultaLenta).order_by(ConsultaLenta.id).all()
+    session.close()
+
+    assert len(consultas) == 3
+    assert monitor.stats['gravadas'] == 3
+    assert all(c.engine == 'datalake' and c.origem and 'test_etl_service.py' in c.origem for c in consultas)
+    assert "'VENDA'" in consultas[0].parametros
+
+    # Varredura completa em nfe; a repetição da instrução não refaz o EXPLAIN
+    assert consultas[0].varredura_sequencial is True
+    assert consultas[0].tabelas_varridas == 'nfe'
+    assert consultas[1].plano is None
+    # Busca pela chave usa o índice único
+    assert consultas[2].varredura_sequencial is False
+    assert monitor.stats['explains'] == 2
+
+    plano = [{"Plan": {"Node Type": "Nested Loop", "Plans": [
+        {"Node Type": "Index Scan", "Relation Name": "nfe"},
+        {"Node Type": "Seq Scan", "Relation Name": "nfe_item"},
+        {"Node Type": "Seq Scan", "Relation Name": "empresa"},
+    ]}}]
+    assert varreduras_postgres(plano) == ['nfe_item']
+
+    # Depois de finalizado, uma nova consulta lenta reinicia a gravação
+    with engine.connect() as conexao:
+        conexao.execute(text("SELECT id FROM nfe WHERE chave_acesso = :chave"), {"chave": "2" * 44})
+    monitor.finalizar(timeout=10)
+    session = leitura()
+    assert session.query(ConsultaLenta).filter(ConsultaLenta.parametros.contains("2" * 44)).count() == 1
+    session.close()
+
+
+def test_pipeline_retoma_execucao_abandonada_do_checkpoint(tmp_path, monkeypatch):
+    """Test an interrupted directory run is taken over and resumed from its last committed batch."""
+    import shutil
+
+
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.models import ProcessamentoArquivo, ProcessamentoETL
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_CHECKPOINT_LOTE", "1")
+    monkeypatch.setenv("ETL_CHECKPOINT_EXPIRACAO", "0")
+    # Queda simulada em processar_arquivo, usado pelo processamento sequencial
+    monkeypatch.setenv("ETL_PIPELINE_ESTAGIOS", "false")
+
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    for nome in ("nfe_entrada.xml", "nfe_saida.xml"):
+        shutil.copy(os.path.join(os.path.dirname(__file__), "fixtures", nome), xmls / nome)
+
+    # Queda do processo no segundo arquivo, depois do checkpoint do primeiro
+    pipeline = ETLPipeline()
+    original = pipeline.processar_arquivo
+
+    def processar_e_cair(arquivo, processamento_id=None):
+        if arquivo.endswith("nfe_saida.xml"):
+            raise KeyboardInterrupt
+        return original(arquivo, processamento_id)
+
+    monkeypatch.setattr(pipeline, "processar_arquivo", processar_e_cair)
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.processar_diretorio(str(xmls), recursivo=False)
+
+    session = Session()
+    processamento = session.query(ProcessamentoETL).one()
+    assert (processamento.status, processamento.posicao_checkpoint, processamento.total_arquivos) == ("executando", 1, 2)
+    assert session.query(ProcessamentoArquivo).count() == 2
+
+    # Processo de outro host que parou de gravar checkpoints
+    processamento.executor = "outro-host:1"
+    session.commit()
+    session.close()
+
+    # Arquivo já concluído não é relido na retomada
+    monkeypatch.setattr(ETLPipeline, "_localizar_arquivos_xml", lambda *args: pytest.fail("varredura refeita"))
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["total_arquivos"], stats["processados"], stats["erros"]) == (2, 2, 0)
+
+    session = Session()
+    processamento = session.query(ProcessamentoETL).one()
+    assert (processamento.status, processamento.posicao_checkpoint) == ("concluido", 2)
+    assert session.query(NFe).count() == 2
+    # Lista de arquivos apagada ao concluir
+    assert session.query(ProcessamentoArquivo).count() == 0
+    session.close()
+
+    with pytest.raises(ValueError, match="concluído"):
+        ETLPipeline().retomar_processamento(processamento.id)
+
+
+def test_pipeline_em_estagios_carrega_em_lote_e_mede_filas(tmp_path, monkeypatch):
+    """Test the staged pipeline loads in batched commits, flags duplicates and reports stage usage."""
+    import shutil
+
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.models import ArquivoProcessado, ProcessamentoETL
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_PIPELINE_ESTAGIOS", "true")
+    monkeypatch.setenv("ETL_TAMANHO_FILA", "1")
+    monkeypatch.setenv("ETL_CARGA_LOTE", "10")
+
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+    shutil.copy(os.path.join(fixtures, "nfe_entrada.xml"), xmls / "a.xml")
+    shutil.copy(os.path.join(fixtures, "nfe_saida.xml"), xmls / "b.xml")
+    shutil.copy(os.path.join(fixtures, "nfe_saida.xml"), xmls / "c_copia.xml")
+    (xmls / "d_invalido.xml").write_text("<nfeProc>", encoding="utf-8")
+
+    lotes = []
+    original = loader_module.DataLoader.carregar_lote
+
+    def carregar_lote(self, documentos, processamento_id=None):
+        lotes.append(len(documentos))
+        return original(self, documentos, processamento_id)
+
+    monkeypatch.setattr(loader_module.DataLoader, "carregar_lote", carregar_lote)
+
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+
+    assert (stats["processados"], stats["duplicados"], stats["erros"]) == (2, 1, 1)
+    assert sum(lotes) in (2, 3)
+    assert set(stats["estagios"]["estagios"]) == {"leitura", "parse", "carga"}
+    assert stats["estagios"]["estagios"]["leitura"]["itens"] == 4
+    assert stats["estagios"]["filas"]["leitura"]["capacidade"] == 1
+
+    session = Session()
+    assert session.query(NFe).count() == 2
+    assert session.query(ArquivoProcessado).filter(ArquivoProcessado.status == "processado").count() == 2
+    processamento = session.query(ProcessamentoETL).one()
+    assert (processamento.status, processamento.posicao_checkpoint) == ("concluido", 4)
+    session.close()
+
+
+def test_estagios_so_contam_arquivos_ate_a_posicao_do_checkpoint():
+    """Test files finished out of order only reach the stats once the contiguous position passes them."""
+    from etl_service.estagios import _FIM, PipelineEstagios
+    from etl_service.pipeline import ETLPipeline
+
+    pipeline = ETLPipeline.__new__(ETLPipeline)
+    pipeline.stats = {'processados': 0, 'duplicados': 0, 'atualizados': 0, 'documentos': {},
+                      'ignorados': 0, 'erros': 0}
+    estagios = PipelineEstagios(pipeline)
+
+    def gravar_lote(itens, processamento_id):
+        for item in itens:
+            estagios._contabilizar(item, {'sucesso': True, 'duplicado': False, 'chave_acesso': None})
+        return [item['indice'] for item in itens]
+
+    estagios._gravar_lote = gravar_lote
+
+    # O arquivo 2 espera o lote; o 3 termina antes dele e o 1 por último
+    for item in ({'tipo': 'documento', 'indice': 2, 'arquivo': 'b.xml'},
+                 {'tipo': 'erro', 'indice': 3, 'arquivo': 'c.xml', 'mensagem': 'XML inválido'},
+                 {'tipo': 'ja_carregado', 'indice': 1, 'arquivo': 'a.xml'}):
+        estagios.filas['carga'].put(item)
+    estagios.filas['carga'].put(_FIM)
+
+    checkpoints = []
+    estagios._carregar(None, 0, lambda posicao: checkpoints.append((posicao, dict(pipeline.stats))))
+
+    assert [(posicao, stats['duplicados'], stats['erros']) for posicao, stats in checkpoints] == [(1, 1, 0), (3, 1, 1)]
+    assert (pipeline.stats['processados'], pipeline.stats['duplicados'], pipeline.stats['erros']) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("estagios", ["true", "false"])
+def test_pipeline_upsert_atualiza_nfe_existente_de_forma_idempotente(tmp_path, monkeypatch, estagios):
+    """Test upsert mode refills changed columns, replaces items and only bumps the watermark on real changes."""
+    import shutil
+
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.models import LogProcessamento, ProcessamentoETL
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_PIPELINE_ESTAGIOS", estagios)
+    monkeypatch.setenv("ETL_RETOMAR_ABANDONADAS", "false")
+
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    shutil.copy(os.path.join(os.path.dirname(__file__), "fixtures", "nfe_entrada.xml"), xmls / "a.xml")
+
+    ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+
+    # Simula uma carga antiga: coluna não preenchida e item divergente
+    antiga = datetime(2020, 1, 1)
+    session = Session()
+    nfe = session.query(NFe).one()
+    natureza, valor_item, total_itens = nfe.natureza_operacao, nfe.itens[0].valor_total_item, len(nfe.itens)
+    nfe.natureza_operacao = None
+    nfe.itens[0].valor_total_item = valor_item + 1
+    session.commit()
+    session.query(NFe).update({NFe.data_atualizacao_etl: antiga})
+    session.commit()
+    session.close()
+
+    # No modo padrão a NF-e existente continua sendo duplicata
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["duplicados"], stats["atualizados"]) == (1, 0)
+
+    stats = ETLPipeline(modo_carga="upsert").processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["atualizados"], stats["erros"]) == (1, 1, 0)
+
+    session = Session()
+    nfe = session.query(NFe).one()
+    assert nfe.natureza_operacao == natureza
+    assert len(nfe.itens) == total_itens
+    assert nfe.itens[0].valor_total_item == valor_item
+    atualizada = nfe.data_atualizacao_etl
+    assert atualizada > antiga
+    session.close()
+
+    # O mesmo XML de novo não altera nada, nem a marca d'água
+    stats = ETLPipeline(modo_carga="upsert").processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["atualizados"]) == (1, 0)
+
+    session = Session()
+    assert session.query(NFe).one().data_atualizacao_etl == atualizada
+    assert session.query(LogProcessamento).filter(LogProcessamento.status == "atualizado").count() == 2
+    assert [p.modo_carga for p in session.query(ProcessamentoETL).order_by(ProcessamentoETL.id)] == \
+        ["inserir", "inserir", "upsert", "upsert"]
+    session.close()
+
+
+def test_extrator_eventos_le_cancelamento_e_retorno():
+    """Test the event extractor reads infEvento/retEvento fields without the full NF-e parser."""
+    from etl_service.eventos import ExtratorEventos
+    from etl_service.plugins import plugin_para
+
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "evento_cancelamento.xml"), "rb") as f:
+        conteudo = f.read()
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "nfe_saida.xml"), "rb") as f:
+        assert plugin_para(f.read()) is None
+    assert plugin_para(conteudo).nome == "evento"
+
+    [evento] = ExtratorEventos().extrair_eventos_bytes(conteudo, "cancelamento.xml")
+
+    assert evento["chave_acesso"] == "35240112345678000190550010000001231000000123"
+    assert (evento["tipo_evento"], evento["sequencia"], evento["codigo_status"]) == ("110111", 1, "135")
+    assert evento["protocolo_nfe"] == "135240000000123"
+    assert evento["protocolo_evento"] == "135240000000999"
+    assert evento["data_evento"] == datetime(2024, 1, 16, 9, 30)
+
+
+@pytest.mark.parametrize("estagios", ["true", "false"])
+def test_pipeline_carrega_eventos_e_cancela_nfe(tmp_path, monkeypatch, estagios):
+    """Test event files bypass the NF-e parser, are idempotent and cancel notes loaded before or after them."""
+    import shutil
+
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.models import NFeEvento
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_PIPELINE_ESTAGIOS", estagios)
+    monkeypatch.setenv("ETL_RETOMAR_ABANDONADAS", "false")
+
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    # O cancelamento vem antes da nota na ordem de processamento
+    shutil.copy(os.path.join(fixtures, "evento_cancelamento.xml"), xmls / "a_cancelamento.xml")
+    shutil.copy(os.path.join(fixtures, "nfe_saida.xml"), xmls / "b_saida.xml")
+    shutil.copy(os.path.join(fixtures, "nfe_entrada.xml"), xmls / "c_entrada.xml")
+
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["documentos"].get("evento"), stats["erros"]) == (3, 1, 0)
+
+    session = Session()
+    situacoes = dict(session.query(NFe.numero_nota, NFe.situacao))
+    assert situacoes["123"] == "Cancelada"
+    assert situacoes["456"] != "Cancelada"
+    assert session.query(NFeEvento).one().justificativa.startswith("Erro na digitacao")
+    session.close()
+
+    # O mesmo evento em outro arquivo não é gravado de novo
+    (xmls / "a_cancelamento.xml").rename(xmls / "d_cancelamento_copia.xml")
+    for nome in ("b_saida.xml", "c_entrada.xml"):
+        (xmls / nome).unlink()
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["duplicados"], stats["documentos"]) == (0, 1, {})
+
+    session = Session()
+    assert session.query(NFeEvento).count() == 1
+    session.close()
+
+
+def test_extrator_cte_le_participantes_icms_e_documentos():
+    """Test the CT-e plugin extracts the taker, ICMS and transported NF-e keys into a CTe model."""
+    from etl_service.plugins import plugin_para
+    from etl_service.metricas import TemporizadorEtapas
+
+    with open(os.path.join(os.path.dirname(__file__), "fixtures", "cte.xml"), "rb") as f:
+        conteudo = f.read()
+    plugin = plugin_para(conteudo)
+    assert plugin.nome == "cte"
+
+    cte = plugin.extrair(conteudo, "cte.xml", TemporizadorEtapas())
+
+    assert cte.chave_acesso == "35240198765432000110570010000007891000007890"
+    assert (cte.numero_cte, cte.modelo, cte.data_emissao) == ("789", "57", datetime(2024, 1, 15, 14, 0))
+    assert (cte.tomador_tipo, cte.tomador_cnpj) == ("0", "12345678000190")
+    assert (cte.valor_total_prestacao, cte.valor_icms, cte.aliquota_icms) == \
+        (Decimal("350.00"), Decimal("42.00"), Decimal("12.00"))
+    assert cte.situacao == "Autorizada"
+    assert [documento.chave_nfe for documento in cte.documentos] == \
+        ["35240112345678000190550010000001231000000123"]
+
+
+@pytest.mark.parametrize("estagios", ["true", "false"])
+def test_pipeline_pasta_mista_roteia_pelo_elemento_raiz(tmp_path, monkeypatch, estagios):
+    """Test a mixed folder loads NF-e, events and CT-e in one pass and skips NFS-e without a plugin."""
+    import shutil
+
+    from etl_service import database as database_module, loader as loader_module
+    from etl_service.models import ArquivoProcessado, CTe, CTeDocumento
+    from etl_service.pipeline import ETLPipeline
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(loader_module, "SessionLocal", Session)
+    monkeypatch.setattr(database_module, "SessionLocal", Session)
+    for variavel in ("DELETAR_APOS_PROCESSAR", "MOVER_PARA_BACKUP", "LOG_EM_LOTE", "DESCARTE_EM_SEGUNDO_PLANO"):
+        monkeypatch.setenv(variavel, "false")
+    monkeypatch.setenv("ETL_PIPELINE_ESTAGIOS", estagios)
+    monkeypatch.setenv("ETL_RETOMAR_ABANDONADAS", "false")
+
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+    xmls = tmp_path / "xml"
+    xmls.mkdir()
+    shutil.copy(os.path.join(fixtures, "cte.xml"), xmls / "a_cte.xml")
+    shutil.copy(os.path.join(fixtures, "evento_cancelamento.xml"), xmls / "b_cancelamento.xml")
+    shutil.copy(os.path.join(fixtures, "nfe_saida.xml"), xmls / "c_saida.xml")
+    (xmls / "d_nfse.xml").write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<CompNfse xmlns="http://www.abrasf.org.br/nfse.xsd"><Nfse><InfNfse><Numero>1</Numero></InfNfse></Nfse></CompNfse>'
+    )
+
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["ignorados"], stats["erros"]) == (3, 1, 0)
+    assert stats["documentos"] == {"cte": 1, "evento": 1}
+
+    session = Session()
+    cte = session.query(CTe).one()
+    assert cte.emitente_nome == "Transportadora Exemplo Ltda"
+    assert session.query(CTeDocumento.chave_nfe).scalar() == session.query(NFe.chave_acesso).scalar()
+    assert session.query(NFe.situacao).scalar() == "Cancelada"
+    ignorados = session.query(ArquivoProcessado.caminho_arquivo).filter(ArquivoProcessado.status == "ignorado").all()
+    assert ignorados == [(str(xmls / "d_nfse.xml"),)]
+    session.close()
+
+    # Reprocessar o CT-e em outro arquivo: duplicata; a NFS-e continua sem plugin e é pulada pelo caminho
+    (xmls / "a_cte.xml").rename(xmls / "e_cte_copia.xml")
+    for nome in ("b_cancelamento.xml", "c_saida.xml"):
+        (xmls / nome).unlink()
+    (xmls / "d_nfse.xml").write_text("<nfse-alterada-nao-relida")
+    stats = ETLPipeline().processar_diretorio(str(xmls), recursivo=False)
+    assert (stats["processados"], stats["duplicados"], stats["ignorados"], stats["erros"]) == (0, 1, 1, 0)
+    session = Session()
+    assert session.query(ArquivoProcessado).filter(ArquivoProcessado.status == "ignorado").count() == 1
+    session.close()
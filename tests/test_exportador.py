@@ -0,0 +1,51 @@
+"""
+Tests for exportador module.
+"""
+import os
+from openpyxl import load_workbook
+from fiscal_auditor import XMLReader, ValidadorTributario, ApuradorTributario
+from fiscal_auditor.exportador import ExportadorRelatorios
+
+
+def test_gerar_excel_streaming_igual_ao_excel():
+    """Test write-only Excel export has the same sheets, values and styles."""
+    reader = XMLReader("12345678000190")
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+    documentos = [
+        reader.ler_xml(os.path.join(base_path, nome))
+        for nome in ("nfe_entrada.xml", "nfe_saida.xml")
+    ]
+    validador = ValidadorTributario()
+    validacoes = [validador.validar_documento(doc) for doc in documentos]
+    apurador = ApuradorTributario()
+    apurador.adicionar_documentos(documentos)
+
+    dados = {
+        "mapa": apurador.apurar("01/2024"),
+        "documentos": documentos,
+        "validacoes": validacoes,
+        "empresa": {"cnpj": "12345678000190", "razao_social": "Empresa Teste"}
+    }
+
+    esperado = load_workbook(ExportadorRelatorios.gerar_excel(dados))
+
+    # Documentos e validações como iteradores de uma única passada
+    caminho = ExportadorRelatorios.gerar_excel_streaming(
+        {**dados, "documentos": iter(documentos), "validacoes": iter(validacoes)}
+    )
+    try:
+        obtido = load_workbook(caminho)
+    finally:
+        os.remove(caminho)
+
+    assert obtido.sheetnames == esperado.sheetnames
+    for nome in esperado.sheetnames:
+        linhas_esperadas = [l for l in esperado[nome].values if l[0] != "Data do Relatório:"]
+        linhas_obtidas = [l for l in obtido[nome].values if l[0] != "Data do Relatório:"]
+        assert linhas_obtidas == linhas_esperadas
+
+    cabecalho = obtido["Documentos"]["A1"]
+    assert cabecalho.font.b
+    assert cabecalho.fill.fgColor.rgb.endswith("4472C4")
+    assert obtido["Documentos"]["H2"].number_format == '#,##0.00'
+    assert obtido["Entradas"]["A3"].value == "Documento"
@@ -1,6 +1,8 @@
 """
 Integration tests using sample XML files.
 """
+import io
+import mmap
 import os
 from decimal import Decimal
 from fiscal_auditor import (
@@ -51,6 +53,30 @@ def test_ler_nfe_saida():
     assert icms.aliquota == Decimal("18.00")
 
 
+def test_ler_nfe_de_memoria():
+    """Test reading NF-e from bytes, memoryview, mmap and file objects."""
+    reader = XMLReader("12345678000190")
+    xml_path = os.path.join(os.path.dirname(__file__), "fixtures", "nfe_saida.xml")
+    esperado = reader.ler_xml(xml_path)
+
+    with open(xml_path, "rb") as f:
+        conteudo = f.read()
+        f.seek(0)
+        do_stream = reader.ler_xml_stream(f)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapeado:
+            do_mmap = reader.ler_xml_bytes(mapeado)
+
+    for doc in (
+        reader.ler_xml_bytes(conteudo),
+        reader.ler_xml_bytes(memoryview(conteudo)),
+        reader.ler_xml_bytes(conteudo.decode("utf-8")),
+        reader.ler_xml_stream(io.BytesIO(conteudo)),
+        do_stream,
+        do_mmap,
+    ):
+        assert doc == esperado
+
+
 def test_ler_nfe_entrada():
     """Test reading NF-e de entrada."""
     # CNPJ da empresa destinatária
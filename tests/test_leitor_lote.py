@@ -0,0 +1,64 @@
+"""
+Tests for the memory-mapped batch XML reader.
+"""
+import os
+
+from etl_service.extractor import XMLExtractor
+from etl_service.leitor_lote import LeitorLoteXML, localizar_documentos
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+CAMPOS_DE_ORIGEM = ('arquivo_original', 'tamanho_arquivo', 'data_extracao')
+
+
+def _criar_dump(tmp_path):
+    """Concatena as NF-e de exemplo em um único arquivo, como nos dumps de ERP."""
+    partes = [b'<?xml version="1.0" encoding="UTF-8"?>\n<lote>\n']
+    for nome in ("nfe_entrada.xml", "nfe_saida.xml", "nfe_saida.xml"):
+        with open(os.path.join(FIXTURES, nome), "rb") as f:
+            conteudo = f.read()
+        partes.append(conteudo[conteudo.index(b"<nfeProc"):])
+    partes.append(b'\n<nfeProcInvalido/>\n<nfeProc>quebrado</nfeProc>\n</lote>\n')
+
+    caminho = tmp_path / "dump.xml"
+    caminho.write_bytes(b"".join(partes))
+    return str(caminho)
+
+
+def _sem_origem(dados):
+    return {k: v for k, v in dados.items() if k not in CAMPOS_DE_ORIGEM}
+
+
+def test_localizar_documentos_por_offset():
+    """Test boundaries are found by byte offsets, ignoring prefixed tags."""
+    buffer = b'<a><nfeProc x="1">A</nfeProc><nfeProcX/><nfeProc>B</nfeProc></a>'
+
+    fatias = [buffer[i:f] for i, f in localizar_documentos(buffer)]
+
+    assert fatias == [b'<nfeProc x="1">A</nfeProc>', b'<nfeProc>B</nfeProc>']
+
+
+def test_leitor_lote_igual_aos_arquivos_individuais(tmp_path):
+    """Test each slice extracts the same data as the standalone files, with and without a pool."""
+    caminho = _criar_dump(tmp_path)
+    extractor = XMLExtractor()
+    esperados = [
+        _sem_origem(extractor.extrair_nfe(os.path.join(FIXTURES, nome)))
+        for nome in ("nfe_entrada.xml", "nfe_saida.xml", "nfe_saida.xml")
+    ]
+
+    for processos in (1, 2):
+        leitor = LeitorLoteXML(caminho, processos=processos, documentos_por_tarefa=2)
+        assert leitor.contar() == 4
+
+        resultados = list(leitor)
+
+        assert [_sem_origem(dados) for _, dados, _ in resultados[:3]] == esperados
+        assert all(erro is None for _, _, erro in resultados[:3])
+        assert resultados[0][0].startswith(caminho + "#")
+        assert resultados[0][1]['arquivo_original'] == resultados[0][0]
+
+        # Documento inválido não interrompe a leitura
+        origem, dados, erro = resultados[3]
+        assert dados is None
+        assert "NF-e válida" in erro
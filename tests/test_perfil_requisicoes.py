@@ -0,0 +1,64 @@
+"""
+Tests for the request profiling middleware.
+"""
+import asyncio
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from perfil_requisicoes import MonitorPerfil, instalar_perfil
+
+
+def _chamar(app, caminho, cabecalhos=()):
+    """Run one GET request through the ASGI app and return (status, headers, body)."""
+    mensagens = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(mensagem):
+        mensagens.append(mensagem)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": caminho, "raw_path": caminho.encode(),
+        "query_string": b"", "root_path": "", "headers": list(cabecalhos),
+        "client": ("127.0.0.1", 1234), "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+
+    inicio = next(m for m in mensagens if m["type"] == "http.response.start")
+    corpo = b"".join(m.get("body", b"") for m in mensagens if m["type"] == "http.response.body")
+    return inicio["status"], dict(inicio["headers"]), corpo
+
+
+def test_perfil_conta_sql_repetido_e_grava_perfil(tmp_path):
+    """Test SQL statements are counted per route, repeats are flagged and header-triggered dumps are written."""
+    engine = create_engine("sqlite://")
+    app = FastAPI()
+    monitor = instalar_perfil(app, MonitorPerfil(amostragem=0, diretorio=str(tmp_path), ferramenta="cprofile"))
+
+    @app.get("/itens/{item_id}")
+    async def obter_item(item_id: int):
+        with engine.connect() as conexao:
+            # N+1: a mesma consulta repetida por item
+            valores = [conexao.execute(text("SELECT :v"), {"v": i}).scalar() for i in range(6)]
+        return {"item": item_id, "valores": valores}
+
+    status, cabecalhos, corpo = _chamar(app, "/itens/1")
+    assert status == 200
+    assert b'"valores":[0,1,2,3,4,5]' in corpo
+    assert b'desc="6 consultas"' in cabecalhos[b"server-timing"]
+    assert not list(tmp_path.iterdir())
+
+    _chamar(app, "/itens/2", [(b"x-perfil", b"1")])
+    assert len(list(tmp_path.glob("*.prof"))) == 1
+
+    resumo = monitor.resumo_rotas()
+    rota = resumo["rotas"][0]
+    assert rota["rota"] == "GET /itens/{item_id}"
+    assert rota["requisicoes"] == 2
+    assert rota["sql_media_consultas"] == 6
+    assert rota["consultas_repetidas"][0]["max_por_requisicao"] == 6
+    assert resumo["requisicoes_lentas"][0]["serializacao_ms"] >= 0
+    assert sum(1 for r in resumo["requisicoes_lentas"] if r["arquivo_perfil"]) == 1
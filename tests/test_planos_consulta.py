@@ -0,0 +1,99 @@
+"""
+Query-plan regression tests for the datalake indexes.
+
+Run EXPLAIN QUERY PLAN (SQLite) on the standard company/period filter (one
+UNION branch per CNPJ column) and the NCM/CFOP aggregates, and check they are
+answered by the composite indexes.
+"""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import create_engine, event, func, text
+from sqlalchemy.orm import sessionmaker
+
+from etl_service.database import Base
+from etl_service.models import NFe, NFeItem
+from datalake_integration import _filtros_periodo, contar_documentos_periodo
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _plano(session, consulta) -> str:
+    """Retorna o plano de execução da consulta como texto."""
+    sql = consulta.statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True})
+    return "\n".join(linha[3] for linha in session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def _filtros():
+    return _filtros_periodo("12345678000190", date(2024, 1, 1), date(2024, 1, 31))
+
+
+def test_filtro_empresa_periodo_usa_indices_compostos(session):
+    """Test each UNION branch seeks its own (cnpj, data_emissao) index, with no OR on CNPJ."""
+    plano = _plano(session, session.query(NFe.id).filter(*_filtros()))
+
+    assert "MULTI-INDEX OR" not in plano
+    assert "USING INDEX ix_nfe_emitente_data_emissao (emitente_cnpj=? AND data_emissao>? AND data_emissao<?)" in plano
+    assert "USING INDEX ix_nfe_destinatario_data_emissao (destinatario_cnpj=? AND data_emissao>? AND data_emissao<?)" in plano
+    assert "SCAN nfe" not in plano.splitlines()
+
+
+def test_contagem_periodo_uma_consulta_sem_duplicar(session):
+    """Test counts come from one query and a note issued to the company itself is counted once."""
+    cnpj = "12345678000190"
+    emissao = datetime(2024, 1, 10)
+    notas = [
+        ("1", cnpj, "99999999000199", "1", emissao),
+        ("2", "99999999000199", cnpj, "0", emissao),
+        ("3", cnpj, cnpj, "0", emissao),
+        ("4", cnpj, None, "1", datetime(2024, 2, 10)),
+    ]
+    session.add_all([
+        NFe(chave_acesso=numero * 44, numero_nota=numero, serie="1", modelo="55",
+            emitente_cnpj=emitente, destinatario_cnpj=destinatario,
+            tipo_operacao=tipo, data_emissao=data)
+        for numero, emitente, destinatario, tipo, data in notas
+    ])
+    session.commit()
+
+    consultas = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: consultas.append(args[2]))
+    contagens = contar_documentos_periodo(session, "12.345.678/0001-90", date(2024, 1, 1), date(2024, 1, 31))
+
+    assert contagens == {"total": 3, "entradas": 2, "saidas": 1}
+    assert len(consultas) == 1
+    assert session.query(NFe.id).filter(*_filtros()).count() == 3
+
+
+@pytest.mark.parametrize("coluna", [NFeItem.ncm, NFeItem.cfop])
+def test_agregacao_itens_usa_indice_por_nfe(session, coluna):
+    """Test NCM/CFOP aggregates join nfe_item through an index and never scan it."""
+    consulta = session.query(
+        coluna, func.sum(NFeItem.valor_total_item), func.sum(NFeItem.valor_icms)
+    ).join(
+        NFe, NFe.id == NFeItem.nfe_id
+    ).filter(*_filtros()).group_by(coluna)
+
+    plano = _plano(session, consulta)
+
+    assert not any(linha.startswith("SCAN") for linha in plano.splitlines())
+    assert "SEARCH nfe_item USING INDEX ix_nfe_item_nfe_" in plano
+    assert "USING INDEX ix_nfe_emitente_data_emissao" in plano
+
+
+def test_indices_compostos_declarados_no_modelo():
+    """Test the composite/covering indexes keep their columns and PostgreSQL INCLUDE list."""
+    indices_nfe = {i.name: [c.name for c in i.columns] for i in NFe.__table__.indexes}
+    indices_item = {i.name: i for i in NFeItem.__table__.indexes}
+
+    assert indices_nfe["ix_nfe_emitente_data_emissao"] == ["emitente_cnpj", "data_emissao"]
+    assert indices_nfe["ix_nfe_destinatario_data_emissao"] == ["destinatario_cnpj", "data_emissao"]
+    assert [c.name for c in indices_item["ix_nfe_item_nfe_ncm"].columns] == ["nfe_id", "ncm"]
+    assert "valor_total_item" in indices_item["ix_nfe_item_nfe_cfop"].dialect_options["postgresql"]["include"]
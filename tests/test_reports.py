@@ -253,3 +253,79 @@ def test_exportar_json_str():
     parsed = json.loads(json_str)
     assert parsed["tipo"] == "Test"
     assert parsed["valor"] == "1000.00"
+
+
+def test_relatorios_stream_identicos_ao_json(monkeypatch):
+    """Test streamed reports are byte-identical to exportar_json_str output."""
+    import os
+    from fiscal_auditor import reports, XMLReader, ValidadorTributario, ApuradorTributario
+
+    class DataFixa(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 2, 1, 12, 0, 0)
+
+    monkeypatch.setattr(reports, "datetime", DataFixa)
+
+    reader = XMLReader("12345678000190")
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+    documentos = [
+        reader.ler_xml(os.path.join(base_path, nome))
+        for nome in ("nfe_entrada.xml", "nfe_saida.xml")
+    ]
+    validador = ValidadorTributario()
+    validacoes = [validador.validar_documento(doc) for doc in documentos]
+    apurador = ApuradorTributario()
+    apurador.adicionar_documentos(documentos)
+    mapa = apurador.apurar("01/2024")
+
+    gerador = GeradorRelatorios()
+
+    esperado = gerador.exportar_json_str(gerador.gerar_relatorio_completo(documentos, mapa, validacoes))
+    assert "".join(gerador.gerar_relatorio_completo_stream(documentos, mapa, validacoes)) == esperado
+
+    esperado = gerador.exportar_json_str(gerador.gerar_demonstrativo_entradas(documentos))
+    assert "".join(gerador.gerar_demonstrativo_entradas_stream(documentos)) == esperado
+
+    esperado = gerador.exportar_json_str(gerador.gerar_demonstrativo_saidas(documentos))
+    assert "".join(gerador.gerar_demonstrativo_saidas_stream(documentos)) == esperado
+
+    # Sem documentos: listas e objetos vazios
+    esperado = gerador.exportar_json_str(gerador.gerar_relatorio_completo([], mapa, []))
+    assert "".join(gerador.gerar_relatorio_completo_stream([], mapa, [])) == esperado
+
+
+def test_relatorios_combinados_iguais_aos_individuais(monkeypatch):
+    """Test single-pass reports match the individual generators."""
+    import os
+    from fiscal_auditor import reports, XMLReader, ValidadorTributario, ApuradorTributario
+
+    class DataFixa(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 2, 1, 12, 0, 0)
+
+    monkeypatch.setattr(reports, "datetime", DataFixa)
+
+    reader = XMLReader("12345678000190")
+    base_path = os.path.join(os.path.dirname(__file__), "fixtures")
+    documentos = [
+        reader.ler_xml(os.path.join(base_path, nome))
+        for nome in ("nfe_entrada.xml", "nfe_saida.xml")
+    ]
+    validador = ValidadorTributario()
+    validacoes = [validador.validar_documento(doc) for doc in documentos]
+    apurador = ApuradorTributario()
+    apurador.adicionar_documentos(documentos)
+    mapa = apurador.apurar("01/2024")
+
+    gerador = GeradorRelatorios()
+    relatorios = gerador.gerar_relatorios_combinados(documentos, mapa, validacoes)
+
+    assert relatorios["entradas"] == gerador.gerar_demonstrativo_entradas(documentos)
+    assert relatorios["saidas"] == gerador.gerar_demonstrativo_saidas(documentos)
+    assert relatorios["mapa"] == gerador.gerar_mapa_apuracao(mapa)
+    assert relatorios["validacao"] == gerador.gerar_relatorio_validacao(validacoes)
+    assert relatorios["completo"]["demonstrativo_saidas"] == relatorios["saidas"]
+    assert gerador.exportar_json_str(relatorios["completo"]) == \
+        "".join(gerador.gerar_relatorio_completo_stream(documentos, mapa, validacoes))